@@ -0,0 +1,349 @@
+"""
+Zentrale Datenerfassung für das MRA 4 Dashboard
+
+Ein Hintergrund-Thread liest das Gerät einmal pro Intervall und stellt den
+letzten Messwert-Snapshot sowie die Graph-Historie für alle Callbacks bereit.
+Callbacks lesen nur noch den Snapshot - die Anzahl der Modbus-Anfragen ist
+damit unabhängig von der Anzahl geöffneter Browser-Tabs.
+"""
+import logging
+import threading
+import time
+from collections import deque, namedtuple
+from datetime import datetime
+
+from modbus_client import decode_registers
+
+logger = logging.getLogger(__name__)
+
+PHASES = ('L1', 'L2', 'L3')
+
+# Kennwerte der Netzqualität im Snapshot (data['analytics'], power_quality):
+# Unsymmetrie Spannung/Strom in %, df/dt in Hz/s
+ANALYTICS_KEYS = ('voltage_unbalance', 'current_unbalance', 'rocof')
+
+# seq: fortlaufende Nummer (ändert sich mit jedem Poll), timestamp: Unix-Zeit,
+# monotonic: time.monotonic() beim Poll, data: Dictionary wie read_all_data(),
+# simulator: True wenn die Daten vom MRA4Simulator stammen,
+# epoch: Zähler der Datenquellen-Wechsel (ändert sich bei set_client),
+# raw: Rohregister des Polls (read_raw_registers) oder None (Simulator, Shared Memory)
+Snapshot = namedtuple('Snapshot', ['seq', 'timestamp', 'monotonic', 'data', 'connected', 'simulator', 'epoch', 'raw'],
+                      defaults=(None,))
+
+# Anzahl gemerkter Umschaltpunkte in der Historie
+MAX_MARKERS = 16
+
+
+def empty_data():
+    """Leerer Datensatz im Format von read_all_data()"""
+    return {
+        'voltage': {phase: None for phase in PHASES},
+        'current': {phase: None for phase in PHASES},
+        'power': {'L1': None, 'L2': None, 'L3': None, 'total': None},
+        'frequency': None,
+        'coupling_switch': None,
+        'di_status': None,
+        'protection_status': None,
+        'cause_of_trip': None,
+        'fault_number': None,
+        'fault_recording': None,
+        'analytics': dict.fromkeys(ANALYTICS_KEYS),
+        'alarms': [],
+    }
+
+
+class AcquisitionService:
+    """Pollt den MRA 4 (oder Simulator) zyklisch und hält Snapshot + Historie"""
+
+    # Wartezeit zwischen Verbindungsversuchen (verdoppelt sich bis zum Maximum)
+    RECONNECT_MIN_S = 1.0
+    RECONNECT_MAX_S = 30.0
+
+    def __init__(self, client, interval_s=1.0, history_points=3600, simulator=False, recorder=None):
+        """
+        Args:
+            client: MRA4Client oder MRA4Simulator (darf noch nicht verbunden sein)
+            interval_s: Poll-Intervall in Sekunden
+            history_points: Anzahl Punkte in der Graph-Historie
+            simulator: True wenn client ein MRA4Simulator ist
+            recorder: optionaler FrameRecorder für die Rohregister jedes Polls
+        """
+        self.client = client
+        self.simulator = simulator
+        self.recorder = recorder
+        self.interval_s = interval_s
+        self.history_points = history_points
+
+        # Serialisiert Poll-Zyklen und Befehle - der pymodbus-Client ist nicht thread-sicher
+        self._device_lock = threading.RLock()
+        self._commands = {}
+        self._listeners = []
+        self._processors = []
+
+        # Zähler für Monitoring (/metrics): Polls, Fehler, Überläufe des Takts, Dauer des letzten Polls
+        self.poll_count = 0
+        self.poll_errors = 0
+        self.overruns = 0
+        self.last_poll_s = 0.0
+
+        self._reconnect_delay = self.RECONNECT_MIN_S
+        self._next_connect_attempt = 0.0
+
+        self._epoch = 0
+        self._marker_pending = False
+        self._snapshot = Snapshot(0, time.time(), time.monotonic(), empty_data(), False, simulator, 0)
+        self._history_lock = threading.Lock()
+        self._time = deque(maxlen=history_points)
+        self._voltage = {phase: deque(maxlen=history_points) for phase in PHASES}
+        self._current = {phase: deque(maxlen=history_points) for phase in PHASES}
+        self._power = {key: deque(maxlen=history_points) for key in PHASES + ('total',)}
+        self._markers = deque(maxlen=MAX_MARKERS)   # Zeit-Labels der ersten Punkte nach einem Wechsel
+
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def start(self):
+        """Poll-Thread starten"""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name='mra4-acquisition', daemon=True)
+        self._thread.start()
+        logger.info(f"Datenerfassung gestartet (Intervall {self.interval_s:.2f}s)")
+
+    def stop(self, timeout=5.0):
+        """Poll-Thread stoppen"""
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def add_listener(self, listener):
+        """Funktion registrieren, die nach jedem Poll mit dem neuen Snapshot aufgerufen wird"""
+        self._listeners.append(listener)
+
+    def add_processor(self, processor):
+        """
+        Verarbeitungsschritt registrieren, der vor dem Veröffentlichen läuft
+
+        processor(data, timestamp, monotonic) darf den Datensatz ergänzen (z.B.
+        data['analytics']) - Snapshot, Listener und Web-Worker sehen das Ergebnis.
+        """
+        self._processors.append(processor)
+
+    def register_command(self, name, handler, locked=True):
+        """
+        Zusätzlichen Befehl für execute() registrieren (z.B. Simulator umschalten)
+
+        Args:
+            name: Befehlsname
+            handler: Funktion, die den Befehl ausführt
+            locked: False für lang laufende Befehle, die selbst einzelne
+                execute()-Aufrufe machen (der Poll-Zyklus läuft dazwischen weiter)
+        """
+        self._commands[name] = (handler, locked)
+
+    def execute(self, command, *args, **kwargs):
+        """
+        Befehl am Gerät ausführen (serialisiert mit dem Poll-Zyklus)
+
+        Args:
+            command: registrierter Befehl oder Methodenname des Clients (z.B. 'acknowledge_all')
+
+        Returns:
+            Rückgabewert des Befehls
+        """
+        handler, locked = self._commands.get(command, (None, True))
+        if not locked:
+            return handler(*args, **kwargs)
+        with self._device_lock:
+            if handler is None:
+                handler = getattr(self.client, command)
+            return handler(*args, **kwargs)
+
+    def set_client(self, client, simulator=False, description=None):
+        """
+        Geräte-Client im laufenden Betrieb austauschen (z.B. neue IP oder Simulator)
+
+        Wartet, bis ein laufender Poll oder Befehl fertig ist, tauscht dann
+        den Client aus und trennt den alten. Die Historie läuft weiter; der
+        erste Punkt der neuen Quelle wird als Umschaltpunkt markiert und die
+        Epoche im Snapshot erhöht.
+
+        Args:
+            client: neuer MRA4Client oder MRA4Simulator (darf noch nicht verbunden sein)
+            simulator: True wenn client ein MRA4Simulator ist
+            description: Beschreibung der neuen Quelle für das Log
+        """
+        with self._device_lock:
+            old = self.client
+            self.client = client
+            self.simulator = simulator
+            self._reconnect_delay = self.RECONNECT_MIN_S
+            self._next_connect_attempt = 0.0
+            self._epoch += 1
+            self._marker_pending = True
+        if old is not None and old is not client:
+            try:
+                old.disconnect()
+            except Exception as e:
+                logger.debug(f"Alter Client konnte nicht getrennt werden: {e}")
+        logger.info(f"Datenquelle gewechselt: {description or ('Simulator' if simulator else 'MRA4')}")
+
+    def set_interval(self, interval_s):
+        """Poll-Intervall ändern (wirkt ab dem nächsten Zyklus)"""
+        if interval_s and interval_s > 0 and interval_s != self.interval_s:
+            self.interval_s = interval_s
+            logger.info(f"Poll-Intervall geändert auf {interval_s:.2f}s")
+
+    def _run(self):
+        next_tick = time.monotonic()
+        while not self._stop_event.is_set():
+            try:
+                self.poll_once()
+            except Exception as e:
+                self.poll_errors += 1
+                logger.error(f"Fehler in der Datenerfassung: {e}")
+            next_tick += self.interval_s
+            delay = next_tick - time.monotonic()
+            if delay < 0:
+                # Überlauf - Takt neu ausrichten statt aufzuholen
+                self.overruns += 1
+                next_tick = time.monotonic()
+                delay = 0
+            self._stop_event.wait(delay)
+
+    def stats(self):
+        """Zähler der Datenerfassung (für Monitoring)"""
+        return {
+            'polls': self.poll_count,
+            'poll_errors': self.poll_errors,
+            'overruns': self.overruns,
+            'last_poll_s': self.last_poll_s,
+            'interval_s': self.interval_s,
+        }
+
+    def _ensure_connected(self, client):
+        """
+        Verbindung im Hintergrund (wieder)herstellen
+
+        Returns:
+            True wenn verbunden, False wenn der nächste Versuch noch aussteht
+        """
+        if client.connected:
+            return True
+        now = time.monotonic()
+        if now < self._next_connect_attempt:
+            return False
+        if client.connect():
+            self._reconnect_delay = self.RECONNECT_MIN_S
+            return True
+        self._next_connect_attempt = now + self._reconnect_delay
+        self._reconnect_delay = min(self._reconnect_delay * 2, self.RECONNECT_MAX_S)
+        return False
+
+    @staticmethod
+    def _link_lost(data):
+        # Keine einzige Messgröße lesbar -> Verbindung als getrennt betrachten
+        return (all(v is None for v in data['voltage'].values())
+                and all(v is None for v in data['current'].values())
+                and data['frequency'] is None)
+
+    def _record(self, raw):
+        try:
+            self.recorder.append(raw, time.monotonic(), time.time())
+        except Exception as e:
+            logger.error(f"Register-Aufzeichnung fehlgeschlagen, wird beendet: {e}")
+            self.recorder = None
+
+    def poll_once(self):
+        """Einen Messzyklus ausführen und den Snapshot veröffentlichen"""
+        started = time.perf_counter()
+        with self._device_lock:
+            client = self.client
+            simulator = self.simulator
+            epoch = self._epoch
+            marker = self._marker_pending
+            self._marker_pending = False
+            raw = None
+            if self._ensure_connected(client):
+                read_raw = getattr(client, 'read_raw_registers', None)
+                if read_raw is not None:
+                    raw = read_raw()
+                    if self.recorder is not None:
+                        self._record(raw)
+                    data = decode_registers(raw)
+                else:
+                    data = client.read_all_data()
+                    data['fault_recording'] = client.read_fault_recording_status()
+                if self._link_lost(data):
+                    logger.warning("Keine Messwerte lesbar - Verbindung wird neu aufgebaut")
+                    client.disconnect()
+            else:
+                data = empty_data()
+            connected = bool(client.connected)
+        now = time.time()
+        monotonic = time.monotonic()
+        for processor in self._processors:
+            try:
+                processor(data, now, monotonic)
+            except Exception as e:
+                logger.error(f"Fehler in Verarbeitungsschritt {getattr(processor, '__name__', processor)}: {e}")
+        self.poll_count += 1
+        self.last_poll_s = time.perf_counter() - started
+
+        with self._history_lock:
+            label = datetime.fromtimestamp(now).strftime('%H:%M:%S')
+            self._time.append(label)
+            if marker:
+                self._markers.append(label)
+            for phase in PHASES:
+                self._voltage[phase].append(data['voltage'][phase] or 0)
+                self._current[phase].append(data['current'][phase] or 0)
+                self._power[phase].append((data['power'][phase] or 0) / 1000)  # W -> kW
+            self._power['total'].append((data['power']['total'] or 0) / 1000)  # W -> kW
+
+        snapshot = Snapshot(self._snapshot.seq + 1, now, monotonic, data, connected, simulator, epoch, raw)
+        # Referenz-Zuweisung ist atomar - Leser sehen immer einen vollständigen Snapshot
+        self._snapshot = snapshot
+
+        for listener in self._listeners:
+            try:
+                listener(snapshot)
+            except Exception as e:
+                logger.error(f"Fehler in Snapshot-Listener {getattr(listener, '__name__', listener)}: {e}")
+        return snapshot
+
+    def latest(self):
+        """Letzten Snapshot liefern (ohne Gerätezugriff)"""
+        return self._snapshot
+
+    def history(self, points=None):
+        """
+        Kopie der Graph-Historie
+
+        Args:
+            points: Anzahl der neuesten Punkte (None = alle)
+
+        Returns:
+            Dictionary mit 'time', 'voltage', 'current', 'power' (Listen) und
+            'markers' (Zeit-Labels der Datenquellen-Wechsel im Fenster)
+        """
+        with self._history_lock:
+            size = len(self._time)
+            start = 0 if points is None else max(0, size - points)
+
+            def tail(buffer):
+                if start == 0:
+                    return list(buffer)
+                return [buffer[i] for i in range(start, size)]
+
+            times = tail(self._time)
+            window = set(times)
+            return {
+                'time': times,
+                'voltage': {phase: tail(self._voltage[phase]) for phase in PHASES},
+                'current': {phase: tail(self._current[phase]) for phase in PHASES},
+                'power': {key: tail(self._power[key]) for key in self._power},
+                'markers': [label for label in self._markers if label in window],
+            }
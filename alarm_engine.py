@@ -0,0 +1,283 @@
+"""
+Regelbasierte Grenzwert-Alarme mit Hysterese und Haltezeit
+
+Die Regeln stehen in der Konfiguration (alarms.rules) und werden einmal zu
+einer Regeltabelle kompiliert: Kanalindex, Vorzeichen, Schwelle, Rückfall-
+schwelle und Haltezeit als numpy-Arrays. Pro Snapshot werden die benötigten
+Kanäle einmal gelesen und alle Regeln in einem vektorisierten Schritt
+ausgewertet - der Aufwand wächst mit der Anzahl Kanäle, nicht mit der Anzahl
+Regeln. Die Auswertung läuft als Verarbeitungsschritt der Datenerfassung
+(einmal pro Poll), nicht pro Browser-Sitzung.
+
+Regel:
+    {"id": "power_high", "channel": "load_percent", "comparator": ">=",
+     "threshold": 90, "hysteresis": 2, "hold_s": 0, "severity": "warning",
+     "message": "Leistung bei {value:.0f}%"}
+
+- channel: Pfad im Datensatz ('voltage.L1', 'frequency',
+  'analytics.voltage_unbalance', ...) oder 'load_percent' (Gesamtleistung in
+  Prozent von max_power_kw)
+- Ein Alarm kommt, wenn die Bedingung hold_s Sekunden ununterbrochen erfüllt
+  ist, und geht erst, wenn der Wert die Schwelle um hysteresis in
+  Gegenrichtung verlassen hat
+- Fehlende Werte (Verbindung unterbrochen) ändern aktive Alarme nicht, eine
+  laufende Haltezeit beginnt neu
+
+Aktive Alarme stehen im Snapshot unter data['alarms'].
+"""
+import logging
+import math
+import threading
+from collections import deque
+
+from acquisition import empty_data
+
+logger = logging.getLogger(__name__)
+
+SEVERITIES = ('info', 'warning', 'critical')
+
+# Vergleich -> (Vorzeichen, strikt); '<' wird als '-x > -Schwelle' ausgewertet
+COMPARATORS = {'>': (1.0, True), '>=': (1.0, False), '<': (-1.0, True), '<=': (-1.0, False)}
+
+# Berechnete Kanäle (nicht direkt im Datensatz)
+DERIVED_CHANNELS = ('load_percent',)
+
+# Höchstzahl gleichzeitig aktiver Alarme im Shared Memory
+MAX_ACTIVE_ALARMS = 32
+
+# Anzahl gemerkter Kommt/Geht-Ereignisse
+MAX_EVENTS = 200
+
+
+def _lookup(data, path):
+    value = data
+    for key in path:
+        if not isinstance(value, dict):
+            return None
+        value = value.get(key)
+    return value
+
+
+def _known_channel(channel):
+    if channel in DERIVED_CHANNELS:
+        return True
+    value = empty_data()
+    for key in channel.split('.'):
+        if not isinstance(value, dict) or key not in value:
+            return False
+        value = value[key]
+    return not isinstance(value, dict)
+
+
+def parse_rules(rules):
+    """
+    Regeln aus der Konfiguration prüfen und vervollständigen
+
+    Ungültige Regeln werden protokolliert und übersprungen.
+
+    Returns:
+        Liste von Regeln mit allen Feldern
+    """
+    parsed = []
+    ids = set()
+    for i, rule in enumerate(rules or []):
+        try:
+            rule_id = str(rule.get('id') or f"rule{i + 1}")
+            channel = rule['channel']
+            comparator = rule.get('comparator', '>=')
+            severity = rule.get('severity', 'warning')
+            if rule_id in ids:
+                raise ValueError(f"doppelte id {rule_id}")
+            if not _known_channel(channel):
+                raise ValueError(f"unbekannter Kanal {channel}")
+            if comparator not in COMPARATORS:
+                raise ValueError(f"unbekannter Vergleich {comparator}")
+            if severity not in SEVERITIES:
+                raise ValueError(f"unbekannte Stufe {severity}")
+            parsed.append({
+                'id': rule_id,
+                'channel': channel,
+                'comparator': comparator,
+                'threshold': float(rule['threshold']),
+                'hysteresis': abs(float(rule.get('hysteresis', 0))),
+                'hold_s': max(0.0, float(rule.get('hold_s', 0))),
+                'severity': severity,
+                'message': rule.get('message') or f"{channel} {comparator} {rule['threshold']}",
+            })
+            ids.add(rule_id)
+        except (AttributeError, KeyError, TypeError, ValueError) as e:
+            logger.error(f"Alarmregel {i + 1} ungültig, wird ignoriert: {e}")
+    return parsed
+
+
+class RuleTable:
+    """Geprüfte Regeln und ihre kompilierte Form (numpy-Arrays, erst bei Bedarf)"""
+
+    def __init__(self, rules):
+        self.rules = parse_rules(rules)
+        self.channels = tuple(dict.fromkeys(rule['channel'] for rule in self.rules))
+        self._paths = [tuple(channel.split('.')) for channel in self.channels]
+        self._compiled = None
+
+    def __len__(self):
+        return len(self.rules)
+
+    def compiled(self):
+        """
+        Returns:
+            (Kanalindex, Vorzeichen * Schwelle, Rückfallschwelle, strikt, Haltezeit) als Arrays
+        """
+        if self._compiled is None:
+            import numpy as np   # erst in der Datenerfassung laden, nicht beim Start
+
+            index = {channel: i for i, channel in enumerate(self.channels)}
+            sign = np.array([COMPARATORS[r['comparator']][0] for r in self.rules])
+            threshold = sign * np.array([r['threshold'] for r in self.rules])
+            self._compiled = (
+                np.array([index[r['channel']] for r in self.rules], dtype=np.intp),
+                sign,
+                threshold,
+                threshold - np.array([r['hysteresis'] for r in self.rules]),
+                np.array([COMPARATORS[r['comparator']][1] for r in self.rules]),
+                np.array([r['hold_s'] for r in self.rules]),
+            )
+        return self._compiled
+
+    def values(self, data, max_power_kw=None):
+        """Werte der benötigten Kanäle (NaN = fehlt), ein Lesezugriff pro Kanal"""
+        values = []
+        for channel, path in zip(self.channels, self._paths):
+            if channel == 'load_percent':
+                power_w = data['power']['total']
+                value = (power_w / 1000 / max_power_kw * 100
+                         if power_w is not None and max_power_kw else None)
+            else:
+                value = _lookup(data, path)
+            values.append(math.nan if value is None else float(value))
+        return values
+
+    def describe(self, index, since, value):
+        """Aktiven Alarm einer Regel als Dictionary (Snapshot, Shared Memory)"""
+        rule = self.rules[index]
+        try:
+            message = rule['message'].format(value=value, threshold=rule['threshold'])
+        except (KeyError, IndexError, TypeError, ValueError):
+            message = rule['message']
+        return {
+            'id': rule['id'],
+            'rule': index,
+            'severity': rule['severity'],
+            'channel': rule['channel'],
+            'value': value,
+            'threshold': rule['threshold'],
+            'since': since,
+            'message': message,
+        }
+
+
+class AlarmEngine:
+    """Verarbeitungsschritt der Datenerfassung: alle Regeln einmal pro Poll auswerten"""
+
+    def __init__(self, rules, max_power_kw=None):
+        """
+        Args:
+            rules: Regeln wie in alarms.rules
+            max_power_kw: Funktion, die die Maximalleistung liefert (für 'load_percent')
+        """
+        self.max_power_kw = max_power_kw
+        self.events = deque(maxlen=MAX_EVENTS)   # (Unix-Zeit, id, 'raised'/'cleared', Wert)
+        self._lock = threading.Lock()
+        self.table = None
+        self._carry = []      # Zustand (aktiv, Haltezeit seit, aktiv seit) je Regel nach set_rules()
+        self._state = None    # dasselbe als numpy-Arrays + letzte Werte, ab dem ersten Poll
+        self.set_rules(rules)
+
+    def set_rules(self, rules):
+        """Neue Regeln übernehmen - Zustand von Regeln mit gleicher id bleibt erhalten"""
+        table = RuleTable(rules)
+        with self._lock:
+            old = {}
+            if self.table is not None:
+                if self._state is not None:
+                    active, pending, since, _ = self._state
+                    self._carry = list(zip(active.tolist(), pending.tolist(), since.tolist()))
+                old = dict(zip((rule['id'] for rule in self.table.rules), self._carry))
+            self.table = table
+            self._carry = [old.get(rule['id'], (False, math.nan, math.nan)) for rule in table.rules]
+            self._state = None
+        logger.info(f"Alarmregeln: {len(table)} aktiv")
+
+    def _arrays(self):
+        if self._state is None:
+            import numpy as np
+            carry = self._carry
+            self._state = (np.array([c[0] for c in carry], dtype=bool),
+                           np.array([c[1] for c in carry], dtype=np.float64),
+                           np.array([c[2] for c in carry], dtype=np.float64),
+                           np.full(len(carry), np.nan))
+        return self._state
+
+    def process(self, data, timestamp, monotonic):
+        """
+        Einen Poll auswerten und data['alarms'] setzen
+
+        Args:
+            data: Datensatz wie read_all_data() (wird ergänzt)
+            timestamp: Unix-Zeit des Polls
+            monotonic: monotone Zeit des Polls
+        """
+        with self._lock:
+            table = self.table
+            if not len(table):
+                data['alarms'] = []
+                return
+            import numpy as np
+
+            channel, sign, threshold, release_level, strict, hold_s = table.compiled()
+            active, pending, since, _ = self._arrays()
+            max_power_kw = self.max_power_kw() if self.max_power_kw else None
+            value = np.array(table.values(data, max_power_kw))[channel]
+            signed = sign * value   # NaN-Vergleiche sind immer False
+
+            exceeded = np.where(strict, signed > threshold, signed >= threshold)
+            released = signed < release_level
+
+            # Haltezeit: ab der ersten Überschreitung zählen, bei Unterbrechung neu beginnen
+            pending = np.where(exceeded, np.where(np.isnan(pending), monotonic, pending), np.nan)
+            raised = ~active & exceeded & (monotonic - pending >= hold_s)
+            cleared = active & released
+            active = (active | raised) & ~cleared
+            since = np.where(raised, timestamp, np.where(active, since, np.nan))
+            self._state = (active, pending, since, value)
+
+            changed = np.flatnonzero(raised | cleared)
+            for i in changed.tolist():
+                rule = table.rules[i]
+                current = float(value[i])
+                if raised[i]:
+                    self.events.append((timestamp, rule['id'], 'raised', current))
+                    logger.warning(f"Alarm kommt: {rule['id']} ({rule['severity']}) {rule['channel']} = {current:g}")
+                else:
+                    self.events.append((timestamp, rule['id'], 'cleared', current))
+                    logger.info(f"Alarm geht: {rule['id']} {rule['channel']} = {current:g}")
+
+            data['alarms'] = self._active_alarms()
+
+    def _active_alarms(self):
+        active, _, since, value = self._arrays()
+        alarms = []
+        for i in active.nonzero()[0].tolist():
+            current = float(value[i])
+            alarms.append(self.table.describe(i, float(since[i]), None if math.isnan(current) else current))
+        return alarms
+
+    def state(self):
+        """Regeln, aktive Alarme und letzte Ereignisse (JSON-serialisierbar)"""
+        with self._lock:
+            table = self.table
+            return {
+                'rules': table.rules,
+                'active': self._active_alarms() if len(table) else [],
+                'events': [{'timestamp': t, 'id': rule_id, 'event': kind, 'value': value}
+                           for t, rule_id, kind, value in self.events],
+            }
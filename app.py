@@ -3,49 +3,58 @@ MRA 4 Dashboard - Dash Web Application
 Dunkles minimales Design mit Echtzeit-Monitoring
 """
 
+# Startzeit-Profil muss vor den schweren Imports aktiviert werden
+import startup_profile
+if startup_profile.enabled():
+    startup_profile.install()
+
 import dash
+import flask
 from dash import dcc, html, Input, Output, State, callback_context, no_update
 import dash_bootstrap_components as dbc
 import dash_daq as daq
 import plotly.graph_objs as go
-from collections import deque
+import plotly.io
 import time
 from datetime import datetime
 from modbus_client import MRA4Simulator, MRA4Client
-from config_manager import get_config_manager, save_config
-from pymodbus.client import ModbusTcpClient
+from modbus_metrics import MODBUS_METRICS
+from metrics_exporter import CONTENT_TYPE as METRICS_CONTENT_TYPE, CallbackTimer, MetricsExporter
+from rest_api import RestApi
+from energy_meter import EnergyMeter
+from power_quality import PowerQualityAnalyzer
+from alarm_engine import AlarmEngine, RuleTable
+from trip_recorder import TripRecorder, list_events, load_event
+from config_manager import DEFAULT_CONFIG, get_config_manager, resolve_path, save_config
+from log_buffer import LogRing, RepeatFilter
+from acquisition import PHASES, AcquisitionService
+from render_cache import RenderCache
+from shm_snapshot import SharedSnapshotReader
+from host_info import HostInfo
 import sys
-import socket
+import atexit
+import threading
 import logging
 import os
+from urllib.parse import urlencode
 
 # Logging-Konfiguration
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 app_logger = logging.getLogger('mra4_dashboard')
 app_logger.setLevel(logging.INFO)
 
-# Log-Buffer für UI-Anzeige
-LOG_BUFFER = deque(maxlen=100)
-LOG_BUFFER_DEBUG = deque(maxlen=500)
-
-class LogHandler(logging.Handler):
-    """Custom Log Handler der Logs in den Buffer schreibt"""
-    def emit(self, record):
-        log_entry = self.format(record)
-        LOG_BUFFER.append(log_entry)
-        LOG_BUFFER_DEBUG.append(log_entry)
+# Log-Ring für UI-Anzeige (strukturiert, Formatierung erst bei Anzeige)
+LOG_RING = LogRing(capacity=500, dedup_window=60.0)
+LOG_RING.set_level_gate('pymodbus', logging.WARNING)
 
-log_handler = LogHandler()
-log_handler.setFormatter(logging.Formatter('%(asctime)s - %(levelname)s - %(message)s', datefmt='%H:%M:%S'))
-app_logger.addHandler(log_handler)
+# Konsole: Wiederholungen (z.B. Modbus-Fehler bei Offline-Gerät) nur einmal pro Minute ausgeben
+for _console_handler in logging.getLogger().handlers:
+    _console_handler.addFilter(RepeatFilter(window=60.0))
 
-# Log-Handler auch für andere Logger hinzufügen
-logging.getLogger('modbus_client').addHandler(log_handler)
+# Nur am Root-Logger anhängen - app_logger und modbus_client propagieren dorthin
+logging.getLogger().addHandler(LOG_RING)
 logging.getLogger('modbus_client').setLevel(logging.INFO)
 
-# Root-Logger für alle anderen Nachrichten
-logging.getLogger().addHandler(log_handler)
-
 # Werkzeug/Flask Logging für saubere Konsole deaktivieren
 logging.getLogger('werkzeug').setLevel(logging.ERROR)
 logging.getLogger('dash').setLevel(logging.ERROR)
@@ -83,34 +92,51 @@ config = get_config_manager()
 # Konfiguration - Max. Leistung
 MAX_POWER_KW = config.get('max_power_kw', 12.0)
 
-# Simulator Modus - IMMER beim Start AUS (nicht persistent)
-SIMULATOR_MODE = False
+# Vorkompilierte Zugriffe für Werte, die in Callbacks bei jedem Tick gelesen werden
+CFG_MODBUS_IP = config.view('modbus.ip', '192.168.1.100', str)
+CFG_MODBUS_PORT = config.view('modbus.port', 502, int)
+CFG_UPDATE_INTERVAL_MS = config.view('update_interval_ms', 1000, int)
+CFG_GRAPH_HISTORY_S = config.view('graph_history_seconds', 60, int)
+CFG_COUPLING_TIMEOUT = config.view('coupling_unlock_timeout', 30, int)
+CFG_MAX_POWER_KW = config.view('max_power_kw', MAX_POWER_KW, float)
+
+# Simulator Modus - beim Start AUS (nicht persistent), außer mit --simulator
+SIMULATOR_MODE = '--simulator' in sys.argv
 
 # Schalter-Timeout aus Config (persistent, änderbar über Supervisor)
 COUPLING_UNLOCK_TIMEOUT = config.get('coupling_unlock_timeout', 30)
 
+# Hostname/IP einmal im Hintergrund ermitteln - Callbacks lesen nur den Cache
+host_info = HostInfo()
+host_info.start()
+
 def get_local_ip():
     """Ermittelt die lokale IP-Adresse des Rechners"""
-    try:
-        s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-        s.connect(("8.8.8.8", 80))
-        ip = s.getsockname()[0]
-        s.close()
-        return ip
-    except Exception:
-        return "127.0.0.1"
+    host_info.wait_ready(timeout=2.0)
+    return host_info.local_ip
 
 def get_hostname():
     """Ermittelt den Hostnamen"""
-    try:
-        return socket.gethostname()
-    except Exception:
-        return "localhost"
+    host_info.wait_ready(timeout=2.0)
+    return host_info.hostname
+
+# Headless-Start: Web-UI sofort starten, Verbindung baut die Datenerfassung im Hintergrund auf.
+# Aktiv mit --headless, MRA4_HEADLESS=1 oder automatisch ohne Konsole (z.B. als Dienst).
+HEADLESS_START = ('--headless' in sys.argv
+                  or os.environ.get('MRA4_HEADLESS', '') == '1'
+                  or sys.stdin is None
+                  or not sys.stdin.isatty())
 
 # Startup-Verbindungstest mit interaktiver IP-Eingabe
 def check_modbus_connection_on_startup():
-    """Prüft die Modbus-Verbindung beim Start"""
+    """
+    Prüft die Modbus-Verbindung beim Start (interaktiv)
+
+    Returns:
+        Verbundener ModbusTcpClient (wird vom MRA4Client übernommen) oder None im Simulator Modus
+    """
     global SIMULATOR_MODE
+    from pymodbus.client import ModbusTcpClient
 
     ip = config.get('modbus.ip', '192.168.1.100')
     port = config.get('modbus.port', 502)
@@ -123,11 +149,10 @@ def check_modbus_connection_on_startup():
         timeout = 30  # 30 Sekunden Timeout
 
         connected = False
+        test_client = ModbusTcpClient(host=ip, port=port, timeout=3)
         while time.time() - start_time < timeout:
             try:
-                test_client = ModbusTcpClient(host=ip, port=port, timeout=3)
                 if test_client.connect():
-                    test_client.close()
                     print("Verbindung erfolgreich hergestellt!\n")
                     connected = True
                     break
@@ -141,7 +166,7 @@ def check_modbus_connection_on_startup():
 
         if connected:
             SIMULATOR_MODE = False
-            return True
+            return test_client
 
         # Timeout erreicht - Fehlermeldung und Optionen anbieten
         print("\n" + "="*60)
@@ -187,7 +212,7 @@ def check_modbus_connection_on_startup():
             elif choice == "4":
                 print("Starte im Simulator Modus (Simulierte Werte)...")
                 SIMULATOR_MODE = True
-                return True
+                return None
 
             elif choice == "5":
                 print("Programm wird beendet.")
@@ -201,8 +226,40 @@ def check_modbus_connection_on_startup():
             print("Programm wird beendet.")
             sys.exit(1)
 
-# Verbindungscheck beim Start
-check_modbus_connection_on_startup()
+# Web-Worker im Multi-Worker-Betrieb (app.py --workers N): Daten kommen aus dem Shared Memory
+# des Erfassungs-Prozesses, der Worker öffnet selbst keine Modbus-Verbindung
+WORKER_MODE = bool(os.environ.get('MRA4_SHM_NAME'))
+
+# Anzahl Web-Worker (--workers N), 1 = ein Prozess wie bisher
+WEB_WORKERS = 1
+if '--workers' in sys.argv:
+    try:
+        WEB_WORKERS = max(1, int(sys.argv[sys.argv.index('--workers') + 1]))
+    except (IndexError, ValueError):
+        print("Ungültiger Wert für --workers - starte mit einem Prozess")
+
+# HTTP-Port des Dashboards (--port N)
+WEB_PORT = 8050
+if '--port' in sys.argv:
+    try:
+        WEB_PORT = int(sys.argv[sys.argv.index('--port') + 1])
+    except (IndexError, ValueError):
+        print(f"Ungültiger Wert für --port - starte auf Port {WEB_PORT}")
+
+# Wiedergabe einer Register-Aufzeichnung statt Gerät (MRA4_REPLAY=datei.rec, MRA4_REPLAY_SPEED=1)
+REPLAY_FILE = os.environ.get('MRA4_REPLAY')
+
+# Rohregister jedes Polls aufzeichnen (--record oder MRA4_RECORD_DIR=verzeichnis)
+RECORD_DIR = os.environ.get('MRA4_RECORD_DIR') or ('recordings' if '--record' in sys.argv else None)
+
+# Verbindungscheck beim Start (nur interaktiv - headless verbindet die Datenerfassung im Hintergrund)
+if WORKER_MODE or REPLAY_FILE or SIMULATOR_MODE:
+    startup_client = None
+elif HEADLESS_START:
+    app_logger.info("Headless-Start: Verbindung zum MRA4 wird im Hintergrund aufgebaut")
+    startup_client = None
+else:
+    startup_client = check_modbus_connection_on_startup()
 
 # App initialisieren mit dunklem Theme
 app = dash.Dash(__name__, external_stylesheets=[dbc.themes.CYBORG], suppress_callback_exceptions=True)
@@ -212,28 +269,236 @@ app.title = "MRA 4 Dashboard"
 current_max_power = MAX_POWER_KW
 current_update_interval = 1000
 
+# Wiedergabe eines Simulator-Szenarios (MRA4_SIM_SCENARIO), None = Zufallswerte
+scenario_player = None
+
 # Modbus Client aus Config initialisieren
-def init_modbus_client():
-    """Initialisiere Modbus Client basierend auf Simulator Modus"""
-    global SIMULATOR_MODE
+def init_modbus_client(startup_client=None):
+    """
+    Initialisiere Modbus Client basierend auf Simulator Modus
+
+    Der echte Client wird hier nicht verbunden - das übernimmt die Datenerfassung
+    im Poll-Thread (AcquisitionService._ensure_connected, Backoff 1 s bis 30 s).
+    Eine bereits offene Verbindung aus dem Startup-Test wird übernommen.
+    """
+    global SIMULATOR_MODE, scenario_player
+    if scenario_player is not None:
+        scenario_player.stop()
+        scenario_player = None
     if SIMULATOR_MODE:
         client = MRA4Simulator()
+        client.connect()
+        scenario_file = os.environ.get('MRA4_SIM_SCENARIO')
+        if scenario_file:
+            # Simulator folgt einem Lastprofil statt Zufallswerten
+            from scenario import Scenario, ScenarioPlayer
+            speed = float(os.environ.get('MRA4_SIM_SPEED', '1'))
+            scenario_player = ScenarioPlayer(Scenario.from_file(scenario_file), client, speed=speed, loop=True).start()
+    elif REPLAY_FILE:
+        from frame_recorder import ReplayClient
+        client = ReplayClient(REPLAY_FILE, speed=float(os.environ.get('MRA4_REPLAY_SPEED', '1')), loop=True)
     else:
         ip = config.get('modbus.ip', '192.168.1.100')
         port = config.get('modbus.port', 502)
         unit_id = config.get('modbus.unit_id', 1)
-        client = MRA4Client(host=ip, port=port, unit_id=unit_id)
-    client.connect()
+        client = MRA4Client(host=ip, port=port, unit_id=unit_id, client=startup_client)
     return client
 
-mra4 = init_modbus_client()
+def set_simulator_mode(value):
+    """Simulator Modus umschalten und den Geräte-Client der Datenerfassung austauschen"""
+    global SIMULATOR_MODE, mra4
+    SIMULATOR_MODE = bool(value)
+    mra4 = init_modbus_client()
+    if SIMULATOR_MODE:
+        description = "Simulator"
+    elif REPLAY_FILE:
+        description = f"Wiedergabe {REPLAY_FILE}"
+    else:
+        description = f"MRA4 {mra4.host}:{mra4.port} (Unit {mra4.unit_id})"
+    acq.set_client(mra4, simulator=SIMULATOR_MODE, description=description)
+    return SIMULATOR_MODE
+
+def coupling_pulse(duration=2.0):
+    """
+    Koppelschalter-Impuls (BA1) senden
+
+    EIN und AUS laufen als getrennte Befehle - die Datenerfassung pollt
+    während des Impulses weiter, die DI-Rückmeldung bleibt sichtbar.
+    """
+    if acq.simulator:
+        return acq.execute('send_coupling_pulse', duration=duration)
+    if not acq.execute('write_coupling_switch', True):
+        return False
+    time.sleep(duration)
+    return acq.execute('write_coupling_switch', False)
 
-# Daten-Buffer für Graphen (letzte 60 Sekunden)
-MAX_DATA_POINTS = 60
-time_data = deque(maxlen=MAX_DATA_POINTS)
-voltage_data = {'L1': deque(maxlen=MAX_DATA_POINTS), 'L2': deque(maxlen=MAX_DATA_POINTS), 'L3': deque(maxlen=MAX_DATA_POINTS)}
-current_data = {'L1': deque(maxlen=MAX_DATA_POINTS), 'L2': deque(maxlen=MAX_DATA_POINTS), 'L3': deque(maxlen=MAX_DATA_POINTS)}
-power_data = {'L1': deque(maxlen=MAX_DATA_POINTS), 'L2': deque(maxlen=MAX_DATA_POINTS), 'L3': deque(maxlen=MAX_DATA_POINTS), 'total': deque(maxlen=MAX_DATA_POINTS)}
+def reconfigure_modbus(key, value):
+    """Geänderten Modbus-Endpunkt (IP/Port/Unit) ohne Neustart übernehmen"""
+    if SIMULATOR_MODE:
+        return   # wird beim Zurückschalten auf das echte Gerät übernommen
+    # Im Hintergrund - set_client wartet auf den laufenden Poll
+    threading.Thread(target=acq.execute, args=('set_simulator', False),
+                     name='mra4-reconfigure', daemon=True).start()
+
+# Verzeichnis der Ereignisdateien (Erfassungs-Prozess schreibt, alle Worker lesen)
+# Relative Pfade gelten ab dem Programmverzeichnis wie config.json (resolve_path)
+TRIP_DIR = resolve_path(config.get('trips.directory', 'trips'))
+# Ereignisrekorder (nur im Erfassungs-Prozess) und Übersicht der Ereignisdateien für die Web-Worker
+trip_recorder = None
+trip_summaries = {}
+
+# Verzeichnis der Spalten-Historie (Erfassungs-Prozess schreibt, Export liest)
+HISTORY_DIR = resolve_path(config.get('history.directory', 'history'))
+
+def configured_alarm_rules():
+    """Alarmregeln aus der Konfiguration (ältere config.json ohne 'alarms': Standardregel für 90 % Leistung)"""
+    return config.get('alarms.rules', DEFAULT_CONFIG['alarms']['rules'])
+
+if WORKER_MODE:
+    host, _, cmd_port = os.environ.get('MRA4_CMD_ADDRESS', '127.0.0.1:0').rpartition(':')
+    mra4 = None
+    acq = SharedSnapshotReader(os.environ['MRA4_SHM_NAME'],
+                               command_address=(host, int(cmd_port)),
+                               authkey=os.environ.get('MRA4_CMD_AUTHKEY', '').encode(),
+                               alarm_rules=RuleTable(configured_alarm_rules()))
+    # Regeltabelle für die Beschreibung der Alarme aus dem Shared Memory aktuell halten
+    config.subscribe('alarms.rules', lambda key, rules: setattr(acq, 'alarm_rules', RuleTable(configured_alarm_rules())))
+    app_logger.info(f"Web-Worker {os.getpid()} liest Snapshot aus Shared Memory {os.environ['MRA4_SHM_NAME']}")
+else:
+    mra4 = init_modbus_client(startup_client)
+
+    recorder = None
+    if RECORD_DIR:
+        from frame_recorder import FrameRecorder
+        recorder = FrameRecorder.in_directory(RECORD_DIR)
+        atexit.register(recorder.close)
+        app_logger.info(f"Register-Aufzeichnung: {recorder.path}")
+
+    # Zentrale Datenerfassung - ein Poll pro Intervall für alle Browser-Sitzungen
+    acq = AcquisitionService(mra4, interval_s=config.get('update_interval_ms', 1000) / 1000,
+                             simulator=SIMULATOR_MODE, recorder=recorder)
+    acq.register_command('set_simulator', set_simulator_mode)
+    acq.register_command('coupling_pulse', coupling_pulse, locked=False)
+    # Transaktionsmetriken lesen ohne Geräte-Sperre (auch für Web-Worker über den Befehlskanal)
+    acq.register_command('modbus_metrics', MODBUS_METRICS.snapshot, locked=False)
+    acq.register_command('acquisition_stats', acq.stats, locked=False)
+    # Netzqualität (Unsymmetrie, df/dt, gleitende Statistik) - einmal pro Poll, vor dem Veröffentlichen
+    power_quality = PowerQualityAnalyzer(windows_s=config.get('analytics.windows_s', [60, 900]),
+                                         rocof_window_s=config.get('analytics.rocof_window_s', 5))
+    acq.add_processor(power_quality.process)
+    acq.register_command('power_quality', power_quality.state, locked=False)
+    # Grenzwert-Alarme (alarms.rules) - nach der Netzqualität, damit deren Kennwerte prüfbar sind
+    alarm_engine = AlarmEngine(configured_alarm_rules(), max_power_kw=CFG_MAX_POWER_KW)
+    acq.add_processor(alarm_engine.process)
+    acq.register_command('alarm_state', alarm_engine.state, locked=False)
+    config.subscribe('alarms.rules', lambda key, rules: alarm_engine.set_rules(configured_alarm_rules()))
+    # Ereignisrekorder: Vorlauf-Ring der Snapshots, bei Auslösung mit Nachlauf als Datei
+    if TRIP_DIR:
+        try:
+            trip_recorder = TripRecorder(TRIP_DIR, pre_s=config.get('trips.pre_s', 10),
+                                         post_s=config.get('trips.post_s', 5),
+                                         max_events=config.get('trips.max_events', 500))
+            acq.add_listener(trip_recorder.on_snapshot)
+            atexit.register(trip_recorder.flush)
+        except OSError as e:
+            app_logger.error(f"Ereignisrekorder nicht verfügbar: {e}")
+    # Messwert-Historie mit vorverdichteten Stufen für /api/history
+    # (numpy wird erst beim ersten Poll im Erfassungs-Thread geladen, nicht beim Start)
+    # Dazu die Spalten-Historie auf der Platte (column_store, für Auswertungen mit numpy/pandas)
+    history_store = None
+    column_writer = None
+
+    def record_history(snapshot):
+        global history_store, column_writer
+        if history_store is None:
+            from history_store import HistoryStore
+            history_store = HistoryStore(raw_points=acq.history_points)
+            if HISTORY_DIR:
+                from column_store import ColumnWriter
+                try:
+                    column_writer = ColumnWriter(HISTORY_DIR, retention_months=config.get('history.retention_months', 24))
+                    atexit.register(column_writer.close)
+                except OSError as e:
+                    app_logger.error(f"Spalten-Historie nicht verfügbar: {e}")
+        history_store.on_snapshot(snapshot)
+        if column_writer is not None:
+            try:
+                column_writer.on_snapshot(snapshot)
+            except Exception as e:
+                app_logger.error(f"Spalten-Historie wird beendet: {e}")
+                column_writer = None
+
+    def query_history(*args):
+        if history_store is None:
+            raise RuntimeError("Historie noch nicht bereit")
+        return history_store.query(*args)
+
+    acq.add_listener(record_history)
+    acq.register_command('history_query', query_history, locked=False)
+    # Energiezähler (kWh) und 15-min-Leistungsmittelwert - Zählerstände überdauern Neustarts
+    energy_meter = EnergyMeter(resolve_path(config.get('energy.state_file', 'energy_state.json')),
+                               demand_window_s=config.get('energy.demand_window_s', 900),
+                               max_gap_s=config.get('energy.max_gap_s', 10))
+    atexit.register(energy_meter.save)
+    acq.add_listener(energy_meter.on_snapshot)
+    acq.register_command('energy_state', energy_meter.state, locked=False)
+    # Intervall-Änderungen (Einstellungen oder extern in config.json) ohne Neustart übernehmen
+    config.subscribe('update_interval_ms', lambda key, value: acq.set_interval((value or 1000) / 1000))
+    # Ein Abonnement für den ganzen Teilbaum - IP + Port in einem Batch = eine Umschaltung
+    config.subscribe('modbus', reconfigure_modbus)
+    # Externe Änderungen an config.json auch ohne offenen Browser erkennen (mtime, max. alle 2 s)
+    acq.add_listener(lambda snapshot: config.check_file())
+    acq.start()
+
+    # Modbus TCP Gateway - weitere Master lesen den Snapshot statt das Gerät
+    gateway = None
+    if config.get('gateway.enabled', False):
+        from modbus_gateway import ModbusGateway
+        try:
+            gateway = ModbusGateway(acq, allow_writes=config.get('gateway.allow_writes', False))
+            gateway.start(config.get('gateway.host', '0.0.0.0'), config.get('gateway.port', 5502))
+        except Exception as e:
+            app_logger.error(f"Modbus-Gateway nicht gestartet: {e}")
+            gateway = None
+
+# Render-Cache - Figuren/Komponenten werden einmal pro Snapshot gebaut
+render_cache = RenderCache(max_entries=64, max_bytes=8 * 1024 * 1024, max_age_s=30.0,
+                           serializer=plotly.io.json.to_json_plotly)
+
+# Prometheus-Export - Text wird einmal pro Tick gerendert, ein Scrape liest nur den Puffer
+callback_timer = CallbackTimer()
+callback_timer.install(app.server)
+metrics_exporter = MetricsExporter(acq, callback_timer)
+if not WORKER_MODE:
+    acq.add_listener(metrics_exporter.on_snapshot)
+
+@app.server.route('/metrics')
+def metrics_endpoint():
+    return flask.Response(metrics_exporter.body(), content_type=METRICS_CONTENT_TYPE)
+
+# REST-API /api/snapshot, /api/history und /api/export - Historie über den Befehl (im Worker über den Befehlskanal)
+rest_api = RestApi(acq, lambda *args: acq.execute('history_query', *args), export_directory=RECORD_DIR,
+                   history_directory=HISTORY_DIR)
+rest_api.install(app.server)
+
+
+def simulator_active():
+    """Stammen die aktuellen Daten vom Simulator? (auch in Web-Workern korrekt)"""
+    return acq.latest().simulator
+
+
+# Kanalgruppen für den Datenexport (Einstellungen)
+EXPORT_CHANNEL_GROUPS = [('Spannung', 'voltage'), ('Strom', 'current'), ('Leistung', 'power'),
+                         ('Frequenz', 'frequency'), ('Koppelschalter', 'coupling_switch'),
+                         ('DI 1', 'di_status'), ('Schutz-Status', 'protection_status'),
+                         ('COT', 'cause_of_trip'), ('Fehlernummer', 'fault_number')]
+
+
+def history_window_points():
+    """Anzahl Graph-Punkte aus Graph-Historie und Update-Intervall"""
+    history_s = CFG_GRAPH_HISTORY_S()
+    interval_ms = CFG_UPDATE_INTERVAL_MS() or 1000
+    return max(1, min(acq.history_points, int(history_s * 1000 / interval_ms)))
 
 # Custom CSS
 app.index_string = '''
@@ -556,7 +821,7 @@ password_modal_coupling = dbc.Modal([
 # Dashboard-Seite
 def create_dashboard_page():
     simulator_indicator = []
-    if SIMULATOR_MODE:
+    if simulator_active():
         simulator_indicator = html.Div("SIMULATOR MODUS AKTIV", className="awd-em-indicator", style={'marginBottom': '10px'})
 
     return html.Div([
@@ -747,11 +1012,33 @@ def create_dashboard_page():
                         html.Div([
                             html.Span(id='max-power-label', children=f"Maximum: {MAX_POWER_KW} kW", style={'color': '#888', 'fontSize': '11px', 'fontWeight': '500'})
                         ], style={'textAlign': 'center'}),
-                        html.Div(id='power-warning', children='')
+                        html.Div(id='power-warning', children=''),
+                        html.Div(id='energy-display', style={'marginTop': '15px'})
                     ], className="card-dark", style={'padding': '15px', 'textAlign': 'center'})
                 ], width=3)
             ], style={'marginTop': '20px', 'marginBottom': '30px'}),
 
+            # Netzqualität: Unsymmetrie, df/dt und gleitende Statistik
+            dbc.Row([
+                dbc.Col([
+                    html.Div([
+                        html.Div([
+                            html.H5("NETZQUALITÄT", style={'color': '#fff', 'fontSize': '16px', 'fontWeight': '600', 'margin': 0, 'letterSpacing': '1px'}),
+                            dcc.RadioItems(
+                                id='quality-window',
+                                options=[{'label': f" {format_window(w)}", 'value': f'{float(w):g}s'}
+                                         for w in config.get('analytics.windows_s', [60, 900])],
+                                value=f"{float(config.get('analytics.windows_s', [60, 900])[0]):g}s",
+                                inline=True,
+                                inputStyle={'marginLeft': '12px'},
+                                style={'color': '#888', 'fontSize': '12px'}
+                            )
+                        ], style={'display': 'flex', 'justifyContent': 'space-between', 'alignItems': 'center', 'marginBottom': '15px'}),
+                        html.Div(id='quality-display')
+                    ], className="card-dark", style={'padding': '25px'})
+                ], width=12)
+            ], style={'marginBottom': '20px'}),
+
             # Leistung über volle Breite
             dbc.Row([
                 dbc.Col([
@@ -833,8 +1120,6 @@ def create_dashboard_page():
         ], fluid=True, style={'padding': '20px', 'paddingBottom': '70px'})
     ])
 
-dashboard_page = create_dashboard_page()
-
 # Settings-Seite mit Tabs (Allgemein + Simulator + Administrator)
 def create_settings_page():
     cfg = get_config_manager()
@@ -917,7 +1202,7 @@ def create_settings_page():
                             html.Div([
                                 html.H4("System-Information", className="neon-cyan"),
                                 html.Hr(style={'borderColor': '#333'}),
-                                html.P(f"Simulator Modus: {'Aktiv' if SIMULATOR_MODE else 'Inaktiv'}", className="neon-text", id="system-info-simulator"),
+                                html.P(f"Simulator Modus: {'Aktiv' if simulator_active() else 'Inaktiv'}", className="neon-text", id="system-info-simulator"),
                                 html.P(f"Modbus IP: {cfg.get('modbus.ip', '192.168.1.100')}:{cfg.get('modbus.port', 502)}", className="neon-text"),
                                 html.P(f"Gestartet: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}", className="neon-text"),
                                 html.P("Version: 1.0.0", className="neon-text"),
@@ -925,6 +1210,48 @@ def create_settings_page():
                         ], width=12)
                     ]),
 
+                    # Datenexport (Download wird direkt vom Server gestreamt)
+                    dbc.Row([
+                        dbc.Col([
+                            html.Div([
+                                html.H4("Datenexport", className="neon-cyan"),
+                                html.Hr(style={'borderColor': '#333'}),
+                                dbc.Row([
+                                    dbc.Col([
+                                        html.Label("Von", style={'color': '#666', 'fontSize': '13px', 'marginBottom': '8px', 'display': 'block'}),
+                                        dbc.Input(id="export-from", type="datetime-local",
+                                                  value=datetime.fromtimestamp(time.time() - 86400).strftime('%Y-%m-%dT%H:%M'),
+                                                  style={'background': '#0f0f0f', 'border': '1px solid #2a2a2a', 'color': '#00ddff', 'borderRadius': '8px', 'padding': '10px'})
+                                    ], width=3),
+                                    dbc.Col([
+                                        html.Label("Bis", style={'color': '#666', 'fontSize': '13px', 'marginBottom': '8px', 'display': 'block'}),
+                                        dbc.Input(id="export-to", type="datetime-local",
+                                                  value=datetime.now().strftime('%Y-%m-%dT%H:%M'),
+                                                  style={'background': '#0f0f0f', 'border': '1px solid #2a2a2a', 'color': '#00ddff', 'borderRadius': '8px', 'padding': '10px'})
+                                    ], width=3),
+                                    dbc.Col([
+                                        html.Label("Kanäle", style={'color': '#666', 'fontSize': '13px', 'marginBottom': '8px', 'display': 'block'}),
+                                        dbc.Checklist(id="export-channels", inline=True,
+                                                      options=[{'label': label, 'value': value} for label, value in EXPORT_CHANNEL_GROUPS],
+                                                      value=[value for _, value in EXPORT_CHANNEL_GROUPS[:4]],
+                                                      style={'color': '#aaa', 'fontSize': '13px'})
+                                    ], width=4),
+                                    dbc.Col([
+                                        html.Label("Format", style={'color': '#666', 'fontSize': '13px', 'marginBottom': '8px', 'display': 'block'}),
+                                        dbc.RadioItems(id="export-format", inline=True, value='csv',
+                                                       options=[{'label': 'CSV', 'value': 'csv'}, {'label': 'Parquet', 'value': 'parquet'}],
+                                                       style={'color': '#aaa', 'fontSize': '13px'})
+                                    ], width=2),
+                                ]),
+                                html.A(dbc.Button("Exportieren",
+                                                  style={'width': '100%', 'background': 'linear-gradient(135deg, #00ff88, #00ddff)', 'color': '#0a0a0a', 'border': 'none', 'fontWeight': '600', 'borderRadius': '8px', 'padding': '12px', 'marginTop': '20px'}),
+                                       id="export-link", href="/api/export", download=""),
+                                html.Small("Quelle: Register-Aufzeichnungen (--record), sonst die Historie im Speicher",
+                                           style={'color': '#555', 'fontSize': '11px'})
+                            ], className="card-dark", style={'padding': '30px', 'marginTop': '30px'})
+                        ], width=12)
+                    ]),
+
                     # Log-Fenster (Normal-Level)
                     dbc.Row([
                         dbc.Col([
@@ -960,10 +1287,10 @@ def create_settings_page():
                                     html.Label("Simulator Modus aktivieren", style={'color': '#666', 'fontSize': '13px', 'marginBottom': '12px', 'display': 'block'}),
                                     daq.ToggleSwitch(
                                         id='simulator-toggle',
-                                        value=SIMULATOR_MODE,
+                                        value=simulator_active(),
                                         color='#FFC107'
                                     ),
-                                    html.Div(id='simulator-status', style={'marginTop': '10px', 'color': '#FFC107' if SIMULATOR_MODE else '#888'})
+                                    html.Div(id='simulator-status', style={'marginTop': '10px', 'color': '#FFC107' if simulator_active() else '#888'})
                                 ], style={'marginBottom': '24px'}),
 
                                 html.Div(id="simulator-save-result", style={'marginTop': '15px'})
@@ -977,8 +1304,8 @@ def create_settings_page():
 
                                 html.Div([
                                     html.P("Aktueller Status:", style={'color': '#666', 'marginBottom': '10px'}),
-                                    html.H3("AKTIV" if SIMULATOR_MODE else "INAKTIV",
-                                           style={'color': '#FFC107' if SIMULATOR_MODE else '#888', 'fontWeight': '600'}),
+                                    html.H3("AKTIV" if simulator_active() else "INAKTIV",
+                                           style={'color': '#FFC107' if simulator_active() else '#888', 'fontWeight': '600'}),
                                 ], style={'marginBottom': '24px', 'textAlign': 'center'}),
 
                                 html.Div([
@@ -996,7 +1323,28 @@ def create_settings_page():
                     ], style={'marginTop': '20px'}),
                 ], label="Simulator", tab_id="tab-simulator", label_style={'color': '#FFC107'}),
 
-                # Tab 3: Administrator-Einstellungen (Hypervisor)
+                # Tab 3: Aufgezeichnete Schutz-Auslösungen (Ereignisrekorder)
+                dbc.Tab([
+                    dbc.Row([
+                        dbc.Col([
+                            html.Div([
+                                html.H4("Auslösungen", className="neon-cyan"),
+                                html.Hr(style={'borderColor': '#333'}),
+                                html.P(f"Vorlauf {config.get('trips.pre_s', 10)} s, Nachlauf {config.get('trips.post_s', 5)} s je Auslösung (Register 1, Bit 0x2000)",
+                                       style={'color': '#666', 'fontSize': '12px'}),
+                                dcc.Dropdown(id='trip-event-select', options=[], placeholder="Keine Auslösung aufgezeichnet",
+                                             clearable=False, style={'color': '#000', 'marginBottom': '15px'}),
+                                dbc.Button("Aktualisieren", id="trip-refresh-btn",
+                                           style={'width': '100%', 'background': 'linear-gradient(135deg, #00ff88, #00ddff)', 'color': '#0a0a0a', 'border': 'none', 'fontWeight': '600', 'borderRadius': '8px', 'padding': '10px'}),
+                            ], className="card-dark", style={'padding': '30px'})
+                        ], width=4),
+                        dbc.Col([
+                            html.Div(id='trip-event-detail', className="card-dark", style={'padding': '30px'})
+                        ], width=8),
+                    ], style={'marginTop': '20px'}),
+                ], label="Auslösungen", tab_id="tab-trips"),
+
+                # Tab 4: Administrator-Einstellungen (Hypervisor)
                 dbc.Tab([
                     html.Div([
                         # Passwort-Eingabe für Admin-Tab
@@ -1081,6 +1429,18 @@ def create_settings_page():
                                 ], width=12)
                             ], style={'marginTop': '20px'}),
 
+                            # Modbus-Statistik (Transaktionsmetriken)
+                            dbc.Row([
+                                dbc.Col([
+                                    html.Div([
+                                        html.H4("Modbus-Statistik", style={'color': '#ff4444', 'fontSize': '16px', 'marginBottom': '20px', 'fontWeight': '600'}),
+                                        html.Div(id='modbus-metrics-panel', children="---", style={'color': '#888', 'fontSize': '13px'}),
+                                        html.Small("Maschinenlesbar: /api/modbus-metrics", style={'color': '#555', 'fontSize': '11px'}),
+                                        dcc.Interval(id='modbus-metrics-interval', interval=2000, n_intervals=0)
+                                    ], className="card-dark", style={'padding': '30px', 'border': '1px solid #ff4444'})
+                                ], width=12)
+                            ], style={'marginTop': '20px'}),
+
                             # Log-Fenster (Debug-Level)
                             dbc.Row([
                                 dbc.Col([
@@ -1135,7 +1495,7 @@ app.layout = html.Div([
     dcc.Store(id='update-interval-store', data=config.get('update_interval_ms', 1000)),
     dcc.Store(id='startup-step', data=0),
     dcc.Store(id='settings-authenticated', data=False),
-    dcc.Store(id='simulator-mode-store', data=SIMULATOR_MODE),
+    dcc.Store(id='simulator-mode-store', data=simulator_active()),
     # Stores für Koppelschalter (global, damit Callbacks funktionieren)
     dcc.Store(id='coupling-unlock-timestamp', data=0),
     dcc.Store(id='coupling-timeout-store', data=config.get('coupling_unlock_timeout', 30)),
@@ -1228,13 +1588,14 @@ def save_passwords(n_clicks, general_pw, hypervisor_pw):
         cfg = get_config_manager()
         saved = False
 
-        if general_pw and len(general_pw) >= 4:
-            cfg.set('passwords.general', general_pw)
-            saved = True
+        with cfg.batch():
+            if general_pw and len(general_pw) >= 4:
+                cfg.set('passwords.general', general_pw)
+                saved = True
 
-        if hypervisor_pw and len(hypervisor_pw) >= 4:
-            cfg.set('passwords.hypervisor', hypervisor_pw)
-            saved = True
+            if hypervisor_pw and len(hypervisor_pw) >= 4:
+                cfg.set('passwords.hypervisor', hypervisor_pw)
+                saved = True
 
         if saved:
             return html.Div("Passwörter erfolgreich gespeichert!",
@@ -1256,11 +1617,12 @@ def save_admin_settings(n_clicks, coupling_timeout, modbus_timeout):
     if n_clicks:
         cfg = get_config_manager()
 
-        if coupling_timeout and 5 <= int(coupling_timeout) <= 300:
-            cfg.set('coupling_unlock_timeout', int(coupling_timeout))
+        with cfg.batch():
+            if coupling_timeout and 5 <= int(coupling_timeout) <= 300:
+                cfg.set('coupling_unlock_timeout', int(coupling_timeout))
 
-        if modbus_timeout and 5 <= int(modbus_timeout) <= 120:
-            cfg.set('modbus_timeout', int(modbus_timeout))
+            if modbus_timeout and 5 <= int(modbus_timeout) <= 120:
+                cfg.set('modbus_timeout', int(modbus_timeout))
 
         return html.Div("Admin-Einstellungen gespeichert!",
                       style={'color': '#00ff88', 'padding': '10px', 'background': 'rgba(0,255,136,0.1)', 'borderRadius': '6px'})
@@ -1274,17 +1636,12 @@ def save_admin_settings(n_clicks, coupling_timeout, modbus_timeout):
     prevent_initial_call=True
 )
 def toggle_simulator_mode(value):
-    global SIMULATOR_MODE, mra4
-
-    SIMULATOR_MODE = value
-
-    # Modbus Client neu initialisieren
+    # Modbus Client im Erfassungs-Prozess neu initialisieren
     try:
-        mra4.disconnect()
-    except:
-        pass
-
-    mra4 = init_modbus_client()
+        acq.execute('set_simulator', value)
+    except Exception as e:
+        app_logger.error(f"Fehler beim Umschalten des Simulator Modus: {e}")
+        return no_update, f"Fehler beim Umschalten: {e}"
 
     status_text = "Simulator Modus aktiviert - Simulierte Werte werden angezeigt" if value else "Simulator Modus deaktiviert - Echte Modbus-Verbindung"
     return value, status_text
@@ -1318,8 +1675,7 @@ def toggle_coupling_modal(unlock_clicks, confirm_clicks, cancel_clicks, is_open)
     [Input('coupling-password-modal', 'is_open')]
 )
 def update_coupling_timeout_info(is_open):
-    cfg = get_config_manager()
-    timeout = cfg.get('coupling_unlock_timeout', 30)
+    timeout = CFG_COUPLING_TIMEOUT()
     return f"Nach erfolgreicher Eingabe ist der Schalter für {timeout} Sekunden bedienbar."
 
 # Coupling Switch - Passwort prüfen und freischalten
@@ -1359,7 +1715,7 @@ def verify_coupling_password(n_clicks, password):
 )
 def update_coupling_unlock_status(n_intervals, unlock_timestamp, timeout):
     if timeout is None:
-        timeout = config.get('coupling_unlock_timeout', 30)
+        timeout = CFG_COUPLING_TIMEOUT()
 
     if unlock_timestamp and unlock_timestamp > 0:
         elapsed = time.time() - unlock_timestamp
@@ -1389,11 +1745,11 @@ def update_coupling_unlock_status(n_intervals, unlock_timestamp, timeout):
 def update_coupling_switch(button_pressed, n, unlock_timestamp, timeout):
     ctx = callback_context
     if timeout is None:
-        timeout = config.get('coupling_unlock_timeout', 30)
+        timeout = CFG_COUPLING_TIMEOUT()
 
-    # Daten vom MRA4 lesen
-    data = mra4.read_all_data()
-    di_status = data.get('di_status', False)
+    # Letzten Snapshot der Datenerfassung lesen
+    data = acq.latest().data
+    di_status = data.get('di_status') or False
 
     # Prüfen welcher Input den Callback ausgelöst hat
     if ctx.triggered:
@@ -1409,7 +1765,7 @@ def update_coupling_switch(button_pressed, n, unlock_timestamp, timeout):
                         # 2-Sekunden-Impuls in separatem Thread senden
                         import threading
                         def send_pulse():
-                            success = mra4.send_coupling_pulse(duration=2.0)
+                            success = acq.execute('coupling_pulse', duration=2.0)
                             if success:
                                 app_logger.info("Koppelschalter 2s-Impuls gesendet")
                             else:
@@ -1438,20 +1794,57 @@ def update_fault_recording_switch(button_pressed, n):
 
         if trigger_id == 'fault-recording-switch':
             # Button wurde gedrückt - Leittechnik-Befehl 3 schalten
-            success = mra4.write_fault_recording_trigger(button_pressed)
+            success = acq.execute('write_fault_recording_trigger', button_pressed)
             if success:
                 app_logger.info(f"Störschrieb-Trigger auf {'EIN' if button_pressed else 'AUS'} gesetzt")
             else:
                 app_logger.error("Fehler beim Setzen des Störschrieb-Triggers")
             return button_pressed
 
-    # Interval-Update: Status vom Gerät lesen
-    try:
-        status = mra4.read_fault_recording_status()
-        return status if status is not None else False
-    except:
-        return False
-
+    # Interval-Update: Status aus dem Snapshot
+    status = acq.latest().data.get('fault_recording')
+    return status if status is not None else False
+
+
+def _trend_figure(x, series, unit, markers=()):
+    """Verlaufsgraph (Spannung/Strom/Leistung) aus Historien-Listen bauen"""
+    fig = go.Figure()
+    for name, values, color, width in series:
+        fig.add_trace(go.Scatter(x=x, y=values, name=name,
+                                 line=dict(color=color, width=width, shape='spline'), mode='lines'))
+    # Wechsel der Datenquelle (neue IP, Simulator) markieren
+    for label in markers:
+        fig.add_vline(x=label, line=dict(color='#ff9800', width=1, dash='dot'))
+    fig.update_layout(
+        paper_bgcolor='#1a1a1a',
+        plot_bgcolor='#0f0f0f',
+        font=dict(color='#888', size=11),
+        xaxis=dict(showgrid=True, gridcolor='#222', title=''),
+        yaxis=dict(showgrid=True, gridcolor='#222', title=unit),
+        margin=dict(l=40, r=10, t=10, b=30),
+        legend=dict(x=0.02, y=0.98, bgcolor='rgba(0,0,0,0.7)', font=dict(size=10)),
+        showlegend=True
+    )
+    return fig
+
+def build_trend_figures(points):
+    """
+    Spannungs-, Strom- und Leistungs-Graph für die letzten `points` Werte
+
+    Returns:
+        Figuren als fertige JSON-Struktur (to_plotly_json) - Dash kodiert sie pro Sitzung nur noch,
+        ohne go.Figure erneut zu kopieren und zu prüfen
+    """
+    history = acq.history(points)
+    x = history['time']
+    markers = history.get('markers', ())
+    phase_colors = (('L1', '#4CAF50'), ('L2', '#2196F3'), ('L3', '#FF9800'))
+
+    voltage_fig = _trend_figure(x, [(p, history['voltage'][p], c, 2) for p, c in phase_colors], 'V', markers)
+    current_fig = _trend_figure(x, [(p, history['current'][p], c, 2) for p, c in phase_colors], 'A', markers)
+    power_fig = _trend_figure(x, [(p, history['power'][p], c, 2) for p, c in phase_colors]
+                              + [('S', history['power']['total'], '#FFC107', 2.5)], 'kW', markers)
+    return voltage_fig.to_plotly_json(), current_fig.to_plotly_json(), power_fig.to_plotly_json()
 
 # Daten-Update Callback
 @app.callback(
@@ -1477,84 +1870,20 @@ def update_fault_recording_switch(button_pressed, n):
     [State('max-power-store', 'data')]
 )
 def update_metrics(n, max_power_from_store):
-    # Daten vom MRA4 lesen
-    data = mra4.read_all_data()
-
-    # Zeitstempel hinzufügen
-    current_time = datetime.now().strftime('%H:%M:%S')
-    time_data.append(current_time)
-
-    # Daten zu Buffer hinzufügen
-    for phase in ['L1', 'L2', 'L3']:
-        voltage_data[phase].append(data['voltage'][phase] or 0)
-        current_data[phase].append(data['current'][phase] or 0)
-        power_data[phase].append((data['power'][phase] or 0) / 1000)  # Convert W to kW
-    power_data['total'].append((data['power']['total'] or 0) / 1000)  # Convert W to kW
-
-    # Spannungs-Graph
-    voltage_fig = go.Figure()
-    voltage_fig.add_trace(go.Scatter(x=list(time_data), y=list(voltage_data['L1']),
-                                     name='L1', line=dict(color='#4CAF50', width=2, shape='spline'), mode='lines'))
-    voltage_fig.add_trace(go.Scatter(x=list(time_data), y=list(voltage_data['L2']),
-                                     name='L2', line=dict(color='#2196F3', width=2, shape='spline'), mode='lines'))
-    voltage_fig.add_trace(go.Scatter(x=list(time_data), y=list(voltage_data['L3']),
-                                     name='L3', line=dict(color='#FF9800', width=2, shape='spline'), mode='lines'))
-    voltage_fig.update_layout(
-        paper_bgcolor='#1a1a1a',
-        plot_bgcolor='#0f0f0f',
-        font=dict(color='#888', size=11),
-        xaxis=dict(showgrid=True, gridcolor='#222', title=''),
-        yaxis=dict(showgrid=True, gridcolor='#222', title='V'),
-        margin=dict(l=40, r=10, t=10, b=30),
-        legend=dict(x=0.02, y=0.98, bgcolor='rgba(0,0,0,0.7)', font=dict(size=10)),
-        showlegend=True
-    )
+    # Letzten Snapshot der Datenerfassung lesen (kein Modbus-Zugriff im Callback)
+    snapshot = acq.latest()
+    data = snapshot.data
 
-    # Strom-Graph
-    current_fig = go.Figure()
-    current_fig.add_trace(go.Scatter(x=list(time_data), y=list(current_data['L1']),
-                                     name='L1', line=dict(color='#4CAF50', width=2, shape='spline'), mode='lines'))
-    current_fig.add_trace(go.Scatter(x=list(time_data), y=list(current_data['L2']),
-                                     name='L2', line=dict(color='#2196F3', width=2, shape='spline'), mode='lines'))
-    current_fig.add_trace(go.Scatter(x=list(time_data), y=list(current_data['L3']),
-                                     name='L3', line=dict(color='#FF9800', width=2, shape='spline'), mode='lines'))
-    current_fig.update_layout(
-        paper_bgcolor='#1a1a1a',
-        plot_bgcolor='#0f0f0f',
-        font=dict(color='#888', size=11),
-        xaxis=dict(showgrid=True, gridcolor='#222', title=''),
-        yaxis=dict(showgrid=True, gridcolor='#222', title='A'),
-        margin=dict(l=40, r=10, t=10, b=30),
-        legend=dict(x=0.02, y=0.98, bgcolor='rgba(0,0,0,0.7)', font=dict(size=10)),
-        showlegend=True
-    )
-
-    # Leistungs-Graph
-    power_fig = go.Figure()
-    power_fig.add_trace(go.Scatter(x=list(time_data), y=list(power_data['L1']),
-                                   name='L1', line=dict(color='#4CAF50', width=2, shape='spline'), mode='lines'))
-    power_fig.add_trace(go.Scatter(x=list(time_data), y=list(power_data['L2']),
-                                   name='L2', line=dict(color='#2196F3', width=2, shape='spline'), mode='lines'))
-    power_fig.add_trace(go.Scatter(x=list(time_data), y=list(power_data['L3']),
-                                   name='L3', line=dict(color='#FF9800', width=2, shape='spline'), mode='lines'))
-    power_fig.add_trace(go.Scatter(x=list(time_data), y=list(power_data['total']),
-                                   name='S', line=dict(color='#FFC107', width=2.5, shape='spline'), mode='lines'))
-    power_fig.update_layout(
-        paper_bgcolor='#1a1a1a',
-        plot_bgcolor='#0f0f0f',
-        font=dict(color='#888', size=11),
-        xaxis=dict(showgrid=True, gridcolor='#222', title=''),
-        yaxis=dict(showgrid=True, gridcolor='#222', title='kW'),
-        margin=dict(l=40, r=10, t=10, b=30),
-        legend=dict(x=0.02, y=0.98, bgcolor='rgba(0,0,0,0.7)', font=dict(size=10)),
-        showlegend=True
-    )
+    # Graphen einmal pro Snapshot bauen und für alle Sitzungen wiederverwenden
+    points = history_window_points()
+    voltage_fig, current_fig, power_fig = render_cache.get_or_build(
+        (snapshot.seq, 'trend-figures', points), lambda: build_trend_figures(points))
 
     # Status-Texte
     freq_text = f"{data['frequency']:.1f} Hz" if data['frequency'] else "-- Hz"
-    status_text = "SIMULATOR" if SIMULATOR_MODE else ("ONLINE" if mra4.connected else "OFFLINE")
+    status_text = "SIMULATOR" if simulator_active() else ("ONLINE" if snapshot.connected else "OFFLINE")
 
-    # Warnung bei 90% Leistung und Gauge-Farbe
+    # Gauge-Farbe
     total_power_kw = (data['power']['total'] or 0) / 1000
     max_power = max_power_from_store if max_power_from_store else MAX_POWER_KW
     power_percentage = (total_power_kw / max_power) * 100 if max_power > 0 else 0
@@ -1567,21 +1896,8 @@ def update_metrics(n, max_power_from_store):
     else:
         gauge_color = "#F44336"  # Rot (80-100%)
 
-    warning_msg = ''
-    if power_percentage >= 90:
-        warning_msg = html.Div([
-            html.Span("! ", style={'fontSize': '20px', 'marginRight': '8px'}),
-            html.Span(f"WARNUNG: Leistung bei {power_percentage:.0f}%!",
-                     style={'fontSize': '14px', 'fontWeight': '600', 'color': '#FF9800'})
-        ], style={
-            'padding': '12px 20px',
-            'background': 'rgba(255, 152, 0, 0.2)',
-            'border': '2px solid #FF9800',
-            'borderRadius': '6px',
-            'marginTop': '15px',
-            'textAlign': 'center',
-            'animation': 'blink 1s ease-in-out infinite'
-        })
+    # Aktive Alarme der Alarm-Engine (einmal pro Poll in der Datenerfassung ausgewertet)
+    warning_msg = render_cache.get_or_build((snapshot.seq, 'alarms'), lambda: build_alarm_banners(data.get('alarms')))
 
     return (
         f"{data['voltage']['L1'] or 0:.1f} V",
@@ -1604,28 +1920,15 @@ def update_metrics(n, max_power_from_store):
         warning_msg
     )
 
-# Schutz-Status, DI Status und Quittier-Button Update
-@app.callback(
-    [Output('coupling-di-status', 'children'),
-     Output('protection-status-text', 'children'),
-     Output('protection-status-text', 'style'),
-     Output('cot-display', 'children'),
-     Output('fault-number-display', 'children'),
-     Output('acknowledge-section', 'children')],
-    [Input('interval-component', 'n_intervals')],
-    prevent_initial_call=False
-)
-def update_protection_and_di_status(n):
-    # Daten vom MRA4 lesen
-    data = mra4.read_all_data()
-
+def build_protection_view(data):
+    """Schutz-Status, DI Status und Quittier-Bereich aus einem Datensatz bauen"""
     # DI Status (Digitaler Eingang für Koppelschalter-Rückmeldung)
-    di_status = data.get('di_status', False)
+    di_status = data.get('di_status') or False
     di_status_text = "EIN" if di_status else "AUS"
     di_status_color = '#00ff88' if di_status else '#ff4444'
 
     # Schutz-Status
-    prot_status = data.get('protection_status', {})
+    prot_status = data.get('protection_status') or {}
     aktiv = prot_status.get('aktiv', False)
     alarm = prot_status.get('alarm', False)
     ausl = prot_status.get('ausl', False)
@@ -1659,7 +1962,7 @@ def update_protection_and_di_status(n):
     }
 
     # COT Code und Beschreibung
-    cot_code = data.get('cause_of_trip', 0)
+    cot_code = data.get('cause_of_trip') or 0
     cot_description = COT_CODES.get(cot_code, f"Unbekannt ({cot_code})")
 
     if cot_code == 0 or cot_code == 1:
@@ -1691,7 +1994,7 @@ def update_protection_and_di_status(n):
         })
 
     # Störfall-Nummer
-    fault_number = data.get('fault_number', 0)
+    fault_number = data.get('fault_number') or 0
     if fault_number > 0:
         fault_display = html.Span(f"Störfall-Nr: {fault_number}",
                                   style={'color': '#ff9800', 'fontWeight': '600', 'marginLeft': '12px'})
@@ -1728,6 +2031,186 @@ def update_protection_and_di_status(n):
         acknowledge_section
     )
 
+# Schutz-Status, DI Status und Quittier-Button Update
+@app.callback(
+    [Output('coupling-di-status', 'children'),
+     Output('protection-status-text', 'children'),
+     Output('protection-status-text', 'style'),
+     Output('cot-display', 'children'),
+     Output('fault-number-display', 'children'),
+     Output('acknowledge-section', 'children')],
+    [Input('interval-component', 'n_intervals')],
+    prevent_initial_call=False
+)
+def update_protection_and_di_status(n):
+    # Komponenten einmal pro Snapshot bauen und für alle Sitzungen wiederverwenden
+    snapshot = acq.latest()
+    return render_cache.get_or_build((snapshot.seq, 'protection-status'),
+                                     lambda: build_protection_view(snapshot.data))
+
+def _format_kw(value):
+    return '--' if value is None else f"{value:.2f} kW"
+
+
+def build_energy_view(state):
+    """Energiezähler und Leistungsmittelwert unter der Gesamt-Gauge"""
+    if not state:
+        return html.Span("Energiezähler nicht verfügbar", style={'color': '#666', 'fontSize': '11px'})
+    label = {'color': '#888', 'fontSize': '11px', 'fontWeight': '500'}
+    value = {'color': '#fff', 'fontSize': '13px', 'fontWeight': '600'}
+
+    def row(name, text, style=value):
+        return html.Div([html.Span(name, style=label), html.Span(text, style=style)],
+                        style={'display': 'flex', 'justifyContent': 'space-between', 'marginBottom': '3px'})
+
+    minutes = int(state['demand_window_s'] // 60)
+    peak = _format_kw(state['peak_block_kw'])
+    if state['peak_block_at']:
+        peak += f" ({datetime.fromtimestamp(state['peak_block_at']):%d.%m. %H:%M})"
+    rows = [
+        row("Bezug", f"{state['import_kwh']:.3f} kWh"),
+        row("Lieferung", f"{state['export_kwh']:.3f} kWh"),
+        row(f"Mittel {minutes} min", _format_kw(state['demand_kw'])),
+        row("Laufender Block", _format_kw(state['block_kw'])),
+        row("Spitze (Block)", peak),
+    ]
+    if state['quality'] in ('gap', 'invalid') or state['gaps']:
+        color = '#FF9800' if state['quality'] in ('gap', 'invalid') else '#888'
+        rows.append(row("Lücken", f"{state['gaps']} ({state['gap_s'] / 60:.0f} min)",
+                        dict(value, color=color, fontSize='11px')))
+    return html.Div(rows, style={'borderTop': '1px solid #252525', 'paddingTop': '10px', 'textAlign': 'left'})
+
+
+# Farben (Text, Hintergrund) der Alarm-Stufen
+ALARM_COLORS = {
+    'info': ('#00ddff', 'rgba(0, 221, 255, 0.15)'),
+    'warning': ('#FF9800', 'rgba(255, 152, 0, 0.2)'),
+    'critical': ('#F44336', 'rgba(244, 67, 54, 0.2)'),
+}
+
+
+def build_alarm_banners(alarms):
+    """Banner der aktiven Alarme, kritische zuerst"""
+    if not alarms:
+        return ''
+    order = {'critical': 0, 'warning': 1, 'info': 2}
+    banners = []
+    for alarm in sorted(alarms, key=lambda a: (order.get(a['severity'], 1), a['since'] or 0)):
+        color, background = ALARM_COLORS.get(alarm['severity'], ALARM_COLORS['warning'])
+        banners.append(html.Div([
+            html.Span("! ", style={'fontSize': '20px', 'marginRight': '8px'}),
+            html.Span(alarm['message'], style={'fontSize': '14px', 'fontWeight': '600', 'color': color})
+        ], style={
+            'padding': '12px 20px',
+            'background': background,
+            'border': f'2px solid {color}',
+            'borderRadius': '6px',
+            'marginTop': '15px',
+            'textAlign': 'center',
+            'animation': 'blink 1s ease-in-out infinite' if alarm['severity'] != 'info' else 'none'
+        }))
+    return banners
+
+
+# Kanäle der Netzqualitäts-Tabelle: (Kanal, Bezeichnung, Faktor, Einheit, Nachkommastellen)
+QUALITY_ROWS = (
+    [(f'voltage.{phase}', f"U {phase}", 1, 'V', 2) for phase in PHASES]
+    + [(f'current.{phase}', f"I {phase}", 1, 'A', 3) for phase in PHASES]
+    + [('power.total', "P gesamt", 1e-3, 'kW', 2), ('frequency', "f", 1, 'Hz', 3)]
+)
+
+
+def format_window(seconds):
+    seconds = float(seconds)
+    return f"{seconds / 60:g} min" if seconds >= 60 else f"{seconds:g} s"
+
+
+def build_quality_view(state, window):
+    """Unsymmetrie, df/dt und Fensterstatistik (min/Mittel/max/Standardabweichung)"""
+    if not state:
+        return html.Div("Netzqualität nicht verfügbar", style={'color': '#666'})
+
+    def badge(label, value, unit, digits, warn):
+        text = '--' if value is None else f"{value:.{digits}f} {unit}"
+        color = '#FF9800' if value is not None and abs(value) >= warn else '#00ddff'
+        return html.Div([html.Span(label, style={'color': '#888', 'fontSize': '11px', 'marginRight': '8px'}),
+                         html.Span(text, style={'color': color, 'fontSize': '15px', 'fontWeight': '600'})],
+                        style={'marginRight': '30px'})
+
+    badges = html.Div([
+        badge("Unsymmetrie U", state['voltage_unbalance'], '%', 2, 2.0),
+        badge("Unsymmetrie I", state['current_unbalance'], '%', 1, 10.0),
+        badge("df/dt", state['rocof'], 'Hz/s', 3, 0.1),
+    ], style={'display': 'flex', 'marginBottom': '12px'})
+
+    stats = state['windows'].get(window) or {}
+    cell = {'padding': '4px 10px', 'borderBottom': '1px solid #222', 'textAlign': 'right'}
+    header = html.Tr([html.Th(title, style=dict(cell, color='#666')) for title in
+                      ("", "Min", "Mittel", "Max", "Std.-Abw.", "Werte")])
+
+    def number(value, factor, digits):
+        return '--' if value is None else f"{value * factor:.{digits}f}"
+
+    rows = []
+    for name, label, factor, unit, digits in QUALITY_ROWS:
+        summary = stats.get(name)
+        if summary is None:
+            continue
+        rows.append(html.Tr([
+            html.Td(f"{label} [{unit}]", style=dict(cell, textAlign='left', color='#888')),
+            html.Td(number(summary['min'], factor, digits), style=cell),
+            html.Td(number(summary['mean'], factor, digits), style=cell),
+            html.Td(number(summary['max'], factor, digits), style=cell),
+            html.Td(number(summary['std'], factor, digits + 1), style=cell),
+            html.Td(summary['count'], style=dict(cell, color='#666')),
+        ]))
+    return html.Div([
+        badges,
+        html.Table([header] + rows, style={'width': '100%', 'fontFamily': 'Courier New, monospace', 'color': '#ccc', 'fontSize': '13px'}),
+    ])
+
+
+# Netzqualität (Fensterstatistik vom Analysator der Datenerfassung)
+@app.callback(
+    Output('quality-display', 'children'),
+    [Input('interval-component', 'n_intervals'),
+     Input('quality-window', 'value')],
+    prevent_initial_call=False
+)
+def update_quality_display(n, window):
+    # Einmal pro Snapshot und Fenster bauen (im Worker über den Befehlskanal)
+    snapshot = acq.latest()
+
+    def build():
+        try:
+            state = acq.execute('power_quality')
+        except Exception as e:
+            app_logger.debug(f"Netzqualität nicht verfügbar: {e}")
+            state = None
+        return build_quality_view(state, window)
+
+    return render_cache.get_or_build((snapshot.seq, 'quality', window), build)
+
+# Energiezähler unter der Gesamt-Gauge
+@app.callback(
+    Output('energy-display', 'children'),
+    [Input('interval-component', 'n_intervals')],
+    prevent_initial_call=False
+)
+def update_energy_display(n):
+    # Zählerstand einmal pro Snapshot abfragen (im Worker über den Befehlskanal)
+    snapshot = acq.latest()
+
+    def build():
+        try:
+            state = acq.execute('energy_state')
+        except Exception as e:
+            app_logger.debug(f"Energiezähler nicht verfügbar: {e}")
+            state = None
+        return build_energy_view(state)
+
+    return render_cache.get_or_build((snapshot.seq, 'energy'), build)
+
 # Quittier-Button Callback
 @app.callback(
     Output('acknowledge-btn', 'children'),
@@ -1737,7 +2220,7 @@ def update_protection_and_di_status(n):
 def acknowledge_trip(n_clicks):
     if n_clicks:
         # ALLE Quittierungen durchführen (Register 22000-22005)
-        success = mra4.acknowledge_all()
+        success = acq.execute('acknowledge_all')
         if success:
             app_logger.info("Alle Quittierungen erfolgreich durchgeführt")
             return "QUITTIERT ✓"
@@ -1758,25 +2241,19 @@ def acknowledge_trip(n_clicks):
 )
 def update_statusbar(n):
     try:
-        cfg = get_config_manager()
-
         # Verbindungsstatus - zeige sowohl Webserver als auch Modbus
-        try:
-            hostname = socket.gethostname()
-            local_ip = socket.gethostbyname(hostname)
-        except:
-            local_ip = "localhost"
+        local_ip = host_info.resolved_ip
 
-        web_port = 8050
-        modbus_ip = cfg.get('modbus.ip', '192.168.1.100')
-        modbus_port = cfg.get('modbus.port', 502)
+        web_port = WEB_PORT
+        modbus_ip = CFG_MODBUS_IP()
+        modbus_port = CFG_MODBUS_PORT()
 
-        if SIMULATOR_MODE:
+        if simulator_active():
             conn_text = f"Web: {local_ip}:{web_port} | Modbus: SIMULATOR"
             conn_color = '#ff9800'
             health_text = "SIMULATOR OK"
             health_color = '#ff9800'
-        elif mra4.connected:
+        elif acq.latest().connected:
             conn_text = f"Web: {local_ip}:{web_port} | Modbus: {modbus_ip}:{modbus_port}"
             conn_color = '#00ddff'
             health_text = "ONLINE"
@@ -1806,19 +2283,12 @@ def update_statusbar(n):
         app_logger.error(f"Fehler in update_statusbar: {e}")
         return "---", {'color': '#666'}, "---", {'color': '#666'}, "00:00:00"
 
-# TopBar COT-Anzeige (große Anzeige wie Simulator)
-@app.callback(
-    Output('topbar-cot-display', 'children'),
-    [Input('interval-component', 'n_intervals')],
-    prevent_initial_call=True
-)
-def update_topbar_cot(n):
-    # Daten vom MRA4 lesen
-    data = mra4.read_all_data()
-    cot_code = data.get('cause_of_trip', 1)
+def build_topbar_cot(data):
+    """TopBar COT-Anzeige aus einem Datensatz bauen"""
+    cot_code = data.get('cause_of_trip') or 1
     cot_description = COT_CODES.get(cot_code, f"Unbekannt ({cot_code})")
 
-    prot_status = data.get('protection_status', {})
+    prot_status = data.get('protection_status') or {}
     ausl = prot_status.get('ausl', False)
 
     if cot_code == 0 or cot_code == 1:
@@ -1858,6 +2328,17 @@ def update_topbar_cot(n):
             })
         ])
 
+# TopBar COT-Anzeige (große Anzeige wie Simulator)
+@app.callback(
+    Output('topbar-cot-display', 'children'),
+    [Input('interval-component', 'n_intervals')],
+    prevent_initial_call=True
+)
+def update_topbar_cot(n):
+    snapshot = acq.latest()
+    return render_cache.get_or_build((snapshot.seq, 'topbar-cot'),
+                                     lambda: build_topbar_cot(snapshot.data))
+
 # Log-Fenster Update (Normal-Level)
 @app.callback(
     Output('normal-log-display', 'children'),
@@ -1865,11 +2346,9 @@ def update_topbar_cot(n):
     prevent_initial_call=False
 )
 def update_normal_log(n):
-    # Letzte 100 Log-Einträge aus LOG_BUFFER
-    log_lines = []
-    for entry in LOG_BUFFER:
-        log_lines.append(html.Div(entry, style={'marginBottom': '4px'}))
-    return log_lines
+    # Letzte 100 Log-Einträge (ab INFO)
+    return [html.Div(line, style={'marginBottom': '4px'})
+            for line in LOG_RING.lines(limit=100, min_level=logging.INFO)]
 
 # Log-Fenster Update (Debug-Level im Admin-Tab)
 @app.callback(
@@ -1878,11 +2357,9 @@ def update_normal_log(n):
     prevent_initial_call=False
 )
 def update_admin_log(n):
-    # Letzte 500 Log-Einträge aus LOG_BUFFER_DEBUG
-    log_lines = []
-    for entry in LOG_BUFFER_DEBUG:
-        log_lines.append(html.Div(entry, style={'marginBottom': '4px'}))
-    return log_lines
+    # Letzte 500 Log-Einträge (alle Level)
+    return [html.Div(line, style={'marginBottom': '4px'})
+            for line in LOG_RING.lines(limit=500)]
 
 # Admin BA/DI Status Update
 @app.callback(
@@ -1892,13 +2369,149 @@ def update_admin_log(n):
     prevent_initial_call=False
 )
 def update_admin_ba_di_status(n):
-    try:
-        data = mra4.read_all_data()
-        ba_status = data.get('coupling_switch', False)
-        di_status = data.get('di_status', False)
-        return ("EIN" if ba_status else "AUS"), ("EIN" if di_status else "AUS")
-    except:
+    data = acq.latest().data
+    ba_status = data.get('coupling_switch')
+    di_status = data.get('di_status')
+    if ba_status is None and di_status is None:
         return "---", "---"
+    return ("EIN" if ba_status else "AUS"), ("EIN" if di_status else "AUS")
+
+def _format_us(value):
+    if value is None:
+        return "> 1 s"
+    return f"{value / 1000:.1f} ms" if value >= 1000 else f"{value:.0f} µs"
+
+def build_modbus_metrics_panel(metrics):
+    """Tabelle der Modbus-Transaktionsmetriken für den Admin-Tab"""
+    if not metrics or not metrics['requests']:
+        return html.Div("Noch keine Modbus-Anfragen (Simulator aktiv oder keine Verbindung)")
+    cell = {'padding': '4px 10px', 'borderBottom': '1px solid #222', 'textAlign': 'right'}
+    header = html.Tr([html.Th(title, style=dict(cell, color='#666')) for title in
+                      ("FC", "Adresse", "Anzahl", "Anfragen", "Exceptions", "Fehler", "Mittel", "p95", "Max")])
+    rows = [html.Tr([
+        html.Td(row['fc'], style=cell),
+        html.Td(row['address'], style=cell),
+        html.Td(row['count'], style=cell),
+        html.Td(row['requests'], style=cell),
+        html.Td(row['exceptions'], style=dict(cell, color='#ffaa00' if row['exceptions'] else '#888')),
+        html.Td(row['errors'], style=dict(cell, color='#ff4444' if row['errors'] else '#888')),
+        html.Td(_format_us(row['mean_us']), style=cell),
+        html.Td(_format_us(row['p95_us']), style=cell),
+        html.Td(_format_us(row['max_us']), style=cell),
+    ]) for row in metrics['series']]
+    codes = ", ".join(f"FC{c['fc']} Code {c['code']}: {c['count']}x" for c in metrics['exception_codes']) or "keine"
+    since = datetime.fromtimestamp(metrics['since']).strftime('%d.%m.%Y %H:%M:%S')
+    return html.Div([
+        html.Div(f"{metrics['requests']} Anfragen seit {since} - {metrics['errors']} ohne Antwort, "
+                 f"{metrics['exceptions']} Exceptions - gesendet {metrics['tx_bytes'] / 1024:.1f} kB, "
+                 f"empfangen {metrics['rx_bytes'] / 1024:.1f} kB", style={'marginBottom': '10px', 'color': '#00ddff'}),
+        html.Table([header] + rows, style={'width': '100%', 'fontFamily': 'Courier New, monospace', 'color': '#ccc'}),
+        html.Div(f"Exception Codes: {codes}", style={'marginTop': '10px'}),
+    ])
+
+# Admin Modbus-Statistik
+@app.callback(
+    Output('modbus-metrics-panel', 'children'),
+    [Input('modbus-metrics-interval', 'n_intervals')],
+    [State('admin-unlocked', 'data')]
+)
+def update_modbus_metrics(n, admin_unlocked):
+    if not admin_unlocked:
+        return no_update
+    return build_modbus_metrics_panel(acq.execute('modbus_metrics'))
+
+# Export-Link aus Zeitraum, Kanälen und Format zusammensetzen (der Browser lädt direkt vom Server)
+@app.callback(
+    Output('export-link', 'href'),
+    [Input('export-from', 'value'),
+     Input('export-to', 'value'),
+     Input('export-channels', 'value'),
+     Input('export-format', 'value')]
+)
+def update_export_link(start, end, channels, fmt):
+    query = {'format': fmt or 'csv', 'from': start or '', 'to': end or '', 'channels': ','.join(channels or [])}
+    return '/api/export?' + urlencode({key: value for key, value in query.items() if value})
+
+def trip_event_label(event):
+    """Eintrag der Ereignisliste: Zeit, COT und Fehlernummer"""
+    cot = event['cause_of_trip']
+    fault_number = event['fault_number'] if event['fault_number'] is not None else '--'
+    return (f"{datetime.fromtimestamp(event['trip_time']):%Y-%m-%d %H:%M:%S} - "
+            f"{COT_CODES.get(cot, f'COT {cot}')} (Fehler #{fault_number})")
+
+
+def build_trip_event_view(record):
+    """Kopfdaten und Verlauf (U, I, P) einer Auslösung, Zeit relativ zur Auslösung"""
+    samples = record['samples']
+    x = [sample['t'] for sample in samples]
+    phase_colors = (('L1', '#4CAF50'), ('L2', '#2196F3'), ('L3', '#FF9800'))
+
+    def series(group, phase, factor=1):
+        return [None if s['data'][group][phase] is None else s['data'][group][phase] * factor for s in samples]
+
+    def on_off(value):
+        return '--' if value is None else ('EIN' if value else 'AUS')
+
+    cot = record['cause_of_trip']
+    cell = {'padding': '4px 10px', 'borderBottom': '1px solid #222'}
+    rows = [
+        ("Auslösung", f"{datetime.fromtimestamp(record['trip_time']):%Y-%m-%d %H:%M:%S.%f}"[:-3]),
+        ("Ursache (COT 5004)", f"{cot} - {COT_CODES.get(cot, 'Unbekannt')}"),
+        ("Fehlernummer", record['fault_number']),
+        ("Schutz-Status (Reg. 1)", '--' if record['protection_status'] is None else f"0x{record['protection_status']:04X}"),
+        ("DI 1", on_off(record['di_status'])),
+        ("BA / Leittechnik-Bef 1", on_off(record['coupling_switch'])),
+        ("Messpunkte", f"{len(samples)} ({record['pre_s']:g} s vor, {record['post_s']:g} s nach)"),
+    ]
+    summary = html.Table([html.Tr([html.Td(label, style=dict(cell, color='#888')), html.Td(value, style=cell)])
+                          for label, value in rows],
+                         style={'width': '100%', 'fontFamily': 'Courier New, monospace', 'color': '#ccc', 'fontSize': '13px'})
+
+    graphs = [
+        _trend_figure(x, [(p, series('voltage', p), c, 2) for p, c in phase_colors], 'V', (0,)),
+        _trend_figure(x, [(p, series('current', p), c, 2) for p, c in phase_colors], 'A', (0,)),
+        _trend_figure(x, [(p, series('power', p, 1e-3), c, 2) for p, c in phase_colors]
+                      + [('S', series('power', 'total', 1e-3), '#FFC107', 2.5)], 'kW', (0,)),
+    ]
+    return html.Div([html.H4(COT_CODES.get(cot, f"COT {cot}"), className="neon-cyan"), summary]
+                    + [dcc.Graph(figure=fig, config={'displayModeBar': False}, style={'height': '220px', 'marginTop': '15px'})
+                       for fig in graphs])
+
+# Ereignisliste beim Öffnen des Tabs oder auf Knopfdruck neu einlesen (Dateien des Ereignisrekorders)
+@app.callback(
+    [Output('trip-event-select', 'options'),
+     Output('trip-event-select', 'value')],
+    [Input('settings-tabs', 'active_tab'),
+     Input('trip-refresh-btn', 'n_clicks')],
+    [State('trip-event-select', 'value')]
+)
+def update_trip_event_list(active_tab, n_clicks, selected):
+    if active_tab != 'tab-trips':
+        return no_update, no_update
+    events = trip_recorder.list_events() if trip_recorder is not None else list_events(TRIP_DIR, trip_summaries)
+    names = [event['name'] for event in events]
+    options = [{'label': trip_event_label(event), 'value': event['name']} for event in events]
+    return options, selected if selected in names else (names[0] if names else None)
+
+# Ausgewählte Auslösung anzeigen
+@app.callback(
+    Output('trip-event-detail', 'children'),
+    [Input('trip-event-select', 'value')]
+)
+def show_trip_event(name):
+    if not name:
+        return html.P("Noch keine Auslösung aufgezeichnet.", style={'color': '#666'})
+    try:
+        record = load_event(os.path.join(TRIP_DIR, os.path.basename(name)))
+    except (OSError, ValueError) as e:
+        app_logger.warning(f"Auslösung {name} nicht lesbar: {e}")
+        return html.P(f"Ereignis nicht lesbar: {e}", style={'color': '#ff4444'})
+    return build_trip_event_view(record)
+
+# Transaktionsmetriken maschinenlesbar (JSON)
+@app.server.route('/api/modbus-metrics')
+def modbus_metrics_endpoint():
+    return flask.jsonify(acq.execute('modbus_metrics') or {})
 
 # Einstellungen übernehmen
 @app.callback(
@@ -1913,22 +2526,23 @@ def apply_settings(n_clicks, max_power_kw, interval_ms, graph_history):
     if n_clicks:
         cfg = get_config_manager()
 
-        if max_power_kw and float(max_power_kw) > 0:
-            cfg.set('max_power_kw', float(max_power_kw))
+        # Eine Transaktion - wird zusammen mit save_settings verzögert einmal gespeichert
+        with cfg.batch():
+            if max_power_kw and float(max_power_kw) > 0:
+                cfg.set('max_power_kw', float(max_power_kw))
 
-        if interval_ms and int(interval_ms) > 0:
-            cfg.set('update_interval_ms', int(interval_ms))
+            if interval_ms and int(interval_ms) > 0:
+                cfg.set('update_interval_ms', int(interval_ms))
 
-        if graph_history and int(graph_history) > 0:
-            cfg.set('graph_history_seconds', int(graph_history))
+            if graph_history and int(graph_history) > 0:
+                cfg.set('graph_history_seconds', int(graph_history))
 
         new_max_power = cfg.get('max_power_kw', MAX_POWER_KW)
         new_interval = cfg.get('update_interval_ms', 1000)
 
         return new_max_power, new_interval
 
-    cfg = get_config_manager()
-    return cfg.get('max_power_kw', MAX_POWER_KW), cfg.get('update_interval_ms', 1000)
+    return CFG_MAX_POWER_KW(), CFG_UPDATE_INTERVAL_MS()
 
 # Update Intervall aktualisieren
 @app.callback(
@@ -1990,6 +2604,7 @@ def test_connection(n_clicks, ip, port, unit):
 
     try:
         # Teste echte Verbindung
+        from pymodbus.client import ModbusTcpClient
         test_client = ModbusTcpClient(host=ip, port=int(port))
         connected = test_client.connect()
         test_client.close()
@@ -2021,19 +2636,65 @@ def save_settings(n_clicks, ip, port, unit, interval, history, max_power):
     try:
         # Konfiguration aktualisieren
         cfg_manager = get_config_manager()
-        cfg_manager.set('modbus.ip', ip)
-        cfg_manager.set('modbus.port', int(port))
-        cfg_manager.set('modbus.unit_id', int(unit))
-        cfg_manager.set('update_interval_ms', int(interval))
-        cfg_manager.set('graph_history_seconds', int(history))
-        cfg_manager.set('max_power_kw', float(max_power))
-
-        return html.Div("Einstellungen gespeichert!",
+        with cfg_manager.batch():
+            cfg_manager.set('modbus.ip', ip)
+            cfg_manager.set('modbus.port', int(port))
+            cfg_manager.set('modbus.unit_id', int(unit))
+            cfg_manager.set('update_interval_ms', int(interval))
+            cfg_manager.set('graph_history_seconds', int(history))
+            cfg_manager.set('max_power_kw', float(max_power))
+
+        return html.Div("Einstellungen gespeichert! Geänderte Modbus-Verbindung wird ohne Neustart übernommen.",
                       style={'color': '#00ff88', 'padding': '10px', 'background': 'rgba(0,255,136,0.1)', 'borderRadius': '6px', 'marginTop': '15px'})
     except Exception as e:
         return html.Div(f"Fehler beim Speichern: {str(e)}",
                       style={'color': '#ff4444', 'padding': '10px', 'background': 'rgba(255,68,68,0.1)', 'borderRadius': '6px', 'marginTop': '15px'})
 
+def run_multi_worker(workers, port):
+    """
+    Dashboard mit mehreren Web-Worker-Prozessen ausliefern (gunicorn, nur POSIX)
+
+    Dieser Prozess bleibt der einzige Modbus-Client: er pollt das Gerät,
+    schreibt jeden Snapshot ins Shared Memory und führt die Befehle der
+    Worker aus. Die Worker lesen nur den Snapshot.
+
+    Args:
+        workers: Anzahl Web-Worker
+        port: HTTP-Port
+    """
+    import secrets
+    import subprocess
+    from shm_snapshot import SharedSnapshotWriter, CommandServer
+
+    if getattr(sys, 'frozen', False):
+        app_logger.error("Multi-Worker-Betrieb ist in der .exe nicht verfügbar - starte mit einem Prozess")
+        app.run(debug=False, host='0.0.0.0', port=port)
+        return
+
+    writer = SharedSnapshotWriter(capacity=acq.history_points)
+    authkey = secrets.token_hex(16)
+    command_server = CommandServer(acq, authkey=authkey.encode())
+    command_server.start()
+    writer.publish(acq.latest())
+    acq.add_listener(writer.publish)
+
+    env = dict(os.environ,
+               MRA4_SHM_NAME=writer.name,
+               MRA4_CMD_ADDRESS=f"{command_server.address[0]}:{command_server.address[1]}",
+               MRA4_CMD_AUTHKEY=authkey)
+    if RECORD_DIR:
+        env['MRA4_RECORD_DIR'] = RECORD_DIR   # Export in den Workern liest die Aufzeichnungen
+    cmd = [sys.executable, '-m', 'gunicorn', '-w', str(workers), '-b', f'0.0.0.0:{port}', 'wsgi:server']
+    app_logger.info(f"Starte {workers} Web-Worker: {' '.join(cmd)}")
+    try:
+        subprocess.call(cmd, env=env, cwd=os.path.dirname(os.path.abspath(__file__)))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        acq.stop()
+        command_server.close()
+        writer.close()
+
 if __name__ == '__main__':
     # Setze Windows-Icon für Taskleiste und Fenster
     try:
@@ -2087,7 +2748,7 @@ if __name__ == '__main__':
     # Dashboard-URL anzeigen
     local_ip = get_local_ip()
     hostname = get_hostname()
-    port = 8050
+    port = WEB_PORT
 
     print("\n" + "="*60)
     print("  MRA 4 ENERGIEMONITORING DASHBOARD")
@@ -2104,4 +2765,25 @@ if __name__ == '__main__':
     print(f"  Simulator Modus: {'Ja' if SIMULATOR_MODE else 'Nein'}")
     print("\n" + "="*60 + "\n")
 
-    app.run(debug=False, host='0.0.0.0', port=port)
+    if startup_profile.enabled():
+        startup_profile.uninstall()
+        startup_profile.report(app_logger)
+
+        first_response = []
+
+        @app.server.after_request
+        def _log_first_response(response):
+            if not first_response:
+                first_response.append(True)
+                app_logger.info(f"Startprofil: erste Antwort nach {startup_profile.elapsed_since_start() * 1000:.0f} ms")
+            return response
+
+    if WEB_WORKERS > 1:
+        import importlib.util
+        if importlib.util.find_spec('gunicorn') is None:
+            app_logger.error("gunicorn ist nicht installiert - Multi-Worker-Betrieb nicht möglich, starte mit einem Prozess")
+            app.run(debug=False, host='0.0.0.0', port=port)
+        else:
+            run_multi_worker(WEB_WORKERS, port)
+    else:
+        app.run(debug=False, host='0.0.0.0', port=port)
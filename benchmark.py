@@ -0,0 +1,454 @@
+"""
+End-to-End Benchmark für Datenerfassung und Dashboard-Callbacks
+
+Läuft komplett auf localhost gegen den MRA4 Emulator (kein Gerät nötig):
+
+    python benchmark.py                          # Ergebnis nach bench_results/
+    python benchmark.py --duration 60 --memory-cycles 5000   # langer Lauf
+    python benchmark.py --compare bench_results/alt.json   # Exit-Code 1 bei Regression
+
+Gemessen werden:
+    acquisition  Polls pro Sekunde, Latenz pro Zyklus (Perzentile),
+                 Modbus-Anfragen pro Zyklus (Zähler des Emulators)
+    decode       Zeit für decode_registers() pro Zyklus
+    callbacks    Antwortzeit und Payload-Größe aller Interval-Callbacks
+                 (update_metrics usw.) über /_dash-update-component - einmal
+                 direkt nach einem neuen Snapshot (cold) und für eine zweite
+                 Sitzung mit demselben Snapshot (warm)
+    memory       Speicherzuwachs (tracemalloc, RSS) über viele Zyklen
+
+Die Hilfsfunktionen für Dash-Anfragen (interval_requests usw.) erzeugen die
+Anfragen so, wie sie der Browser auf der Dashboard-Seite sendet - sie werden
+auch vom Lastgenerator verwendet.
+"""
+import argparse
+import gc
+import json
+import logging
+import os
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+INTERVAL_TRIGGER = 'interval-component.n_intervals'
+
+# Kennzahlen für --compare: (Pfad, True = höher ist besser)
+KEY_METRICS = (
+    ('acquisition.polls_per_s', True),
+    ('acquisition.latency_ms.p50', False),
+    ('acquisition.latency_ms.p95', False),
+    ('acquisition.requests_per_cycle', False),
+    ('decode.us_per_call', False),
+    ('memory.growth_kb_per_1000_cycles', False),
+)
+CALLBACK_METRICS = (('cold_ms.p50', False), ('warm_ms.p50', False), ('payload_bytes', False))
+
+
+def percentiles(values):
+    """Perzentile einer Messreihe (gleiche Einheit wie values)"""
+    if not values:
+        return {}
+    ordered = sorted(values)
+    n = len(ordered)
+
+    def pick(q):
+        return round(ordered[min(n - 1, int(q * n))], 4)
+
+    return {
+        'p50': pick(0.50), 'p90': pick(0.90), 'p95': pick(0.95), 'p99': pick(0.99),
+        'max': round(ordered[-1], 4), 'mean': round(sum(ordered) / n, 4), 'n': n,
+    }
+
+
+# ---------------------------------------------------------------------------
+# Dash-Anfragen wie im Browser
+# ---------------------------------------------------------------------------
+
+def parse_output(spec):
+    """Output-Spezifikation aus /_dash-dependencies in [(id, property), ...] zerlegen"""
+    if spec.startswith('..'):
+        return [tuple(part.rsplit('.', 1)) for part in spec[2:-2].split('...')]
+    return [tuple(spec.rsplit('.', 1))]
+
+
+def collect_props(tree, props=None):
+    """Props aller Komponenten mit id aus einem Layout-Baum (JSON) sammeln"""
+    if props is None:
+        props = {}
+    if isinstance(tree, list):
+        for item in tree:
+            collect_props(item, props)
+    elif isinstance(tree, dict):
+        component = tree.get('props')
+        if isinstance(component, dict):
+            if isinstance(component.get('id'), str):
+                props[component['id']] = component
+            collect_props(component.get('children'), props)
+    return props
+
+
+def build_request(dependency, props, changed=None, overrides=None):
+    """
+    Anfrage-Body für /_dash-update-component
+
+    Args:
+        dependency: Eintrag aus /_dash-dependencies
+        props: Props pro Komponenten-id (collect_props)
+        changed: auslösende Property ('id.property')
+        overrides: {(id, property): Wert} statt der Werte aus dem Layout
+    """
+    overrides = overrides or {}
+
+    def value(item):
+        key = (item['id'], item['property'])
+        if key in overrides:
+            return overrides[key]
+        return props.get(item['id'], {}).get(item['property'])
+
+    outputs = [{'id': cid, 'property': prop} for cid, prop in parse_output(dependency['output'])]
+    return {
+        'output': dependency['output'],
+        'outputs': outputs if dependency['output'].startswith('..') else outputs[0],
+        'inputs': [dict(item, value=value(item)) for item in dependency['inputs']],
+        'changedPropIds': [changed] if changed else [],
+        'state': [dict(item, value=value(item)) for item in dependency.get('state', [])],
+    }
+
+
+def request_label(body):
+    """Kurzname einer Anfrage: erster Output und Anzahl weiterer Outputs"""
+    outputs = body['outputs'] if isinstance(body['outputs'], list) else [body['outputs']]
+    label = f"{outputs[0]['id']}.{outputs[0]['property']}"
+    return f"{label} (+{len(outputs) - 1})" if len(outputs) > 1 else label
+
+
+def interval_requests(get, post, trigger=INTERVAL_TRIGGER, pathname='/'):
+    """
+    Alle Anfragen, die der Browser pro Interval-Tick der Dashboard-Seite sendet
+
+    Args:
+        get: Funktion(pfad) -> bytes
+        post: Funktion(pfad, body) -> (status, bytes)
+        trigger: auslösende Property
+        pathname: Seite, deren Layout geladen wird
+
+    Returns:
+        Liste von Anfrage-Bodies (enthält auch Stores wie max-power-store)
+    """
+    dependencies = json.loads(get('/_dash-dependencies'))
+    props = collect_props(json.loads(get('/_dash-layout')))
+
+    # Seite über den Routing-Callback laden - wie der Browser nach dem Startbildschirm
+    routing = next(d for d in dependencies if d['output'] == 'page-content.children')
+    body = build_request(routing, props, changed='url.pathname',
+                         overrides={('url', 'pathname'): pathname, ('startup-interval', 'n_intervals'): 12})
+    status, payload = post('/_dash-update-component', body)
+    if status != 200:
+        raise RuntimeError(f"Seite {pathname} konnte nicht geladen werden (HTTP {status})")
+    collect_props(json.loads(payload)['response']['page-content']['children'], props)
+
+    requests = []
+    for dependency in dependencies:
+        if dependency.get('clientside_function'):
+            continue
+        if trigger not in [f"{i['id']}.{i['property']}" for i in dependency['inputs']]:
+            continue
+        cid, prop = trigger.rsplit('.', 1)
+        requests.append(build_request(dependency, props, changed=trigger, overrides={(cid, prop): 1}))
+    return requests
+
+
+# ---------------------------------------------------------------------------
+# Messungen
+# ---------------------------------------------------------------------------
+
+def _modbus_requests(emulator):
+    return sum(count for key, count in emulator.stats.items() if key.startswith('fc'))
+
+
+def bench_acquisition(emulator, port, duration_s):
+    """Polls pro Sekunde, Latenz und Anfragen pro Zyklus gegen den Emulator"""
+    from acquisition import AcquisitionService
+    from modbus_client import MRA4Client, decode_registers
+
+    client = MRA4Client(host='127.0.0.1', port=port, unit_id=1)
+    acq = AcquisitionService(client, interval_s=0)
+    acq.poll_once()   # Verbindungsaufbau nicht mitmessen
+    raw = client.read_raw_registers()
+
+    requests_before = _modbus_requests(emulator)
+    latencies = []
+    started = time.perf_counter()
+    while time.perf_counter() - started < duration_s:
+        t0 = time.perf_counter()
+        acq.poll_once()
+        latencies.append((time.perf_counter() - t0) * 1000)
+    elapsed = time.perf_counter() - started
+    cycles = len(latencies)
+    requests = _modbus_requests(emulator) - requests_before
+    client.disconnect()
+
+    # Dekodieren allein (ohne Netzwerk)
+    iterations = 20000
+    t0 = time.perf_counter()
+    for _ in range(iterations):
+        decode_registers(raw)
+    decode_us = (time.perf_counter() - t0) / iterations * 1e6
+
+    return {
+        'cycles': cycles,
+        'polls_per_s': round(cycles / elapsed, 2),
+        'latency_ms': percentiles(latencies),
+        'requests_per_cycle': round(requests / cycles, 2) if cycles else None,
+        'block_read': client.block_read,
+    }, {'us_per_call': round(decode_us, 2), 'iterations': iterations}
+
+
+def _load_app(port):
+    """
+    Dashboard headless importieren und die Datenerfassung auf den Emulator umstellen
+
+    Der Import startet im Simulator Modus (kein Zugriff auf das konfigurierte
+    Gerät) mit einer frischen Standard-Konfiguration in einem temporären
+    Daten- und Arbeitsverzeichnis - config.json des Projekts (Gateway,
+    Alarmregeln, Passwörter) wird weder gelesen noch angelegt, Historie,
+    Energiezähler und Ereignisse des Benchmarks landen nicht im Projekt.
+    """
+    import tempfile
+
+    os.environ['MRA4_HEADLESS'] = '1'
+    os.environ['MRA4_DATA_DIR'] = tempfile.mkdtemp(prefix='mra4_bench_')
+    os.environ['MRA4_CONFIG_FILE'] = os.path.join(os.environ['MRA4_DATA_DIR'], 'config.json')
+    for name in ('MRA4_REPLAY', 'MRA4_SHM_NAME', 'MRA4_RECORD_DIR', 'MRA4_SIM_SCENARIO'):
+        os.environ.pop(name, None)
+    sys.argv = [sys.argv[0], '--headless', '--simulator']
+    os.chdir(os.environ['MRA4_DATA_DIR'])
+    import app as dashboard
+    from modbus_client import MRA4Client
+
+    dashboard.acq.stop()
+    dashboard.acq.set_client(MRA4Client(host='127.0.0.1', port=port, unit_id=1),
+                             description=f"Emulator 127.0.0.1:{port}")
+    dashboard.acq.poll_once()
+    client = dashboard.app.server.test_client()
+
+    def get(path):
+        return client.get(path).data
+
+    def post(path, body):
+        response = client.post(path, json=body)
+        return response.status_code, response.data
+
+    return dashboard, get, post
+
+
+def bench_callbacks(dashboard, get, post, rounds):
+    """Antwortzeit und Payload-Größe der Interval-Callbacks (cold und warm)"""
+    requests = interval_requests(get, post)
+    results = {}
+    for body in requests:
+        cold, warm, sizes, errors = [], [], [], 0
+        for _ in range(rounds):
+            dashboard.acq.poll_once()   # neuer Snapshot - Render-Cache ist leer
+            for samples in (cold, warm):
+                t0 = time.perf_counter()
+                status, payload = post('/_dash-update-component', body)
+                samples.append((time.perf_counter() - t0) * 1000)
+                if status not in (200, 204):
+                    errors += 1
+            sizes.append(len(payload))
+        results[request_label(body)] = {
+            'cold_ms': percentiles(cold),
+            'warm_ms': percentiles(warm),
+            'payload_bytes': max(sizes),
+            'errors': errors,
+        }
+    return results
+
+
+def bench_memory(dashboard, get, post, cycles):
+    """Speicherzuwachs über viele Poll- und Callback-Zyklen"""
+    requests = interval_requests(get, post)
+    history_points = dashboard.acq.history_points
+
+    def cycle():
+        dashboard.acq.poll_once()
+        for body in requests:
+            post('/_dash-update-component', body)
+
+    # Historie zuerst füllen - ihr Wachstum bis history_points ist gewollt
+    for _ in range(min(history_points, cycles)):
+        dashboard.acq.poll_once()
+    gc.collect()
+    tracemalloc.start()
+    rss_start = _rss_kb()
+    samples = []
+    for i in range(cycles):
+        cycle()
+        if i % max(1, cycles // 20) == 0:
+            gc.collect()
+            samples.append((i, tracemalloc.get_traced_memory()[0]))
+    gc.collect()
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    samples.append((cycles, current))
+
+    # Zuwachs in der zweiten Hälfte - Caches sind dann aufgewärmt
+    half = [s for s in samples if s[0] >= cycles // 2]
+    growth = (half[-1][1] - half[0][1]) / 1024 / max(1, half[-1][0] - half[0][0]) * 1000
+    rss_end = _rss_kb()
+    return {
+        'cycles': cycles,
+        'traced_kb_start': round(samples[0][1] / 1024, 1),
+        'traced_kb_end': round(current / 1024, 1),
+        'traced_kb_peak': round(peak / 1024, 1),
+        'growth_kb_per_1000_cycles': round(growth, 2),
+        'rss_kb_start': rss_start,
+        'rss_kb_end': rss_end,
+    }
+
+
+def _rss_kb():
+    """Aktueller Arbeitsspeicher des Prozesses in kB (None wenn nicht ermittelbar)"""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') // 1024
+    except (OSError, ValueError, AttributeError):
+        pass
+    try:
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss   # Spitzenwert
+    except ImportError:
+        return None
+
+
+def _git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), timeout=5).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+# ---------------------------------------------------------------------------
+# Vergleich
+# ---------------------------------------------------------------------------
+
+def _lookup(result, path):
+    for key in path.split('.'):
+        if not isinstance(result, dict) or key not in result:
+            return None
+        result = result[key]
+    return result
+
+
+def compare(baseline, current, threshold):
+    """
+    Kennzahlen zweier Läufe vergleichen und ausgeben
+
+    Returns:
+        Liste der Regressionen (Pfad, alt, neu, Änderung in %)
+    """
+    rows = [(path, _lookup(baseline, path), _lookup(current, path), higher) for path, higher in KEY_METRICS]
+    for name, stats in current.get('callbacks', {}).items():
+        old_stats = baseline.get('callbacks', {}).get(name, {})
+        rows += [(f'{name} {path}', _lookup(old_stats, path), _lookup(stats, path), higher)
+                 for path, higher in CALLBACK_METRICS]
+
+    regressions = []
+    print(f"\n{'Kennzahl':70s} {'alt':>12s} {'neu':>12s} {'Änderung':>9s}")
+    for path, old, new, higher_is_better in rows:
+        if not isinstance(old, (int, float)) or not isinstance(new, (int, float)):
+            continue
+        change = (new - old) / abs(old) * 100 if old else 0.0
+        worse = change < -threshold if higher_is_better else change > threshold
+        # Sehr kleine Absolutwerte (z.B. Speicherzuwachs um 0) nicht als Regression werten
+        if worse and abs(new - old) > 0.05:
+            regressions.append((path, old, new, change))
+        print(f"{path[:70]:70s} {old:12.3f} {new:12.3f} {change:+8.1f}%{'  !' if worse else ''}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="MRA 4 Dashboard Benchmark (gegen den lokalen Emulator)")
+    parser.add_argument('--port', type=int, default=5030, help="Port für den Emulator")
+    parser.add_argument('--latency-ms', type=float, default=0.0, help="Emulator-Latenz pro Anfrage")
+    parser.add_argument('--duration', type=float, default=10.0, help="Dauer der Poll-Messung in Sekunden")
+    parser.add_argument('--rounds', type=int, default=50, help="Messungen pro Callback")
+    parser.add_argument('--memory-cycles', type=int, default=1000, help="Zyklen für die Speichermessung (0 = aus)")
+    parser.add_argument('--output', default=None, help="Ergebnisdatei (Standard: bench_results/<Zeit>_<Commit>.json)")
+    parser.add_argument('--compare', default=None, help="Ergebnisdatei eines früheren Laufs zum Vergleich")
+    parser.add_argument('--threshold', type=float, default=10.0, help="Regression ab dieser Verschlechterung in %%")
+    args = parser.parse_args()
+    # Pfade vor dem Wechsel ins temporäre Arbeitsverzeichnis (_load_app) festlegen
+    output = os.path.abspath(args.output) if args.output else None
+    baseline_path = os.path.abspath(args.compare) if args.compare else None
+    results_dir = os.path.abspath('bench_results')
+
+    logging.basicConfig(level=logging.WARNING, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    from mra4_emulator import MRA4Emulator
+
+    emulator = MRA4Emulator(latency_s=args.latency_ms / 1000, update_interval_s=0.1, seed=1)
+    emulator.start('127.0.0.1', args.port)
+    try:
+        print(f"Datenerfassung ({args.duration:g}s) ...")
+        acquisition, decode = bench_acquisition(emulator, args.port, args.duration)
+        print("Dashboard-Callbacks ...")
+        dashboard, get, post = _load_app(args.port)
+        logging.getLogger().setLevel(logging.WARNING)
+        callbacks = bench_callbacks(dashboard, get, post, args.rounds)
+        memory = None
+        if args.memory_cycles:
+            print(f"Speicher ({args.memory_cycles} Zyklen) ...")
+            memory = bench_memory(dashboard, get, post, args.memory_cycles)
+    finally:
+        emulator.stop()
+
+    commit = _git_commit()
+    result = {
+        'meta': {
+            'timestamp': datetime.now().isoformat(timespec='seconds'),
+            'commit': commit,
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'args': vars(args),
+        },
+        'acquisition': acquisition,
+        'decode': decode,
+        'callbacks': callbacks,
+        'memory': memory,
+    }
+
+    if output is None:
+        os.makedirs(results_dir, exist_ok=True)
+        output = os.path.join(results_dir, f"{datetime.now():%Y%m%d_%H%M%S}_{commit or 'local'}.json")
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(result, f, indent=2)
+
+    print(f"\nPolls/s: {acquisition['polls_per_s']}  Latenz p50/p95: {acquisition['latency_ms']['p50']}/"
+          f"{acquisition['latency_ms']['p95']} ms  Anfragen/Zyklus: {acquisition['requests_per_cycle']}  "
+          f"Dekodieren: {decode['us_per_call']} µs")
+    for name, stats in callbacks.items():
+        print(f"  {name[:60]:60s} cold p50 {stats['cold_ms']['p50']:7.2f} ms  warm p50 "
+              f"{stats['warm_ms']['p50']:7.2f} ms  {stats['payload_bytes']:7d} B")
+    if memory:
+        print(f"Speicherzuwachs: {memory['growth_kb_per_1000_cycles']} kB / 1000 Zyklen")
+    print(f"Ergebnis: {output}")
+
+    if baseline_path:
+        with open(baseline_path, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        regressions = compare(baseline, result, args.threshold)
+        if regressions:
+            print(f"\n{len(regressions)} Regression(en) über {args.threshold:g}%")
+            sys.exit(1)
+        print("\nKeine Regression")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,363 @@
+"""
+Messwert-Historie als memory-mapped Spaltendateien (für Auswertungen)
+
+Das Dashboard schreibt jeden Poll in eine Spaltendatei pro Kanal, ein
+Verzeichnis pro Monat:
+
+    history/2025-01/meta.json       Kanäle und Datentypen
+    history/2025-01/count           Anzahl gültiger Zeilen (u64)
+    history/2025-01/time.f8         Unix-Zeit (float64)
+    history/2025-01/voltage.L1.f4   Werte (float32, NaN = nicht lesbar)
+    ...
+
+Auswertungen (z.B. Jupyter) öffnen das Verzeichnis nur lesend und bekommen
+numpy-Arrays bzw. pandas-DataFrames direkt auf den gemappten Dateien - ohne
+Kopie und ohne Parsen, ein Monat 1-Hz-Daten ist in Millisekunden geladen:
+
+    from column_store import open_history
+    history = open_history('history')
+    arrays = history.arrays('2025-01-01', '2025-02-01', ['voltage', 'power.total'])
+    df = history.dataframe('2025-01-01', '2025-02-01')          # benötigt pandas
+
+Lesen während das Dashboard schreibt ist sicher: der Schreiber füllt erst
+alle Spalten einer Zeile und erhöht danach den Zähler in 'count'; Leser
+sehen nur Zeilen unterhalb des Zählers. Die Dateien wachsen in Blöcken
+(vorab reserviert), Leser mappen bei Bedarf neu.
+"""
+import json
+import logging
+import math
+import os
+import shutil
+import threading
+from datetime import datetime
+
+import numpy as np
+
+from history_store import CHANNELS, CHANNEL_NAMES
+
+logger = logging.getLogger(__name__)
+
+VERSION = 1
+TIME_DTYPE = np.dtype('<f8')
+VALUE_DTYPE = np.dtype('<f4')
+
+# Zeilen, um die die Spaltendateien jeweils wachsen (1 Tag bei 1 s)
+CHUNK_ROWS = 86400
+
+
+def _segment_name(t):
+    return datetime.fromtimestamp(t).strftime('%Y-%m')
+
+
+def _column_file(directory, name, dtype):
+    return os.path.join(directory, f"{name}.{'f8' if dtype == TIME_DTYPE else 'f4'}")
+
+
+def _to_timestamp(value):
+    """Unix-Zeit, ISO-Text, datetime oder numpy/pandas-Zeit -> Unix-Zeit"""
+    if value is None or isinstance(value, (int, float)):
+        return value
+    if isinstance(value, str):
+        return datetime.fromisoformat(value).timestamp()
+    if isinstance(value, np.datetime64):
+        return value.astype('datetime64[ns]').astype(np.int64) / 1e9
+    return value.timestamp()
+
+
+class ColumnWriter:
+    """Hängt Polls an die Spaltendateien des laufenden Monats an (Dashboard)"""
+
+    def __init__(self, directory, channels=CHANNEL_NAMES, chunk_rows=CHUNK_ROWS, retention_months=0):
+        """
+        Args:
+            directory: Basisverzeichnis der Historie
+            channels: Kanalnamen (Pfade wie history_store.CHANNELS)
+            chunk_rows: Zeilen, um die die Dateien jeweils wachsen
+            retention_months: ältere Monatsverzeichnisse löschen (0 = alle behalten)
+        """
+        self.directory = str(directory)
+        self.channels = tuple(channels)
+        self.chunk_rows = chunk_rows
+        self.retention_months = retention_months
+        self.segment = None
+        self.count = 0
+        self._columns = {}
+        self._counter = None
+        self._capacity = 0
+        self._lock = threading.Lock()
+        os.makedirs(self.directory, exist_ok=True)
+
+    def on_snapshot(self, snapshot):
+        """Snapshot-Listener: Messwerte eines Polls anhängen"""
+        if not snapshot.connected:
+            return
+        values = []
+        for name in self.channels:
+            value = snapshot.data
+            for key in CHANNELS[name]:
+                value = value.get(key) if isinstance(value, dict) else None
+            values.append(math.nan if value is None else value)
+        self.append(snapshot.timestamp, values)
+
+    def append(self, t, values):
+        """
+        Eine Zeile anhängen
+
+        Args:
+            t: Unix-Zeit
+            values: Werte in der Reihenfolge von channels (NaN = ungültig)
+        """
+        with self._lock:
+            segment = _segment_name(t)
+            if segment != self.segment:
+                self._open(segment)
+            if self.count >= self._capacity:
+                self._grow(self.count + self.chunk_rows)
+            i = self.count
+            self._columns['time'][i] = t
+            for name, value in zip(self.channels, values):
+                self._columns[name][i] = value
+            # Zähler zuletzt - Leser sehen die Zeile erst, wenn alle Spalten geschrieben sind
+            self.count = i + 1
+            self._counter[0] = self.count
+
+    def _open(self, segment):
+        self._close()
+        path = os.path.join(self.directory, segment)
+        os.makedirs(path, exist_ok=True)
+        meta_path = os.path.join(path, 'meta.json')
+        if os.path.exists(meta_path):
+            with open(meta_path, encoding='utf-8') as f:
+                meta = json.load(f)
+            known = tuple(meta.get('channels', ()))
+            if meta.get('version') != VERSION or not set(known) <= set(self.channels):
+                raise ValueError(f"{path} hat ein anderes Format - bitte verschieben oder löschen")
+            if known != self.channels:
+                # Neue Kanäle im laufenden Monat: Dateien entstehen in _grow() mit NaN für die bisherigen Zeilen
+                meta['channels'] = list(self.channels)
+                with open(meta_path, 'w', encoding='utf-8') as f:
+                    json.dump(meta, f, indent=2)
+                logger.info(f"Spalten-Historie {path}: Kanäle ergänzt ({', '.join(sorted(set(self.channels) - set(known)))})")
+        else:
+            with open(meta_path, 'w', encoding='utf-8') as f:
+                json.dump({'version': VERSION, 'channels': list(self.channels),
+                           'time_dtype': TIME_DTYPE.str, 'value_dtype': VALUE_DTYPE.str}, f, indent=2)
+        count_path = os.path.join(path, 'count')
+        if not os.path.exists(count_path):
+            with open(count_path, 'wb') as f:
+                f.write(np.zeros(1, dtype='<u8').tobytes())
+        self._counter = np.memmap(count_path, dtype='<u8', mode='r+', shape=(1,))
+        self.count = int(self._counter[0])
+        self.segment = segment
+        self._path = path
+        self._grow(self.count + self.chunk_rows)
+        logger.info(f"Spalten-Historie: {path} ({self.count} Zeilen)")
+        self._apply_retention()
+
+    def _grow(self, rows):
+        """Alle Spaltendateien auf rows Zeilen vergrößern und neu mappen"""
+        for name in ('time',) + self.channels:
+            dtype = TIME_DTYPE if name == 'time' else VALUE_DTYPE
+            file = _column_file(self._path, name, dtype)
+            self._columns.pop(name, None)
+            with open(file, 'ab') as f:
+                size = f.tell()
+                if size < rows * dtype.itemsize:
+                    # Neue Zeilen mit NaN vorbelegen (Lücken bleiben erkennbar)
+                    missing = rows - size // dtype.itemsize
+                    f.write(np.full(missing, np.nan, dtype=dtype).tobytes())
+            self._columns[name] = np.memmap(file, dtype=dtype, mode='r+', shape=(rows,))
+        self._capacity = rows
+
+    def _apply_retention(self):
+        if not self.retention_months:
+            return
+        segments = sorted(name for name in os.listdir(self.directory)
+                          if os.path.isfile(os.path.join(self.directory, name, 'meta.json')))
+        for name in segments[:-self.retention_months]:
+            try:
+                shutil.rmtree(os.path.join(self.directory, name))
+                logger.info(f"Spalten-Historie {name} gelöscht (Aufbewahrung {self.retention_months} Monate)")
+            except OSError as e:
+                logger.warning(f"Spalten-Historie {name} nicht löschbar: {e}")
+
+    def flush(self):
+        with self._lock:
+            for column in self._columns.values():
+                column.flush()
+            if self._counter is not None:
+                self._counter.flush()
+
+    def _close(self):
+        for column in self._columns.values():
+            column.flush()
+        if self._counter is not None:
+            self._counter.flush()
+        self._columns = {}
+        self._counter = None
+        self._capacity = 0
+
+    def close(self):
+        """Dateien schreiben und schließen (reservierte Zeilen bleiben, count ist maßgeblich)"""
+        with self._lock:
+            self._close()
+
+
+class _Segment:
+    """Ein Monatsverzeichnis, nur lesend gemappt"""
+
+    def __init__(self, path):
+        self.path = path
+        self.name = os.path.basename(path)
+        with open(os.path.join(path, 'meta.json'), encoding='utf-8') as f:
+            meta = json.load(f)
+        if meta.get('version') != VERSION:
+            raise ValueError(f"{path}: nicht unterstützte Version {meta.get('version')}")
+        self.channels = tuple(meta['channels'])
+        self._counter = np.memmap(os.path.join(path, 'count'), dtype='<u8', mode='r', shape=(1,))
+        self._columns = {}
+
+    def count(self):
+        """Gültige Zeilen (aktueller Stand des Schreibers)"""
+        return int(self._counter[0])
+
+    def column(self, name, rows):
+        """Die ersten rows Werte einer Spalte (Sicht auf die Datei, nur lesend)"""
+        column = self._columns.get(name)
+        if column is None or len(column) < rows:
+            # Erstes Lesen oder Datei ist gewachsen - ganze Datei neu mappen
+            dtype = TIME_DTYPE if name == 'time' else VALUE_DTYPE
+            file = _column_file(self.path, name, dtype)
+            if not os.path.exists(file):
+                # Kanal kam erst später hinzu - in diesem Monat nicht aufgezeichnet
+                return np.full(rows, np.nan, dtype=dtype)
+            column = self._columns[name] = np.memmap(file, dtype=dtype, mode='r',
+                                                     shape=(os.path.getsize(file) // dtype.itemsize,))
+        return column[:rows]
+
+
+class HistoryReader:
+    """Nur lesender Zugriff auf die Spalten-Historie des Dashboards"""
+
+    def __init__(self, directory):
+        """
+        Args:
+            directory: Basisverzeichnis der Historie (z.B. 'history')
+        """
+        self.directory = str(directory)
+        self._segments = {}
+
+    def segments(self):
+        """Monatsverzeichnisse (aufsteigend)"""
+        if not os.path.isdir(self.directory):
+            return []
+        names = sorted(name for name in os.listdir(self.directory)
+                       if os.path.isfile(os.path.join(self.directory, name, 'meta.json')))
+        for name in names:
+            if name not in self._segments:
+                self._segments[name] = _Segment(os.path.join(self.directory, name))
+        return [self._segments[name] for name in names]
+
+    @property
+    def channels(self):
+        segments = self.segments()
+        return segments[-1].channels if segments else CHANNEL_NAMES
+
+    def _expand(self, channels):
+        known = self.channels
+        if channels is None:
+            return list(known)
+        if isinstance(channels, str):
+            channels = [channels]
+        names = []
+        for name in channels:
+            group = [channel for channel in known if channel.startswith(name + '.')]
+            for channel in group or [name]:
+                if channel not in known:
+                    raise KeyError(f"Unbekannter Kanal: {channel}")
+                if channel not in names:
+                    names.append(channel)
+        return names
+
+    def arrays(self, start=None, end=None, channels=None):
+        """
+        Spalten eines Zeitraums als numpy-Arrays
+
+        Liegt der Zeitraum in einem Monatsverzeichnis, sind die Arrays Sichten
+        auf die gemappten Dateien (keine Kopie, nicht beschreibbar). Über
+        Monatsgrenzen hinweg werden die Teile aneinandergehängt (Kopie).
+
+        Args:
+            start, end: Unix-Zeit, ISO-Text, datetime oder numpy-Zeit (None = offen)
+            channels: Kanäle oder Gruppen ('voltage'), None = alle
+
+        Returns:
+            Dictionary {'time': float64, Kanal: float32}
+        """
+        start, end = _to_timestamp(start), _to_timestamp(end)
+        names = self._expand(channels)
+        parts = [{'time': times[lo:hi], **{name: segment.column(name, rows)[lo:hi] for name in names}}
+                 for segment, rows, times, lo, hi in self._ranges(start, end)]
+        if not parts:
+            return {'time': np.zeros(0, dtype=TIME_DTYPE), **{name: np.zeros(0, dtype=VALUE_DTYPE) for name in names}}
+        if len(parts) == 1:
+            return parts[0]
+        return {key: np.concatenate([part[key] for part in parts]) for key in parts[0]}
+
+    def iter_batches(self, start=None, end=None, channels=None, batch_rows=CHUNK_ROWS):
+        """
+        Zeitraum in Blöcken von höchstens batch_rows Zeilen (für lange Exporte)
+
+        Anders als arrays() wird über Monatsgrenzen nichts aneinandergehängt -
+        jeder Block ist eine Sicht auf die gemappten Dateien eines Monats.
+
+        Yields:
+            Dictionary {'time': float64, Kanal: float32} wie arrays()
+        """
+        start, end = _to_timestamp(start), _to_timestamp(end)
+        names = self._expand(channels)
+        for segment, rows, times, lo, hi in self._ranges(start, end):
+            columns = {name: segment.column(name, rows) for name in names}
+            for i in range(lo, hi, batch_rows):
+                j = min(i + batch_rows, hi)
+                yield {'time': times[i:j], **{name: column[i:j] for name, column in columns.items()}}
+
+    def _ranges(self, start, end):
+        """(Monat, Zeilen, Zeitspalte, erste, letzte + 1) der Zeilen im Zeitraum je Monatsverzeichnis"""
+        for segment in self.segments():
+            rows = segment.count()
+            if not rows:
+                continue
+            times = segment.column('time', rows)
+            if (start is not None and times[-1] < start) or (end is not None and times[0] > end):
+                continue
+            lo = 0 if start is None else int(np.searchsorted(times, start, side='left'))
+            hi = rows if end is None else int(np.searchsorted(times, end, side='right'))
+            if hi > lo:
+                yield segment, rows, times, lo, hi
+
+    def dataframe(self, start=None, end=None, channels=None, datetime_index=True):
+        """
+        Zeitraum als pandas-DataFrame (Spalten ohne Kopie auf den Dateien)
+
+        Args:
+            datetime_index: Index als lokale Zeit (DatetimeIndex, kopiert nur die
+                Zeitspalte), sonst die Unix-Zeit als float-Index ohne Kopie
+        """
+        try:
+            import pandas as pd
+        except ImportError:
+            raise ImportError("dataframe() benötigt pandas (pip install pandas)")
+        arrays = self.arrays(start, end, channels)
+        times = arrays.pop('time')
+        if datetime_index:
+            index = pd.to_datetime(times, unit='s', utc=True).tz_convert(datetime.now().astimezone().tzinfo)
+        else:
+            index = pd.Index(times, name='timestamp', copy=False)
+        return pd.DataFrame(arrays, index=index, copy=False)
+
+
+def open_history(directory='history'):
+    """Spalten-Historie des Dashboards nur lesend öffnen"""
+    return HistoryReader(directory)
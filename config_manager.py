@@ -1,11 +1,20 @@
 """
 Konfigurationsverwaltung für MRA 4 Dashboard
 """
+import atexit
+import copy
 import json
+import logging
 import os
+import threading
+import time
+from contextlib import contextmanager
 from pathlib import Path
 
-CONFIG_FILE = Path(__file__).parent / 'config.json'
+logger = logging.getLogger(__name__)
+
+# Im Programmverzeichnis oder MRA4_CONFIG_FILE (Benchmark, Tests, mehrere Instanzen)
+CONFIG_FILE = Path(os.environ.get('MRA4_CONFIG_FILE') or Path(__file__).parent / 'config.json')
 
 DEFAULT_CONFIG = {
     "max_power_kw": 12.0,
@@ -21,12 +30,154 @@ DEFAULT_CONFIG = {
     "passwords": {
         "general": "2023",
         "hypervisor": "202320"
+    },
+    "gateway": {
+        "enabled": False,
+        "host": "0.0.0.0",
+        "port": 5502,
+        "allow_writes": False
+    },
+    "history": {
+        "directory": "history",
+        "retention_months": 24
+    },
+    "energy": {
+        "state_file": "energy_state.json",
+        "demand_window_s": 900,
+        "max_gap_s": 10
+    },
+    "analytics": {
+        "windows_s": [60, 900],
+        "rocof_window_s": 5
+    },
+    "trips": {
+        "directory": "trips",
+        "pre_s": 10,
+        "post_s": 5,
+        "max_events": 500
+    },
+    "alarms": {
+        # Grenzwert-Regeln (alarm_engine): Kanal, Vergleich, Schwelle, Hysterese, Haltezeit, Stufe
+        "rules": [
+            {
+                "id": "power_high",
+                "channel": "load_percent",
+                "comparator": ">=",
+                "threshold": 90,
+                "hysteresis": 2,
+                "hold_s": 0,
+                "severity": "warning",
+                "message": "WARNUNG: Leistung bei {value:.0f}%!"
+            }
+        ]
     }
 }
 
+_MISSING = object()
+
+
+def resolve_path(path):
+    """
+    Relativen Pfad aus der Konfiguration auf das Datenverzeichnis beziehen
+
+    Datenverzeichnis ist das Verzeichnis von config.json oder
+    MRA4_DATA_DIR - unabhängig vom Arbeitsverzeichnis beim Start (Dienst,
+    Verknüpfung, Benchmark).
+
+    Returns:
+        Absoluter Pfad als Text oder der leere Wert unverändert (Funktion aus)
+    """
+    if not path:
+        return path
+    path = Path(path).expanduser()
+    if not path.is_absolute():
+        path = Path(os.environ.get('MRA4_DATA_DIR') or CONFIG_FILE.parent) / path
+    return str(path)
+
+
+def _resolve(config, keys):
+    """Wert zu einer bereits zerlegten Schlüsselfolge (oder _MISSING)"""
+    value = config
+    for k in keys:
+        if isinstance(value, dict) and k in value:
+            value = value[k]
+        else:
+            return _MISSING
+    return value
+
+
+class ConfigValue:
+    """
+    Vorkompilierter, typisierter Zugriff auf einen Config-Wert
+
+    Der Schlüssel wird einmal zerlegt, der Wert einmal aufgelöst und
+    umgewandelt. Erst wenn sich die Konfiguration ändert (Generation des
+    ConfigManager), wird neu aufgelöst.
+    """
+
+    __slots__ = ('_manager', '_keys', 'key', 'default', 'type', '_generation', '_value')
+
+    def __init__(self, manager, key, default=None, type=None):
+        self._manager = manager
+        self._keys = tuple(key.split('.'))
+        self.key = key
+        self.default = default
+        self.type = type
+        self._generation = -1
+        self._value = default
+
+    def get(self):
+        """Aktueller Wert (aus dem Cache, solange sich die Config nicht geändert hat)"""
+        manager = self._manager
+        manager.check_file()
+        if self._generation != manager.generation:
+            config = manager.config
+            generation = manager.generation
+            value = _resolve(config, self._keys)
+            if value is _MISSING or value is None:
+                value = self.default
+            elif self.type is not None:
+                try:
+                    value = self.type(value)
+                except (TypeError, ValueError):
+                    value = self.default
+            self._value = value
+            self._generation = generation
+        return self._value
+
+    __call__ = get
+
+
 class ConfigManager:
+    """
+    Konfiguration mit Copy-on-Write-Snapshot und verzögertem, atomarem Speichern
+
+    Leser sehen immer ein vollständiges Dictionary (self.config wird nur als
+    Ganzes ausgetauscht). Änderungen werden gesammelt und nach DEBOUNCE_S in
+    einem Hintergrund-Thread einmal geschrieben (temporäre Datei + os.replace).
+    """
+
+    # Wartezeit nach der letzten Änderung bis zum Schreiben der Datei
+    DEBOUNCE_S = 0.5
+    # Mindestabstand zwischen zwei Prüfungen auf externe Änderungen der Datei
+    FILE_CHECK_S = 2.0
+    # Wartezeit bis zum nächsten Versuch nach einem fehlgeschlagenen Speichern
+    RETRY_S = 5.0
+
     def __init__(self):
+        self._lock = threading.RLock()
+        self._write_lock = threading.Lock()   # hält die Reihenfolge der Schreibvorgänge ein
+        self._batch_depth = 0
+        self._pending = None     # Arbeitskopie während batch()
+        self._dirty = False
+        self._timer = None
+        self.save_failed = False  # letzter Schreibversuch fehlgeschlagen (Änderungen nur im Speicher)
+        self._subscribers = []   # (Schlüsselfolge, callback)
+        self._file_mtime = None
+        self._next_file_check = 0.0
+        self.generation = 0      # wird bei jeder Änderung erhöht (invalidiert ConfigValue)
         self.config = self.load_config()
+        self._file_mtime = self._stat_mtime()
 
     def load_config(self):
         """Lade Konfiguration aus Datei oder erstelle Default"""
@@ -35,52 +186,213 @@ class ConfigManager:
                 with open(CONFIG_FILE, 'r', encoding='utf-8') as f:
                     return json.load(f)
             except Exception as e:
-                print(f"Fehler beim Laden der Config: {e}")
-                return DEFAULT_CONFIG.copy()
+                logger.error(f"Fehler beim Laden der Config: {e}")
+                return copy.deepcopy(DEFAULT_CONFIG)
         else:
             # Erstelle Default-Config
             self.save_config(DEFAULT_CONFIG)
-            return DEFAULT_CONFIG.copy()
+            return copy.deepcopy(DEFAULT_CONFIG)
 
     def save_config(self, config=None):
-        """Speichere Konfiguration in Datei"""
+        """Speichere Konfiguration sofort und atomar in Datei"""
         if config is None:
             config = self.config
+        tmp_file = CONFIG_FILE.with_name(CONFIG_FILE.name + '.tmp')
         try:
-            with open(CONFIG_FILE, 'w', encoding='utf-8') as f:
+            with open(tmp_file, 'w', encoding='utf-8') as f:
                 json.dump(config, f, indent=4, ensure_ascii=False)
+                f.flush()
+                os.fsync(f.fileno())
+            # Atomarer Austausch - bei Stromausfall bleibt die alte oder die neue Datei
+            os.replace(tmp_file, CONFIG_FILE)
             return True
         except Exception as e:
-            print(f"Fehler beim Speichern der Config: {e}")
+            logger.error(f"Fehler beim Speichern der Config: {e}")
             return False
 
     def get(self, key, default=None):
         """Hole einzelnen Config-Wert"""
-        keys = key.split('.')
-        value = self.config
-        for k in keys:
-            if isinstance(value, dict) and k in value:
-                value = value[k]
-            else:
-                return default
-        return value
+        value = _resolve(self.config, key.split('.'))
+        return default if value is _MISSING else value
+
+    def view(self, key, default=None, type=None):
+        """
+        Vorkompilierten Zugriff für häufig gelesene Werte anlegen
+
+        Args:
+            key: Schlüssel mit Punkt-Notation (z.B. 'modbus.ip')
+            default: Wert, falls nicht gesetzt oder nicht umwandelbar
+            type: Umwandlungsfunktion (z.B. int, float)
+
+        Returns:
+            ConfigValue - Aufruf oder .get() liefert den aktuellen Wert
+        """
+        return ConfigValue(self, key, default, type)
+
+    def subscribe(self, key, callback):
+        """
+        Benachrichtigung bei Änderung eines Wertes (oder Teilbaums) registrieren
+
+        Args:
+            key: Schlüssel mit Punkt-Notation ('modbus' meldet jede Änderung darunter)
+            callback: Funktion (key, neuer Wert), wird nach der Übernahme aufgerufen
+        """
+        self._subscribers.append((tuple(key.split('.')), key, callback))
+
+    def _swap(self, config):
+        """Neue Konfiguration sichtbar machen (unter _lock), liefert die alte"""
+        old = self.config
+        self.config = config   # Referenz-Zuweisung - Leser sehen alles oder nichts
+        self.generation += 1
+        return old
+
+    def _notify(self, old, config):
+        """Abonnenten über geänderte Werte informieren (ohne _lock)"""
+        for keys, key, callback in self._subscribers:
+            value = _resolve(config, keys)
+            if value != _resolve(old, keys):
+                try:
+                    callback(key, None if value is _MISSING else value)
+                except Exception as e:
+                    logger.error(f"Fehler in Config-Abonnent für {key}: {e}")
+
+    def _stat_mtime(self):
+        try:
+            return os.stat(CONFIG_FILE).st_mtime_ns
+        except OSError:
+            return None
+
+    def check_file(self, force=False):
+        """
+        Externe Änderungen an config.json übernehmen (günstige mtime-Prüfung)
+
+        Wird höchstens alle FILE_CHECK_S Sekunden tatsächlich geprüft.
+
+        Returns:
+            True wenn die Datei neu geladen wurde
+        """
+        now = time.monotonic()
+        if not force and now < self._next_file_check:
+            return False
+        self._next_file_check = now + self.FILE_CHECK_S
+        mtime = self._stat_mtime()
+        if mtime is None or mtime == self._file_mtime or self._dirty or self._batch_depth:
+            return False
+        try:
+            with open(CONFIG_FILE, 'r', encoding='utf-8') as f:
+                config = json.load(f)
+        except Exception as e:
+            # Halb geschriebene Datei eines anderen Programms - beim nächsten Mal erneut
+            logger.warning(f"Geänderte Config konnte nicht geladen werden: {e}")
+            return False
+        with self._lock:
+            if self._dirty or self._batch_depth:
+                return False
+            self._file_mtime = mtime
+            old = self._swap(config)
+        logger.info("config.json wurde extern geändert - Konfiguration neu geladen")
+        self._notify(old, config)
+        return True
+
+    @contextmanager
+    def batch(self):
+        """
+        Mehrere Änderungen als eine Transaktion übernehmen
+
+        Innerhalb des Blocks werden Änderungen in einer Arbeitskopie gesammelt,
+        am Ende gemeinsam sichtbar und einmal gespeichert. Bei einer Exception
+        werden sie verworfen.
+
+        Beispiel:
+            with cfg.batch():
+                cfg.set('modbus.ip', ip)
+                cfg.set('modbus.port', port)
+        """
+        committed = None
+        with self._lock:
+            if self._batch_depth == 0:
+                self._pending = copy.deepcopy(self.config)
+            self._batch_depth += 1
+            try:
+                yield self
+            except BaseException:
+                if self._batch_depth == 1:
+                    self._pending = None
+                raise
+            finally:
+                self._batch_depth -= 1
+            if self._batch_depth == 0 and self._pending is not None:
+                config, self._pending = self._pending, None
+                self._dirty = True
+                committed = (self._swap(config), config)
+                self._schedule_save()
+        if committed is not None:
+            self._notify(*committed)
 
     def set(self, key, value):
-        """Setze einzelnen Config-Wert"""
-        keys = key.split('.')
-        config = self.config
-        for k in keys[:-1]:
-            if k not in config:
-                config[k] = {}
-            config = config[k]
-        config[keys[-1]] = value
-        return self.save_config()
+        """
+        Setze einzelnen Config-Wert (wird verzögert gespeichert)
+
+        Returns:
+            False wenn der letzte Schreibversuch fehlgeschlagen ist - der Wert
+            gilt dann nur im Speicher, bis das Speichern wieder gelingt
+        """
+        with self.batch():
+            keys = key.split('.')
+            config = self._pending
+            for k in keys[:-1]:
+                if not isinstance(config.get(k), dict):
+                    config[k] = {}
+                config = config[k]
+            config[keys[-1]] = value
+        return not self.save_failed
 
     def update(self, updates):
-        """Update mehrere Config-Werte"""
-        for key, value in updates.items():
-            self.set(key, value)
-        return self.save_config()
+        """Update mehrere Config-Werte (ein Schreibvorgang, Rückgabe wie set())"""
+        with self.batch():
+            for key, value in updates.items():
+                self.set(key, value)
+        return not self.save_failed
+
+    def _schedule_save(self, delay=None):
+        if self._timer is not None:
+            self._timer.cancel()
+        self._timer = threading.Timer(self.DEBOUNCE_S if delay is None else delay, self.flush)
+        self._timer.daemon = True
+        self._timer.start()
+
+    def flush(self):
+        """
+        Ausstehende Änderungen sofort speichern
+
+        Schlägt das Speichern fehl, bleiben die Änderungen ausstehend und
+        werden nach RETRY_S erneut geschrieben.
+
+        Returns:
+            True wenn nichts aussteht oder das Speichern gelungen ist
+        """
+        with self._write_lock:
+            with self._lock:
+                if self._timer is not None:
+                    self._timer.cancel()
+                    self._timer = None
+                if not self._dirty:
+                    return True
+                config = self.config
+                generation = self.generation
+            # Datei-I/O außerhalb von _lock - Leser und set() werden nicht blockiert
+            saved = self.save_config(config)
+            with self._lock:
+                self.save_failed = not saved
+                if not saved:
+                    if self._timer is None:
+                        self._schedule_save(self.RETRY_S)
+                    return False
+                self._file_mtime = self._stat_mtime()   # eigene Änderung nicht als extern erkennen
+                # Während des Schreibens geänderte Werte bleiben ausstehend (Timer läuft bereits)
+                if self.generation == generation:
+                    self._dirty = False
+            return True
 
 # Singleton-Instanz
 _config_manager = None
@@ -90,10 +402,14 @@ def get_config_manager():
     global _config_manager
     if _config_manager is None:
         _config_manager = ConfigManager()
+        atexit.register(_config_manager.flush)
     return _config_manager
 
 def save_config(config_dict):
     """Speichere komplette Konfiguration"""
     manager = get_config_manager()
-    manager.config = config_dict
-    return manager.save_config()
+    with manager._lock:
+        manager._dirty = True
+        old = manager._swap(config_dict)
+    manager._notify(old, config_dict)
+    return manager.flush()
@@ -0,0 +1,85 @@
+"""
+Gemeinsame pytest-Fixtures
+
+Die Skripte test_addresses.py, test_modbus.py, test_read_coil.py,
+test_single_reads.py und test_write_coil.py sind manuelle Gerätetests (sie
+verbinden sich beim Import mit dem konfigurierten MRA 4) und werden von
+pytest nicht gesammelt.
+"""
+import pytest
+
+from modbus_client import HOLDING_REGISTERS, INPUT_BLOCK_COUNT, encode_registers, input_offset
+
+collect_ignore = [
+    'test_addresses.py',
+    'test_modbus.py',
+    'test_read_coil.py',
+    'test_single_reads.py',
+    'test_write_coil.py',
+]
+
+
+def sample_data(power_l1=2300.0):
+    """Datensatz wie read_all_data() mit plausiblen Messwerten"""
+    return {
+        'voltage': {'L1': 230.0, 'L2': 231.0, 'L3': 229.0},
+        'current': {'L1': 10.0, 'L2': 9.5, 'L3': 10.5},
+        'power': {'L1': power_l1, 'L2': 2000.0, 'L3': -1500.0, 'total': power_l1 + 500.0},
+        'frequency': 50.0,
+        'coupling_switch': True,
+        'di_status': True,
+        'protection_status': None,
+        'cause_of_trip': 1,
+        'fault_number': 7,
+        'fault_recording': False,
+    }
+
+
+class _Response:
+    def __init__(self, registers=None, error=False):
+        self.registers = registers
+        self.error = error
+
+    def isError(self):
+        return self.error
+
+
+class FakeModbusDevice:
+    """Ersatz für ModbusTcpClient: liefert Register aus Rohdaten (encode_registers)"""
+
+    def __init__(self, raw, reachable=True, rejected=()):
+        self.raw = raw
+        self.reachable = reachable
+        self.rejected = set(rejected)   # Input Register mit Illegal Data Address
+        self.connected = False
+        self.connect_attempts = 0
+
+    def connect(self):
+        self.connect_attempts += 1
+        self.connected = self.reachable
+        return self.connected
+
+    def close(self):
+        self.connected = False
+
+    def read_input_registers(self, address, count=1, device_id=1):
+        if not self.connected:
+            raise ConnectionError("nicht verbunden")
+        if self.rejected.intersection(range(address, address + count)):
+            return _Response(error=True)
+        offset = input_offset(address)
+        return _Response(self.raw[offset:offset + count])
+
+    def read_holding_registers(self, address, count=1, device_id=1):
+        if not self.connected:
+            raise ConnectionError("nicht verbunden")
+        value = self.raw[INPUT_BLOCK_COUNT + HOLDING_REGISTERS.index(address)]
+        return _Response(error=True) if value is None else _Response([value])
+
+
+@pytest.fixture
+def fake_device():
+    """Fabrik für FakeModbusDevice mit den Registern von sample_data()"""
+    def make(data=None, **kwargs):
+        return FakeModbusDevice(encode_registers(data or sample_data()), **kwargs)
+    return make
@@ -0,0 +1,344 @@
+"""
+Export der Messwert-Historie als CSV oder Parquet (gestreamt)
+
+Quelle sind die Register-Aufzeichnungen (frame_recorder, --record): die
+Dateien werden per numpy direkt auf der memory-mapped Datei gelesen und in
+Spaltenblöcken von BATCH_ROWS Frames dekodiert. Jeder Block wird sofort
+formatiert und an den Client geschickt - der Speicherbedarf bleibt auch für
+Monate mit 1-Hz-Daten konstant.
+
+Ohne Aufzeichnungen kommen die Messkanäle aus der Spalten-Historie auf der
+Platte (column_store, jeder Poll), ebenfalls in Blöcken von BATCH_ROWS
+Zeilen. Fehlt auch diese, wird aus der Historie im Speicher (HistoryStore,
+Mittelwerte pro Raster) exportiert.
+
+Parquet benötigt das Paket pyarrow (ein Row Group pro Block).
+"""
+import glob
+import io
+import logging
+import os
+import threading
+import time
+
+from modbus_client import (CURRENT_ANGLE_REGISTERS, CURRENT_REGISTERS, FREQUENCY_REGISTER, HOLDING_REGISTERS,
+                           INPUT_BLOCK_COUNT, TOTAL_POWER_REGISTER, VOLTAGE_ANGLE_REGISTERS, VOLTAGE_REGISTERS,
+                           input_offset)
+
+logger = logging.getLogger(__name__)
+
+# Frames pro Block (ca. 7 MB Registerdaten, wenige MB formatierter Text)
+BATCH_ROWS = 50000
+
+# Ein Export gleichzeitig - ein Jahresexport soll das Dashboard nicht ausbremsen
+_EXPORT_SLOTS = threading.BoundedSemaphore(1)
+
+
+def _float_channel(address, digits):
+    return ('float', address, digits)
+
+
+def _holding_channel(address, bit=None):
+    return ('holding', INPUT_BLOCK_COUNT + HOLDING_REGISTERS.index(address), bit)
+
+
+# Kanalname -> Dekodierung aus den Rohregistern (Namen wie history_store.CHANNELS)
+EXPORT_CHANNELS = {
+    **{f'voltage.L{i + 1}': _float_channel(a, 2) for i, a in enumerate(VOLTAGE_REGISTERS)},
+    **{f'current.L{i + 1}': _float_channel(a, 3) for i, a in enumerate(CURRENT_REGISTERS)},
+    # P = U * I * cos(phi U - phi I) wie modbus_client.phase_powers()
+    **{f'power.L{i + 1}': ('phase_power', i, 2) for i in range(3)},
+    'power.total': _float_channel(TOTAL_POWER_REGISTER, 2),
+    'frequency': _float_channel(FREQUENCY_REGISTER, 2),
+    'coupling_switch': _holding_channel(1005, 0x1),
+    'di_status': _holding_channel(1000, 0x1),
+    'protection_status': _holding_channel(1),
+    'cause_of_trip': _holding_channel(5004),
+    'fault_number': _holding_channel(57),
+}
+
+FORMATS = {
+    'csv': ('text/csv; charset=utf-8', 'csv'),
+    'parquet': ('application/vnd.apache.parquet', 'parquet'),
+}
+
+
+class ExportBusy(Exception):
+    """Es läuft bereits ein Export"""
+
+
+def parquet_available():
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def decode_columns(frames, channels):
+    """
+    Kanäle aus einem Block Frames dekodieren (vektorisiert)
+
+    Args:
+        frames: numpy-Array mit frame_recorder.frame_dtype() (Ausschnitt der Datei)
+        channels: Kanalnamen aus EXPORT_CHANNELS
+
+    Returns:
+        {Kanal: float64-Array}, NaN für nicht lesbare Register
+    """
+    import numpy as np
+
+    registers = frames['registers']
+    mask = frames['mask']
+
+    def valid(offset):
+        return (mask[:, offset // 64] >> np.uint64(offset % 64)) & np.uint64(1) != 0
+
+    def floats(addresses):
+        # Zwei Register Big-Endian -> float32 (wie MRA4Client._registers_to_float), (Frames, Adressen)
+        offsets = np.array([input_offset(address) for address in addresses])
+        bits = (registers[:, offsets].astype(np.uint32) << 16) | registers[:, offsets + 1]
+        values = bits.view(np.float32).astype(np.float64)
+        ok = np.column_stack([valid(offset) & valid(offset + 1) for offset in offsets])
+        values[~ok] = np.nan
+        return values
+
+    powers = None
+    columns = {}
+    for name in channels:
+        kind, key, arg = EXPORT_CHANNELS[name]
+        if kind == 'holding':
+            values = registers[:, key] if arg is None else (registers[:, key] & arg) != 0
+            values = values.astype(np.float64)
+            values[~valid(key)] = np.nan
+        elif kind == 'phase_power':
+            if powers is None:
+                # Alle Phasen in einem Schritt: U * I * cos(phi U - phi I), ohne Phasenlage total / 3
+                u, i, phi_u, phi_i = (floats(addresses) for addresses in (
+                    VOLTAGE_REGISTERS, CURRENT_REGISTERS, VOLTAGE_ANGLE_REGISTERS, CURRENT_ANGLE_REGISTERS))
+                powers = u * i * np.cos(np.radians(phi_u - phi_i))
+                missing = np.isnan(phi_u) | np.isnan(phi_i)
+                total = floats((TOTAL_POWER_REGISTER,))
+                powers = np.round(np.where(missing, total / 3, powers), arg)
+            values = powers[:, key]
+        else:
+            values = np.round(floats((key,))[:, 0], arg)
+        columns[name] = values
+    return columns
+
+
+def recording_files(directory):
+    """Aufzeichnungen im Verzeichnis (nach Startzeit im Dateinamen sortiert)"""
+    if not directory or not os.path.isdir(directory):
+        return []
+    return sorted(glob.glob(os.path.join(directory, '*.rec')))
+
+
+def iter_recording_batches(directory, start, end, channels, batch_rows=BATCH_ROWS):
+    """
+    Blöcke (Zeitstempel, {Kanal: Werte}) aus den Aufzeichnungen lesen
+
+    Liest nur die Frames im Zeitraum; pro Block wird eine Kopie der
+    benötigten Spalten erzeugt, die Datei selbst bleibt gemappt.
+    """
+    import numpy as np
+    from frame_recorder import FrameReader
+
+    for path in recording_files(directory):
+        try:
+            reader = FrameReader(path)
+        except (OSError, ValueError) as e:
+            logger.warning(f"Aufzeichnung {path} übersprungen: {e}")
+            continue
+        frames = timestamps = block = None
+        try:
+            frames = reader.frames()
+            if not len(frames):
+                continue
+            timestamps = frames['timestamp']
+            if timestamps[0] > end or timestamps[-1] < start:
+                continue
+            lo = int(np.searchsorted(timestamps, start, side='left'))
+            hi = int(np.searchsorted(timestamps, end, side='right'))
+            for i in range(lo, hi, batch_rows):
+                block = frames[i:min(i + batch_rows, hi)]
+                yield block['timestamp'].copy(), decode_columns(reader.upgrade(block), channels)
+        finally:
+            # numpy-Sichten müssen weg sein, bevor das mmap geschlossen wird
+            frames = timestamps = block = None
+            try:
+                reader.close()
+            except BufferError:
+                pass
+
+
+def has_column_history(directory):
+    """Liegt im Verzeichnis eine Spalten-Historie (column_store) mit Daten?"""
+    if not directory or not os.path.isdir(directory):
+        return False
+    from column_store import HistoryReader
+    try:
+        return any(segment.count() for segment in HistoryReader(directory).segments())
+    except (OSError, ValueError) as e:
+        logger.warning(f"Spalten-Historie {directory} nicht lesbar: {e}")
+        return False
+
+
+def iter_column_batches(directory, start, end, channels, batch_rows=BATCH_ROWS):
+    """
+    Blöcke (Zeitstempel, {Kanal: Werte}) aus der Spalten-Historie lesen
+
+    Jeder Poll, aber nur die Messkanäle - Status-Register (Koppelschalter,
+    COT, ...) werden dort nicht gespeichert und bleiben leer.
+    """
+    import numpy as np
+    from column_store import HistoryReader
+
+    reader = HistoryReader(directory)
+    stored = [name for name in channels if name in reader.channels]
+    for batch in reader.iter_batches(start, end, stored, batch_rows):
+        timestamps = np.array(batch['time'], dtype=np.float64)
+        columns = {}
+        for name in channels:
+            if name in batch:
+                # float32 der Spalten auf die Stellen der Aufzeichnungen runden (236.32 statt 236.3200073)
+                columns[name] = np.round(batch[name].astype(np.float64), EXPORT_CHANNELS[name][2])
+            else:
+                columns[name] = np.full(len(timestamps), np.nan)
+        yield timestamps, columns
+
+
+def iter_history_batches(query_history, start, end, channels):
+    """Ein Block aus der Historie im Speicher (Mittelwerte; nur Messkanäle)"""
+    import numpy as np
+    from history_store import CHANNEL_NAMES
+
+    measured = [name for name in channels if name in CHANNEL_NAMES]
+    result = query_history(start, end, None, measured)
+    if not result['time']:
+        return
+    columns = {}
+    for name in channels:
+        values = result['channels'][name]['mean'] if name in measured else [None] * len(result['time'])
+        columns[name] = np.array([np.nan if v is None else v for v in values], dtype=np.float64)
+    yield np.array(result['time'], dtype=np.float64), columns
+
+
+def _csv_block(timestamps, columns, channels):
+    """Einen Block als CSV-Text formatieren (leere Felder für fehlende Werte)"""
+    import numpy as np
+
+    iso = np.datetime_as_string((timestamps * 1000).astype('datetime64[ms]'), unit='ms')
+    fields = [iso, np.char.mod('%.3f', timestamps)]
+    for name in channels:
+        values = columns[name]
+        text = np.char.mod('%.10g', values)
+        fields.append(np.where(np.isnan(values), '', text))
+    lines = fields[0].astype(object) + 'Z'
+    for field in fields[1:]:
+        lines = lines + ',' + field.astype(object)
+    return ('\n'.join(lines.tolist()) + '\n').encode('utf-8')
+
+
+def iter_csv(batches, channels):
+    """CSV-Bytes blockweise: Kopfzeile, dann ein Stück pro Block"""
+    yield (','.join(['time_utc', 'timestamp'] + list(channels)) + '\n').encode('utf-8')
+    for timestamps, columns in batches:
+        yield _csv_block(timestamps, columns, channels)
+        time.sleep(0)   # anderen Threads (Callbacks) den GIL überlassen
+
+
+class _StreamSink(io.RawIOBase):
+    """Datei-Objekt für pyarrow, das geschriebene Bytes zum Abholen sammelt"""
+
+    def __init__(self):
+        self._chunks = []
+        self._position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        data = bytes(data)
+        self._chunks.append(data)
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def take(self):
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def iter_parquet(batches, channels):
+    """Parquet-Bytes blockweise (ein Row Group pro Block)"""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = pa.schema([('time', pa.timestamp('ms', tz='UTC'))] + [(name, pa.float64()) for name in channels])
+    sink = _StreamSink()
+    writer = pq.ParquetWriter(sink, schema, compression='snappy')
+    try:
+        for timestamps, columns in batches:
+            arrays = [pa.array((timestamps * 1000).astype('int64'), type=pa.timestamp('ms', tz='UTC'))]
+            arrays += [pa.array(columns[name], from_pandas=True) for name in channels]
+            writer.write_table(pa.Table.from_arrays(arrays, schema=schema))
+            yield sink.take()
+            time.sleep(0)
+    finally:
+        writer.close()
+    yield sink.take()
+
+
+def export_stream(fmt, start, end, channels, directory=None, query_history=None, history_directory=None):
+    """
+    Export als Byte-Generator
+
+    Belegt den Export-Slot sofort (der erste Block wird hier schon erzeugt)
+    und gibt ihn am Ende - auch bei Abbruch der Verbindung - wieder frei.
+
+    Args:
+        fmt: 'csv' oder 'parquet'
+        start, end: Unix-Zeit
+        channels: Kanalnamen aus EXPORT_CHANNELS
+        directory: Verzeichnis der Aufzeichnungen (None = keine)
+        query_history: Funktion wie HistoryStore.query (Quelle ohne Aufzeichnungen und Spalten-Historie)
+        history_directory: Verzeichnis der Spalten-Historie (Quelle ohne Aufzeichnungen)
+
+    Raises:
+        ExportBusy: es läuft bereits ein Export
+    """
+    def generate():
+        if not _EXPORT_SLOTS.acquire(blocking=False):
+            raise ExportBusy("Es läuft bereits ein Export")
+        started = time.perf_counter()
+        size = 0
+        try:
+            yield b''
+            if recording_files(directory):
+                batches = iter_recording_batches(directory, start, end, channels)
+            elif has_column_history(history_directory):
+                batches = iter_column_batches(history_directory, start, end, channels)
+            else:
+                batches = iter_history_batches(query_history, start, end, channels)
+            chunks = iter_parquet(batches, channels) if fmt == 'parquet' else iter_csv(batches, channels)
+            for chunk in chunks:
+                if chunk:
+                    size += len(chunk)
+                    yield chunk
+            logger.info(f"Export ({fmt}) fertig: {size / 1e6:.1f} MB in {time.perf_counter() - started:.1f}s")
+        except GeneratorExit:
+            logger.info(f"Export ({fmt}) abgebrochen nach {size / 1e6:.1f} MB")
+            raise
+        except Exception as e:
+            logger.error(f"Export ({fmt}) fehlgeschlagen: {e}")
+            raise
+        finally:
+            _EXPORT_SLOTS.release()
+
+    stream = generate()
+    next(stream)   # Slot belegen (ExportBusy hier, nicht erst beim Senden)
+    return stream
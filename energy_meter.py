@@ -0,0 +1,312 @@
+"""
+Energiezähler (kWh) und Leistungsmittelwerte (15 min) aus der Datenerfassung
+
+Die Wirkleistung jedes Polls wird über die monotone Zeit mit der
+Trapezregel integriert - getrennt nach Bezug und Lieferung (bei einem
+Vorzeichenwechsel wird das Trapez am Nulldurchgang geteilt). Jeder Schritt
+kostet O(1), damit der Zähler auch für viele Geräte mitlaufen kann.
+
+Qualität: Ein Intervall wird nur integriert, wenn beide Endpunkte gültig
+sind (verbunden, Leistung lesbar) und der Abstand höchstens max_gap_s
+beträgt. Sonst wird es als Lücke gezählt (Anzahl und Dauer), nicht
+geschätzt. Kurze Aussetzer (ungültige Polls innerhalb von max_gap_s)
+werden überbrückt und getrennt gezählt. Nach einem Neustart beginnt die
+Integration mit dem ersten gültigen Poll neu; die Ausfallzeit zählt als
+Lücke. Dasselbe gilt bei einem Wechsel der Datenquelle (Epoche des
+Snapshots, z.B. neue IP): Fenster und laufender Block beginnen neu, die
+Umschaltung zählt als Lücke. Simulator-Snapshots werden nicht gezählt.
+
+Leistungsmittelwert:
+- gleitend über demand_window_s (Summe der Intervall-Energien in einer
+  Queue, ältere Einträge fallen vorne heraus - amortisiert O(1))
+- in festen Viertelstunden-Blöcken wie bei der Abrechnung (Energie des
+  Blocks / Blockdauer), mit Spitzenwert und Zeitpunkt
+- Maximum der Momentanleistung im Fenster über eine monotone Queue
+
+Die Zählerstände werden alle save_interval_s Sekunden und beim Beenden in
+eine JSON-Datei geschrieben (temporäre Datei + os.replace).
+"""
+import json
+import logging
+import os
+import threading
+import time
+from collections import deque
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+# Qualität des letzten Intervalls
+QUALITY_OK = 'ok'
+QUALITY_GAP = 'gap'          # Abstand > max_gap_s (z.B. Verbindungsausfall)
+QUALITY_INVALID = 'invalid'  # Poll ohne gültige Leistung
+QUALITY_START = 'start'      # erster gültiger Poll nach dem Start
+QUALITY_BRIDGED = 'bridged'  # integriert über ungültige Polls hinweg (Abstand <= max_gap_s)
+
+# Mindestabdeckung des gleitenden Fensters, bevor ein Spitzenwert zählt
+MIN_WINDOW_COVERAGE = 0.9
+
+_PERSISTED = ('import_kwh', 'export_kwh', 'gaps', 'gap_s', 'invalid_samples', 'covered_s', 'bridged_s',
+              'peak_demand_kw', 'peak_demand_at', 'peak_block_kw', 'peak_block_at', 'since', 'last_timestamp')
+
+
+def _split_trapezoid(p0, p1, dt):
+    """
+    Trapezfläche (kWs) in Bezug (>= 0) und Lieferung (< 0) zerlegen
+
+    Returns:
+        (Bezug, Lieferung) in kWs, beide >= 0
+    """
+    if p0 >= 0 and p1 >= 0:
+        return (p0 + p1) / 2 * dt, 0.0
+    if p0 <= 0 and p1 <= 0:
+        return 0.0, -(p0 + p1) / 2 * dt
+    # Vorzeichenwechsel: am Nulldurchgang teilen
+    t_zero = p0 / (p0 - p1) * dt
+    first = p0 / 2 * t_zero
+    second = p1 / 2 * (dt - t_zero)
+    return max(first, second, 0.0), -min(first, second, 0.0)
+
+
+class EnergyMeter:
+    """Integriert die Gesamtwirkleistung der Snapshots zu kWh und Leistungsmittelwerten"""
+
+    def __init__(self, state_file=None, demand_window_s=900, max_gap_s=10.0, save_interval_s=60.0):
+        """
+        Args:
+            state_file: JSON-Datei für die Zählerstände (None = nicht speichern)
+            demand_window_s: Fenster/Block für den Leistungsmittelwert in Sekunden
+            max_gap_s: größter Poll-Abstand, der noch integriert wird
+            save_interval_s: Abstand der Sicherungen in Sekunden
+        """
+        self.state_file = Path(state_file) if state_file else None
+        self.demand_window_s = float(demand_window_s)
+        self.max_gap_s = float(max_gap_s)
+        self.save_interval_s = save_interval_s
+        self._lock = threading.Lock()
+
+        # Zählerstände (persistent)
+        self.import_kwh = 0.0
+        self.export_kwh = 0.0
+        self.gaps = 0
+        self.gap_s = 0.0
+        self.invalid_samples = 0
+        self.covered_s = 0.0
+        self.bridged_s = 0.0
+        self.peak_demand_kw = None
+        self.peak_demand_at = None
+        self.peak_block_kw = None
+        self.peak_block_at = None
+        self.since = time.time()
+        self.last_timestamp = None
+
+        # Laufzeitzustand
+        self.quality = None
+        self._last = None                  # (monotonic, Leistung kW) des letzten gültigen Polls
+        self._invalid_since_last = False
+        self._epoch = None                 # Epoche der Datenquelle (Snapshot.epoch)
+        self._source_changed = False       # nächster gültiger Poll zählt die Umschaltung als Lücke
+        self._window = deque()             # (monotonic Ende, Netto-Energie kWs, Dauer s)
+        self._window_energy = 0.0
+        self._window_covered = 0.0
+        self._maxima = deque()             # (monotonic, kW) - absteigend, Maximum vorne
+        self.demand_kw = None
+        self._block_start = None           # Unix-Zeit des laufenden Blocks
+        self._block_energy = 0.0
+        self._block_covered = 0.0
+        self.last_block_kw = None
+        self._last_save = time.monotonic()
+
+        self._load()
+
+    def _load(self):
+        if self.state_file is None or not self.state_file.exists():
+            return
+        try:
+            with open(self.state_file, encoding='utf-8') as f:
+                state = json.load(f)
+            for key in _PERSISTED:
+                if key in state:
+                    setattr(self, key, state[key])
+            logger.info(f"Energiezähler geladen: Bezug {self.import_kwh:.3f} kWh, Lieferung {self.export_kwh:.3f} kWh")
+        except (OSError, ValueError) as e:
+            logger.error(f"Energiezähler {self.state_file} nicht lesbar, beginne bei 0: {e}")
+
+    def save(self):
+        """Zählerstände atomar in die JSON-Datei schreiben"""
+        if self.state_file is None:
+            return
+        with self._lock:
+            state = {key: getattr(self, key) for key in _PERSISTED}
+        tmp_file = self.state_file.with_name(self.state_file.name + '.tmp')
+        try:
+            with open(tmp_file, 'w', encoding='utf-8') as f:
+                json.dump(state, f, indent=2)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_file, self.state_file)
+        except OSError as e:
+            logger.error(f"Energiezähler konnte nicht gespeichert werden: {e}")
+
+    def on_snapshot(self, snapshot):
+        """Snapshot-Listener: einen Poll verarbeiten (Simulator-Werte werden nicht gezählt)"""
+        if snapshot.epoch != self._epoch:
+            if self._epoch is not None:
+                self.restart()
+            self._epoch = snapshot.epoch
+        if snapshot.simulator:
+            return
+        power_w = snapshot.data['power']['total'] if snapshot.connected else None
+        self.add(snapshot.monotonic, snapshot.timestamp, None if power_w is None else power_w / 1000)
+        if self.state_file is not None and snapshot.monotonic - self._last_save >= self.save_interval_s:
+            self._last_save = snapshot.monotonic
+            self.save()
+
+    def add(self, monotonic, timestamp, power_kw):
+        """
+        Einen Messwert verarbeiten (O(1) amortisiert)
+
+        Args:
+            monotonic: monotone Zeit des Polls in Sekunden
+            timestamp: Unix-Zeit des Polls (Blockgrenzen, Spitzenzeitpunkte)
+            power_kw: Gesamtwirkleistung in kW oder None (ungültig)
+        """
+        with self._lock:
+            if power_kw is None:
+                self.invalid_samples += 1
+                self._invalid_since_last = True
+                self.quality = QUALITY_INVALID
+                return
+            last = self._last
+            bridged = self._invalid_since_last
+            self._last = (monotonic, power_kw)
+            self._invalid_since_last = False
+            if last is None:
+                # Erster gültiger Poll (Start oder nach einem Quellenwechsel): Ausfall seit dem letzten Punkt
+                changed, self._source_changed = self._source_changed, False
+                if self.last_timestamp is not None and (changed or timestamp - self.last_timestamp > self.max_gap_s):
+                    self.gaps += 1
+                    self.gap_s += max(0.0, timestamp - self.last_timestamp)
+                self.quality = QUALITY_GAP if changed else QUALITY_START
+            else:
+                dt = monotonic - last[0]
+                if dt <= 0:
+                    return
+                if dt > self.max_gap_s:
+                    self.gaps += 1
+                    self.gap_s += dt
+                    self.quality = QUALITY_GAP
+                else:
+                    self._integrate(last[1], power_kw, dt, monotonic, timestamp)
+                    if bridged:
+                        self.bridged_s += dt
+                    self.quality = QUALITY_BRIDGED if bridged else QUALITY_OK
+            self.last_timestamp = timestamp
+            self._track_maximum(monotonic, power_kw)
+
+    def restart(self):
+        """
+        Integration neu beginnen (Wechsel der Datenquelle)
+
+        Zählerstände und Spitzen bleiben, das gleitende Fenster und der
+        laufende Block werden verworfen - sie enthielten Werte beider Quellen.
+        """
+        with self._lock:
+            self._source_changed = self.last_timestamp is not None
+            self._last = None
+            self._invalid_since_last = False
+            self._window.clear()
+            self._window_energy = 0.0
+            self._window_covered = 0.0
+            self._maxima.clear()
+            self.demand_kw = None
+            self._block_start = None
+            self._block_energy = 0.0
+            self._block_covered = 0.0
+        logger.info("Energiezähler: Datenquelle gewechselt - Integration beginnt neu")
+
+    def _integrate(self, p0, p1, dt, monotonic, timestamp):
+        imported, exported = _split_trapezoid(p0, p1, dt)
+        self.import_kwh += imported / 3600
+        self.export_kwh += exported / 3600
+        self.covered_s += dt
+        energy = imported - exported   # netto kWs
+
+        # Gleitendes Fenster: neues Intervall hinten, abgelaufene vorne heraus
+        self._window.append((monotonic, energy, dt))
+        self._window_energy += energy
+        self._window_covered += dt
+        horizon = monotonic - self.demand_window_s
+        while self._window and self._window[0][0] <= horizon:
+            _, old_energy, old_dt = self._window.popleft()
+            self._window_energy -= old_energy
+            self._window_covered -= old_dt
+        if self._window_covered > 0:
+            self.demand_kw = self._window_energy / self._window_covered
+            if self._window_covered >= MIN_WINDOW_COVERAGE * self.demand_window_s and (
+                    self.peak_demand_kw is None or self.demand_kw > self.peak_demand_kw):
+                self.peak_demand_kw = self.demand_kw
+                self.peak_demand_at = timestamp
+
+        # Feste Blöcke (z.B. Viertelstunden ab voller Stunde)
+        block = timestamp - timestamp % self.demand_window_s
+        if block != self._block_start:
+            self._close_block()
+            self._block_start = block
+        self._block_energy += energy
+        self._block_covered += dt
+
+    def _close_block(self):
+        if self._block_start is None or self._block_covered <= 0:
+            return
+        self.last_block_kw = self._block_energy / self.demand_window_s
+        # Nur ausreichend abgedeckte Blöcke zählen für die Spitze
+        if self._block_covered >= MIN_WINDOW_COVERAGE * self.demand_window_s and (
+                self.peak_block_kw is None or self.last_block_kw > self.peak_block_kw):
+            self.peak_block_kw = self.last_block_kw
+            self.peak_block_at = self._block_start
+        self._block_energy = 0.0
+        self._block_covered = 0.0
+
+    def _track_maximum(self, monotonic, power_kw):
+        maxima = self._maxima
+        while maxima and maxima[-1][1] <= power_kw:
+            maxima.pop()
+        maxima.append((monotonic, power_kw))
+        horizon = monotonic - self.demand_window_s
+        while maxima[0][0] <= horizon:
+            maxima.popleft()
+
+    def reset_peaks(self):
+        """Spitzenwerte zurücksetzen (z.B. zum Monatsbeginn)"""
+        with self._lock:
+            self.peak_demand_kw = self.peak_demand_at = None
+            self.peak_block_kw = self.peak_block_at = None
+        self.save()
+        logger.info("Leistungsspitzen zurückgesetzt")
+
+    def state(self):
+        """Aktueller Stand (JSON-serialisierbar)"""
+        with self._lock:
+            return {
+                'import_kwh': round(self.import_kwh, 6),
+                'export_kwh': round(self.export_kwh, 6),
+                'demand_kw': self.demand_kw,
+                'demand_window_s': self.demand_window_s,
+                'demand_coverage': round(self._window_covered / self.demand_window_s, 3),
+                'window_max_kw': self._maxima[0][1] if self._maxima else None,
+                'block_start': self._block_start,
+                'block_kw': self._block_energy / self.demand_window_s if self._block_start is not None else None,
+                'last_block_kw': self.last_block_kw,
+                'peak_demand_kw': self.peak_demand_kw,
+                'peak_demand_at': self.peak_demand_at,
+                'peak_block_kw': self.peak_block_kw,
+                'peak_block_at': self.peak_block_at,
+                'quality': self.quality,
+                'gaps': self.gaps,
+                'gap_s': round(self.gap_s, 1),
+                'invalid_samples': self.invalid_samples,
+                'covered_s': round(self.covered_s, 1),
+                'bridged_s': round(self.bridged_s, 1),
+                'since': self.since,
+            }
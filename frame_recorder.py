@@ -0,0 +1,374 @@
+"""
+Aufzeichnung und Wiedergabe der rohen Modbus-Register
+
+Jeder Poll-Zyklus wird als Frame fester Größe an eine Datei angehängt
+(memory-mapped, nur anhängen). Ein Frame enthält den monotonen und den
+Unix-Zeitstempel, eine Gültigkeitsmaske und alle Register des Zyklus im
+Layout von modbus_client.read_raw_registers().
+
+ReplayClient spielt eine Aufzeichnung mit der MRA4Client-Schnittstelle ab -
+in Echtzeit, beschleunigt oder Frame für Frame (Benchmarks, Fehlersuche).
+
+Dateiformat (Little-Endian):
+    Header (64 Byte): Magic 'MRA4RAW1', Version, Frame-Größe, Register pro
+        Frame, Startadresse Input-Block, Anzahl Frames (u64, Offset 32)
+    Frames: monotonic (f64), Unix-Zeit (f64), Maske (MASK_WORDS x u64,
+        Bit i = Register i gültig), Register (u16 ...)
+
+Version 2 hat die Phasenlagen im Input-Block und mehr als 64 Register pro
+Frame. Aufzeichnungen der Version 1 (ein Input-Block 20100-20155, Maske in
+einem u64) werden weiter gelesen und beim Lesen in das aktuelle Layout
+übertragen - ohne Phasenlagen, die Phasenleistung ist dann Gesamtleistung / 3.
+"""
+import logging
+import mmap
+import os
+import struct
+import time
+from datetime import datetime
+
+from modbus_client import (HOLDING_REGISTERS, INPUT_BLOCK_COUNT, INPUT_BLOCK_START, RAW_SIZE,
+                           decode_registers)
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b'MRA4RAW1'
+VERSION = 2
+HEADER_SIZE = 64
+_HEADER = struct.Struct('<8sIIII')
+_COUNT = struct.Struct('<Q')
+_COUNT_OFFSET = 32
+# Gültigkeitsmaske: ein Bit pro Register in 64-Bit-Worten
+MASK_WORDS = (RAW_SIZE + 63) // 64
+# Frame auf 8 Byte ausgerichtet (für numpy-Zugriff ohne Kopie)
+_FRAME = struct.Struct(f'<dd{MASK_WORDS}Q{RAW_SIZE}H')
+FRAME_SIZE = (_FRAME.size + 7) // 8 * 8
+
+# Version 1: 56 Input Register (20100-20155) + Holding Register, Maske in einem u64
+V1_INPUT_COUNT = 56
+V1_RAW_SIZE = V1_INPUT_COUNT + len(HOLDING_REGISTERS)
+_FRAME_V1 = struct.Struct(f'<ddQ{V1_RAW_SIZE}H')
+FRAME_SIZE_V1 = (_FRAME_V1.size + 7) // 8 * 8
+
+
+def frame_dtype(version=VERSION):
+    """numpy-dtype eines Frames (für Auswertungen direkt auf der Datei)"""
+    import numpy as np
+    if version == 1:
+        return np.dtype({
+            'names': ['monotonic', 'timestamp', 'mask', 'registers'],
+            'formats': ['<f8', '<f8', '<u8', (np.dtype('<u2'), V1_RAW_SIZE)],
+            'offsets': [0, 8, 16, 24],
+            'itemsize': FRAME_SIZE_V1,
+        })
+    return np.dtype({
+        'names': ['monotonic', 'timestamp', 'mask', 'registers'],
+        'formats': ['<f8', '<f8', (np.dtype('<u8'), MASK_WORDS), (np.dtype('<u2'), RAW_SIZE)],
+        'offsets': [0, 8, 16, 16 + 8 * MASK_WORDS],
+        'itemsize': FRAME_SIZE,
+    })
+
+
+def _upgrade_raw_v1(values, mask):
+    """Rohdaten eines Frames der Version 1 im aktuellen Layout (Phasenlagen fehlen)"""
+    raw = [None] * RAW_SIZE
+    for i, value in enumerate(values):
+        if mask >> i & 1:
+            # Der erste Input-Block beginnt in beiden Versionen bei 20100
+            raw[i if i < V1_INPUT_COUNT else INPUT_BLOCK_COUNT + i - V1_INPUT_COUNT] = value
+    return raw
+
+
+class FrameRecorder:
+    """Hängt Register-Frames an eine memory-mapped Datei an"""
+
+    def __init__(self, path, chunk_frames=4096):
+        """
+        Args:
+            path: Zieldatei (existiert sie, wird angehängt)
+            chunk_frames: Anzahl Frames, um die die Datei jeweils wächst
+        """
+        self.path = str(path)
+        self.chunk_frames = chunk_frames
+        exists = os.path.exists(self.path) and os.path.getsize(self.path) >= HEADER_SIZE
+        self._file = open(self.path, 'r+b' if exists else 'w+b')
+        if exists:
+            header = self._file.read(HEADER_SIZE)
+            magic, version, frame_size, raw_size, _ = _HEADER.unpack_from(header)
+            if magic != MAGIC or version != VERSION or frame_size != FRAME_SIZE or raw_size != RAW_SIZE:
+                raise ValueError(f"{self.path} ist keine kompatible Register-Aufzeichnung")
+            self.count = _COUNT.unpack_from(header, _COUNT_OFFSET)[0]
+        else:
+            header = bytearray(HEADER_SIZE)
+            _HEADER.pack_into(header, 0, MAGIC, VERSION, FRAME_SIZE, RAW_SIZE, INPUT_BLOCK_START)
+            self._file.write(header)
+            self.count = 0
+        self._map = None
+        self._capacity = 0
+        self._grow(self.count + chunk_frames)
+
+    def _grow(self, frames):
+        if self._map is not None:
+            self._map.close()
+        self._file.truncate(HEADER_SIZE + frames * FRAME_SIZE)
+        self._map = mmap.mmap(self._file.fileno(), 0)
+        self._capacity = frames
+
+    def append(self, raw, monotonic=None, timestamp=None):
+        """
+        Einen Poll-Zyklus anhängen
+
+        Args:
+            raw: Liste mit RAW_SIZE Registerwerten (None = nicht lesbar)
+            monotonic: time.monotonic() des Polls
+            timestamp: Unix-Zeit des Polls
+        """
+        if self.count >= self._capacity:
+            self._grow(self._capacity + self.chunk_frames)
+        mask = 0
+        values = [0] * RAW_SIZE
+        for i, value in enumerate(raw):
+            if value is not None:
+                mask |= 1 << i
+                values[i] = value
+        _FRAME.pack_into(self._map, HEADER_SIZE + self.count * FRAME_SIZE,
+                         time.monotonic() if monotonic is None else monotonic,
+                         time.time() if timestamp is None else timestamp,
+                         *(mask >> 64 * word & 0xFFFFFFFFFFFFFFFF for word in range(MASK_WORDS)), *values)
+        self.count += 1
+        # Zähler erst nach dem Frame schreiben - Leser sehen nur vollständige Frames
+        _COUNT.pack_into(self._map, _COUNT_OFFSET, self.count)
+
+    def close(self):
+        """Datei auf die belegte Größe kürzen und schließen"""
+        if self._map is None:
+            return
+        self._map.flush()
+        self._map.close()
+        self._map = None
+        self._file.truncate(HEADER_SIZE + self.count * FRAME_SIZE)
+        self._file.close()
+        logger.info(f"Register-Aufzeichnung geschlossen: {self.path} ({self.count} Frames)")
+
+    @classmethod
+    def in_directory(cls, directory, **kwargs):
+        """Neue Aufzeichnung mit Zeitstempel im Dateinamen anlegen"""
+        os.makedirs(directory, exist_ok=True)
+        name = datetime.now().strftime('mra4_%Y%m%d_%H%M%S.rec')
+        return cls(os.path.join(directory, name), **kwargs)
+
+
+class FrameReader:
+    """Liest eine Register-Aufzeichnung (auch während sie noch geschrieben wird)"""
+
+    def __init__(self, path):
+        self.path = str(path)
+        self._file = open(self.path, 'rb')
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, frame_size, raw_size, _ = _HEADER.unpack_from(self._map)
+        if magic != MAGIC or (version, frame_size, raw_size) not in ((VERSION, FRAME_SIZE, RAW_SIZE),
+                                                                     (1, FRAME_SIZE_V1, V1_RAW_SIZE)):
+            raise ValueError(f"{self.path} ist keine kompatible Register-Aufzeichnung (Version {version})")
+        self.version = version
+        self.frame_size = frame_size
+
+    def __len__(self):
+        count = _COUNT.unpack_from(self._map, _COUNT_OFFSET)[0]
+        if HEADER_SIZE + count * self.frame_size > len(self._map):
+            # Der Rekorder hat die Datei vergrößert - neu einblenden (alte Ansichten bleiben gültig)
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        return min(count, (len(self._map) - HEADER_SIZE) // self.frame_size)
+
+    def frame(self, index):
+        """
+        Einen Frame lesen (Version 1 im aktuellen Layout)
+
+        Returns:
+            (monotonic, Unix-Zeit, Rohdaten-Liste mit None für ungültige Register)
+        """
+        offset = HEADER_SIZE + index * self.frame_size
+        if self.version == 1:
+            monotonic, timestamp, mask, *values = _FRAME_V1.unpack_from(self._map, offset)
+            return monotonic, timestamp, _upgrade_raw_v1(values, mask)
+        monotonic, timestamp, *fields = _FRAME.unpack_from(self._map, offset)
+        mask = 0
+        for word, bits in enumerate(fields[:MASK_WORDS]):
+            mask |= bits << 64 * word
+        raw = [value if mask >> i & 1 else None for i, value in enumerate(fields[MASK_WORDS:])]
+        return monotonic, timestamp, raw
+
+    def frames(self):
+        """
+        Alle Frames als numpy-Array (ohne Kopie, nur lesend)
+
+        Das Layout ist das der Datei (frame_dtype(reader.version)) - für
+        Registerzugriffe Ausschnitte mit upgrade() umwandeln.
+        """
+        import numpy as np
+        return np.frombuffer(self._map, dtype=frame_dtype(self.version), count=len(self), offset=HEADER_SIZE)
+
+    def upgrade(self, frames):
+        """
+        Ausschnitt von frames() im aktuellen Layout (Version 2 unverändert, Version 1 als Kopie)
+
+        Register der Version 1 landen an ihren Adressen, die Phasenlagen bleiben ungültig.
+        """
+        if self.version == VERSION:
+            return frames
+        import numpy as np
+        upgraded = np.zeros(len(frames), dtype=frame_dtype())
+        upgraded['monotonic'] = frames['monotonic']
+        upgraded['timestamp'] = frames['timestamp']
+        registers = frames['registers']
+        upgraded['registers'][:, :V1_INPUT_COUNT] = registers[:, :V1_INPUT_COUNT]
+        upgraded['registers'][:, INPUT_BLOCK_COUNT:] = registers[:, V1_INPUT_COUNT:]
+        mask = frames['mask']
+        # Maskenbits an die neuen Registerpositionen schieben (Input-Block bleibt, Holding Register wandern)
+        for bit in range(V1_RAW_SIZE):
+            target = bit if bit < V1_INPUT_COUNT else INPUT_BLOCK_COUNT + bit - V1_INPUT_COUNT
+            word, shift = divmod(target, 64)
+            upgraded['mask'][:, word] |= ((mask >> np.uint64(bit)) & np.uint64(1)) << np.uint64(shift)
+        return upgraded
+
+    def close(self):
+        self._map.close()
+        self._file.close()
+
+
+class ReplayClient:
+    """
+    Spielt eine Register-Aufzeichnung mit der Schnittstelle des MRA4Client ab
+
+    Schreibende Befehle (Quittieren, Koppelschalter, Störschrieb) werden
+    protokolliert und ignoriert.
+    """
+
+    def __init__(self, path, speed=1.0, loop=False):
+        """
+        Args:
+            path: Aufzeichnung (.rec)
+            speed: Wiedergabe-Geschwindigkeit (1.0 = Echtzeit); None = jeder
+                read_raw_registers()-Aufruf liefert den nächsten Frame
+            loop: am Ende von vorn beginnen (sonst bleibt der letzte Frame stehen)
+        """
+        self.path = str(path)
+        self.host = 'replay'
+        self.port = 0
+        self.unit_id = 1
+        self.speed = speed
+        self.loop = loop
+        self.connected = False
+        self.finished = False
+        self.index = -1
+        self._reader = None
+        self._monotonic = None
+        self._started = 0.0
+        self._raw = [None] * RAW_SIZE
+
+    def connect(self):
+        if self._reader is None:
+            self._reader = FrameReader(self.path)
+            self._monotonic = self._reader.frames()['monotonic']
+        if len(self._reader) == 0:
+            logger.error(f"[REPLAY] Aufzeichnung {self.path} ist leer")
+            return False
+        self._started = time.monotonic()
+        self.index = -1
+        self.finished = False
+        self.connected = True
+        logger.info(f"[REPLAY] {self.path}: {len(self._reader)} Frames, Geschwindigkeit "
+                    f"{'Frame für Frame' if not self.speed else f'x{self.speed:g}'}")
+        return True
+
+    def disconnect(self):
+        self.connected = False
+
+    def _next_index(self):
+        count = len(self._reader)
+        if count != len(self._monotonic):
+            # Aufzeichnung läuft noch - neue Frames mit abspielen
+            self._monotonic = self._reader.frames()['monotonic']
+        if not self.speed:
+            index = self.index + 1
+            if index < count:
+                return index
+        else:
+            target = self._monotonic[0] + (time.monotonic() - self._started) * self.speed
+            if target <= self._monotonic[-1]:
+                import numpy as np
+                return max(int(np.searchsorted(self._monotonic, target, side='right')) - 1, 0)
+        # Ende der Aufzeichnung überschritten
+        if self.loop:
+            self._started = time.monotonic()
+            return 0
+        self.finished = True
+        return count - 1
+
+    def read_raw_registers(self):
+        """Rohdaten des zur aktuellen Wiedergabezeit gehörenden Frames"""
+        self.index = self._next_index()
+        self._raw = self._reader.frame(self.index)[2]
+        return self._raw
+
+    def read_all_data(self):
+        return decode_registers(self.read_raw_registers())
+
+    # Einzelwerte aus dem zuletzt gelieferten Frame
+    def _data(self):
+        return decode_registers(self._raw)
+
+    def read_voltage(self, phase=1):
+        return self._data()['voltage'][f'L{phase}']
+
+    def read_current(self, phase=1):
+        return self._data()['current'][f'L{phase}']
+
+    def read_power(self, phase=1):
+        return self._data()['power'][f'L{phase}']
+
+    def read_total_power(self):
+        return self._data()['power']['total']
+
+    def read_frequency(self):
+        return self._data()['frequency']
+
+    def read_coupling_switch(self):
+        return self._data()['coupling_switch']
+
+    def read_di_status(self, di_number=1):
+        value = self._raw[len(self._raw) - len(HOLDING_REGISTERS) + HOLDING_REGISTERS.index(1000)]
+        return None if value is None else (value >> (di_number - 1) & 1) == 1
+
+    def read_protection_status(self):
+        return self._data()['protection_status']
+
+    def read_cause_of_trip(self):
+        return self._data()['cause_of_trip']
+
+    def read_fault_number(self):
+        return self._data()['fault_number']
+
+    def read_fault_recording_status(self):
+        return self._data()['fault_recording']
+
+    def _ignored(self, command):
+        logger.info(f"[REPLAY] Befehl {command} ignoriert (Wiedergabe)")
+        return True
+
+    def acknowledge_all(self):
+        return self._ignored('acknowledge_all')
+
+    def acknowledge_device(self):
+        return self._ignored('acknowledge_device')
+
+    def acknowledge_trip_command(self):
+        return self._ignored('acknowledge_trip_command')
+
+    def send_coupling_pulse(self, duration=2.0):
+        return self._ignored('send_coupling_pulse')
+
+    def write_coupling_switch(self, state):
+        return self._ignored('write_coupling_switch')
+
+    def write_fault_recording_trigger(self, state):
+        return self._ignored('write_fault_recording_trigger')
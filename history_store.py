@@ -0,0 +1,292 @@
+"""
+Messwert-Historie mit vorverdichteten Stufen (für die REST-API)
+
+Neben den Rohpunkten (ein Punkt pro Poll) werden beim Eintragen Stufen mit
+festen Zeitrastern fortgeschrieben (Mittel, Minimum, Maximum pro Raster).
+Eine Abfrage über einen langen Zeitraum liest damit nur wenige
+vorverdichtete Zeilen statt aller Rohpunkte.
+
+    Stufe       Raster   Kapazität          Zeitraum
+    roh         Poll     history_points     (1 h bei 1 s)
+    10 s        10 s     8640               24 h
+    1 min       60 s     10080              7 Tage
+    15 min      900 s    2976               31 Tage
+
+Neben den Messwerten werden die Kennwerte der Netzqualität (Unsymmetrie,
+df/dt aus data['analytics']) als eigene Kanäle geführt.
+
+Die Werte liegen in numpy-Ringpuffern (float32), None wird als NaN
+gespeichert und in Abfragen als None ausgegeben. Die Historie liegt nur im
+Speicher - nach einem Neustart beginnt sie leer.
+"""
+import logging
+import math
+import threading
+
+import numpy as np
+
+from acquisition import PHASES
+
+logger = logging.getLogger(__name__)
+
+# Kanalname -> Pfad im read_all_data()-Datensatz (Einheiten wie vom Gerät: V, A, W, Hz)
+CHANNELS = {
+    **{f'voltage.{phase}': ('voltage', phase) for phase in PHASES},
+    **{f'current.{phase}': ('current', phase) for phase in PHASES},
+    **{f'power.{key}': ('power', key) for key in PHASES + ('total',)},
+    'frequency': ('frequency',),
+    # Netzqualität (power_quality): Unsymmetrie in %, df/dt in Hz/s
+    'unbalance.voltage': ('analytics', 'voltage_unbalance'),
+    'unbalance.current': ('analytics', 'current_unbalance'),
+    'rocof': ('analytics', 'rocof'),
+}
+CHANNEL_NAMES = tuple(CHANNELS)
+
+# (Raster in Sekunden, Kapazität) der verdichteten Stufen
+DEFAULT_TIERS = ((10, 8640), (60, 10080), (900, 2976))
+
+# Obergrenze der Punkte pro Abfrage (gröberes Raster wird automatisch gewählt)
+MAX_POINTS = 10000
+
+
+def _value(data, path):
+    value = data
+    for key in path:
+        value = value.get(key) if isinstance(value, dict) else None
+    return math.nan if value is None else float(value)
+
+
+class _Ring:
+    """Ringpuffer für Zeitstempel und Mittel/Min/Max pro Kanal"""
+
+    def __init__(self, capacity, channels):
+        self.capacity = capacity
+        self.time = np.zeros(capacity, dtype=np.float64)
+        self.mean = np.full((capacity, channels), np.nan, dtype=np.float32)
+        self.min = np.full((capacity, channels), np.nan, dtype=np.float32)
+        self.max = np.full((capacity, channels), np.nan, dtype=np.float32)
+        self.count = np.zeros((capacity, channels), dtype=np.uint32)
+        self.pos = 0
+        self.size = 0
+
+    def append(self, t, mean, low, high, count):
+        i = self.pos
+        self.time[i] = t
+        self.mean[i] = mean
+        self.min[i] = low
+        self.max[i] = high
+        self.count[i] = count
+        self.pos = (i + 1) % self.capacity
+        self.size = min(self.size + 1, self.capacity)
+
+    def oldest(self):
+        if not self.size:
+            return None
+        return self.time[(self.pos - self.size) % self.capacity]
+
+    def window(self, start, end, columns):
+        """Zeilen mit start <= Zeit <= end in zeitlicher Reihenfolge (Kopien)"""
+        order = np.arange(self.pos - self.size, self.pos) % self.capacity
+        times = self.time[order]
+        rows = order[np.searchsorted(times, start, side='left'):np.searchsorted(times, end, side='right')]
+        return (self.time[rows], self.mean[rows][:, columns], self.min[rows][:, columns],
+                self.max[rows][:, columns], self.count[rows][:, columns])
+
+
+class _Accumulator:
+    """Laufendes Raster einer verdichteten Stufe (noch nicht abgeschlossen)"""
+
+    def __init__(self, channels):
+        self.start = None
+        self.sum = np.zeros(channels)
+        self.min = np.full(channels, np.inf)
+        self.max = np.full(channels, -np.inf)
+        self.count = np.zeros(channels, dtype=np.uint32)
+
+    def reset(self, start):
+        self.start = start
+        self.sum[:] = 0.0
+        self.min[:] = np.inf
+        self.max[:] = -np.inf
+        self.count[:] = 0
+
+    def add(self, values, valid):
+        self.sum += np.where(valid, values, 0.0)
+        np.fmin(self.min, values, out=self.min)
+        np.fmax(self.max, values, out=self.max)
+        self.count += valid
+
+    def row(self):
+        """(Mittel, Min, Max, Anzahl) mit NaN für Kanäle ohne gültigen Wert"""
+        valid = self.count > 0
+        with np.errstate(invalid='ignore', divide='ignore'):
+            mean = np.where(valid, self.sum / np.maximum(self.count, 1), np.nan)
+        return mean, np.where(valid, self.min, np.nan), np.where(valid, self.max, np.nan), self.count.copy()
+
+
+class HistoryStore:
+    """Rohpunkte und verdichtete Stufen aller Messkanäle"""
+
+    def __init__(self, raw_points=3600, tiers=DEFAULT_TIERS):
+        """
+        Args:
+            raw_points: Kapazität der Rohpunkte (ein Punkt pro Poll)
+            tiers: (Raster in Sekunden, Kapazität) der verdichteten Stufen
+        """
+        channels = len(CHANNEL_NAMES)
+        self.raw = _Ring(raw_points, channels)
+        self.tiers = [(resolution, _Ring(capacity, channels), _Accumulator(channels))
+                      for resolution, capacity in sorted(tiers)]
+        self.seq = 0
+        self._lock = threading.Lock()
+
+    def on_snapshot(self, snapshot):
+        """Snapshot-Listener: Messwerte eines Polls eintragen"""
+        if not snapshot.connected:
+            return
+        values = np.array([_value(snapshot.data, path) for path in CHANNELS.values()])
+        self.add(snapshot.timestamp, values, snapshot.seq)
+
+    def add(self, t, values, seq=None):
+        """
+        Einen Punkt eintragen
+
+        Args:
+            t: Unix-Zeit
+            values: Werte in der Reihenfolge von CHANNEL_NAMES (NaN = ungültig)
+            seq: Snapshot-Nummer (für ETags)
+        """
+        valid = ~np.isnan(values)
+        with self._lock:
+            self.raw.append(t, values, values, values, valid)
+            for resolution, ring, acc in self.tiers:
+                start = t - t % resolution
+                if acc.start != start:
+                    if acc.start is not None:
+                        ring.append(acc.start, *acc.row())
+                    acc.reset(start)
+                acc.add(values, valid)
+            self.seq = self.seq + 1 if seq is None else seq
+
+    def info(self):
+        """Stufen mit Raster, Anzahl Zeilen und ältestem Zeitstempel"""
+        with self._lock:
+            tiers = [{'resolution': None, 'rows': self.raw.size, 'oldest': _float(self.raw.oldest())}]
+            tiers += [{'resolution': resolution, 'rows': ring.size, 'oldest': _float(ring.oldest())}
+                      for resolution, ring, _ in self.tiers]
+        return {'seq': self.seq, 'channels': list(CHANNEL_NAMES), 'tiers': tiers}
+
+    def _select(self, start, resolution):
+        """
+        Stufe für eine Abfrage wählen
+
+        Bevorzugt die gröbste Stufe mit Raster <= resolution, die den Anfang
+        noch abdeckt. Reicht keine so weit zurück, die feinste gröbere Stufe,
+        die ihn abdeckt. Sonst (Historie jünger als der Zeitraum) die gröbste
+        Stufe mit Raster <= resolution.
+
+        Returns:
+            (Raster oder None für Rohpunkte, Ring, Akkumulator oder None)
+        """
+        levels = [(None, self.raw, None)] + self.tiers
+        finer = [level for level in levels if (level[0] or 0) <= resolution]
+
+        def covers(level):
+            oldest = level[1].oldest()
+            return oldest is not None and oldest <= start
+
+        for level in reversed(finer):
+            if covers(level):
+                return level
+        for level in levels[len(finer):]:
+            if covers(level):
+                return level
+        return finer[-1]
+
+    def query(self, start, end, resolution=None, channels=None):
+        """
+        Historie eines Zeitraums abfragen
+
+        Args:
+            start, end: Unix-Zeit
+            resolution: Raster in Sekunden (None = automatisch, max. MAX_POINTS Punkte)
+            channels: Kanalnamen aus CHANNEL_NAMES (None = alle)
+
+        Returns:
+            Dictionary mit 'time' (Rasterbeginn bzw. Zeitpunkt des Rohpunkts),
+            'channels' ({Kanal: {'mean', 'min', 'max'}}), 'resolution'
+            (tatsächliches Raster, None = Rohpunkte), 'tier' (gelesene Stufe)
+            und 'seq' (Stand der Historie). Listen enthalten None statt NaN.
+        """
+        names = list(CHANNEL_NAMES) if not channels else list(channels)
+        unknown = [name for name in names if name not in CHANNELS]
+        if unknown:
+            raise ValueError(f"Unbekannte Kanäle: {', '.join(unknown)}")
+        if end < start:
+            raise ValueError("'to' liegt vor 'from'")
+        columns = [CHANNEL_NAMES.index(name) for name in names]
+        auto = resolution is None
+        resolution = max(resolution or 0.0, (end - start) / MAX_POINTS)
+
+        with self._lock:
+            tier, ring, acc = self._select(start, resolution)
+            # Raster, die den Anfang überlappen, gehören dazu
+            lower = start - tier + 1e-6 if tier else start
+            times, mean, low, high, count = ring.window(lower, end, columns)
+            if acc is not None and acc.start is not None and lower <= acc.start <= end:
+                # Laufendes Raster mitliefern, damit die neuesten Punkte nicht fehlen
+                row = acc.row()
+                times = np.append(times, acc.start)
+                mean, low, high, count = (np.vstack((a, r[columns].astype(a.dtype)))
+                                          for a, r in zip((mean, low, high, count), row))
+            seq = self.seq
+
+        step = tier
+        if times.size and resolution > (tier or 0) and (not auto or times.size > MAX_POINTS):
+            step = self._step(resolution)
+            if step > (tier or 0):
+                times, mean, low, high = self._downsample(times, mean, low, high, count, step)
+            else:
+                step = tier
+
+        return {
+            'from': start,
+            'to': end,
+            'resolution': step,
+            'tier': tier,
+            'seq': seq,
+            'time': times.tolist(),
+            'channels': {name: {'mean': _list(mean[:, i]), 'min': _list(low[:, i]), 'max': _list(high[:, i])}
+                         for i, name in enumerate(names)},
+        }
+
+    @staticmethod
+    def _step(resolution):
+        # Ganze Sekunden, damit die Raster an der Uhr ausgerichtet sind
+        return max(1, int(math.ceil(resolution)))
+
+    @staticmethod
+    def _downsample(times, mean, low, high, count, step):
+        """Zeilen auf ein gröberes Raster zusammenfassen (Mittel gewichtet mit der Anzahl)"""
+        buckets = times - times % step
+        starts = np.flatnonzero(np.r_[True, buckets[1:] != buckets[:-1]])
+        weights = count.astype(np.float64)
+        total = np.add.reduceat(np.where(weights > 0, mean, 0.0) * weights, starts)
+        n = np.add.reduceat(weights, starts)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            mean = np.where(n > 0, total / np.maximum(n, 1), np.nan)
+        low = np.fmin.reduceat(low, starts)
+        high = np.fmax.reduceat(high, starts)
+        return buckets[starts], mean, low, high
+
+
+def _list(column):
+    """numpy-Spalte als Liste, NaN -> None, auf 4 Nachkommastellen gerundet"""
+    values = np.round(column.astype(np.float64), 4)
+    if not np.isnan(values).any():
+        return values.tolist()
+    return [None if v != v else v for v in values.tolist()]
+
+
+def _float(value):
+    return None if value is None else float(value)
@@ -0,0 +1,95 @@
+"""
+Host-Informationen (Hostname, IP-Adresse) für Statusleiste und Startmeldung
+
+Hostname und IP werden einmal im Hintergrund ermittelt und danach in großen
+Abständen aufgefrischt. Callbacks lesen nur die zwischengespeicherten Werte -
+ein langsames oder fehlendes DNS blockiert damit keinen Web-Worker mehr.
+"""
+import logging
+import socket
+import threading
+
+logger = logging.getLogger(__name__)
+
+
+def _primary_ip():
+    """IP der Schnittstelle mit der Standardroute (UDP-connect sendet kein Paket, kein DNS)"""
+    s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    try:
+        s.connect(("8.8.8.8", 80))
+        return s.getsockname()[0]
+    finally:
+        s.close()
+
+
+class HostInfo:
+    """Zwischengespeicherte Host-Identität mit Hintergrund-Aktualisierung"""
+
+    def __init__(self, refresh_s=600.0, check_s=30.0):
+        """
+        Args:
+            refresh_s: Abstand für die vollständige Neuermittlung (inkl. DNS)
+            check_s: Abstand für die günstige Prüfung auf Netzwerkwechsel
+        """
+        self.refresh_s = refresh_s
+        self.check_s = check_s
+        # Startwerte bis zur ersten Ermittlung
+        self.hostname = "localhost"
+        self.local_ip = "127.0.0.1"
+        self.resolved_ip = "localhost"
+        self._ready = threading.Event()
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def start(self):
+        """Hintergrund-Thread starten (erste Ermittlung sofort)"""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._thread = threading.Thread(target=self._run, name='host-info', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+
+    def wait_ready(self, timeout=None):
+        """Auf die erste Ermittlung warten (z.B. für die Startmeldung)"""
+        return self._ready.wait(timeout)
+
+    def refresh(self):
+        """Alle Werte neu ermitteln (kann bei langsamem DNS Sekunden dauern)"""
+        try:
+            hostname = socket.gethostname()
+        except Exception:
+            hostname = "localhost"
+        try:
+            local_ip = _primary_ip()
+        except Exception:
+            local_ip = "127.0.0.1"
+        try:
+            resolved_ip = socket.gethostbyname(hostname)
+        except Exception:
+            resolved_ip = "localhost"
+
+        changed = (hostname, local_ip) != (self.hostname, self.local_ip)
+        # Einzelne Attribut-Zuweisungen sind atomar - Leser sehen alte oder neue Werte
+        self.hostname = hostname
+        self.local_ip = local_ip
+        self.resolved_ip = resolved_ip
+        if changed and self._ready.is_set():
+            logger.info(f"Netzwerk geändert: {hostname} / {local_ip}")
+        self._ready.set()
+
+    def _network_changed(self):
+        try:
+            return _primary_ip() != self.local_ip
+        except Exception:
+            return self.local_ip != "127.0.0.1"
+
+    def _run(self):
+        self.refresh()
+        since_refresh = 0.0
+        while not self._stop_event.wait(self.check_s):
+            since_refresh += self.check_s
+            if since_refresh >= self.refresh_s or self._network_changed():
+                self.refresh()
+                since_refresh = 0.0
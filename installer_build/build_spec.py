@@ -17,8 +17,27 @@ added_files = [
     ('../app.py', '.'),
     ('../modbus_client.py', '.'),
     ('../config_manager.py', '.'),
+    ('../log_buffer.py', '.'),
+    ('../acquisition.py', '.'),
+    ('../render_cache.py', '.'),
+    ('../startup_profile.py', '.'),
+    ('../shm_snapshot.py', '.'),
+    ('../host_info.py', '.'),
+    ('../scenario.py', '.'),
+    ('../frame_recorder.py', '.'),
+    ('../modbus_metrics.py', '.'),
+    ('../metrics_exporter.py', '.'),
+    ('../modbus_gateway.py', '.'),
+    ('../history_store.py', '.'),
+    ('../rest_api.py', '.'),
+    ('../data_export.py', '.'),
+    ('../column_store.py', '.'),
+    ('../energy_meter.py', '.'),
+    ('../power_quality.py', '.'),
+    ('../alarm_engine.py', '.'),
+    ('../trip_recorder.py', '.'),
+    ('../scenarios', 'scenarios'),
     ('../assets', 'assets'),
-    ('../MRA4-3.7-DE-Modbus.xlsx', '.'),
 ]
 
 # Hidden imports für Dash und Modbus
@@ -31,13 +50,26 @@ hiddenimports = [
     'pymodbus',
     'pymodbus.client',
     'pymodbus.exceptions',
-    'pandas',
-    'openpyxl',
     'werkzeug',
     'flask',
     'flask_compress',
 ]
 
+# Zur Laufzeit nicht benötigte Pakete (kleineres Bundle, schnellerer Start).
+# IPython & Co. würde dash._jupyter sonst beim Start mitladen.
+excludes = [
+    'pandas',
+    'openpyxl',
+    'IPython',
+    'jedi',
+    'prompt_toolkit',
+    'nest_asyncio',
+    'comm',
+    'matplotlib',
+    'tkinter',
+    'pytest',
+]
+
 # Dash-spezifische Daten
 dash_data = collect_data_files('dash')
 dbc_data = collect_data_files('dash_bootstrap_components')
@@ -52,7 +84,7 @@ a = Analysis(
     hookspath=[],
     hooksconfig={},
     runtime_hooks=[],
-    excludes=[],
+    excludes=excludes,
     win_no_prefer_redirects=False,
     win_private_assemblies=False,
     cipher=block_cipher,
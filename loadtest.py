@@ -0,0 +1,239 @@
+"""
+Lastgenerator für die Dash-Callback-Endpunkte
+
+Simuliert N gleichzeitige Browser-Sitzungen auf der Dashboard-Seite. Jede
+Sitzung lädt die Seite wie ein Browser und sendet dann pro Interval-Tick alle
+/_dash-update-component-Anfragen der Interval-Callbacks (inkl. Stores wie
+max-power-store) über eine eigene Keep-Alive-Verbindung.
+
+    python loadtest.py --start simulator --sessions 1,5,10,20,50
+    python loadtest.py --url http://127.0.0.1:8050 --sessions 10,40 --step-duration 30
+
+Ziel ist entweder ein laufendes Dashboard (--url, z.B. mit dem Emulator als
+Modbus-Gerät) oder ein automatisch gestartetes Dashboard im Simulator-Modus
+(--start simulator). Pro Stufe werden Durchsatz, Latenz-Perzentile,
+Fehlerrate und der Anteil verspäteter Ticks (Tick dauert länger als das
+Intervall) ausgegeben - die erste Stufe mit mehr als 5 % verspäteten Ticks
+oder 1 % Fehlern gilt als Überlast.
+"""
+import argparse
+import http.client
+import json
+import logging
+import os
+import random
+import subprocess
+import sys
+import threading
+import time
+from datetime import datetime
+from urllib.parse import urlsplit
+
+from benchmark import collect_props, interval_requests, percentiles, request_label
+
+logger = logging.getLogger(__name__)
+
+OVERLOAD_LATE_TICKS = 0.05
+OVERLOAD_ERRORS = 0.01
+
+
+class _Connection:
+    """Keep-Alive-Verbindung einer Sitzung (baut sich nach Fehlern neu auf)"""
+
+    def __init__(self, host, port, timeout):
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self._conn = None
+
+    def request(self, method, path, body=None):
+        if self._conn is None:
+            self._conn = http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+        headers = {'Content-Type': 'application/json'} if body is not None else {}
+        try:
+            self._conn.request(method, path, body=body, headers=headers)
+            response = self._conn.getresponse()
+            return response.status, response.read()
+        except Exception:
+            self._conn.close()
+            self._conn = None
+            raise
+
+    def get(self, path):
+        return self.request('GET', path)[1]
+
+    def post(self, path, body):
+        return self.request('POST', path, json.dumps(body))
+
+    def close(self):
+        if self._conn is not None:
+            self._conn.close()
+
+
+class Session(threading.Thread):
+    """Eine simulierte Browser-Sitzung"""
+
+    def __init__(self, host, port, requests, interval_s, timeout, stop_event):
+        super().__init__(name='loadtest-session', daemon=True)
+        self.connection = _Connection(host, port, timeout)
+        self.requests = [(request_label(body), json.dumps(body)) for body in requests]
+        self.interval_s = interval_s
+        self.stop_event = stop_event
+        # (Zeitpunkt, Label, Latenz in ms, ok) pro Anfrage und (Zeitpunkt, Dauer in s) pro Tick
+        self.samples = []
+        self.ticks = []
+
+    def run(self):
+        conn = self.connection
+        try:
+            conn.get('/')   # Seite laden wie der Browser
+        except Exception as e:
+            logger.warning(f"Seite nicht ladbar: {e}")
+        # Sitzungen starten nicht alle im selben Moment
+        next_tick = time.monotonic() + random.uniform(0, self.interval_s)
+        while not self.stop_event.wait(max(0.0, next_tick - time.monotonic())):
+            tick_start = time.monotonic()
+            for label, body in self.requests:
+                t0 = time.monotonic()
+                try:
+                    status, _ = conn.request('POST', '/_dash-update-component', body)
+                    ok = status in (200, 204)
+                except Exception:
+                    ok = False
+                self.samples.append((t0, label, (time.monotonic() - t0) * 1000, ok))
+            duration = time.monotonic() - tick_start
+            self.ticks.append((tick_start, duration))
+            # Wie dcc.Interval: verpasste Ticks werden nicht nachgeholt
+            next_tick += self.interval_s
+            if next_tick < time.monotonic():
+                next_tick = time.monotonic()
+        conn.close()
+
+
+def run_step(sessions, window_start, window_end, interval_s):
+    """Messwerte aller Sitzungen im Zeitfenster auswerten"""
+    samples = [s for session in sessions for s in session.samples if window_start <= s[0] < window_end]
+    ticks = [t for session in sessions for t in session.ticks if window_start <= t[0] < window_end]
+    latencies = [s[2] for s in samples]
+    errors = sum(1 for s in samples if not s[3])
+    late = sum(1 for t in ticks if t[1] > interval_s)
+    duration = window_end - window_start
+    per_callback = {}
+    for label in sorted({s[1] for s in samples}):
+        per_callback[label] = percentiles([s[2] for s in samples if s[1] == label])
+    return {
+        'sessions': len(sessions),
+        'requests': len(samples),
+        'throughput_rps': round(len(samples) / duration, 2),
+        'latency_ms': percentiles(latencies),
+        'tick_ms': percentiles([t[1] * 1000 for t in ticks]),
+        'error_rate': round(errors / len(samples), 4) if samples else None,
+        'late_tick_rate': round(late / len(ticks), 4) if ticks else None,
+        'callbacks': per_callback,
+    }
+
+
+def start_dashboard(mode, url, wait_s=120.0):
+    """Dashboard headless starten und warten, bis es antwortet"""
+    parts = urlsplit(url)
+    args = [sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'app.py'), '--headless',
+            '--port', str(parts.port or 80)]
+    if mode == 'simulator':
+        args.append('--simulator')
+    process = subprocess.Popen(args, stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+                               env=dict(os.environ, MRA4_HEADLESS='1'))
+    deadline = time.monotonic() + wait_s
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"Dashboard beendet (Exit-Code {process.returncode})")
+        try:
+            conn = http.client.HTTPConnection(parts.hostname, parts.port or 80, timeout=2)
+            conn.request('GET', '/_dash-layout')
+            if conn.getresponse().status == 200:
+                conn.close()
+                return process
+        except OSError:
+            pass
+        time.sleep(0.5)
+    process.terminate()
+    raise RuntimeError(f"Dashboard unter {url} nicht erreichbar")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Lastgenerator für das MRA 4 Dashboard")
+    parser.add_argument('--url', default='http://127.0.0.1:8050', help="Adresse des Dashboards")
+    parser.add_argument('--start', choices=['simulator'], default=None,
+                        help="Dashboard selbst starten (sonst muss es unter --url laufen)")
+    parser.add_argument('--sessions', default='1,5,10,20,50', help="Anzahl Sitzungen pro Stufe (kommagetrennt)")
+    parser.add_argument('--step-duration', type=float, default=20.0, help="Messdauer pro Stufe in Sekunden")
+    parser.add_argument('--warmup', type=float, default=3.0, help="Einlaufzeit pro Stufe in Sekunden")
+    parser.add_argument('--interval-ms', type=float, default=None,
+                        help="Tick-Intervall (Standard: update-interval-store des Dashboards)")
+    parser.add_argument('--timeout', type=float, default=10.0, help="HTTP-Timeout pro Anfrage")
+    parser.add_argument('--output', default=None, help="Ergebnisdatei (JSON)")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    steps = sorted({max(1, int(n)) for n in args.sessions.split(',') if n.strip()})
+    parts = urlsplit(args.url)
+    host, port = parts.hostname, parts.port or 80
+
+    process = start_dashboard(args.start, args.url) if args.start else None
+    stop_event = threading.Event()
+    sessions = []
+    results = []
+    try:
+        bootstrap = _Connection(host, port, args.timeout)
+        requests = interval_requests(bootstrap.get, bootstrap.post)
+        interval_s = args.interval_ms / 1000 if args.interval_ms else None
+        if interval_s is None:
+            props = collect_props(json.loads(bootstrap.get('/_dash-layout')))
+            interval_s = (props.get('update-interval-store', {}).get('data') or 1000) / 1000
+        bootstrap.close()
+        logger.info(f"{len(requests)} Anfragen pro Tick, Intervall {interval_s:g}s")
+
+        print(f"\n{'Sitzungen':>9s} {'Anfr./s':>9s} {'p50 ms':>8s} {'p95 ms':>8s} {'p99 ms':>8s} "
+              f"{'Fehler':>7s} {'verspätet':>9s}")
+        for count in steps:
+            while len(sessions) < count:
+                session = Session(host, port, requests, interval_s, args.timeout, stop_event)
+                session.start()
+                sessions.append(session)
+            time.sleep(args.warmup)
+            window_start = time.monotonic()
+            time.sleep(args.step_duration)
+            result = run_step(sessions, window_start, time.monotonic(), interval_s)
+            results.append(result)
+            latency = result['latency_ms']
+            print(f"{count:9d} {result['throughput_rps']:9.1f} {latency.get('p50', 0):8.1f} "
+                  f"{latency.get('p95', 0):8.1f} {latency.get('p99', 0):8.1f} "
+                  f"{(result['error_rate'] or 0) * 100:6.1f}% {(result['late_tick_rate'] or 0) * 100:8.1f}%")
+    finally:
+        stop_event.set()
+        for session in sessions:
+            session.join(args.timeout)
+        if process is not None:
+            process.terminate()
+            process.wait(10)
+
+    overload = next((r['sessions'] for r in results
+                     if (r['late_tick_rate'] or 0) > OVERLOAD_LATE_TICKS or (r['error_rate'] or 0) > OVERLOAD_ERRORS),
+                    None)
+    if overload:
+        print(f"\nÜberlast ab {overload} Sitzungen")
+    else:
+        print(f"\nKeine Überlast bis {steps[-1]} Sitzungen")
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump({
+                'meta': {'timestamp': datetime.now().isoformat(timespec='seconds'), 'url': args.url,
+                         'interval_s': interval_s, 'requests_per_tick': len(requests), 'args': vars(args)},
+                'steps': results,
+                'overload_sessions': overload,
+            }, f, indent=2)
+        print(f"Ergebnis: {args.output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,178 @@
+"""
+Strukturierter In-Memory Log-Ring für die UI-Anzeige
+
+Speichert pro Log-Record nur die Rohfelder (Zeit, Level, Logger, Nachricht)
+in einem vorallokierten Ringpuffer. Formatiert wird erst, wenn das Log-Fenster
+angezeigt wird. Wiederholte Meldungen (z.B. Modbus-Fehler bei Offline-Gerät)
+werden zusammengefasst und nur gezählt.
+"""
+import logging
+import threading
+import time
+
+# Slot-Felder (Liste statt Objekt, damit emit() billig bleibt)
+_CREATED = 0      # Zeitstempel der ersten Meldung
+_LAST = 1         # Zeitstempel der letzten Wiederholung
+_LEVELNO = 2
+_LEVELNAME = 3
+_NAME = 4
+_MSG = 5
+_ARGS = 6
+_COUNT = 7
+_EXC_TEXT = 8
+_FORMATTED = 9    # Cache (Anzahl, formatierte Zeile) - None = noch nicht formatiert
+
+
+class LogRing(logging.Handler):
+    """Log-Handler mit vorallokiertem Ringpuffer, Deduplizierung und Level-Gates"""
+
+    def __init__(self, capacity=500, dedup_window=60.0, level=logging.NOTSET):
+        """
+        Args:
+            capacity: Anzahl Einträge im Ring
+            dedup_window: Zeitfenster in Sekunden, in dem gleiche Meldungen gezählt statt gespeichert werden
+            level: Standard-Level für Logger ohne eigenes Gate
+        """
+        super().__init__(level=level)
+        self.capacity = capacity
+        self.dedup_window = dedup_window
+        self._slots = [None] * capacity
+        self._written = 0           # Anzahl geschriebener Slots (monoton)
+        self._last_by_key = {}      # Dedup-Key -> absolute Slot-Nummer
+        self._gates = {}            # Logger-Name -> Mindest-Level
+        self._gate_cache = {}       # aufgelöste Gates pro Logger-Name
+        self._ring_lock = threading.Lock()
+
+    def set_level_gate(self, logger_name, level):
+        """Mindest-Level für einen Logger (inkl. Unter-Logger) im Ring setzen"""
+        with self._ring_lock:
+            self._gates[logger_name] = level
+            self._gate_cache.clear()
+
+    def _gate_for(self, name):
+        """Aufgelöstes Mindest-Level eines Loggers (nur unter _ring_lock aufrufen)"""
+        level = self._gate_cache.get(name)
+        if level is None:
+            # Hierarchie auflösen: 'a.b.c' -> 'a.b' -> 'a' -> Handler-Level
+            level = self.level
+            probe = name
+            while probe:
+                if probe in self._gates:
+                    level = self._gates[probe]
+                    break
+                probe = probe.rpartition('.')[0]
+            self._gate_cache[name] = level
+        return level
+
+    def emit(self, record):
+        levelno = record.levelno
+        args = record.args
+        created = record.created
+        # Gate-Cache und Ring unter einem Lock - emit() läuft in Poll-, Dash- und Schreib-Threads
+        with self._ring_lock:
+            if levelno < self._gate_for(record.name):
+                return
+
+            try:
+                key = (record.name, levelno, record.msg, args)
+                hash(key)
+            except TypeError:
+                key = None
+
+            if key is not None:
+                pos = self._last_by_key.get(key)
+                if pos is not None and pos >= self._written - self.capacity:
+                    slot = self._slots[pos % self.capacity]
+                    if created - slot[_CREATED] <= self.dedup_window:
+                        slot[_LAST] = created
+                        slot[_COUNT] += 1
+                        return
+
+            exc_text = None
+            if record.exc_info:
+                exc_text = logging.Formatter().formatException(record.exc_info)
+
+            pos = self._written
+            index = pos % self.capacity
+            old = self._slots[index]
+            if old is not None:
+                old_key = (old[_NAME], old[_LEVELNO], old[_MSG], old[_ARGS])
+                try:
+                    if self._last_by_key.get(old_key) == pos - self.capacity:
+                        del self._last_by_key[old_key]
+                except TypeError:
+                    pass
+            self._slots[index] = [created, created, levelno, record.levelname, record.name,
+                                  record.msg, args, 1, exc_text, None]
+            if key is not None:
+                self._last_by_key[key] = pos
+            self._written = pos + 1
+
+    @staticmethod
+    def _format_slot(slot):
+        msg = slot[_MSG]
+        args = slot[_ARGS]
+        try:
+            text = str(msg) % args if args else str(msg)
+        except Exception:
+            text = f"{msg} {args}"
+        line = f"{time.strftime('%H:%M:%S', time.localtime(slot[_CREATED]))} - {slot[_LEVELNAME]} - {text}"
+        if slot[_COUNT] > 1:
+            span = int(slot[_LAST] - slot[_CREATED])
+            line += f" (x{slot[_COUNT]} in {span} s)"
+        if slot[_EXC_TEXT]:
+            line += "\n" + slot[_EXC_TEXT]
+        return line
+
+    def lines(self, limit=None, min_level=logging.NOTSET):
+        """
+        Formatierte Log-Zeilen (älteste zuerst)
+
+        Args:
+            limit: maximale Anzahl Zeilen (neueste werden behalten)
+            min_level: nur Einträge ab diesem Level
+
+        Returns:
+            Liste von Strings
+        """
+        with self._ring_lock:
+            start = max(0, self._written - self.capacity)
+            slots = [self._slots[pos % self.capacity] for pos in range(start, self._written)]
+
+        if min_level > logging.NOTSET:
+            slots = [s for s in slots if s[_LEVELNO] >= min_level]
+        if limit is not None:
+            slots = slots[-limit:]
+
+        result = []
+        for slot in slots:
+            cached = slot[_FORMATTED]
+            count = slot[_COUNT]
+            if cached is None or cached[0] != count:
+                cached = (count, self._format_slot(slot))
+                slot[_FORMATTED] = cached
+            result.append(cached[1])
+        return result
+
+
+class RepeatFilter(logging.Filter):
+    """Unterdrückt identische Meldungen innerhalb eines Zeitfensters (z.B. für die Konsole)"""
+
+    def __init__(self, window=60.0):
+        super().__init__()
+        self.window = window
+        self._first_seen = {}
+
+    def filter(self, record):
+        try:
+            key = (record.name, record.levelno, record.msg, record.args)
+            first = self._first_seen.get(key)
+        except TypeError:
+            return True
+        now = record.created
+        if first is not None and now - first <= self.window:
+            return False
+        if len(self._first_seen) > 1000:
+            self._first_seen.clear()
+        self._first_seen[key] = now
+        return True
@@ -0,0 +1,265 @@
+"""
+Prometheus-Export (/metrics) für Messwerte und interne Zustände
+
+Der Text im Prometheus-Exposition-Format wird einmal pro Erfassungs-Tick
+gerendert und als fertiger Byte-Puffer ausgeliefert. Ein Scrape liest nur
+diesen Puffer - er löst nie eine Modbus-Anfrage aus und kostet Mikrosekunden.
+
+Im Einzelprozess-Betrieb rendert ein Snapshot-Listener nach jedem Poll. In
+Web-Workern (Multi-Worker-Betrieb) gibt es keine Listener - dort rendert der
+erste Scrape nach einem neuen Snapshot, alle weiteren liefern den Puffer.
+Callback-Latenzen gelten pro Prozess (jeder Worker misst seine eigenen).
+"""
+import logging
+import threading
+import time
+from bisect import bisect_left
+
+from acquisition import PHASES
+from alarm_engine import SEVERITIES
+
+logger = logging.getLogger(__name__)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# Bucket-Grenzen für Callback-Antwortzeiten in Sekunden
+CALLBACK_BUCKETS_S = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+
+PROTECTION_BITS = ('aktiv', 'alarm', 'alarm_l1', 'alarm_l2', 'alarm_l3', 'ausl', 'ausl_l1', 'ausl_l2', 'ausl_l3')
+
+
+class CallbackTimer:
+    """Antwortzeiten der Dash-Callbacks (/_dash-update-component) pro Output"""
+
+    def __init__(self, buckets_s=CALLBACK_BUCKETS_S):
+        self.buckets_s = tuple(buckets_s)
+        self.series = {}   # Output -> [Anzahl, Summe, Buckets...]
+        self._lock = threading.Lock()
+
+    def install(self, server):
+        """Flask-Hooks registrieren"""
+        import flask
+
+        @server.before_request
+        def _start_timer():
+            if flask.request.path.endswith('/_dash-update-component'):
+                flask.g.callback_started = time.perf_counter()
+
+        @server.after_request
+        def _stop_timer(response):
+            started = flask.g.pop('callback_started', None)
+            if started is not None:
+                body = flask.request.get_json(silent=True) or {}
+                self.observe(str(body.get('output', 'unbekannt')).split('...')[0].lstrip('.'),
+                             time.perf_counter() - started)
+            return response
+
+    def observe(self, output, duration_s):
+        with self._lock:
+            series = self.series.get(output)
+            if series is None:
+                series = self.series[output] = [0, 0.0] + [0] * (len(self.buckets_s) + 1)
+            series[0] += 1
+            series[1] += duration_s
+            series[2 + bisect_left(self.buckets_s, duration_s)] += 1
+
+    def snapshot(self):
+        with self._lock:
+            return {output: list(series) for output, series in self.series.items()}
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{key}="{_escape(value)}"' for key, value in labels.items()) + '}'
+
+
+def _number(value):
+    if isinstance(value, bool):
+        return '1' if value else '0'
+    if isinstance(value, float):
+        return repr(value)
+    return str(value)
+
+
+class _Writer:
+    """Baut den Text im Prometheus-Format zusammen"""
+
+    def __init__(self):
+        self.lines = []
+
+    def metric(self, name, kind, help_text, samples):
+        """
+        Args:
+            samples: Liste (Labels-dict oder None, Wert); None-Werte werden ausgelassen
+        """
+        samples = [(labels, value) for labels, value in samples if value is not None]
+        if not samples:
+            return
+        self.lines.append(f'# HELP {name} {help_text}')
+        self.lines.append(f'# TYPE {name} {kind}')
+        for labels, value in samples:
+            self.lines.append(f'{name}{_labels(labels)} {_number(value)}')
+
+    def histogram(self, name, help_text, series):
+        """
+        Args:
+            series: Liste (Labels, Bucket-Grenzen, Bucket-Zähler inkl. +Inf, Summe, Anzahl)
+        """
+        if not series:
+            return
+        self.lines.append(f'# HELP {name} {help_text}')
+        self.lines.append(f'# TYPE {name} histogram')
+        for labels, bounds, counts, total, count in series:
+            cumulative = 0
+            for bound, n in zip(list(bounds) + ['+Inf'], counts):
+                cumulative += n
+                le = bound if bound == '+Inf' else _number(float(bound))
+                self.lines.append(f'{name}_bucket{_labels(dict(labels, le=le))} {cumulative}')
+            self.lines.append(f'{name}_sum{_labels(labels)} {_number(float(total))}')
+            self.lines.append(f'{name}_count{_labels(labels)} {count}')
+
+    def render(self):
+        return ('\n'.join(self.lines) + '\n').encode('utf-8')
+
+
+class MetricsExporter:
+    """Hält den vorgerenderten /metrics-Puffer"""
+
+    def __init__(self, acq, callback_timer=None):
+        """
+        Args:
+            acq: AcquisitionService oder SharedSnapshotReader
+            callback_timer: CallbackTimer für die Callback-Latenzen (optional)
+        """
+        self.acq = acq
+        self.callback_timer = callback_timer
+        self._seq = None
+        self._body = b''
+        self._render_lock = threading.Lock()
+        self.renders = 0
+        self.render_s = 0.0
+
+    def on_snapshot(self, snapshot):
+        """Snapshot-Listener: Puffer für den neuen Snapshot rendern"""
+        self._refresh(snapshot)
+
+    def body(self):
+        """Aktueller Puffer (rendert nur, wenn noch kein Listener den Snapshot verarbeitet hat)"""
+        snapshot = self.acq.latest()
+        if snapshot.seq != self._seq:
+            self._refresh(snapshot)
+        return self._body
+
+    def _refresh(self, snapshot):
+        with self._render_lock:
+            if snapshot.seq == self._seq:
+                return
+            started = time.perf_counter()
+            try:
+                body = self.render(snapshot)
+            except Exception as e:
+                logger.error(f"Fehler beim Rendern von /metrics: {e}")
+                return
+            self._body = body
+            self._seq = snapshot.seq
+            self.renders += 1
+            self.render_s = time.perf_counter() - started
+
+    def render(self, snapshot):
+        """Alle Metriken für einen Snapshot als Text rendern"""
+        data = snapshot.data
+        w = _Writer()
+
+        w.metric('mra4_up', 'gauge', 'Modbus-Verbindung zum MRA4 aktiv', [(None, bool(snapshot.connected))])
+        w.metric('mra4_simulator', 'gauge', 'Daten stammen vom Simulator', [(None, bool(snapshot.simulator))])
+        w.metric('mra4_snapshot_sequence', 'gauge', 'Fortlaufende Nummer des Snapshots', [(None, snapshot.seq)])
+        w.metric('mra4_snapshot_timestamp_seconds', 'gauge', 'Unix-Zeit des letzten Polls',
+                 [(None, float(snapshot.timestamp))])
+
+        w.metric('mra4_voltage_volts', 'gauge', 'Leiter-Erd-Spannung',
+                 [({'phase': phase}, data['voltage'][phase]) for phase in PHASES])
+        w.metric('mra4_current_amperes', 'gauge', 'Phasenstrom',
+                 [({'phase': phase}, data['current'][phase]) for phase in PHASES])
+        w.metric('mra4_power_watts', 'gauge', 'Wirkleistung',
+                 [({'phase': phase}, data['power'][phase]) for phase in PHASES + ('total',)])
+        w.metric('mra4_frequency_hertz', 'gauge', 'Netzfrequenz', [(None, data['frequency'])])
+
+        w.metric('mra4_coupling_switch', 'gauge', 'Koppelschalter-Befehl BA1', [(None, data['coupling_switch'])])
+        w.metric('mra4_di_status', 'gauge', 'Koppelschalter-Rückmeldung DI1', [(None, data['di_status'])])
+        w.metric('mra4_fault_recording', 'gauge', 'Störschrieb-Trigger aktiv', [(None, data['fault_recording'])])
+        status = data['protection_status'] or {}
+        w.metric('mra4_protection_status', 'gauge', 'Schutz-Status-Bits (Register 1)',
+                 [({'bit': bit}, status.get(bit)) for bit in PROTECTION_BITS])
+        w.metric('mra4_cause_of_trip', 'gauge', 'Auslöseursache (COT, Register 5004)', [(None, data['cause_of_trip'])])
+        w.metric('mra4_fault_number', 'gauge', 'Fehlernummer (Register 57)', [(None, data['fault_number'])])
+
+        analytics = data.get('analytics') or {}
+        w.metric('mra4_unbalance_percent', 'gauge', 'Unsymmetrie (größte Abweichung vom Phasenmittel)',
+                 [({'quantity': 'voltage'}, analytics.get('voltage_unbalance')),
+                  ({'quantity': 'current'}, analytics.get('current_unbalance'))])
+        w.metric('mra4_frequency_rocof_hertz_per_second', 'gauge', 'Frequenzänderung df/dt',
+                 [(None, analytics.get('rocof'))])
+        alarms = data.get('alarms') or []
+        w.metric('mra4_alarms_active', 'gauge', 'Aktive Grenzwert-Alarme (alarm_engine)',
+                 [({'severity': severity}, sum(1 for alarm in alarms if alarm['severity'] == severity))
+                  for severity in SEVERITIES])
+
+        # Interne Zähler - im Worker über den Befehlskanal, einmal pro Tick
+        stats = self._execute('acquisition_stats') or {}
+        w.metric('mra4_poll_cycles_total', 'counter', 'Ausgeführte Poll-Zyklen', [(None, stats.get('polls'))])
+        w.metric('mra4_poll_errors_total', 'counter', 'Poll-Zyklen mit Fehler', [(None, stats.get('poll_errors'))])
+        w.metric('mra4_poll_overruns_total', 'counter', 'Poll-Zyklen länger als das Intervall',
+                 [(None, stats.get('overruns'))])
+        w.metric('mra4_poll_duration_seconds', 'gauge', 'Dauer des letzten Poll-Zyklus',
+                 [(None, stats.get('last_poll_s'))])
+        w.metric('mra4_poll_interval_seconds', 'gauge', 'Eingestelltes Poll-Intervall',
+                 [(None, stats.get('interval_s'))])
+
+        energy = self._execute('energy_state')
+        if energy:
+            w.metric('mra4_energy_kwh_total', 'counter', 'Wirkenergie (Trapezintegration der Gesamtleistung)',
+                     [({'direction': 'import'}, energy['import_kwh']), ({'direction': 'export'}, energy['export_kwh'])])
+            w.metric('mra4_demand_kw', 'gauge', 'Gleitender Leistungsmittelwert', [(None, energy['demand_kw'])])
+            w.metric('mra4_demand_peak_kw', 'gauge', 'Höchster Leistungsmittelwert eines festen Blocks',
+                     [(None, energy['peak_block_kw'])])
+            w.metric('mra4_energy_gaps_total', 'counter', 'Nicht integrierte Lücken (Poll-Abstand > max_gap_s)',
+                     [(None, energy['gaps'])])
+            w.metric('mra4_energy_gap_seconds_total', 'counter', 'Dauer der nicht integrierten Lücken',
+                     [(None, energy['gap_s'])])
+
+        modbus = self._execute('modbus_metrics')
+        if modbus:
+            requests, histograms = [], []
+            bounds = [b / 1e6 for b in modbus['buckets_us']]
+            for row in modbus['series']:
+                labels = {'fc': row['fc'], 'address': row['address'], 'count': row['count']}
+                for outcome in ('ok', 'exceptions', 'errors'):
+                    requests.append((dict(labels, outcome=outcome), row[outcome]))
+                histograms.append((labels, bounds, row['histogram'], row['total_us'] / 1e6, row['requests']))
+            w.metric('mra4_modbus_requests_total', 'counter', 'Modbus-Anfragen nach Ergebnis', requests)
+            w.histogram('mra4_modbus_request_duration_seconds', 'Dauer der Modbus-Anfragen', histograms)
+            w.metric('mra4_modbus_exceptions_total', 'counter', 'Modbus-Exception-Antworten nach Code',
+                     [({'fc': c['fc'], 'code': c['code']}, c['count']) for c in modbus['exception_codes']])
+            w.metric('mra4_modbus_bytes_total', 'counter', 'Modbus-TCP-Bytes auf der Leitung',
+                     [({'direction': 'tx'}, modbus['tx_bytes']), ({'direction': 'rx'}, modbus['rx_bytes'])])
+
+        if self.callback_timer is not None:
+            timer = self.callback_timer
+            w.histogram('mra4_callback_duration_seconds', 'Antwortzeit der Dash-Callbacks',
+                        [({'output': output}, timer.buckets_s, series[2:], series[1], series[0])
+                         for output, series in sorted(timer.snapshot().items())])
+
+        w.metric('mra4_metrics_render_seconds', 'gauge', 'Dauer des letzten /metrics-Renderns', [(None, self.render_s)])
+        return w.render()
+
+    def _execute(self, command):
+        try:
+            return self.acq.execute(command)
+        except Exception as e:
+            logger.debug(f"{command} nicht verfügbar: {e}")
+            return None
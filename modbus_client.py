@@ -3,9 +3,10 @@ Modbus TCP Client für MRA 4 Multimeter
 Kommunikation über Modbus TCP/IP
 """
 
-from pymodbus.client import ModbusTcpClient
-from pymodbus.exceptions import ModbusException
 import logging
+import math
+
+from modbus_metrics import MODBUS_METRICS, InstrumentedModbusClient
 
 # Logging-Konfiguration für Modbus-Kommunikation
 logging.basicConfig(
@@ -14,11 +15,198 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Registerlayout eines Poll-Zyklus ("Rohdaten"): Blöcke Input Register mit
+# allen Messwerten (hintereinander) + einzelne Holding Register. Rohdaten sind
+# eine Liste mit RAW_SIZE Einträgen (16-Bit-Werte, None = nicht lesbar).
+INPUT_BLOCKS = (
+    (20100, 110),                             # 20100-20209: Messwerte, Leistung, Phasenlage Strom
+    (20392, 10),                              # 20392-20401: Phasenlage Spannung
+)
+INPUT_BLOCK_START = INPUT_BLOCKS[0][0]
+INPUT_BLOCK_COUNT = sum(count for _, count in INPUT_BLOCKS)   # Input Register in den Rohdaten
+HOLDING_REGISTERS = (1, 57, 1000, 1005, 5004)
+RAW_SIZE = INPUT_BLOCK_COUNT + len(HOLDING_REGISTERS)
+
+# Float-Messwerte im Input-Block (Startadresse je 2 Register, Big-Endian)
+CURRENT_REGISTERS = (20100, 20102, 20104)    # Strom L1-L3
+FREQUENCY_REGISTER = 20128
+VOLTAGE_REGISTERS = (20136, 20138, 20140)    # Spannung UL1-UL3
+TOTAL_POWER_REGISTER = 20154
+CURRENT_ANGLE_REGISTERS = (20204, 20206, 20208)   # phi IL1-IL3 in Grad
+VOLTAGE_ANGLE_REGISTERS = (20392, 20396, 20400)   # phi UL1-UL3 in Grad
+FLOAT_REGISTERS = (CURRENT_REGISTERS + (FREQUENCY_REGISTER,) + VOLTAGE_REGISTERS + (TOTAL_POWER_REGISTER,)
+                   + CURRENT_ANGLE_REGISTERS + VOLTAGE_ANGLE_REGISTERS)
+
+
+def _block_offsets():
+    offsets, position = {}, 0
+    for start, count in INPUT_BLOCKS:
+        for address in range(start, start + count):
+            offsets[address] = position + address - start
+        position += count
+    return offsets
+
+
+_INPUT_OFFSETS = _block_offsets()
+
+
+def input_offset(address):
+    """Index eines Input Registers in den Rohdaten (KeyError außerhalb der Blöcke)"""
+    return _INPUT_OFFSETS[address]
+
+
+def decode_protection_status(value):
+    """Schutz-Status-Bits aus Register 1 zerlegen"""
+    return {
+        'aktiv': (value & 0x4) != 0,
+        'alarm': (value & 0x100) != 0,
+        'alarm_l1': (value & 0x10) != 0,
+        'alarm_l2': (value & 0x20) != 0,
+        'alarm_l3': (value & 0x40) != 0,
+        'ausl': (value & 0x2000) != 0,  # General-Auslösung
+        'ausl_l1': (value & 0x200) != 0,
+        'ausl_l2': (value & 0x400) != 0,
+        'ausl_l3': (value & 0x800) != 0,
+        'raw_value': value
+    }
+
+
+def _raw_float(raw, address):
+    offset = _INPUT_OFFSETS[address]
+    high, low = raw[offset], raw[offset + 1]
+    if high is None or low is None:
+        return None
+    return MRA4Client._registers_to_float([high, low], byte_order='big')
+
+
+def _raw_holding(raw, address):
+    return raw[INPUT_BLOCK_COUNT + HOLDING_REGISTERS.index(address)]
+
+
+def phase_powers(raw, total=None):
+    """
+    Wirkleistung pro Phase: P = U * I * cos(phi U - phi I)
+
+    Spannung, Strom und die Phasenlagen beider Zeiger kommen aus demselben
+    Poll - keine zusätzlichen Anfragen. Der Winkel zwischen den Zeigern trägt
+    auch das Vorzeichen (Lieferung bei mehr als 90°).
+
+    Args:
+        raw: Rohdaten eines Poll-Zyklus
+        total: Gesamtwirkleistung in W - Ersatzwert total / 3 für Phasen
+            ohne lesbare Phasenlage (Gerät/Firmware ohne diese Register)
+
+    Returns:
+        Liste [L1, L2, L3] in W (None = nicht bestimmbar)
+    """
+    powers = []
+    for registers in zip(VOLTAGE_REGISTERS, CURRENT_REGISTERS, VOLTAGE_ANGLE_REGISTERS, CURRENT_ANGLE_REGISTERS):
+        u, i, phi_u, phi_i = (_raw_float(raw, address) for address in registers)
+        if u is not None and i is not None and phi_u is not None and phi_i is not None:
+            powers.append(round(u * i * math.cos(math.radians(phi_u - phi_i)), 2))
+        else:
+            powers.append(None if total is None else round(total / 3, 2))
+    return powers
+
+
+def decode_registers(raw):
+    """
+    Rohdaten eines Poll-Zyklus in Messwerte umrechnen
+
+    Args:
+        raw: Liste mit RAW_SIZE Registerwerten (None = nicht lesbar)
+
+    Returns:
+        Dictionary wie read_all_data() inkl. 'fault_recording'
+    """
+    def rounded(address, digits):
+        value = _raw_float(raw, address)
+        return None if value is None else round(value, digits)
+
+    total = rounded(TOTAL_POWER_REGISTER, 2)
+    power_l1, power_l2, power_l3 = phase_powers(raw, total)
+    protection = _raw_holding(raw, 1)
+    ba = _raw_holding(raw, 1005)
+    di = _raw_holding(raw, 1000)
+    return {
+        'voltage': {f'L{i + 1}': rounded(a, 2) for i, a in enumerate(VOLTAGE_REGISTERS)},
+        'current': {f'L{i + 1}': rounded(a, 3) for i, a in enumerate(CURRENT_REGISTERS)},
+        'power': {'L1': power_l1, 'L2': power_l2, 'L3': power_l3, 'total': total},
+        'frequency': rounded(FREQUENCY_REGISTER, 2),
+        'coupling_switch': None if ba is None else (ba & 0x1) != 0,
+        'di_status': None if di is None else (di & 0x1) != 0,   # DI 1 = Koppelschalter-Rückmeldung
+        'protection_status': None if protection is None else decode_protection_status(protection),
+        'cause_of_trip': _raw_holding(raw, 5004),
+        'fault_number': _raw_holding(raw, 57),
+        'fault_recording': None if ba is None else (ba & 0x4) != 0,
+    }
+
+
+def float_to_registers(value):
+    """Float -> zwei 16-Bit-Register (Big-Endian, Gegenstück zu _registers_to_float)"""
+    import struct
+    raw = struct.unpack('>I', struct.pack('>f', value))[0]
+    return [raw >> 16, raw & 0xFFFF]
+
+
+def encode_registers(data):
+    """
+    Messwerte zurück in Rohdaten umrechnen (Gegenstück zu decode_registers)
+
+    Für Quellen ohne Rohdaten (Simulator). Nicht dekodierte Register des
+    Input-Blocks bleiben 0, unbekannte Werte None. Die Phasenlagen werden so
+    gesetzt, dass phase_powers() die Leistung pro Phase wieder ergibt
+    (Spannungszeiger symmetrisch, cos phi = P / (U * I), begrenzt auf +-1).
+
+    Args:
+        data: Dictionary wie read_all_data()
+
+    Returns:
+        Liste mit RAW_SIZE Registerwerten
+    """
+    raw = [0] * INPUT_BLOCK_COUNT + [None] * len(HOLDING_REGISTERS)
+
+    def put_float(address, value):
+        offset = _INPUT_OFFSETS[address]
+        raw[offset:offset + 2] = [None, None] if value is None else float_to_registers(value)
+
+    for i, address in enumerate(VOLTAGE_REGISTERS):
+        put_float(address, data['voltage'][f'L{i + 1}'])
+    for i, address in enumerate(CURRENT_REGISTERS):
+        put_float(address, data['current'][f'L{i + 1}'])
+    for i, phi_u in enumerate((0.0, -120.0, 120.0)):
+        phase = f'L{i + 1}'
+        u, current, power = data['voltage'][phase], data['current'][phase], data['power'][phase]
+        if power is None:
+            put_float(VOLTAGE_ANGLE_REGISTERS[i], None)
+            put_float(CURRENT_ANGLE_REGISTERS[i], None)
+            continue
+        apparent = (u or 0.0) * (current or 0.0)
+        cos_phi = max(-1.0, min(1.0, power / apparent)) if apparent else 1.0
+        put_float(VOLTAGE_ANGLE_REGISTERS[i], phi_u)
+        put_float(CURRENT_ANGLE_REGISTERS[i], phi_u - math.degrees(math.acos(cos_phi)))
+    put_float(FREQUENCY_REGISTER, data['frequency'])
+    put_float(TOTAL_POWER_REGISTER, data['power']['total'])
+
+    def put_holding(address, value):
+        raw[INPUT_BLOCK_COUNT + HOLDING_REGISTERS.index(address)] = value
+
+    protection = data.get('protection_status')
+    put_holding(1, None if protection is None else protection['raw_value'])
+    put_holding(57, data.get('fault_number'))
+    di = data.get('di_status')
+    put_holding(1000, None if di is None else int(bool(di)))
+    switch, recording = data.get('coupling_switch'), data.get('fault_recording')
+    if switch is not None or recording is not None:
+        put_holding(1005, (0x1 if switch else 0) | (0x4 if recording else 0))
+    put_holding(5004, data.get('cause_of_trip'))
+    return raw
+
 
 class MRA4Client:
     """Client zur Kommunikation mit dem MRA 4 Multimeter über Modbus TCP"""
 
-    def __init__(self, host='192.168.1.100', port=502, unit_id=1):
+    def __init__(self, host='192.168.1.100', port=502, unit_id=1, client=None, metrics=MODBUS_METRICS):
         """
         Initialisiert den Modbus TCP Client
 
@@ -26,31 +214,51 @@ class MRA4Client:
             host: IP-Adresse des MRA 4 Geräts
             port: Modbus TCP Port (Standard: 502)
             unit_id: Modbus Unit ID (Standard: 1)
+            client: bereits verbundener ModbusTcpClient (z.B. aus dem Startup-Test), wird übernommen
+            metrics: ModbusMetrics für die Transaktionsmetriken (Standard: gemeinsame Instanz)
         """
         self.host = host
         self.port = port
         self.unit_id = unit_id
-        self.client = ModbusTcpClient(host=host, port=port)
-        self.connected = False
+        self.metrics = metrics
+        # Reihen der Poll-Anfragen (read_raw_registers) vorab anlegen - der Heißpfad fügt dann nichts ein
+        metrics.preallocate([(4, start, count) for start, count in INPUT_BLOCKS]
+                            + [(3, address, 1) for address in HOLDING_REGISTERS])
+        # pymodbus wird erst beim ersten Zugriff auf self.client importiert (schnellerer Start im Simulator)
+        self._client = None if client is None else InstrumentedModbusClient(client, metrics)
+        # Messwerte blockweise lesen; pro Block False nach Illegal Data Address (dann Einzelzugriffe)
+        self.block_read = {start: True for start, _ in INPUT_BLOCKS}
+
+    @property
+    def client(self):
+        """ModbusTcpClient (instrumentiert), wird beim ersten Zugriff angelegt - auch ohne connect()"""
+        if self._client is None:
+            from pymodbus.client import ModbusTcpClient
+            self._client = InstrumentedModbusClient(ModbusTcpClient(host=self.host, port=self.port), self.metrics)
+        return self._client
+
+    @property
+    def connected(self):
+        """Verbindungszustand des Sockets (pymodbus verbindet beim Lesen selbst neu)"""
+        return bool(self._client is not None and self._client.connected)
 
     def connect(self):
         """Verbindung zum MRA 4 herstellen"""
         try:
-            self.connected = self.client.connect()
-            if self.connected:
+            connected = self.client.connect()
+            if connected:
                 logger.info(f"Verbunden mit MRA 4 auf {self.host}:{self.port}")
             else:
                 logger.error(f"Verbindung zu {self.host}:{self.port} fehlgeschlagen")
-            return self.connected
+            return connected
         except Exception as e:
             logger.error(f"Verbindungsfehler: {e}")
             return False
 
     def disconnect(self):
         """Verbindung trennen"""
-        if self.client:
-            self.client.close()
-            self.connected = False
+        if self._client is not None:
+            self._client.close()
             logger.info("Verbindung getrennt")
 
     def read_voltage(self, phase=1):
@@ -110,23 +318,37 @@ class MRA4Client:
 
     def read_power(self, phase=1):
         """
-        Leistung lesen pro Phase (berechnet aus Gesamtleistung / 3)
+        Wirkleistung einer Phase lesen (P = U * I * cos phi)
 
-        Hinweis: MRA4 liefert nur Gesamtwirkleistung P, nicht pro Phase.
-        Diese Funktion gibt 1/3 der Gesamtleistung zurück als Annäherung.
+        Das MRA4 liefert nur die Gesamtwirkleistung. Die Phasenleistung wird aus
+        Spannung, Strom und den Phasenlagen beider Zeiger berechnet (vier
+        Register-Paare). Lehnt das Gerät ein Register ab (z.B. Firmware ohne
+        Phasenlagen), gilt wie im Poll-Zyklus der Ersatzwert Gesamtleistung / 3.
+        Im Poll-Zyklus kommen alle Phasen ohne zusätzliche Anfragen aus
+        read_all_data().
 
         Args:
-            phase: Phase 1-3 (wird ignoriert, alle Phasen bekommen gleiche Werte)
+            phase: Phase 1-3
 
         Returns:
             Leistung in Watt oder None bei Fehler
         """
+        idx = phase - 1
+        raw = [None] * RAW_SIZE
         try:
-            total = self.read_total_power()
-            if total is not None:
-                # Approximation: Gesamtleistung gleichmäßig auf 3 Phasen verteilt
-                return round(total / 3, 2)
-            return None
+            for address in (VOLTAGE_REGISTERS[idx], CURRENT_REGISTERS[idx],
+                            VOLTAGE_ANGLE_REGISTERS[idx], CURRENT_ANGLE_REGISTERS[idx]):
+                result = self.client.read_input_registers(address=address, count=2, device_id=self.unit_id)
+                if result.isError():
+                    logger.debug(f"Register {address} nicht lesbar (Leistung Phase {phase}): {result}")
+                    continue
+                offset = _INPUT_OFFSETS[address]
+                raw[offset:offset + 2] = result.registers
+            power = phase_powers(raw)[idx]
+            if power is None:
+                total = self.read_total_power()
+                power = phase_powers(raw, total)[idx]
+            return power
         except Exception as e:
             logger.error(f"Fehler beim Berechnen der Leistung Phase {phase}: {e}")
             return None
@@ -249,19 +471,7 @@ class MRA4Client:
             result = self.client.read_holding_registers(address=address, count=1, device_id=self.unit_id)
 
             if not result.isError():
-                value = result.registers[0]
-                return {
-                    'aktiv': (value & 0x4) != 0,
-                    'alarm': (value & 0x100) != 0,
-                    'alarm_l1': (value & 0x10) != 0,
-                    'alarm_l2': (value & 0x20) != 0,
-                    'alarm_l3': (value & 0x40) != 0,
-                    'ausl': (value & 0x2000) != 0,  # General-Auslösung
-                    'ausl_l1': (value & 0x200) != 0,
-                    'ausl_l2': (value & 0x400) != 0,
-                    'ausl_l3': (value & 0x800) != 0,
-                    'raw_value': value
-                }
+                return decode_protection_status(result.registers[0])
             else:
                 logger.error(f"Fehler beim Lesen des Schutz-Status: {result}")
                 return None
@@ -543,38 +753,65 @@ class MRA4Client:
             logger.error(f"Fehler beim Lesen des Leittechnik-Befehls 3: {e}")
             return None
 
+    def read_raw_registers(self):
+        """
+        Alle Register eines Poll-Zyklus lesen (ohne Umrechnung)
+
+        Die Messwerte kommen mit einer Anfrage pro Input-Block (FC4,
+        20100-20209 und 20392-20401). Lehnt das Gerät einen Block ab, werden
+        dessen Float-Register einzeln gelesen.
+
+        Returns:
+            Liste mit RAW_SIZE Registerwerten (None = nicht lesbar)
+        """
+        raw = [None] * RAW_SIZE
+        position = 0
+        for start, count in INPUT_BLOCKS:
+            if self.block_read[start]:
+                try:
+                    result = self.client.read_input_registers(address=start, count=count, device_id=self.unit_id)
+                    if not result.isError():
+                        raw[position:position + count] = result.registers
+                    else:
+                        logger.warning(f"Block-Lesen {start}-{start + count - 1} "
+                                       f"abgelehnt ({result}) - lese Messwerte einzeln")
+                        self.block_read[start] = False
+                except Exception as e:
+                    logger.error(f"Fehler beim Block-Lesen der Messwerte: {e}")
+                    return raw
+            if not self.block_read[start]:
+                for address in FLOAT_REGISTERS:
+                    if not start <= address < start + count:
+                        continue
+                    try:
+                        result = self.client.read_input_registers(address=address, count=2, device_id=self.unit_id)
+                        if not result.isError():
+                            offset = position + address - start
+                            raw[offset:offset + 2] = result.registers
+                        else:
+                            logger.error(f"Fehler beim Lesen von Register {address}: {result}")
+                    except Exception as e:
+                        logger.error(f"Fehler beim Lesen von Register {address}: {e}")
+            position += count
+        for i, address in enumerate(HOLDING_REGISTERS):
+            try:
+                result = self.client.read_holding_registers(address=address, count=1, device_id=self.unit_id)
+                if not result.isError():
+                    raw[INPUT_BLOCK_COUNT + i] = result.registers[0]
+                else:
+                    logger.error(f"Fehler beim Lesen von Register {address}: {result}")
+            except Exception as e:
+                logger.error(f"Fehler beim Lesen von Register {address}: {e}")
+        return raw
+
     def read_all_data(self):
         """
         Alle Messwerte auf einmal lesen
 
         Returns:
-            Dictionary mit allen Messwerten
+            Dictionary mit allen Messwerten (inkl. Störschrieb-Status)
         """
-        data = {
-            'voltage': {
-                'L1': self.read_voltage(1),
-                'L2': self.read_voltage(2),
-                'L3': self.read_voltage(3)
-            },
-            'current': {
-                'L1': self.read_current(1),
-                'L2': self.read_current(2),
-                'L3': self.read_current(3)
-            },
-            'power': {
-                'L1': self.read_power(1),
-                'L2': self.read_power(2),
-                'L3': self.read_power(3),
-                'total': self.read_total_power()
-            },
-            'frequency': self.read_frequency(),
-            'coupling_switch': self.read_coupling_switch(),
-            'di_status': self.read_di_status(1),  # DI 1 = Koppelschalter-Rückmeldung
-            'protection_status': self.read_protection_status(),
-            'cause_of_trip': self.read_cause_of_trip(),
-            'fault_number': self.read_fault_number()
-        }
-        return data
+        return decode_registers(self.read_raw_registers())
 
     @staticmethod
     def _registers_to_float(registers, byte_order='big'):
@@ -638,6 +875,12 @@ class MRA4Simulator:
         self.cause_of_trip = 1  # 1 = NORM (kein Trip)
         self.fault_number = 0
 
+        # Szenario-Betrieb (scenario.ScenarioPlayer setzt die Messwerte, kein Zufallsweg)
+        self.external_values = False
+        # Verzögerung der DI-1-Rückmeldung nach einem Koppelschalter-Befehl
+        self.di_feedback_delay_s = 0.0
+        self._di_pending = None  # (Fälligkeit time.monotonic(), Zustand)
+
         import random
         self.random = random
 
@@ -664,6 +907,8 @@ class MRA4Simulator:
 
     def _update_value(self, current_val, value_range, max_delta_percent=0.10):
         """Update a value with max 10% delta, staying within range"""
+        if self.external_values:
+            return current_val
         max_delta = current_val * max_delta_percent
         delta = self.random.uniform(-max_delta, max_delta)
         new_val = current_val + delta
@@ -723,7 +968,7 @@ class MRA4Simulator:
         import time
         # Toggle-Zustand - EIN setzen
         self.coupling_switch_state = not self.coupling_switch_state
-        self.di_states[0] = self.coupling_switch_state
+        self._set_di_feedback(self.coupling_switch_state)
         logger.info(f"[SIMULATOR] Koppelschalter-Impuls gesendet (EIN für {duration}s)")
 
         # Nach duration Sekunden wieder AUS setzen (wird vom Callback übernommen)
@@ -732,7 +977,7 @@ class MRA4Simulator:
     def write_coupling_switch(self, state):
         self.coupling_switch_state = state
         # DI 1 folgt dem Koppelschalter-Befehl (Rückmeldung)
-        self.di_states[0] = state
+        self._set_di_feedback(state)
         logger.info(f"[SIMULATOR] Koppelschalter auf {'EIN' if state else 'AUS'} gesetzt")
         return True
 
@@ -749,8 +994,26 @@ class MRA4Simulator:
         """Störschrieb-Status lesen (simuliert)"""
         return self.fault_recording_state
 
+    def _set_di_feedback(self, state):
+        """DI 1 (Schalter-Rückmeldung) sofort oder nach di_feedback_delay_s setzen"""
+        if self.di_feedback_delay_s > 0:
+            import time
+            self._di_pending = (time.monotonic() + self.di_feedback_delay_s, state)
+        else:
+            self._di_pending = None
+            self.di_states[0] = state
+
+    def _apply_di_feedback(self):
+        if self._di_pending is not None:
+            import time
+            due, state = self._di_pending
+            if time.monotonic() >= due:
+                self.di_states[0] = state
+                self._di_pending = None
+
     def read_di_status(self, di_number=1):
         """Digitaler Eingang Status lesen (simuliert)"""
+        self._apply_di_feedback()
         if 1 <= di_number <= 8:
             return self.di_states[di_number - 1]
         return False
@@ -0,0 +1,214 @@
+"""
+Modbus TCP Gateway - stellt die Werte des MRA 4 weiteren Modbus-Mastern bereit
+
+Mehrere Master, die gleichzeitig das MRA 4 pollen, führen zu "Slave device
+is busy". Mit dem Gateway bleibt die Datenerfassung der einzige Master am
+Gerät; SCADA, Energie-Logger usw. lesen stattdessen hier:
+
+    FC3 Holding Register 1, 57, 1000, 1005, 5004
+    FC4 Input Register 20100-20209, 20392-20401
+        -> aus dem letzten Erfassungs-Snapshot (keine Anfrage ans Gerät)
+    FC5/FC15 Coils 22003, 22005, 22020, 22021, 22022
+        -> über acq.execute() an das Gerät (serialisiert mit dem Poll-Zyklus),
+           nur wenn Schreiben freigegeben ist
+
+Ist das Gerät nicht verbunden oder ein Register nicht lesbar, antwortet das
+Gateway mit Exception 0x0B (Gateway Target Device Failed to Respond).
+
+Konfiguration (config.json):
+    "gateway": {"enabled": false, "host": "0.0.0.0", "port": 5502, "allow_writes": false}
+"""
+import asyncio
+import logging
+import threading
+
+from modbus_client import HOLDING_REGISTERS, INPUT_BLOCK_COUNT, encode_registers, input_offset
+
+logger = logging.getLogger(__name__)
+
+# Coil -> (Befehl für acq.execute, True = Wert weitergeben / False = nur steigende Flanke)
+COIL_COMMANDS = {
+    22020: ('write_coupling_switch', True),
+    22022: ('write_fault_recording_trigger', True),
+    22021: ('acknowledge_all', False),
+    22003: ('acknowledge_device', False),
+    22005: ('acknowledge_trip_command', False),
+}
+
+
+class _Stats(dict):
+    def __missing__(self, key):
+        return 0
+
+
+def _device_context_class():
+    # pymodbus erst hier importieren - das Modul bleibt ohne pymodbus importierbar
+    from pymodbus.constants import ExcCodes
+    from pymodbus.datastore import ModbusBaseDeviceContext
+
+    class GatewayDeviceContext(ModbusBaseDeviceContext):
+        """Datastore, der aus dem Snapshot liest und Schreibzugriffe weiterleitet"""
+
+        def __init__(self, gateway):
+            self.gateway = gateway
+
+        def reset(self):
+            pass
+
+        async def async_getValues(self, func_code, address, count=1):
+            gateway = self.gateway
+            if func_code in (5, 15):
+                # Antwort auf Schreibzugriffe: zuletzt geschriebene Coil-Werte
+                return gateway.coil_values(address, count)
+            gateway.stats[f'fc{func_code}'] += 1
+            if func_code not in (3, 4):
+                gateway.stats['illegal_function'] += 1
+                return ExcCodes.ILLEGAL_FUNCTION
+            values = gateway.read(func_code, address, count)
+            if values is False:
+                gateway.stats['illegal_address'] += 1
+                return ExcCodes.ILLEGAL_ADDRESS
+            if values is None:
+                gateway.stats['no_response'] += 1
+                return ExcCodes.GATEWAY_NO_RESPONSE
+            return values
+
+        async def async_setValues(self, func_code, address, values):
+            gateway = self.gateway
+            gateway.stats[f'fc{func_code}'] += 1
+            if func_code not in (5, 15):
+                gateway.stats['illegal_function'] += 1
+                return ExcCodes.ILLEGAL_FUNCTION
+            if not gateway.allow_writes:
+                gateway.stats['writes_rejected'] += 1
+                return ExcCodes.ILLEGAL_FUNCTION
+            if any(address + i not in COIL_COMMANDS for i in range(len(values))):
+                gateway.stats['illegal_address'] += 1
+                return ExcCodes.ILLEGAL_ADDRESS
+            # Befehle warten auf die Geräte-Sperre - nicht im Event-Loop blockieren
+            ok = await asyncio.get_running_loop().run_in_executor(None, gateway.write_coils, address, list(values))
+            if not ok:
+                gateway.stats['write_failed'] += 1
+                return ExcCodes.DEVICE_FAILURE
+            return None
+
+    return GatewayDeviceContext
+
+
+class ModbusGateway:
+    """Modbus TCP Server über dem Snapshot der Datenerfassung"""
+
+    def __init__(self, acq, allow_writes=False):
+        """
+        Args:
+            acq: AcquisitionService (liefert Snapshots, führt Befehle aus)
+            allow_writes: Coil-Schreibzugriffe an das Gerät weiterleiten
+        """
+        self.acq = acq
+        self.allow_writes = allow_writes
+        self.stats = _Stats()
+        self._seq = None
+        self._input = []
+        self._holding = {}
+        self._connected = False
+        self._image_lock = threading.Lock()
+        self._coils = dict.fromkeys(COIL_COMMANDS, False)
+
+        self._loop = None
+        self._server = None
+        self._thread = None
+        self.address = None
+
+    def _refresh(self):
+        """Registerabbild bei neuem Snapshot neu aufbauen (einmal pro Poll)"""
+        snapshot = self.acq.latest()
+        if snapshot.seq == self._seq:
+            return
+        with self._image_lock:
+            if snapshot.seq == self._seq:
+                return
+            raw = snapshot.raw if snapshot.raw is not None else encode_registers(snapshot.data)
+            self._input = raw[:INPUT_BLOCK_COUNT]
+            self._holding = dict(zip(HOLDING_REGISTERS, raw[INPUT_BLOCK_COUNT:]))
+            self._connected = snapshot.connected
+            self._seq = snapshot.seq
+
+    def read(self, func_code, address, count):
+        """
+        Register aus dem Snapshot lesen
+
+        Returns:
+            Liste der Werte, False bei nicht gespiegelter Adresse,
+            None wenn das Gerät die Werte nicht liefert
+        """
+        self._refresh()
+        if func_code == 4:
+            try:
+                values = [self._input[input_offset(a)] for a in range(address, address + count)]
+            except KeyError:
+                return False
+        else:
+            try:
+                values = [self._holding[a] for a in range(address, address + count)]
+            except KeyError:
+                return False
+        if not self._connected or any(v is None for v in values):
+            return None
+        return values
+
+    def coil_values(self, address, count):
+        """Zuletzt über das Gateway geschriebene Coil-Werte"""
+        return [self._coils.get(a, False) for a in range(address, address + count)]
+
+    def write_coils(self, address, values):
+        """Coil-Schreibzugriffe als Befehle an das Gerät weitergeben"""
+        ok = True
+        for coil, value in zip(range(address, address + len(values)), values):
+            self._coils[coil] = bool(value)
+            command, with_value = COIL_COMMANDS[coil]
+            if with_value:
+                logger.info(f"Gateway: Coil {coil} = {'EIN' if value else 'AUS'} -> {command}")
+                ok = bool(self.acq.execute(command, bool(value))) and ok
+            elif value:
+                logger.info(f"Gateway: Coil {coil} EIN -> {command}")
+                ok = bool(self.acq.execute(command)) and ok
+        return ok
+
+    async def serve(self, host='0.0.0.0', port=5502, ready=None):
+        """Server im aktuellen Event-Loop betreiben (bis shutdown)"""
+        from pymodbus.datastore import ModbusServerContext
+        from pymodbus.server import ModbusTcpServer
+
+        context = ModbusServerContext(devices=_device_context_class()(self), single=True)
+        self._server = ModbusTcpServer(context, address=(host, port))
+        self._loop = asyncio.get_running_loop()
+        await self._server.serve_forever(background=True)
+        self.address = (host, port)
+        logger.info(f"Modbus-Gateway läuft auf {host}:{port} (Schreiben {'erlaubt' if self.allow_writes else 'gesperrt'})")
+        if ready is not None:
+            ready.set()
+        await self._server.serving
+
+    def start(self, host='0.0.0.0', port=5502, timeout=10.0):
+        """Server in einem Hintergrund-Thread starten (kehrt zurück, sobald er lauscht)"""
+        ready = threading.Event()
+
+        def run():
+            try:
+                asyncio.run(self.serve(host, port, ready))
+            except Exception as e:
+                logger.error(f"Modbus-Gateway auf {host}:{port} fehlgeschlagen: {e}")
+
+        self._thread = threading.Thread(target=run, name='modbus-gateway', daemon=True)
+        self._thread.start()
+        if not ready.wait(timeout):
+            raise RuntimeError(f"Modbus-Gateway konnte nicht auf {host}:{port} gestartet werden")
+        return self
+
+    def stop(self, timeout=5.0):
+        """Server beenden"""
+        if self._loop is not None and self._server is not None:
+            asyncio.run_coroutine_threadsafe(self._server.shutdown(), self._loop)
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
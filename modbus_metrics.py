@@ -0,0 +1,257 @@
+"""
+Modbus-Transaktionsmetriken
+
+Jede Anfrage des MRA4Client wird mit Function Code, Adressbereich, Dauer,
+Ergebnis und Exception Code erfasst. Die Dauer landet in einem Histogramm mit
+festen Grenzen, dazu kommen Zähler und die Bytes auf der Leitung (aus der
+Größe der Modbus-TCP-Telegramme berechnet).
+
+Die Erfassung ist auf < 1 µs pro Anfrage ausgelegt und bleibt im Betrieb
+aktiv, deshalb ohne Lock im Heißpfad. Bytes und OK-Zähler werden erst beim
+Auslesen berechnet. Die Reihen der Poll-Anfragen legt MRA4Client beim Start
+an (preallocate), weitere Reihen entstehen über das defaultdict - ohne
+Prüfung und ohne Einfügen während des Polls.
+
+Gleichzeitige Schreiber: alle Anfragen der Anwendung laufen über
+AcquisitionService.execute unter der Geräte-Sperre. Ein Aufruf außerhalb
+dieser Sperre (Skripte, eigener Client) kann die Struktur nicht beschädigen;
+im ungünstigsten Fall geht bei genau gleichzeitigen Anfragen ein Zählerschritt
+verloren.
+
+Gemessen in der Testumgebung (CPython 3.11): etwa 0,6 µs für record() und
+1,7-2 µs Mehraufwand für einen umhüllten Aufruf insgesamt - über dem Ziel von
+1 µs. Dort kosten allein perf_counter_ns() 80 ns und ein Dictionary-Zugriff
+50 ns; der Rest sind Python-Aufrufe (Hülle, record(), isError()).
+"""
+import time
+from bisect import bisect_left
+from collections import defaultdict
+from time import perf_counter_ns
+
+# Obergrenzen der Latenz-Buckets in Mikrosekunden (letzter Bucket: darüber)
+DEFAULT_BUCKETS_US = (250, 500, 1000, 2500, 5000, 10000, 25000, 50000, 100000, 250000, 500000, 1000000)
+
+# Telegrammgrößen Modbus TCP: MBAP-Header (7) + PDU
+_MBAP = 7
+_REQUEST_BYTES = _MBAP + 5                  # Function Code + Adresse + Anzahl/Wert
+_EXCEPTION_BYTES = _MBAP + 2                # Function Code + Exception Code
+
+# Aufbau eines Eintrags in ModbusMetrics.series
+_REQUESTS, _EXCEPTIONS, _ERRORS, _SUM_NS, _MAX_NS, _HIST = 0, 1, 2, 3, 4, 5
+
+FUNCTION_NAMES = {
+    1: 'Read Coils',
+    3: 'Read Holding Registers',
+    4: 'Read Input Registers',
+    5: 'Write Single Coil',
+    6: 'Write Single Register',
+}
+
+
+def _response_bytes(fc, count):
+    """Größe einer regulären Antwort"""
+    if fc in (3, 4):
+        return _MBAP + 2 + 2 * count
+    if fc == 1:
+        return _MBAP + 2 + (count + 7) // 8
+    return _MBAP + 5   # Schreibbefehle: Echo der Anfrage
+
+
+class ModbusMetrics:
+    """Histogramme und Zähler pro (Function Code, Adresse, Anzahl)"""
+
+    def __init__(self, buckets_us=DEFAULT_BUCKETS_US):
+        self.buckets_us = tuple(buckets_us)
+        self._bounds_ns = tuple(b * 1000 for b in self.buckets_us)
+        self._preallocated = set()
+        self.reset()
+
+    def reset(self):
+        """Alle Zähler auf 0 setzen (vorab angelegte Reihen bleiben angelegt)"""
+        # (fc, address, count) -> [requests, exceptions, errors, sum_ns, max_ns, hist...]
+        series = defaultdict(self._new_series)
+        for key in self._preallocated:
+            series[key]
+        self.series = series
+        self.exception_codes = defaultdict(int)   # (fc, code) -> Anzahl
+        self.since = time.time()
+
+    def _new_series(self):
+        return [0] * (_HIST + len(self._bounds_ns) + 1)
+
+    def preallocate(self, keys):
+        """
+        Reihen vorab anlegen, damit der Poll-Zyklus nie in das Dictionary einfügt
+
+        Args:
+            keys: (fc, address, count) der regelmäßigen Anfragen
+        """
+        for key in keys:
+            self._preallocated.add(key)
+            self.series[key]
+
+    def record(self, fc, address, count, duration_ns, result):
+        """
+        Eine beantwortete Anfrage erfassen (Heißpfad - so wenig Arbeit wie möglich)
+
+        Args:
+            fc: Function Code
+            address, count: angefragter Bereich
+            duration_ns: Dauer in Nanosekunden
+            result: pymodbus-Antwort (isError() = Modbus-Exception)
+        """
+        series = self.series[fc, address, count]
+        series[_REQUESTS] += 1
+        series[_SUM_NS] += duration_ns
+        if duration_ns > series[_MAX_NS]:
+            series[_MAX_NS] = duration_ns
+        series[_HIST + bisect_left(self._bounds_ns, duration_ns)] += 1
+        if result.isError():
+            series[_EXCEPTIONS] += 1
+            self.exception_codes[fc, getattr(result, 'exception_code', 0)] += 1
+
+    def failed(self, fc, address, count, duration_ns):
+        """Anfrage ohne Antwort erfassen (Timeout, Verbindungsfehler)"""
+        series = self.series[fc, address, count]
+        series[_REQUESTS] += 1
+        series[_ERRORS] += 1
+        series[_SUM_NS] += duration_ns
+        if duration_ns > series[_MAX_NS]:
+            series[_MAX_NS] = duration_ns
+        series[_HIST + bisect_left(self._bounds_ns, duration_ns)] += 1
+
+    def _quantile_us(self, histogram, q):
+        """Obergrenze des Buckets, in dem das Quantil liegt (None = über dem letzten)"""
+        total = sum(histogram)
+        if not total:
+            return None
+        target = q * total
+        seen = 0
+        for i, n in enumerate(histogram):
+            seen += n
+            if seen >= target:
+                return self.buckets_us[i] if i < len(self.buckets_us) else None
+        return None
+
+    def snapshot(self):
+        """
+        Maschinenlesbarer Stand aller Metriken
+
+        Bytes auf der Leitung werden aus den Zählern und den Telegrammgrößen
+        berechnet (Modbus TCP, ohne TCP/IP-Header).
+
+        Returns:
+            Dictionary (JSON-serialisierbar)
+        """
+        rows = []
+        tx_bytes = rx_bytes = 0
+        for (fc, address, count), series in sorted(list(self.series.items())):
+            series = list(series)   # Kopie - der Poll-Thread schreibt weiter
+            requests = series[_REQUESTS]
+            if not requests:
+                continue   # vorab angelegt, noch keine Anfrage
+            histogram = series[_HIST:]
+            exceptions = series[_EXCEPTIONS]
+            errors = series[_ERRORS]
+            ok = requests - exceptions - errors
+            tx_bytes += requests * _REQUEST_BYTES
+            rx_bytes += ok * _response_bytes(fc, count) + exceptions * _EXCEPTION_BYTES
+            rows.append({
+                'fc': fc,
+                'function': FUNCTION_NAMES.get(fc, f'FC{fc}'),
+                'address': address,
+                'count': count,
+                'requests': requests,
+                'ok': ok,
+                'exceptions': exceptions,
+                'errors': errors,
+                'total_us': round(series[_SUM_NS] / 1000, 1),
+                'mean_us': round(series[_SUM_NS] / requests / 1000, 1) if requests else None,
+                'max_us': round(series[_MAX_NS] / 1000, 1),
+                'p50_us': self._quantile_us(histogram, 0.50),
+                'p95_us': self._quantile_us(histogram, 0.95),
+                'p99_us': self._quantile_us(histogram, 0.99),
+                'histogram': histogram,
+            })
+        return {
+            'since': self.since,
+            'buckets_us': list(self.buckets_us),
+            'requests': sum(row['requests'] for row in rows),
+            'errors': sum(row['errors'] for row in rows),
+            'exceptions': sum(row['exceptions'] for row in rows),
+            'tx_bytes': tx_bytes,
+            'rx_bytes': rx_bytes,
+            'series': rows,
+            'exception_codes': [{'fc': fc, 'code': code, 'count': n}
+                                for (fc, code), n in sorted(list(self.exception_codes.items()))],
+        }
+
+
+class InstrumentedModbusClient:
+    """
+    Hülle um einen pymodbus-Client, die jede Anfrage in ModbusMetrics erfasst
+
+    Alle übrigen Attribute (connect, close, connected, comm_params, ...)
+    werden an den eigentlichen Client durchgereicht.
+    """
+
+    def __init__(self, client, metrics):
+        self.client = client
+        self.metrics = metrics
+
+    def __getattr__(self, name):
+        return getattr(self.client, name)
+
+    def read_input_registers(self, address, count=1, **kwargs):
+        started = perf_counter_ns()
+        try:
+            result = self.client.read_input_registers(address, count=count, **kwargs)
+        except Exception:
+            self.metrics.failed(4, address, count, perf_counter_ns() - started)
+            raise
+        self.metrics.record(4, address, count, perf_counter_ns() - started, result)
+        return result
+
+    def read_holding_registers(self, address, count=1, **kwargs):
+        started = perf_counter_ns()
+        try:
+            result = self.client.read_holding_registers(address, count=count, **kwargs)
+        except Exception:
+            self.metrics.failed(3, address, count, perf_counter_ns() - started)
+            raise
+        self.metrics.record(3, address, count, perf_counter_ns() - started, result)
+        return result
+
+    def read_coils(self, address, count=1, **kwargs):
+        started = perf_counter_ns()
+        try:
+            result = self.client.read_coils(address, count=count, **kwargs)
+        except Exception:
+            self.metrics.failed(1, address, count, perf_counter_ns() - started)
+            raise
+        self.metrics.record(1, address, count, perf_counter_ns() - started, result)
+        return result
+
+    def write_coil(self, address, value, **kwargs):
+        started = perf_counter_ns()
+        try:
+            result = self.client.write_coil(address, value, **kwargs)
+        except Exception:
+            self.metrics.failed(5, address, 1, perf_counter_ns() - started)
+            raise
+        self.metrics.record(5, address, 1, perf_counter_ns() - started, result)
+        return result
+
+    def write_register(self, address, value, **kwargs):
+        started = perf_counter_ns()
+        try:
+            result = self.client.write_register(address, value, **kwargs)
+        except Exception:
+            self.metrics.failed(6, address, 1, perf_counter_ns() - started)
+            raise
+        self.metrics.record(6, address, 1, perf_counter_ns() - started, result)
+        return result
+
+
+# Gemeinsame Metriken aller MRA4Client-Instanzen (bleiben beim Umschalten des Clients erhalten)
+MODBUS_METRICS = ModbusMetrics()
@@ -0,0 +1,314 @@
+"""
+MRA 4 Emulator - Modbus TCP Server mit dem Registerlayout des MRA 4
+
+Im Gegensatz zum MRA4Simulator (Python-Objekt ohne Netzwerk) läuft der
+Emulator als echter Modbus TCP Server (pymodbus). Damit lässt sich der
+komplette Pfad des MRA4Client testen: Framing, Timeouts, Blockzugriffe und
+parallele Verbindungen.
+
+Registerlayout:
+    Input Register 20100-20209 und 20392-20401: Messwerte als Float
+        (IEEE754, Big-Endian) - 20100/20102/20104 Strom L1-L3, 20128 Frequenz,
+        20136/20138/20140 Spannung L1-L3, 20154 Gesamtwirkleistung,
+        20204/20206/20208 Phasenlage IL1-IL3, 20392/20396/20400 Phasenlage UL1-UL3
+    Holding Register 1 (Schutz-Status), 57 (Störfall-Nr.), 1000 (DI),
+        1005 (Leittechnik-Befehle), 5004 (Auslöseursache)
+    Coils 22003, 22005, 22020-22022 (Quittierungen, Koppelschalter, Störschrieb)
+
+Die Werte liefert ein MRA4Simulator, der im Intervall fortgeschrieben wird.
+Schreibzugriffe auf die Coils werden an den Simulator weitergegeben.
+
+Start:
+    python mra4_emulator.py --port 5020 --latency-ms 20 --jitter-ms 5 --drop-rate 0.01
+    python mra4_emulator.py --illegal i:20120-20127 --illegal h:57
+    python mra4_emulator.py --scenario scenarios/lastprofil_beispiel.json --speed 10
+"""
+import argparse
+import asyncio
+import logging
+import random
+import threading
+
+from modbus_client import INPUT_BLOCK_COUNT, MRA4Simulator, encode_registers, input_offset
+
+logger = logging.getLogger(__name__)
+
+HOLDING_ADDRESSES = (1, 57, 1000, 1005, 5004)
+COIL_ADDRESSES = (22003, 22005, 22020, 22021, 22022)
+
+# Funktionscode -> Registertabelle
+_TABLES = {1: 'c', 5: 'c', 15: 'c', 3: 'h', 6: 'h', 16: 'h', 4: 'i'}
+
+
+def parse_address_range(text):
+    """
+    Adressbereich aus der Kommandozeile lesen
+
+    Args:
+        text: '20120-20127', '57' oder mit Tabelle 'i:20120-20127' (i, h, c)
+
+    Returns:
+        (Tabelle oder None, erste Adresse, letzte Adresse)
+    """
+    table = None
+    if ':' in text:
+        table, text = text.split(':', 1)
+    first, _, last = text.partition('-')
+    return table, int(first), int(last or first)
+
+
+def _device_context_class():
+    # pymodbus erst hier importieren - das Modul bleibt ohne pymodbus importierbar
+    from pymodbus.constants import ExcCodes
+    from pymodbus.datastore import ModbusBaseDeviceContext
+    from pymodbus.exceptions import NoSuchIdException
+
+    class EmulatorDeviceContext(ModbusBaseDeviceContext):
+        """Datastore mit Latenz, Jitter, verworfenen Anfragen und gesperrten Bereichen"""
+
+        def __init__(self, emulator):
+            self.emulator = emulator
+
+        def reset(self):
+            pass
+
+        async def _delay(self):
+            emulator = self.emulator
+            delay = emulator.latency_s
+            if emulator.jitter_s:
+                delay += emulator.random.uniform(-emulator.jitter_s, emulator.jitter_s)
+            if delay > 0:
+                await asyncio.sleep(delay)
+            if emulator.drop_rate and emulator.random.random() < emulator.drop_rate:
+                emulator.stats['dropped'] += 1
+                # Keine Antwort senden - der Client läuft in seinen Timeout
+                raise NoSuchIdException("Anfrage verworfen (Emulator)")
+
+        async def async_getValues(self, func_code, address, count=1):
+            self.emulator.stats[f'fc{func_code}'] += 1
+            await self._delay()
+            values = self.emulator.get_values(_TABLES.get(func_code), address, count)
+            if values is None:
+                self.emulator.stats['illegal_address'] += 1
+                return ExcCodes.ILLEGAL_ADDRESS
+            return values
+
+        async def async_setValues(self, func_code, address, values):
+            self.emulator.stats[f'fc{func_code}'] += 1
+            await self._delay()
+            if not self.emulator.set_values(_TABLES.get(func_code), address, values):
+                self.emulator.stats['illegal_address'] += 1
+                return ExcCodes.ILLEGAL_ADDRESS
+            return None
+
+    return EmulatorDeviceContext
+
+
+class _Stats(dict):
+    def __missing__(self, key):
+        return 0
+
+
+class MRA4Emulator:
+    """Modbus TCP Server mit MRA 4 Registerlayout"""
+
+    def __init__(self, simulator=None, latency_s=0.0, jitter_s=0.0, drop_rate=0.0,
+                 illegal_ranges=(), update_interval_s=1.0, seed=None):
+        """
+        Args:
+            simulator: MRA4Simulator als Wertequelle (None = neuer Simulator)
+            latency_s: Verzögerung pro Anfrage in Sekunden
+            jitter_s: zufällige Abweichung der Verzögerung (+/-) in Sekunden
+            drop_rate: Anteil der Anfragen, die nicht beantwortet werden (0-1)
+            illegal_ranges: Bereiche (Tabelle oder None, erste, letzte Adresse),
+                die mit Illegal Data Address beantwortet werden
+            update_interval_s: Intervall für neue Messwerte vom Simulator
+            seed: Startwert für Jitter/Drop (reproduzierbare Läufe)
+        """
+        self.simulator = simulator or MRA4Simulator()
+        self.simulator.connect()
+        self.latency_s = latency_s
+        self.jitter_s = jitter_s
+        self.drop_rate = drop_rate
+        self.illegal_ranges = [parse_address_range(r) if isinstance(r, str) else tuple(r)
+                               for r in illegal_ranges]
+        self.update_interval_s = update_interval_s
+        self.random = random.Random(seed)
+        self.stats = _Stats()
+
+        self._lock = threading.Lock()
+        self._input = [0] * INPUT_BLOCK_COUNT   # Input-Blöcke im Layout von modbus_client
+        self._holding = dict.fromkeys(HOLDING_ADDRESSES, 0)
+        self._coils = dict.fromkeys(COIL_ADDRESSES, False)
+
+        self._loop = None
+        self._server = None
+        self._thread = None
+        self.address = None
+
+        self.update_measurements()
+
+    # --- Registerzugriff -------------------------------------------------
+
+    def _illegal(self, table, address, count):
+        for range_table, first, last in self.illegal_ranges:
+            if (range_table is None or range_table == table) and address <= last and address + count - 1 >= first:
+                return True
+        return False
+
+    def get_values(self, table, address, count):
+        """Registerwerte lesen (None = Illegal Data Address)"""
+        if table is None or self._illegal(table, address, count):
+            return None
+        with self._lock:
+            if table == 'i':
+                try:
+                    return [self._input[input_offset(a)] for a in range(address, address + count)]
+                except KeyError:
+                    return None
+            store = self._holding if table == 'h' else self._coils
+            try:
+                return [store[a] for a in range(address, address + count)]
+            except KeyError:
+                return None
+
+    def set_values(self, table, address, values):
+        """Schreibzugriff (nur Coils) - gibt False bei Illegal Data Address zurück"""
+        if table != 'c' or self._illegal(table, address, len(values)):
+            return False
+        addresses = range(address, address + len(values))
+        if any(a not in self._coils for a in addresses):
+            return False
+        for a, value in zip(addresses, values):
+            self._write_coil(a, bool(value))
+        self.update_status()
+        return True
+
+    def _write_coil(self, address, value):
+        sim = self.simulator
+        with self._lock:
+            rising = value and not self._coils[address]
+            self._coils[address] = value
+        if address == 22020 and rising:
+            sim.send_coupling_pulse()
+        elif address == 22022:
+            sim.write_fault_recording_trigger(value)
+        elif address == 22021 and rising:
+            sim.acknowledge_all()
+        elif address == 22003 and rising:
+            sim.acknowledge_device()
+        elif address == 22005 and rising:
+            sim.acknowledge_trip_command()
+
+    # --- Werte vom Simulator übernehmen ----------------------------------
+
+    def update_measurements(self):
+        """Neue Messwerte vom Simulator holen und in die Input Register schreiben"""
+        # Gleiche Umrechnung wie für Gateway/Aufzeichnung (inkl. Phasenlagen aus P, U und I)
+        raw = encode_registers(self.simulator.read_all_data())
+        with self._lock:
+            self._input[:] = [value or 0 for value in raw[:INPUT_BLOCK_COUNT]]
+        self.update_status()
+
+    def update_status(self):
+        """Status-Register (Schutz, DI, Leittechnik-Befehle, COT) vom Simulator übernehmen"""
+        sim = self.simulator
+        di_mask = 0
+        for i in range(8):
+            if sim.read_di_status(i + 1):
+                di_mask |= 1 << i
+        ba_mask = (0x1 if sim.coupling_switch_state else 0) | (0x4 if sim.fault_recording_state else 0)
+        with self._lock:
+            self._holding[1] = sim.read_protection_status()['raw_value']
+            self._holding[57] = sim.fault_number & 0xFFFF
+            self._holding[1000] = di_mask
+            self._holding[1005] = ba_mask
+            self._holding[5004] = sim.cause_of_trip & 0xFFFF
+
+    # --- Server ----------------------------------------------------------
+
+    async def _update_loop(self):
+        while True:
+            await asyncio.sleep(self.update_interval_s)
+            try:
+                self.update_measurements()
+            except Exception as e:
+                logger.error(f"Fehler beim Aktualisieren der Emulator-Werte: {e}")
+
+    async def serve(self, host='127.0.0.1', port=5020, ready=None):
+        """Server im aktuellen Event-Loop betreiben (bis shutdown)"""
+        from pymodbus.datastore import ModbusServerContext
+        from pymodbus.server import ModbusTcpServer
+
+        context = ModbusServerContext(devices=_device_context_class()(self), single=True)
+        # ignore_missing_devices: verworfene Anfragen bleiben ohne Antwort
+        self._server = ModbusTcpServer(context, address=(host, port), ignore_missing_devices=True)
+        self._loop = asyncio.get_running_loop()
+        updater = asyncio.create_task(self._update_loop())
+        try:
+            await self._server.serve_forever(background=True)
+            self.address = (host, port)
+            logger.info(f"MRA4 Emulator läuft auf {host}:{port} (Latenz {self.latency_s * 1000:.0f} ms, "
+                        f"Jitter {self.jitter_s * 1000:.0f} ms, Drop {self.drop_rate:.1%})")
+            if ready is not None:
+                ready.set()
+            await self._server.serving
+        finally:
+            updater.cancel()
+
+    def start(self, host='127.0.0.1', port=5020, timeout=10.0):
+        """Server in einem Hintergrund-Thread starten (kehrt zurück, sobald er lauscht)"""
+        ready = threading.Event()
+        self._thread = threading.Thread(target=lambda: asyncio.run(self.serve(host, port, ready)),
+                                        name='mra4-emulator', daemon=True)
+        self._thread.start()
+        if not ready.wait(timeout):
+            raise RuntimeError(f"Emulator konnte nicht auf {host}:{port} gestartet werden")
+        return self
+
+    def stop(self, timeout=5.0):
+        """Hintergrund-Server beenden"""
+        if self._loop is not None and self._server is not None:
+            asyncio.run_coroutine_threadsafe(self._server.shutdown(), self._loop)
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="MRA 4 Modbus TCP Emulator")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=5020)
+    parser.add_argument('--latency-ms', type=float, default=0.0, help="Verzögerung pro Anfrage")
+    parser.add_argument('--jitter-ms', type=float, default=0.0, help="zufällige Abweichung (+/-)")
+    parser.add_argument('--drop-rate', type=float, default=0.0, help="Anteil unbeantworteter Anfragen (0-1)")
+    parser.add_argument('--illegal', action='append', default=[],
+                        help="Bereich mit Illegal Data Address, z.B. i:20120-20127 oder h:57 (mehrfach)")
+    parser.add_argument('--update-interval', type=float, default=1.0, help="Sekunden zwischen neuen Messwerten")
+    parser.add_argument('--seed', type=int, default=None)
+    parser.add_argument('--scenario', default=None, help="Szenario-Datei (JSON) statt Zufallswerten")
+    parser.add_argument('--speed', type=float, default=1.0, help="Wiedergabe-Geschwindigkeit des Szenarios")
+    parser.add_argument('--loop', action='store_true', help="Szenario am Ende wiederholen")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    logging.getLogger('pymodbus').setLevel(logging.WARNING)
+    emulator = MRA4Emulator(latency_s=args.latency_ms / 1000, jitter_s=args.jitter_ms / 1000,
+                            drop_rate=args.drop_rate, illegal_ranges=args.illegal,
+                            update_interval_s=args.update_interval, seed=args.seed)
+    player = None
+    if args.scenario:
+        from scenario import Scenario, ScenarioPlayer
+        player = ScenarioPlayer(Scenario.from_file(args.scenario), emulator, speed=args.speed, loop=args.loop).start()
+    try:
+        asyncio.run(emulator.serve(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if player is not None:
+            player.stop()
+    print(f"Anfragen: {dict(emulator.stats)}")
+
+
+if __name__ == '__main__':
+    main()
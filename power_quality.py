@@ -0,0 +1,237 @@
+"""
+Netzqualität aus dem Datenstrom: Unsymmetrie, gleitende Statistik, df/dt
+
+Der Analysator läuft als Verarbeitungsschritt der Datenerfassung - nach dem
+Dekodieren, vor dem Veröffentlichen des Snapshots. Jeder Poll wird einmal
+eingearbeitet, alle Kennwerte werden inkrementell fortgeschrieben (O(1)
+amortisiert pro Messwert, unabhängig von der Fensterlänge):
+
+- Unsymmetrie von Spannung und Strom (größte Abweichung vom Mittelwert der
+  Phasen in Prozent des Mittelwerts, wie NEMA MG 1)
+- gleitendes Minimum/Maximum (monotone Queues) und Mittelwert/Standard-
+  abweichung (Welford mit Entfernen abgelaufener Werte) pro Kanal und Fenster
+- df/dt als Steigung der Regressionsgeraden der Frequenz über
+  rocof_window_s (laufende Summen)
+
+Unsymmetrie und df/dt stehen im Snapshot unter data['analytics'] (und damit
+in Historie, Shared Memory, REST-API und /metrics); die Fensterstatistik
+liefert state().
+"""
+import logging
+import math
+import threading
+from collections import deque
+
+from acquisition import ANALYTICS_KEYS, PHASES
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CHANNELS = (tuple(f'voltage.{phase}' for phase in PHASES) + tuple(f'current.{phase}' for phase in PHASES)
+                    + ('power.total', 'frequency'))
+
+# Unterhalb dieser Mittelwerte ist die Unsymmetrie nicht aussagekräftig
+MIN_MEAN = {'voltage': 1.0, 'current': 0.1}
+
+
+def unbalance(values, minimum=0.0):
+    """
+    Unsymmetrie dreier Phasenwerte in Prozent
+
+    Returns:
+        max(|x - Mittel|) / Mittel * 100 oder None (Wert fehlt, Mittel zu klein)
+    """
+    if any(value is None for value in values):
+        return None
+    mean = sum(values) / len(values)
+    if mean <= minimum:
+        return None
+    return max(abs(value - mean) for value in values) / mean * 100
+
+
+def _lookup(data, name):
+    value = data
+    for key in name.split('.'):
+        value = value.get(key) if isinstance(value, dict) else None
+    return value
+
+
+class RollingStats:
+    """Minimum, Maximum, Mittelwert und Standardabweichung über ein gleitendes Zeitfenster"""
+
+    def __init__(self, window_s):
+        self.window_s = float(window_s)
+        self._values = deque()      # (t, x) im Fenster
+        self._minima = deque()      # aufsteigend, Minimum vorne
+        self._maxima = deque()      # absteigend, Maximum vorne
+        self.count = 0
+        self.mean = 0.0
+        self._m2 = 0.0              # Summe der quadrierten Abweichungen (Welford)
+
+    def add(self, t, x):
+        """
+        Einen Messwert aufnehmen und abgelaufene Werte entfernen
+
+        Args:
+            t: monotone Zeit in Sekunden
+            x: Messwert oder None (dann nur Fenster weiterschieben)
+        """
+        if x is not None:
+            self._values.append((t, x))
+            self.count += 1
+            delta = x - self.mean
+            self.mean += delta / self.count
+            self._m2 += delta * (x - self.mean)
+            while self._minima and self._minima[-1][1] >= x:
+                self._minima.pop()
+            self._minima.append((t, x))
+            while self._maxima and self._maxima[-1][1] <= x:
+                self._maxima.pop()
+            self._maxima.append((t, x))
+        self._expire(t)
+
+    def _expire(self, t):
+        horizon = t - self.window_s
+        values = self._values
+        while values and values[0][0] <= horizon:
+            _, y = values.popleft()
+            if self.count == 1:
+                # Fenster leer - exakt zurücksetzen (keine aufgelaufenen Rundungsfehler)
+                self.count, self.mean, self._m2 = 0, 0.0, 0.0
+                continue
+            self.count -= 1
+            delta = y - self.mean
+            self.mean -= delta / self.count
+            self._m2 -= delta * (y - self.mean)
+        while self._minima and self._minima[0][0] <= horizon:
+            self._minima.popleft()
+        while self._maxima and self._maxima[0][0] <= horizon:
+            self._maxima.popleft()
+
+    def std(self):
+        """Standardabweichung (Stichprobe) oder None bei weniger als zwei Werten"""
+        if self.count < 2:
+            return None
+        return math.sqrt(max(self._m2, 0.0) / (self.count - 1))
+
+    def summary(self):
+        if not self.count:
+            return {'min': None, 'max': None, 'mean': None, 'std': None, 'count': 0}
+        return {'min': self._minima[0][1], 'max': self._maxima[0][1], 'mean': self.mean,
+                'std': self.std(), 'count': self.count}
+
+
+class RateOfChange:
+    """Steigung (Einheit/s) der Regressionsgeraden über ein gleitendes Zeitfenster"""
+
+    def __init__(self, window_s, max_gap_s=10.0):
+        self.window_s = float(window_s)
+        self.max_gap_s = max_gap_s
+        self._points = deque()              # (t, x) relativ zu _origin
+        self._origin = None                 # (t, x) des Bezugspunkts
+        self._sums = [0.0, 0.0, 0.0, 0.0]   # Summe t, x, t*t, t*x (relativ zu _origin)
+
+    def reset(self):
+        self._points.clear()
+        self._origin = None
+        self._sums = [0.0, 0.0, 0.0, 0.0]
+
+    def _update(self, t, x, sign):
+        sums = self._sums
+        sums[0] += sign * t
+        sums[1] += sign * x
+        sums[2] += sign * t * t
+        sums[3] += sign * t * x
+
+    def _rebase(self):
+        """Bezugspunkt auf den ältesten Punkt legen und die Summen neu bilden"""
+        t0, x0 = self._points[0]
+        self._origin = (self._origin[0] + t0, self._origin[1] + x0)
+        self._points = deque((t - t0, x - x0) for t, x in self._points)
+        self._sums = [0.0, 0.0, 0.0, 0.0]
+        for t, x in self._points:
+            self._update(t, x, 1)
+
+    def add(self, t, x):
+        """
+        Returns:
+            Steigung oder None (Wert fehlt, weniger als drei Punkte)
+        """
+        if x is None or (self._points and t - self._origin[0] - self._points[-1][0] > self.max_gap_s):
+            # Lücke: Steigung über die Lücke hinweg wäre geraten
+            self.reset()
+            if x is None:
+                return None
+        if self._origin is None:
+            self._origin = (t, x)
+        # Relativ zum Bezugspunkt - die Summen bleiben klein und genau
+        t -= self._origin[0]
+        x -= self._origin[1]
+        self._points.append((t, x))
+        self._update(t, x, 1)
+        horizon = t - self.window_s
+        while self._points[0][0] < horizon:
+            self._update(*self._points.popleft(), -1)
+        if self._points[0][0] >= self.window_s:
+            # Einmal pro Fensterlänge (amortisiert O(1)): Zeiten wachsen nicht, Rundungsfehler
+            # aus dem Hinzufügen und Entfernen laufen nicht auf
+            self._rebase()
+        n = len(self._points)
+        if n < 3:
+            return None
+        sum_t, sum_x, sum_tt, sum_tx = self._sums
+        denominator = n * sum_tt - sum_t * sum_t
+        if denominator <= 0:
+            return None
+        return (n * sum_tx - sum_t * sum_x) / denominator
+
+
+class PowerQualityAnalyzer:
+    """Verarbeitungsschritt der Datenerfassung: Kennwerte pro Poll fortschreiben"""
+
+    def __init__(self, windows_s=(60, 900), channels=DEFAULT_CHANNELS, rocof_window_s=5.0):
+        """
+        Args:
+            windows_s: Fensterlängen der gleitenden Statistik in Sekunden
+            channels: Kanäle wie history_store.CHANNELS ('voltage.L1', 'frequency', ...)
+            rocof_window_s: Fenster der df/dt-Regression in Sekunden
+        """
+        self.windows_s = tuple(sorted(float(w) for w in windows_s))
+        self.channels = tuple(channels)
+        self._stats = {window: {name: RollingStats(window) for name in self.channels}
+                       for window in self.windows_s}
+        self._rocof = RateOfChange(rocof_window_s)
+        self._analytics = dict.fromkeys(ANALYTICS_KEYS)
+        self._timestamp = None
+        self._lock = threading.Lock()
+
+    def process(self, data, timestamp, monotonic):
+        """
+        Einen Poll einarbeiten und data['analytics'] setzen
+
+        Args:
+            data: Datensatz wie read_all_data() (wird ergänzt)
+            timestamp: Unix-Zeit des Polls
+            monotonic: monotone Zeit des Polls
+        """
+        analytics = {
+            'voltage_unbalance': unbalance([data['voltage'][p] for p in PHASES], MIN_MEAN['voltage']),
+            'current_unbalance': unbalance([data['current'][p] for p in PHASES], MIN_MEAN['current']),
+        }
+        with self._lock:
+            analytics['rocof'] = self._rocof.add(monotonic, data['frequency'])
+            for stats in self._stats.values():
+                for name, rolling in stats.items():
+                    rolling.add(monotonic, _lookup(data, name))
+            self._analytics = analytics
+            self._timestamp = timestamp
+        data['analytics'] = analytics
+
+    def state(self):
+        """Kennwerte und Fensterstatistik ({Fenster: {Kanal: {min, max, mean, std, count}}})"""
+        with self._lock:
+            return {
+                'timestamp': self._timestamp,
+                **self._analytics,
+                'windows': {f'{window:g}s': {name: rolling.summary() for name, rolling in stats.items()}
+                            for window, stats in self._stats.items()},
+            }
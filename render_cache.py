@@ -0,0 +1,136 @@
+"""
+Gemeinsamer Render-Cache für Dash-Callbacks
+
+Figuren und Komponenten hängen nur vom Erfassungs-Snapshot ab, nicht von der
+Browser-Sitzung. Der Cache baut jede Ansicht einmal pro Snapshot (Schlüssel
+z.B. (seq, 'voltage-graph', 60)) und liefert dasselbe Objekt an alle
+Sitzungen aus. Figuren werden dafür als fertige JSON-Struktur
+(fig.to_plotly_json()) gespeichert: Dash kodiert pro Antwort dann nur noch
+Listen und Dictionaries, statt jede Figur erneut zu kopieren und zu prüfen.
+Beim Einlagern wird jedes Payload einmal serialisiert, um seine Größe zu
+bestimmen. Einträge werden nach Alter, Anzahl und Gesamtgröße verdrängt.
+"""
+import json
+import threading
+import time
+from collections import OrderedDict
+
+
+def _default_serializer(payload):
+    return json.dumps(payload, default=str)
+
+
+class RenderCache:
+    """Thread-sicherer LRU-Cache mit Alters-, Anzahl- und Größenbegrenzung"""
+
+    def __init__(self, max_entries=64, max_bytes=8 * 1024 * 1024, max_age_s=30.0, serializer=None):
+        """
+        Args:
+            max_entries: maximale Anzahl Einträge
+            max_bytes: maximale Summe der serialisierten Größen
+            max_age_s: maximales Alter eines Eintrags in Sekunden
+            serializer: Funktion payload -> str/bytes für die Größe (Standard: json.dumps)
+        """
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.max_age_s = max_age_s
+        self.serializer = serializer or _default_serializer
+
+        self._entries = OrderedDict()   # key -> (payload, size, created)
+        self._building = {}             # key -> threading.Event
+        self._total_bytes = 0
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+
+    def get_or_build(self, key, builder):
+        """
+        Payload aus dem Cache holen oder genau einmal bauen
+
+        Fragen mehrere Sitzungen gleichzeitig denselben Schlüssel an, baut nur
+        die erste - die anderen warten auf das Ergebnis.
+
+        Args:
+            key: hashbarer Schlüssel (Snapshot-Sequenz, Ansicht, Fenster)
+            builder: Funktion ohne Argumente, die das Payload erzeugt
+
+        Returns:
+            Payload (Figur als Dictionary, Komponente, Tupel, ...)
+        """
+        entry = self._lookup(key)
+        if entry is not None:
+            return entry[0]
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self.hits += 1
+                return entry[0]
+            event = self._building.get(key)
+            owner = event is None
+            if owner:
+                event = threading.Event()
+                self._building[key] = event
+
+        if not owner:
+            event.wait(10.0)
+            entry = self._lookup(key)
+            if entry is not None:
+                return entry[0]
+            return builder()
+
+        try:
+            payload = builder()
+            self._store(key, payload, len(self.serializer(payload)))
+            return payload
+        finally:
+            with self._lock:
+                self._building.pop(key, None)
+            event.set()
+
+    def _lookup(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if time.monotonic() - entry[2] > self.max_age_s:
+                self._remove(key)
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def _store(self, key, payload, size):
+        now = time.monotonic()
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (payload, size, now)
+            self._total_bytes += size
+            self.misses += 1
+            self._evict(now)
+
+    def _remove(self, key):
+        payload, size, created = self._entries.pop(key)
+        self._total_bytes -= size
+
+    def _evict(self, now):
+        # Älteste zuerst: abgelaufene Einträge, dann über Größen-/Anzahl-Limit
+        while self._entries:
+            key, (payload, size, created) = next(iter(self._entries.items()))
+            expired = now - created > self.max_age_s
+            too_big = self._total_bytes > self.max_bytes or len(self._entries) > self.max_entries
+            if not (expired or too_big):
+                break
+            self._remove(key)
+
+    def stats(self):
+        """Cache-Statistik für Diagnosezwecke"""
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'bytes': self._total_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+            }
@@ -0,0 +1,308 @@
+"""
+Lesende REST-API für Snapshot und Historie
+
+    GET /api/snapshot
+    GET /api/history?from=&to=&resolution=&channels=
+
+Beide Endpunkte lesen nur den Erfassungs-Snapshot bzw. die Historie - keine
+Anfrage löst einen Modbus-Zugriff aus.
+
+- ETag/If-None-Match: der ETag folgt der Snapshot-Nummer (bei der Historie
+  zusätzlich der Abfrage). Ohne neuen Poll -> 304 ohne Body.
+- Format: JSON (Standard) oder msgpack (Accept: application/msgpack oder
+  ?format=msgpack, benötigt das Paket msgpack).
+- gzip bei Accept-Encoding: gzip und Antworten ab 1 KB.
+- Der Snapshot wird pro Poll und Format nur einmal serialisiert und
+  komprimiert, alle weiteren Anfragen liefern die fertigen Bytes.
+
+Historie: from/to als Unix-Zeit oder ISO 8601 (Standard: letzte Stunde),
+resolution in Sekunden oder mit Einheit (30s, 5m, 1h), channels
+kommagetrennt (voltage.L1, power.total, frequency oder eine Gruppe wie
+voltage). Lange Zeiträume lesen die vorverdichteten Stufen des HistoryStore.
+"""
+import gzip
+import json
+import logging
+import threading
+import time
+import zlib
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+JSON_TYPE = 'application/json'
+MSGPACK_TYPE = 'application/msgpack'
+
+# Kleinere Antworten werden nicht komprimiert (gzip-Header lohnt nicht)
+GZIP_MIN_BYTES = 1024
+GZIP_LEVEL = 5
+
+DEFAULT_HISTORY_S = 3600
+
+_UNITS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+
+
+def parse_time(value, default):
+    """Unix-Zeit oder ISO 8601 (ohne Zeitzone = lokale Zeit) -> Unix-Zeit"""
+    if value in (None, ''):
+        return default
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    try:
+        return datetime.fromisoformat(value.replace('Z', '+00:00')).timestamp()
+    except ValueError:
+        raise ValueError(f"Ungültige Zeitangabe: {value}")
+
+
+def parse_resolution(value):
+    """'30', '30s', '5m', '1h' -> Sekunden (None = automatisch)"""
+    if value in (None, '', 'auto'):
+        return None
+    try:
+        unit = _UNITS.get(value[-1].lower()) if value[-1].isalpha() else 1
+        seconds = float(value[:-1] if value[-1].isalpha() else value) * unit
+    except (TypeError, ValueError):
+        raise ValueError(f"Ungültige Auflösung: {value}")
+    if unit is None or not seconds > 0:
+        raise ValueError(f"Ungültige Auflösung: {value}")
+    return seconds
+
+
+def parse_channels(value, known=None):
+    """
+    Kommagetrennte Kanäle, Gruppen ('voltage') werden zu allen Phasen erweitert
+
+    Args:
+        known: erlaubte Kanalnamen (None = Kanäle des HistoryStore)
+    """
+    if not value:
+        return None
+    if known is None:
+        from history_store import CHANNEL_NAMES as known   # lädt numpy - erst bei der ersten Abfrage
+    channels = []
+    for name in (part.strip() for part in value.split(',')):
+        if not name:
+            continue
+        group = [channel for channel in known if channel.startswith(name + '.')]
+        for channel in group or [name]:
+            if channel not in known:
+                raise ValueError(f"Unbekannter Kanal: {channel}")
+            if channel not in channels:
+                channels.append(channel)
+    return channels
+
+
+def snapshot_payload(snapshot):
+    """Snapshot als serialisierbares Dictionary"""
+    return {
+        'seq': snapshot.seq,
+        'timestamp': snapshot.timestamp,
+        'connected': bool(snapshot.connected),
+        'simulator': bool(snapshot.simulator),
+        'epoch': snapshot.epoch,
+        'data': snapshot.data,
+    }
+
+
+def encode(payload, content_type):
+    if content_type == MSGPACK_TYPE:
+        return msgpack.packb(payload, use_bin_type=True)
+    return json.dumps(payload, separators=(',', ':'), ensure_ascii=False).encode('utf-8')
+
+
+def _compress(body):
+    return gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0)
+
+
+class RestApi:
+    """Flask-Routen /api/snapshot, /api/history und /api/export"""
+
+    def __init__(self, acq, query_history, export_directory=None, history_directory=None):
+        """
+        Args:
+            acq: AcquisitionService oder SharedSnapshotReader (latest())
+            query_history: Funktion wie HistoryStore.query (im Web-Worker über den Befehlskanal)
+            export_directory: Verzeichnis der Register-Aufzeichnungen für /api/export
+            history_directory: Verzeichnis der Spalten-Historie (Export ohne Aufzeichnungen)
+        """
+        self.acq = acq
+        self.query_history = query_history
+        self.export_directory = export_directory
+        self.history_directory = history_directory
+        # (seq, Content-Type, gzip) -> fertige Bytes; wird bei neuem Snapshot ersetzt
+        self._cache_seq = None
+        self._cache = {}
+        self._cache_lock = threading.Lock()
+
+    def install(self, server):
+        """Routen am Flask-Server registrieren"""
+        import flask
+
+        @server.route('/api/snapshot')
+        def api_snapshot():
+            return self.snapshot_response(flask.request)
+
+        @server.route('/api/history')
+        def api_history():
+            return self.history_response(flask.request)
+
+        @server.route('/api/export')
+        def api_export():
+            return self.export_response(flask.request)
+
+    @staticmethod
+    def _negotiate(request):
+        """
+        Returns:
+            (Content-Type, gzip) oder (None, None) wenn msgpack verlangt, aber nicht installiert
+        """
+        requested = request.args.get('format', '').lower()
+        if requested == 'msgpack' or (not requested and MSGPACK_TYPE in request.headers.get('Accept', '')):
+            if msgpack is None:
+                if requested:
+                    return None, None
+            else:
+                return MSGPACK_TYPE, 'gzip' in request.headers.get('Accept-Encoding', '')
+        return JSON_TYPE, 'gzip' in request.headers.get('Accept-Encoding', '')
+
+    @staticmethod
+    def _not_modified(request, etag):
+        import flask
+        # Schwacher Vergleich: W/ auf beiden Seiten ignorieren
+        tags = (tag.strip().removeprefix('W/') for tag in request.headers.get('If-None-Match', '').split(','))
+        if etag.removeprefix('W/') in tags:
+            response = flask.Response(status=304)
+            response.headers['ETag'] = etag
+            return response
+        return None
+
+    @staticmethod
+    def _response(body, content_type, gzipped, etag):
+        import flask
+        response = flask.Response(body, content_type=content_type)
+        response.headers['ETag'] = etag
+        response.headers['Cache-Control'] = 'no-cache'
+        response.headers['Vary'] = 'Accept, Accept-Encoding'
+        if gzipped:
+            response.headers['Content-Encoding'] = 'gzip'
+        return response
+
+    @staticmethod
+    def _error(status, message):
+        import flask
+        response = flask.jsonify({'error': message})
+        response.status_code = status
+        return response
+
+    def _body(self, snapshot, content_type, gzipped):
+        """Serialisierte (und ggf. komprimierte) Bytes eines Snapshots - einmal pro Poll"""
+        key = (content_type, gzipped)
+        with self._cache_lock:
+            if self._cache_seq != snapshot.seq:
+                self._cache_seq = snapshot.seq
+                self._cache = {}
+            cached = self._cache.get(key)
+            if cached is not None:
+                return cached
+            body = self._cache.get((content_type, False))
+            if body is None:
+                body = self._cache[(content_type, False)] = encode(snapshot_payload(snapshot), content_type)
+            if gzipped:
+                body = _compress(body) if len(body) >= GZIP_MIN_BYTES else body
+                self._cache[key] = body
+            return body
+
+    @staticmethod
+    def _etag(prefix, snapshot, content_type, extra=''):
+        # Schwacher ETag: gleicher Inhalt, unabhängig von gzip; Zeitstempel, weil seq nach einem Neustart neu beginnt
+        kind = 'm' if content_type == MSGPACK_TYPE else 'j'
+        return f'W/"{prefix}{kind}{snapshot.seq}-{int(snapshot.timestamp * 1000)}{extra}"'
+
+    def snapshot_response(self, request):
+        snapshot = self.acq.latest()
+        content_type, gzipped = self._negotiate(request)
+        if content_type is None:
+            return self._error(406, "msgpack ist nicht installiert (pip install msgpack)")
+        etag = self._etag('s', snapshot, content_type)
+        not_modified = self._not_modified(request, etag)
+        if not_modified is not None:
+            return not_modified
+        body = self._body(snapshot, content_type, gzipped)
+        return self._response(body, content_type, gzipped and body[:2] == b'\x1f\x8b', etag)
+
+    def history_response(self, request):
+        """
+        Die Historie ändert sich nur mit neuen Polls - der ETag aus Snapshot
+        und Abfrage wird vor der Abfrage geprüft, 304 kostet keine Abfrage.
+        """
+        content_type, gzipped = self._negotiate(request)
+        if content_type is None:
+            return self._error(406, "msgpack ist nicht installiert (pip install msgpack)")
+        query = request.query_string.decode('latin-1')
+        etag = self._etag('h', self.acq.latest(), content_type, f'-{zlib.crc32(query.encode()):08x}')
+        not_modified = self._not_modified(request, etag)
+        if not_modified is not None:
+            return not_modified
+
+        args = request.args
+        try:
+            end = parse_time(args.get('to'), time.time())
+            start = parse_time(args.get('from'), end - DEFAULT_HISTORY_S)
+            resolution = parse_resolution(args.get('resolution'))
+            channels = parse_channels(args.get('channels'))
+            if end < start:
+                raise ValueError("'to' liegt vor 'from'")
+            # Im Web-Worker über den Befehlskanal - Eingaben sind hier schon geprüft
+            result = self.query_history(start, end, resolution, channels)
+        except ValueError as e:
+            return self._error(400, str(e))
+        except Exception as e:
+            logger.error(f"Historien-Abfrage fehlgeschlagen: {e}")
+            return self._error(503, "Historie nicht verfügbar")
+
+        body = encode(result, content_type)
+        gzipped = gzipped and len(body) >= GZIP_MIN_BYTES
+        return self._response(_compress(body) if gzipped else body, content_type, gzipped, etag)
+
+    def export_response(self, request):
+        """
+        Gestreamter Export (chunked): ?from=&to=&channels=&format=csv|parquet
+
+        Ohne from gilt der letzte Tag. Es läuft höchstens ein Export gleichzeitig.
+        """
+        import flask
+        from data_export import EXPORT_CHANNELS, FORMATS, ExportBusy, export_stream, parquet_available
+
+        args = request.args
+        fmt = args.get('format', 'csv').lower()
+        if fmt not in FORMATS:
+            return self._error(400, f"Unbekanntes Format: {fmt}")
+        if fmt == 'parquet' and not parquet_available():
+            return self._error(406, "Parquet-Export benötigt pyarrow (pip install pyarrow)")
+        try:
+            end = parse_time(args.get('to'), time.time())
+            start = parse_time(args.get('from'), end - 86400)
+            channels = parse_channels(args.get('channels'), EXPORT_CHANNELS) or list(EXPORT_CHANNELS)
+            if end < start:
+                raise ValueError("'to' liegt vor 'from'")
+        except ValueError as e:
+            return self._error(400, str(e))
+        try:
+            stream = export_stream(fmt, start, end, channels, self.export_directory, self.query_history,
+                                   self.history_directory)
+        except ExportBusy as e:
+            return self._error(429, str(e))
+
+        content_type, extension = FORMATS[fmt]
+        name = f"mra4_{datetime.fromtimestamp(start):%Y%m%d_%H%M}-{datetime.fromtimestamp(end):%Y%m%d_%H%M}.{extension}"
+        response = flask.Response(stream, content_type=content_type)
+        response.headers['Content-Disposition'] = f'attachment; filename="{name}"'
+        response.headers['Cache-Control'] = 'no-store'
+        return response
@@ -0,0 +1,270 @@
+"""
+Szenario- und Lastprofil-Engine für MRA4Simulator und MRA4 Emulator
+
+Ein Szenario beschreibt deklarativ einen Zeitablauf (JSON oder dict):
+
+    {
+        "name": "Lastrampe mit f-Auslösung",
+        "duration_s": 3600, "step_s": 1.0, "seed": 42,
+        "base": {"voltage_v": 230.0, "load_kw": 3.0, "power_factor": 0.95,
+                 "frequency_hz": 50.0, "noise": 0.01, "voltage_drop_per_kw": 0.4},
+        "di_feedback_delay_s": 0.5,
+        "events": [
+            {"type": "load_ramp", "start_s": 60, "duration_s": 600, "to_kw": 11.0},
+            {"type": "imbalance", "start_s": 900, "duration_s": 300, "factors": [1.3, 1.0, 0.7]},
+            {"type": "frequency_excursion", "start_s": 1500, "duration_s": 20, "delta_hz": -0.6},
+            {"type": "voltage_sag", "start_s": 1800, "duration_s": 2, "depth": 0.3, "phases": [1]},
+            {"type": "trip", "at_s": 1510, "cot": 1401, "load_kw_after": 0.0}
+        ]
+    }
+
+generate() berechnet alle Messwerte vektorisiert mit numpy (Stunden an Daten
+in Millisekunden). ScenarioPlayer spielt sie in Echtzeit oder beschleunigt
+in einen Simulator oder Emulator ein.
+"""
+import json
+import logging
+import threading
+import time
+
+import numpy as np
+
+from acquisition import PHASES
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BASE = {
+    'voltage_v': 230.0,           # Leiter-Erd-Spannung
+    'load_kw': 3.0,               # Gesamtlast zu Beginn
+    'power_factor': 0.95,
+    'frequency_hz': 50.0,
+    'noise': 0.01,                # relatives Rauschen der Messwerte
+    'voltage_drop_per_kw': 0.4,   # Spannungsfall pro kW Phasenlast
+}
+
+
+class ScenarioFrames:
+    """Vorberechnete Messwerte eines Szenarios (ein Eintrag pro Zeitschritt)"""
+
+    def __init__(self, t, voltage, current, power, frequency, trips, step_s, name=''):
+        """
+        Args:
+            t: Zeitachse in Sekunden (n,)
+            voltage, current, power: Werte pro Phase (n, 3) in V, A, W
+            frequency: Frequenz (n,) in Hz
+            trips: Liste (Index, COT-Code), nach Index sortiert
+            step_s: Schrittweite in Sekunden
+        """
+        self.t = t
+        self.voltage = voltage
+        self.current = current
+        self.power = power
+        self.frequency = frequency
+        self.trips = trips
+        self.step_s = step_s
+        self.name = name
+
+    def __len__(self):
+        return len(self.t)
+
+    def index_at(self, elapsed_s):
+        """Index des Schritts zur Szenariozeit elapsed_s"""
+        return min(len(self.t) - 1, max(0, int(elapsed_s / self.step_s)))
+
+    def data_at(self, index):
+        """Messwerte eines Schritts im Format von read_all_data() (nur Messgrößen)"""
+        voltage = self.voltage[index].tolist()
+        current = self.current[index].tolist()
+        power = self.power[index].tolist()
+        return {
+            'voltage': {phase: round(v, 2) for phase, v in zip(PHASES, voltage)},
+            'current': {phase: round(i, 3) for phase, i in zip(PHASES, current)},
+            'power': dict({phase: round(p, 2) for phase, p in zip(PHASES, power)},
+                          total=round(sum(power), 2)),
+            'frequency': round(float(self.frequency[index]), 2),
+        }
+
+
+class Scenario:
+    """Deklarativer Zeitablauf für Last, Unsymmetrie, Frequenz, Spannung und Auslösungen"""
+
+    def __init__(self, spec):
+        """
+        Args:
+            spec: Szenario-Beschreibung (dict, Format siehe Modul-Docstring)
+        """
+        self.spec = spec
+        self.name = spec.get('name', 'Szenario')
+        self.duration_s = float(spec.get('duration_s', 3600))
+        self.step_s = float(spec.get('step_s', 1.0))
+        self.seed = spec.get('seed')
+        self.base = dict(DEFAULT_BASE, **spec.get('base', {}))
+        self.di_feedback_delay_s = float(spec.get('di_feedback_delay_s', 0.0))
+        self.events = list(spec.get('events', []))
+
+    @classmethod
+    def from_file(cls, path):
+        """Szenario aus einer JSON-Datei laden"""
+        with open(path, 'r', encoding='utf-8') as f:
+            return cls(json.load(f))
+
+    @staticmethod
+    def _window(t, event):
+        start = float(event.get('start_s', 0.0))
+        return (t >= start) & (t < start + float(event.get('duration_s', 0.0)))
+
+    def generate(self):
+        """
+        Alle Zeitschritte vektorisiert berechnen
+
+        Returns:
+            ScenarioFrames
+        """
+        base = self.base
+        rng = np.random.default_rng(self.seed)
+        n = int(round(self.duration_s / self.step_s)) + 1
+        t = np.arange(n) * self.step_s
+
+        def events(kind):
+            return [e for e in self.events if e.get('type') == kind]
+
+        def smooth_noise(shape):
+            # Tiefpass-gefiltertes Rauschen (gleitender Mittelwert) - realistischer als weißes Rauschen
+            white = rng.standard_normal(shape)
+            window = max(1, int(round(10.0 / self.step_s)))
+            kernel = np.ones(window) / np.sqrt(window)
+            if white.ndim == 1:
+                return np.convolve(white, kernel, mode='same')
+            return np.stack([np.convolve(white[:, k], kernel, mode='same') for k in range(white.shape[1])], axis=1)
+
+        # Gesamtlast: Rampen und Lastabwurf bei Auslösung in zeitlicher Reihenfolge,
+        # jeweils vom erreichten Niveau aus
+        load = np.full(n, float(base['load_kw']))
+        trips = []
+        timeline = events('load_ramp') + events('trip')
+        for event in sorted(timeline, key=lambda e: e.get('start_s', e.get('at_s', 0.0))):
+            if event['type'] == 'trip':
+                index = min(n - 1, int(float(event.get('at_s', 0.0)) / self.step_s))
+                trips.append((index, int(event.get('cot', 3201))))
+                if event.get('load_kw_after') is not None:
+                    load[index:] = float(event['load_kw_after'])   # Schalter offen
+                continue
+            start = float(event.get('start_s', 0.0))
+            duration = max(float(event.get('duration_s', 0.0)), self.step_s)
+            level = load[min(n - 1, int(start / self.step_s))]
+            fraction = np.clip((t - start) / duration, 0.0, 1.0)
+            load = load + fraction * (float(event['to_kw']) - level)
+        trips.sort()
+
+        # Unsymmetrie: Anteil pro Phase, Summe bleibt erhalten
+        factors = np.ones((n, 3))
+        for event in events('imbalance'):
+            factors[self._window(t, event)] = np.asarray(event.get('factors', [1.0, 1.0, 1.0]), dtype=float)
+        factors /= factors.mean(axis=1, keepdims=True)
+
+        noise = float(base['noise'])
+        phase_kw = np.maximum(load, 0.0)[:, None] / 3.0 * factors
+        power = phase_kw * 1000.0 * (1.0 + noise * smooth_noise((n, 3)))
+
+        voltage = float(base['voltage_v']) - float(base['voltage_drop_per_kw']) * phase_kw
+        voltage = voltage * (1.0 + noise * 0.2 * smooth_noise((n, 3)))
+        for event in events('voltage_sag'):
+            phases = [p - 1 for p in event.get('phases', [1, 2, 3])]
+            mask = self._window(t, event)
+            voltage[np.ix_(mask, phases)] *= 1.0 - float(event.get('depth', 0.2))
+
+        current = np.maximum(power, 0.0) / (voltage * float(base['power_factor']))
+
+        # Frequenz: Trapez pro Abweichung (20 % Anstieg, Halten, 20 % Rückkehr)
+        frequency = float(base['frequency_hz']) + 0.01 * smooth_noise(n)
+        for event in events('frequency_excursion'):
+            start = float(event.get('start_s', 0.0))
+            duration = float(event.get('duration_s', 0.0))
+            delta = float(event.get('delta_hz', 0.0))
+            frequency += np.interp(t, [start, start + 0.2 * duration, start + 0.8 * duration, start + duration],
+                                   [0.0, delta, delta, 0.0], left=0.0, right=0.0)
+
+        return ScenarioFrames(t, voltage, current, power, frequency, trips, self.step_s, self.name)
+
+
+class ScenarioPlayer:
+    """Spielt ScenarioFrames in einen MRA4Simulator oder MRA4Emulator ein"""
+
+    def __init__(self, frames, target, speed=1.0, loop=False, di_feedback_delay_s=None):
+        """
+        Args:
+            frames: ScenarioFrames (oder Scenario, wird erzeugt)
+            target: MRA4Simulator oder MRA4Emulator
+            speed: Wiedergabe-Geschwindigkeit (1.0 = Echtzeit, 60 = eine Minute pro Sekunde)
+            loop: am Ende von vorn beginnen
+            di_feedback_delay_s: DI-Rückmeldeverzögerung für den Simulator (None = aus dem Szenario)
+        """
+        if isinstance(frames, Scenario):
+            if di_feedback_delay_s is None:
+                di_feedback_delay_s = frames.di_feedback_delay_s
+            frames = frames.generate()
+        self.frames = frames
+        self.target = target
+        self.simulator = getattr(target, 'simulator', target)
+        self.speed = speed
+        self.loop = loop
+        self.di_feedback_delay_s = di_feedback_delay_s
+        self.index = -1
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def apply(self, index):
+        """Schritt `index` in den Simulator übernehmen (Auslösungen seit dem letzten Schritt inklusive)"""
+        frames = self.frames
+        sim = self.simulator
+        sim.current_voltage = frames.voltage[index].tolist()
+        sim.current_current = frames.current[index].tolist()
+        sim.current_power = frames.power[index].tolist()
+        sim.current_frequency = float(frames.frequency[index])
+        for trip_index, cot in frames.trips:
+            if self.index < trip_index <= index:
+                sim.simulate_trip(cot)
+        self.index = index
+        update = getattr(self.target, 'update_measurements', None)
+        if update is not None:
+            update()
+
+    def start(self):
+        """Wiedergabe im Hintergrund starten"""
+        sim = self.simulator
+        sim.external_values = True
+        if self.di_feedback_delay_s is not None:
+            sim.di_feedback_delay_s = self.di_feedback_delay_s
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name='scenario-player', daemon=True)
+        self._thread.start()
+        logger.info(f"Szenario '{self.frames.name}' gestartet ({len(self.frames)} Schritte, "
+                    f"{self.frames.step_s:g}s, Geschwindigkeit x{self.speed:g})")
+        return self
+
+    def stop(self):
+        """Wiedergabe beenden - der Simulator läuft danach wieder frei"""
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join(5.0)
+            self._thread = None
+        self.simulator.external_values = False
+
+    def _run(self):
+        frames = self.frames
+        tick_s = frames.step_s / self.speed
+        started = time.monotonic()
+        self.index = -1
+        while not self._stop_event.is_set():
+            elapsed = (time.monotonic() - started) * self.speed
+            index = frames.index_at(elapsed)
+            if index != self.index:
+                self.apply(index)
+            if index >= len(frames) - 1:
+                if not self.loop:
+                    logger.info(f"Szenario '{frames.name}' beendet")
+                    return
+                started = time.monotonic()
+                self.index = -1
+            # Nächster Schritt; bei hoher Geschwindigkeit höchstens ~50 Updates/s
+            self._stop_event.wait(max(tick_s, 0.02))
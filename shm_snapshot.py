@@ -0,0 +1,363 @@
+"""
+Snapshot und Graph-Historie im Shared Memory (Multi-Worker-Betrieb)
+
+Ein Erfassungs-Prozess schreibt nach jedem Poll den Snapshot und einen neuen
+Historienpunkt in ein multiprocessing.shared_memory-Segment. Beliebig viele
+Web-Worker lesen daraus, ohne selbst eine Modbus-Verbindung zu öffnen.
+
+Konsistenz über ein Seqlock: der Schreiber setzt den Zähler vor dem Schreiben
+auf ungerade und danach auf gerade. Leser wiederholen den Lesevorgang, wenn
+der Zähler ungerade war oder sich währenddessen geändert hat.
+
+Befehle (Quittieren, Koppelschalter, ...) schicken die Worker über eine lokale
+multiprocessing.connection an den Erfassungs-Prozess, der sie serialisiert mit
+dem Poll-Zyklus ausführt.
+
+Aktive Alarme (data['alarms']) liegen als (Regelindex, seit, Wert) im
+Segment; der Leser ergänzt id, Stufe und Meldung aus seiner Regeltabelle
+(alarm_rules, aus derselben Konfiguration).
+"""
+import logging
+import math
+import os
+import threading
+import time
+from datetime import datetime
+from multiprocessing import shared_memory
+from multiprocessing.connection import Client, Listener
+
+from acquisition import ANALYTICS_KEYS, MAX_MARKERS, PHASES, Snapshot, empty_data
+from alarm_engine import MAX_ACTIVE_ALARMS
+
+logger = logging.getLogger(__name__)
+
+# Header-Slots (alle Werte als float64)
+_H_SEQLOCK = 0
+_H_SNAPSHOT_SEQ = 1
+_H_TIMESTAMP = 2
+_H_MONOTONIC = 3
+_H_CONNECTED = 4
+_H_SIMULATOR = 5
+_H_HISTORY_COUNT = 6
+_H_CAPACITY = 7
+_H_EPOCH = 8
+_H_MARKER_COUNT = 9
+_H_ALARM_COUNT = 10
+_HEADER_SIZE = 11
+
+_PROTECTION_FLAGS = ('aktiv', 'alarm', 'alarm_l1', 'alarm_l2', 'alarm_l3',
+                     'ausl', 'ausl_l1', 'ausl_l2', 'ausl_l3')
+
+# Pfade in den read_all_data()-Datensatz; None wird als NaN gespeichert
+VALUE_KEYS = (
+    [('voltage', phase) for phase in PHASES]
+    + [('current', phase) for phase in PHASES]
+    + [('power', key) for key in PHASES + ('total',)]
+    + [('frequency',), ('coupling_switch',), ('di_status',), ('cause_of_trip',),
+       ('fault_number',), ('fault_recording',), ('protection_status', 'raw_value')]
+    + [('protection_status', flag) for flag in _PROTECTION_FLAGS]
+    + [('analytics', key) for key in ANALYTICS_KEYS]
+)
+_BOOL_KEYS = {('coupling_switch',), ('di_status',), ('fault_recording',)} | {
+    ('protection_status', flag) for flag in _PROTECTION_FLAGS}
+_INT_KEYS = {('cause_of_trip',), ('fault_number',), ('protection_status', 'raw_value')}
+
+# Historien-Reihen in der Reihenfolge im Segment (Einheit wie AcquisitionService.history)
+HISTORY_SERIES = (
+    [('voltage', phase) for phase in PHASES]
+    + [('current', phase) for phase in PHASES]
+    + [('power', key) for key in PHASES + ('total',)]
+)
+
+# Befehle, die Web-Worker auslösen dürfen
+DEFAULT_ALLOWED_COMMANDS = ('coupling_pulse', 'send_coupling_pulse', 'write_fault_recording_trigger',
+                            'acknowledge_all', 'set_simulator', 'modbus_metrics',
+                            'acquisition_stats', 'history_query', 'energy_state',
+                            'power_quality', 'alarm_state')
+
+
+# Aufbau: Header | Werte | Umschaltpunkte (Ring, Zeitstempel) | aktive Alarme (je Regel, seit, Wert)
+#         | Historie (Zeit + Reihen, je ein Ring)
+_VALUES_BASE = _HEADER_SIZE
+_MARKER_BASE = _VALUES_BASE + len(VALUE_KEYS)
+_ALARM_BASE = _MARKER_BASE + MAX_MARKERS
+_HISTORY_BASE = _ALARM_BASE + 3 * MAX_ACTIVE_ALARMS
+
+
+def _segment_size(capacity):
+    return 8 * (_HISTORY_BASE + capacity * (1 + len(HISTORY_SERIES)))
+
+
+def _lookup(data, path):
+    value = data
+    for key in path:
+        if not isinstance(value, dict):
+            return None
+        value = value.get(key)
+    return value
+
+
+def _history_value(data, path):
+    value = _lookup(data, path) or 0
+    return value / 1000 if path[0] == 'power' else value   # W -> kW wie in der Historie
+
+
+class SharedSnapshotWriter:
+    """Schreibt Snapshots in ein neues Shared-Memory-Segment (Erfassungs-Prozess)"""
+
+    def __init__(self, capacity=3600, name=None):
+        """
+        Args:
+            capacity: Anzahl Punkte im Historien-Ring
+            name: Name des Segments (None = automatisch)
+        """
+        self.capacity = capacity
+        self._shm = shared_memory.SharedMemory(name=name, create=True, size=_segment_size(capacity))
+        self._buf = self._shm.buf.cast('d')
+        for i in range(len(self._buf)):
+            self._buf[i] = 0.0
+        self._buf[_H_CAPACITY] = capacity
+        self._last_epoch = None
+
+    @property
+    def name(self):
+        return self._shm.name
+
+    def publish(self, snapshot):
+        """Snapshot + neuen Historienpunkt schreiben (als AcquisitionService-Listener nutzbar)"""
+        buf = self._buf
+        data = snapshot.data
+        seqlock = buf[_H_SEQLOCK]
+        buf[_H_SEQLOCK] = seqlock + 1   # ungerade: Schreiben läuft
+        try:
+            buf[_H_SNAPSHOT_SEQ] = snapshot.seq
+            buf[_H_TIMESTAMP] = snapshot.timestamp
+            buf[_H_MONOTONIC] = snapshot.monotonic
+            buf[_H_CONNECTED] = 1.0 if snapshot.connected else 0.0
+            buf[_H_SIMULATOR] = 1.0 if snapshot.simulator else 0.0
+            buf[_H_EPOCH] = snapshot.epoch
+            for i, path in enumerate(VALUE_KEYS):
+                value = _lookup(data, path)
+                buf[_VALUES_BASE + i] = math.nan if value is None else float(value)
+
+            if self._last_epoch is not None and snapshot.epoch != self._last_epoch:
+                markers = int(buf[_H_MARKER_COUNT])
+                buf[_MARKER_BASE + markers % MAX_MARKERS] = snapshot.timestamp
+                buf[_H_MARKER_COUNT] = markers + 1
+            self._last_epoch = snapshot.epoch
+
+            alarms = data.get('alarms') or []
+            for i, alarm in enumerate(alarms[:MAX_ACTIVE_ALARMS]):
+                base = _ALARM_BASE + 3 * i
+                buf[base] = alarm['rule']
+                buf[base + 1] = alarm['since']
+                buf[base + 2] = math.nan if alarm['value'] is None else alarm['value']
+            buf[_H_ALARM_COUNT] = min(len(alarms), MAX_ACTIVE_ALARMS)
+
+            count = int(buf[_H_HISTORY_COUNT])
+            slot = count % self.capacity
+            base = _HISTORY_BASE
+            buf[base + slot] = snapshot.timestamp
+            for i, path in enumerate(HISTORY_SERIES):
+                buf[base + (i + 1) * self.capacity + slot] = float(_history_value(data, path))
+            buf[_H_HISTORY_COUNT] = count + 1
+        finally:
+            buf[_H_SEQLOCK] = seqlock + 2   # gerade: konsistent
+
+    def close(self):
+        """Segment schließen und freigeben"""
+        self._buf.release()
+        self._shm.close()
+        try:
+            self._shm.unlink()
+        except FileNotFoundError:
+            pass
+
+
+class SharedSnapshotReader:
+    """
+    Liest Snapshot und Historie aus dem Shared Memory (Web-Worker)
+
+    Bietet dieselbe Schnittstelle wie AcquisitionService (latest, history,
+    history_points, execute), damit die Dash-Callbacks unverändert bleiben.
+    """
+
+    def __init__(self, name, command_address=None, authkey=None, alarm_rules=None):
+        """
+        Args:
+            name: Name des Shared-Memory-Segments
+            command_address: (host, port) des CommandServer im Erfassungs-Prozess
+            authkey: Schlüssel für die Befehlsverbindung (bytes)
+            alarm_rules: alarm_engine.RuleTable für die Beschreibung aktiver Alarme
+        """
+        self._shm = shared_memory.SharedMemory(name=name)
+        if os.name == 'posix':
+            # Python < 3.13 würde das Segment beim Worker-Ende sonst für alle Prozesse löschen
+            from multiprocessing import resource_tracker
+            resource_tracker.unregister(self._shm._name, 'shared_memory')
+        self._buf = self._shm.buf.cast('d')
+        self.history_points = int(self._buf[_H_CAPACITY])
+        self.command_address = command_address
+        self.authkey = authkey
+        self.alarm_rules = alarm_rules
+        self._cached = None
+
+    def _consistent(self, read):
+        buf = self._buf
+        for _ in range(1000):
+            before = buf[_H_SEQLOCK]
+            if int(before) % 2:
+                time.sleep(0)
+                continue
+            result = read()
+            if buf[_H_SEQLOCK] == before:
+                return result
+        raise RuntimeError("Shared-Memory-Snapshot nicht konsistent lesbar")
+
+    def _read_alarm(self, i):
+        buf = self._buf
+        base = _ALARM_BASE + 3 * i
+        index, since, value = int(buf[base]), buf[base + 1], buf[base + 2]
+        value = None if math.isnan(value) else value
+        rules = self.alarm_rules
+        if rules is not None and index < len(rules):
+            return rules.describe(index, since, value)
+        return {'id': None, 'rule': index, 'severity': 'warning', 'channel': None, 'value': value,
+                'threshold': None, 'since': since, 'message': f"Alarm {index + 1}"}
+
+    def _read_snapshot(self):
+        buf = self._buf
+        data = empty_data()
+        protection = {}
+        for i, path in enumerate(VALUE_KEYS):
+            value = buf[_VALUES_BASE + i]
+            if math.isnan(value):
+                value = None
+            elif path in _BOOL_KEYS:
+                value = value != 0.0
+            elif path in _INT_KEYS:
+                value = int(value)
+            if path[0] == 'protection_status':
+                protection[path[1]] = value
+            elif len(path) == 2:
+                data[path[0]][path[1]] = value
+            else:
+                data[path[0]] = value
+        data['protection_status'] = protection if protection.get('raw_value') is not None else None
+        data['alarms'] = [self._read_alarm(i) for i in range(int(buf[_H_ALARM_COUNT]))]
+        return Snapshot(int(buf[_H_SNAPSHOT_SEQ]), buf[_H_TIMESTAMP], buf[_H_MONOTONIC], data,
+                        buf[_H_CONNECTED] != 0.0, buf[_H_SIMULATOR] != 0.0, int(buf[_H_EPOCH]))
+
+    def latest(self):
+        """Letzten Snapshot liefern (zwischengespeichert bis sich die Sequenz ändert)"""
+        cached = self._cached
+        if cached is not None and cached.seq == int(self._buf[_H_SNAPSHOT_SEQ]):
+            return cached
+        snapshot = self._consistent(self._read_snapshot)
+        self._cached = snapshot
+        return snapshot
+
+    def history(self, points=None):
+        """Historie im Format von AcquisitionService.history()"""
+        capacity = self.history_points
+        base = _HISTORY_BASE
+
+        def read():
+            buf = self._buf
+            count = int(buf[_H_HISTORY_COUNT])
+            n = min(count, capacity) if points is None else min(points, count, capacity)
+            start = (count - n) % capacity
+
+            def ring(offset):
+                first = buf[offset + start:offset + min(start + n, capacity)].tolist()
+                if start + n > capacity:
+                    first += buf[offset:offset + start + n - capacity].tolist()
+                return first
+
+            markers = buf[_MARKER_BASE:_MARKER_BASE + min(int(buf[_H_MARKER_COUNT]), MAX_MARKERS)].tolist()
+            return ring(base), [ring(base + (i + 1) * capacity) for i in range(len(HISTORY_SERIES))], markers
+
+        def label(ts):
+            return datetime.fromtimestamp(ts).strftime('%H:%M:%S')
+
+        timestamps, series, markers = self._consistent(read)
+        oldest = timestamps[0] if timestamps else math.inf
+        result = {
+            'time': [label(ts) for ts in timestamps],
+            'voltage': {}, 'current': {}, 'power': {},
+            'markers': [label(ts) for ts in sorted(markers) if ts >= oldest],
+        }
+        for (group, key), values in zip(HISTORY_SERIES, series):
+            result[group][key] = values
+        return result
+
+    def execute(self, command, *args, **kwargs):
+        """Befehl an den Erfassungs-Prozess weiterleiten"""
+        if self.command_address is None:
+            raise RuntimeError("Keine Befehlsverbindung zum Erfassungs-Prozess konfiguriert")
+        with Client(self.command_address, authkey=self.authkey) as conn:
+            conn.send((command, args, kwargs))
+            status, result = conn.recv()
+        if status != 'ok':
+            raise RuntimeError(f"Befehl {command} fehlgeschlagen: {result}")
+        return result
+
+    def close(self):
+        self._buf.release()
+        self._shm.close()
+
+
+class CommandServer:
+    """Nimmt Befehle der Web-Worker entgegen und führt sie über AcquisitionService.execute aus"""
+
+    def __init__(self, acquisition, authkey, address=('127.0.0.1', 0), allowed=DEFAULT_ALLOWED_COMMANDS):
+        """
+        Args:
+            acquisition: AcquisitionService im Erfassungs-Prozess
+            authkey: gemeinsamer Schlüssel (bytes)
+            address: lokale Adresse (Port 0 = frei wählen)
+            allowed: erlaubte Befehlsnamen
+        """
+        self.acquisition = acquisition
+        self.allowed = set(allowed)
+        self._listener = Listener(address, authkey=authkey)
+        self._thread = threading.Thread(target=self._serve, name='mra4-command-server', daemon=True)
+
+    @property
+    def address(self):
+        return self._listener.address
+
+    def start(self):
+        self._thread.start()
+        logger.info(f"Befehlsserver für Web-Worker auf {self.address[0]}:{self.address[1]}")
+
+    def _serve(self):
+        while True:
+            try:
+                conn = self._listener.accept()
+            except OSError:
+                return
+            except Exception as e:
+                logger.warning(f"Befehlsverbindung abgelehnt: {e}")
+                continue
+            threading.Thread(target=self._handle, args=(conn,), daemon=True).start()
+
+    def _handle(self, conn):
+        with conn:
+            try:
+                command, args, kwargs = conn.recv()
+                if command not in self.allowed:
+                    conn.send(('error', f"Befehl nicht erlaubt: {command}"))
+                    return
+                conn.send(('ok', self.acquisition.execute(command, *args, **kwargs)))
+            except EOFError:
+                pass
+            except Exception as e:
+                logger.error(f"Fehler beim Ausführen eines Worker-Befehls: {e}")
+                try:
+                    conn.send(('error', str(e)))
+                except Exception:
+                    pass
+
+    def close(self):
+        self._listener.close()
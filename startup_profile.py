@@ -0,0 +1,100 @@
+"""
+Startzeit-Profil für das MRA 4 Dashboard
+
+Misst die Importzeiten (ähnlich `python -X importtime`) und die Zeit bis zur
+ersten ausgelieferten Seite und schreibt das Ergebnis ins App-Log. Funktioniert
+auch in der PyInstaller-.exe, wo `-X importtime` nicht verfügbar ist.
+
+Aktivierung: `--profile-startup` oder Umgebungsvariable MRA4_PROFILE_STARTUP=1
+"""
+import builtins
+import os
+import sys
+import threading
+import time
+
+_original_import = None
+_process_start = time.perf_counter()
+_records = {}       # Modulname -> [inklusive Zeit, eigene Zeit] in Sekunden
+_local = threading.local()   # pro Thread: Kinderzeiten der gerade laufenden Importe
+_modules_at_install = 0
+
+
+def enabled():
+    """Ist der Profil-Modus angefordert?"""
+    return '--profile-startup' in sys.argv or os.environ.get('MRA4_PROFILE_STARTUP', '') == '1'
+
+
+def _timed_import(name, globals=None, locals=None, fromlist=(), level=0):
+    # Bereits geladene Module (der Normalfall) ohne Messung durchreichen
+    if level == 0 and not fromlist and name in sys.modules:
+        return _original_import(name, globals, locals, fromlist, level)
+
+    stack = getattr(_local, 'stack', None)
+    if stack is None:
+        stack = _local.stack = []
+    stack.append(0.0)
+    start = time.perf_counter()
+    try:
+        return _original_import(name, globals, locals, fromlist, level)
+    finally:
+        elapsed = time.perf_counter() - start
+        children = stack.pop()
+        if stack:
+            stack[-1] += elapsed
+        if level:
+            package = (globals or {}).get('__package__') or ''
+            name = f"{package}.{name}" if name else package
+        record = _records.setdefault(name, [0.0, 0.0])
+        record[0] += elapsed
+        record[1] += elapsed - children
+
+
+def install():
+    """Import-Hook installieren (so früh wie möglich aufrufen)"""
+    global _original_import, _modules_at_install
+    if _original_import is not None:
+        return
+    _modules_at_install = len(sys.modules)
+    _original_import = builtins.__import__
+    builtins.__import__ = _timed_import
+
+
+def uninstall():
+    """Import-Hook wieder entfernen"""
+    global _original_import
+    if _original_import is None:
+        return
+    builtins.__import__ = _original_import
+    _original_import = None
+
+
+def elapsed_since_start():
+    """Sekunden seit dem Import dieses Moduls (≈ Prozessstart)"""
+    return time.perf_counter() - _process_start
+
+
+def report(logger, top=15):
+    """
+    Import-Profil ins Log schreiben
+
+    Args:
+        logger: Ziel-Logger
+        top: Anzahl der teuersten Pakete/Module
+    """
+    # Nach Top-Level-Paket zusammenfassen (eigene Zeit, damit nichts doppelt zählt)
+    packages = {}
+    for name, (cumulative, own) in _records.items():
+        root = name.split('.')[0]
+        packages[root] = packages.get(root, 0.0) + own
+
+    total = sum(packages.values())
+    loaded = len(sys.modules) - _modules_at_install
+    logger.info(f"Startprofil: {loaded} Module in {total * 1000:.0f} ms importiert, "
+                f"bereit nach {elapsed_since_start() * 1000:.0f} ms")
+    for root, own in sorted(packages.items(), key=lambda item: item[1], reverse=True)[:top]:
+        logger.info(f"Startprofil:   {root:<30} {own * 1000:8.1f} ms")
+
+    logger.info("Startprofil: teuerste Einzelimporte (inklusiv)")
+    for name, (cumulative, own) in sorted(_records.items(), key=lambda item: item[1][0], reverse=True)[:top]:
+        logger.info(f"Startprofil:   {name:<40} {cumulative * 1000:8.1f} ms (eigen {own * 1000:.1f} ms)")
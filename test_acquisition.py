@@ -0,0 +1,34 @@
+"""
+Tests der Datenerfassung: Verbindungsaufbau im Hintergrund (Headless-Start)
+"""
+from acquisition import AcquisitionService
+from modbus_client import MRA4Client
+from modbus_metrics import ModbusMetrics
+
+
+def test_headless_client_connects_in_poll(fake_device, monkeypatch):
+    # Headless: der Client wird ohne connect() übergeben, die Datenerfassung verbindet
+    monkeypatch.setattr(AcquisitionService, 'RECONNECT_MIN_S', 0.0)
+    device = fake_device(reachable=False)
+    acq = AcquisitionService(MRA4Client(client=device, metrics=ModbusMetrics()))
+
+    snapshot = acq.poll_once()
+    assert not snapshot.connected
+    assert snapshot.data['voltage']['L1'] is None
+    assert device.connect_attempts == 1
+
+    device.reachable = True
+    snapshot = acq.poll_once()
+    assert snapshot.connected
+    assert snapshot.data['voltage']['L1'] == 230.0
+    assert device.connect_attempts == 2
+
+
+def test_reconnect_backoff(fake_device):
+    device = fake_device(reachable=False)
+    acq = AcquisitionService(MRA4Client(client=device, metrics=ModbusMetrics()))
+
+    acq.poll_once()
+    acq.poll_once()   # nächster Versuch erst nach RECONNECT_MIN_S
+    assert device.connect_attempts == 1
+    assert acq._reconnect_delay == 2 * AcquisitionService.RECONNECT_MIN_S
@@ -0,0 +1,83 @@
+"""
+Tests der Grenzwert-Alarme: Haltezeit, Hysterese und fehlende Werte
+"""
+from acquisition import empty_data
+from alarm_engine import AlarmEngine, parse_rules
+
+T0 = 1.7e9
+
+
+def poll(engine, t, frequency=None, power_w=None):
+    """Einen Poll zur monotonen Zeit t auswerten, aktive Alarm-ids liefern"""
+    data = empty_data()
+    data['frequency'] = frequency
+    data['power']['total'] = power_w
+    engine.process(data, T0 + t, t)
+    return [alarm['id'] for alarm in data['alarms']]
+
+
+def test_parse_rules_skips_invalid():
+    rules = parse_rules([
+        {'id': 'a', 'channel': 'frequency', 'threshold': 51},
+        {'id': 'a', 'channel': 'frequency', 'threshold': 49},        # doppelte id
+        {'channel': 'unbekannt', 'threshold': 1},
+        {'channel': 'frequency', 'comparator': '==', 'threshold': 1},
+        {'channel': 'frequency'},                                    # ohne Schwelle
+    ])
+    assert [rule['id'] for rule in rules] == ['a']
+    assert rules[0]['comparator'] == '>='
+
+
+def test_hold_time():
+    engine = AlarmEngine([{'id': 'f_high', 'channel': 'frequency', 'comparator': '>', 'threshold': 50.2,
+                           'hold_s': 3}])
+    assert poll(engine, 0, 50.3) == []
+    assert poll(engine, 2, 50.3) == []
+    assert poll(engine, 3, 50.3) == ['f_high']   # 3 s ununterbrochen
+
+    engine = AlarmEngine(engine.table.rules)
+    assert poll(engine, 0, 50.3) == []
+    assert poll(engine, 2, 50.1) == []           # Unterbrechung: Haltezeit beginnt neu
+    assert poll(engine, 3, 50.3) == []
+    assert poll(engine, 5, 50.3) == []
+    assert poll(engine, 6, 50.3) == ['f_high']
+    assert [(kind, value) for _, _, kind, value in engine.events] == [('raised', 50.3)]
+
+
+def test_hysteresis():
+    engine = AlarmEngine([{'id': 'f_low', 'channel': 'frequency', 'comparator': '<', 'threshold': 49.8,
+                           'hysteresis': 0.1}])
+    assert poll(engine, 0, 49.8) == []            # strikt: Schwelle selbst löst nicht aus
+    assert poll(engine, 1, 49.7) == ['f_low']
+    assert poll(engine, 2, 49.85) == ['f_low']    # über der Schwelle, aber innerhalb der Hysterese
+    assert poll(engine, 3, 49.9) == ['f_low']
+    assert poll(engine, 4, 49.95) == []
+    assert [kind for _, _, kind, _ in engine.events] == ['raised', 'cleared']
+
+
+def test_missing_values_keep_alarm_and_restart_hold():
+    engine = AlarmEngine([{'id': 'load', 'channel': 'load_percent', 'threshold': 90, 'hysteresis': 5,
+                           'hold_s': 1, 'message': 'Leistung bei {value:.0f}%'}],
+                         max_power_kw=lambda: 100.0)
+    poll(engine, 0, power_w=95000)
+    assert poll(engine, 1, power_w=95000) == ['load']
+    assert poll(engine, 2) == ['load']            # Verbindung unterbrochen: Alarm bleibt
+    assert engine.state()['active'][0]['value'] is None
+    assert poll(engine, 3, power_w=80000) == []
+
+    poll(engine, 4, power_w=95000)
+    poll(engine, 5)                               # Lücke: Haltezeit beginnt neu
+    assert poll(engine, 6, power_w=95000) == []
+    data = empty_data()
+    data['power']['total'] = 96000
+    engine.process(data, T0 + 7, 7)
+    assert data['alarms'][0]['message'] == 'Leistung bei 96%'
+
+
+def test_set_rules_keeps_state_by_id():
+    rule = {'id': 'f_high', 'channel': 'frequency', 'threshold': 50.2}
+    engine = AlarmEngine([rule])
+    assert poll(engine, 0, 50.5) == ['f_high']
+    engine.set_rules([{'id': 'f_low', 'channel': 'frequency', 'comparator': '<', 'threshold': 49.8}, rule])
+    assert poll(engine, 1, 50.5) == ['f_high']
+    assert len(engine.events) == 1               # kein zweites 'raised'
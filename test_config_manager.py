@@ -0,0 +1,95 @@
+"""
+Tests des ConfigManagers: Transaktionen (batch) und Speichern
+"""
+import json
+
+import pytest
+
+import config_manager
+from config_manager import ConfigManager
+
+
+@pytest.fixture
+def manager(tmp_path, monkeypatch):
+    monkeypatch.setattr(config_manager, 'CONFIG_FILE', tmp_path / 'config.json')
+    monkeypatch.setattr(ConfigManager, 'DEBOUNCE_S', 60.0)   # nur explizites flush() schreibt
+    monkeypatch.setattr(ConfigManager, 'RETRY_S', 60.0)
+    manager = ConfigManager()
+    yield manager
+    if manager._timer is not None:
+        manager._timer.cancel()
+
+
+def saved_config():
+    with open(config_manager.CONFIG_FILE, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def test_batch_commits_once(manager):
+    changes = []
+    manager.subscribe('modbus', lambda key, value: changes.append(value))
+    generation = manager.generation
+
+    with manager.batch():
+        manager.set('modbus.ip', '10.0.0.5')
+        manager.set('modbus.port', 5020)
+        assert manager.get('modbus.ip') != '10.0.0.5'   # erst am Ende sichtbar
+
+    assert manager.get('modbus.ip') == '10.0.0.5'
+    assert manager.generation == generation + 1
+    assert len(changes) == 1
+    assert manager.flush()
+    assert saved_config()['modbus'] == manager.get('modbus')
+
+
+def test_batch_discarded_on_exception(manager):
+    ip = manager.get('modbus.ip')
+    with pytest.raises(RuntimeError):
+        with manager.batch():
+            manager.set('modbus.ip', '10.0.0.5')
+            raise RuntimeError("abgebrochen")
+    assert manager.get('modbus.ip') == ip
+    assert not manager._dirty
+
+
+def test_failed_flush_stays_pending(manager, monkeypatch):
+    save = manager.save_config
+    monkeypatch.setattr(manager, 'save_config', lambda config=None: False)
+    assert manager.set('modbus.ip', '10.0.0.5')
+    assert not manager.flush()
+    assert manager._dirty
+    assert manager._timer is not None   # erneuter Versuch geplant
+    assert not manager.set('modbus.port', 5020)
+
+    monkeypatch.setattr(manager, 'save_config', save)
+    assert manager.flush()
+    assert not manager._dirty
+    assert manager.set('modbus.unit_id', 2)
+    assert saved_config()['modbus']['ip'] == '10.0.0.5'
+    assert saved_config()['modbus']['port'] == 5020
+
+
+def test_change_during_save_stays_pending(manager, monkeypatch):
+    save = manager.save_config
+
+    def slow_save(config=None):
+        manager.set('modbus.port', 5021)   # Änderung während des Schreibens
+        return save(config)
+
+    manager.set('modbus.ip', '10.0.0.6')
+    monkeypatch.setattr(manager, 'save_config', slow_save)
+    assert manager.flush()
+    assert manager._dirty
+    monkeypatch.setattr(manager, 'save_config', save)
+    assert manager.flush()
+    assert saved_config()['modbus']['port'] == 5021
+
+
+def test_resolve_path(tmp_path, monkeypatch):
+    monkeypatch.setattr(config_manager, 'CONFIG_FILE', tmp_path / 'config.json')
+    monkeypatch.delenv('MRA4_DATA_DIR', raising=False)
+    assert config_manager.resolve_path('history') == str(tmp_path / 'history')
+    assert config_manager.resolve_path(str(tmp_path / 'x' / 'trips')) == str(tmp_path / 'x' / 'trips')
+    assert config_manager.resolve_path('') == ''
+    monkeypatch.setenv('MRA4_DATA_DIR', str(tmp_path / 'data'))
+    assert config_manager.resolve_path('energy_state.json') == str(tmp_path / 'data' / 'energy_state.json')
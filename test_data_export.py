@@ -0,0 +1,40 @@
+"""
+Tests des Datenexports aus der Spalten-Historie (ohne Register-Aufzeichnungen)
+"""
+import math
+
+from column_store import CHANNEL_NAMES, ColumnWriter
+from data_export import export_stream, iter_column_batches
+
+T0 = 1.7e9
+
+
+def write_history(directory, rows):
+    writer = ColumnWriter(directory, chunk_rows=64)
+    for i in range(rows):
+        writer.append(T0 + i, [float(i)] * len(CHANNEL_NAMES))
+    writer.close()
+
+
+def test_column_batches(tmp_path):
+    write_history(tmp_path, 150)
+    batches = list(iter_column_batches(str(tmp_path), T0 + 10, T0 + 139, ['power.total', 'cause_of_trip'],
+                                       batch_rows=50))
+    assert [len(timestamps) for timestamps, _ in batches] == [50, 50, 30]
+    timestamps, columns = batches[-1]
+    assert timestamps[-1] == T0 + 139
+    assert columns['power.total'][-1] == 139.0
+    assert all(math.isnan(v) for v in columns['cause_of_trip'])   # nicht in der Spalten-Historie
+
+
+def test_export_prefers_column_history(tmp_path):
+    write_history(tmp_path, 20)
+
+    def query_history(*args):
+        raise AssertionError("Historie im Speicher statt Spalten-Historie")
+
+    body = b''.join(export_stream('csv', T0, T0 + 100, ['voltage.L1'], None, query_history, str(tmp_path)))
+    lines = body.decode('utf-8').splitlines()
+    assert lines[0] == 'time_utc,timestamp,voltage.L1'
+    assert len(lines) == 21
+    assert lines[-1].endswith(',19')
@@ -0,0 +1,77 @@
+"""
+Tests des Energiezählers: Trapezregel, Nulldurchgang, Lücken und Quellenwechsel
+"""
+import pytest
+
+from acquisition import Snapshot, empty_data
+from energy_meter import QUALITY_BRIDGED, QUALITY_GAP, EnergyMeter, _split_trapezoid
+
+T0 = 1.7e9 - 1.7e9 % 900   # Blockgrenze
+
+
+def snapshot(t, power_kw, epoch=0, simulator=False, connected=True):
+    data = empty_data()
+    data['power']['total'] = None if power_kw is None else power_kw * 1000
+    return Snapshot(int(t), T0 + t, t, data, connected, simulator, epoch)
+
+
+def feed(meter, samples, **kwargs):
+    for t, power_kw in samples:
+        meter.on_snapshot(snapshot(t, power_kw, **kwargs))
+
+
+def test_trapezoid():
+    meter = EnergyMeter(max_gap_s=10)
+    feed(meter, [(0, 10.0), (1, 20.0), (2, 20.0), (3, 0.0)])
+    # (10 + 20) / 2 + 20 + (20 + 0) / 2 = 45 kWs
+    assert meter.import_kwh == pytest.approx(45 / 3600)
+    assert meter.export_kwh == 0.0
+    assert meter.covered_s == 3.0
+
+
+def test_zero_crossing_split():
+    imported, exported = _split_trapezoid(10.0, -30.0, 4.0)
+    # Nulldurchgang nach 1 s: Bezug 10/2*1, Lieferung 30/2*3
+    assert imported == pytest.approx(5.0)
+    assert exported == pytest.approx(45.0)
+    assert _split_trapezoid(-4.0, -2.0, 2.0) == (0.0, pytest.approx(6.0))
+
+
+def test_gaps_and_bridging():
+    meter = EnergyMeter(max_gap_s=5)
+    feed(meter, [(0, 3.6), (1, None), (2, 3.6)])
+    assert meter.quality == QUALITY_BRIDGED
+    assert meter.bridged_s == 2.0
+    assert meter.invalid_samples == 1
+    assert meter.import_kwh == pytest.approx(2 * 3.6 / 3600)
+
+    feed(meter, [(20, 3.6)])   # Abstand > max_gap_s wird nicht integriert
+    assert meter.quality == QUALITY_GAP
+    assert (meter.gaps, meter.gap_s) == (1, 18.0)
+    assert meter.import_kwh == pytest.approx(2 * 3.6 / 3600)
+
+
+def test_simulator_snapshots_ignored():
+    meter = EnergyMeter(max_gap_s=10)
+    feed(meter, [(0, 100.0), (1, 100.0), (2, 100.0)], simulator=True)
+    assert meter.import_kwh == 0.0
+    assert meter.last_timestamp is None
+
+
+def test_epoch_change_restarts_integration():
+    meter = EnergyMeter(demand_window_s=900, max_gap_s=10)
+    feed(meter, [(0, 10.0), (1, 10.0), (2, 10.0)], epoch=0)
+    imported = meter.import_kwh
+    assert meter.demand_kw == pytest.approx(10.0)
+
+    # Neue Quelle (z.B. andere IP) - kein Trapez zwischen den Quellen, Umschaltung als Lücke
+    feed(meter, [(3, 50.0)], epoch=1)
+    assert meter.import_kwh == imported
+    assert meter.quality == QUALITY_GAP
+    assert (meter.gaps, meter.gap_s) == (1, 1.0)
+    assert meter.demand_kw is None
+
+    feed(meter, [(4, 50.0)], epoch=1)
+    assert meter.import_kwh == pytest.approx(imported + 50.0 / 3600)
+    assert meter.demand_kw == pytest.approx(50.0)   # Fenster enthält nur die neue Quelle
+    assert meter.state()['block_kw'] == pytest.approx(50.0 / 900)
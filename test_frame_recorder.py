@@ -0,0 +1,143 @@
+"""
+Tests der Register-Aufzeichnung und der Wiedergabe (ReplayClient)
+"""
+import types
+
+import pytest
+
+import frame_recorder
+from conftest import sample_data
+from data_export import decode_columns
+from frame_recorder import FrameReader, FrameRecorder, ReplayClient
+from modbus_client import INPUT_BLOCK_COUNT, decode_registers, encode_registers
+
+
+def frame_raw(i):
+    """Rohdaten mit der Framenummer in der Leistung L1 (1 Frame pro Sekunde)"""
+    return encode_registers(sample_data(power_l1=100.0 * i))
+
+
+def frame_number(client):
+    """Nächsten Frame abspielen und seine Nummer liefern"""
+    return round(client.read_all_data()['power']['L1'] / 100.0)
+
+
+@pytest.fixture
+def path(tmp_path):
+    return tmp_path / 'test.rec'
+
+
+def record(path, frames, chunk_frames=4096):
+    recorder = FrameRecorder(path, chunk_frames=chunk_frames)
+    for i in range(frames):
+        recorder.append(frame_raw(i), monotonic=float(i), timestamp=1e9 + i)
+    return recorder
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(frame_recorder, 'time', types.SimpleNamespace(monotonic=lambda: now[0]))
+    return now
+
+
+def test_round_trip(path):
+    record(path, 3).close()
+    reader = FrameReader(path)
+    assert len(reader) == 3
+    monotonic, timestamp, raw = reader.frame(2)
+    assert (monotonic, timestamp) == (2.0, 1e9 + 2)
+    assert raw == frame_raw(2)
+    assert list(reader.frames()['monotonic']) == [0.0, 1.0, 2.0]
+
+
+def test_frame_by_frame_finishes(path):
+    record(path, 3).close()
+    client = ReplayClient(path, speed=None)
+    assert client.connect()
+    assert [frame_number(client) for _ in range(3)] == [0, 1, 2]
+    assert not client.finished
+    assert frame_number(client) == 2   # letzter Frame bleibt stehen
+    assert client.finished
+
+
+def test_frame_by_frame_loops(path):
+    record(path, 3).close()
+    client = ReplayClient(path, speed=None, loop=True)
+    client.connect()
+    assert [frame_number(client) for _ in range(7)] == [0, 1, 2, 0, 1, 2, 0]
+    assert not client.finished
+
+
+def test_timed_replay_finishes(path, clock):
+    record(path, 3).close()
+    client = ReplayClient(path, speed=2.0)
+    client.connect()
+    numbers = []
+    for _ in range(4):
+        client.read_raw_registers()
+        numbers.append(client.index)
+        clock[0] += 0.5   # doppelte Geschwindigkeit: 1 Frame pro Aufruf
+    assert numbers == [0, 1, 2, 2]
+    assert client.finished
+
+
+def test_timed_replay_loops(path, clock):
+    record(path, 3).close()
+    client = ReplayClient(path, speed=1.0, loop=True)
+    client.connect()
+    numbers = []
+    for _ in range(5):
+        client.read_raw_registers()
+        numbers.append(client.index)
+        clock[0] += 1.0
+    assert numbers == [0, 1, 2, 0, 1]
+    assert not client.finished
+
+
+def test_replay_follows_growing_recording(path):
+    recorder = record(path, 3, chunk_frames=4)
+    client = ReplayClient(path, speed=None)
+    client.connect()
+    assert [frame_number(client) for _ in range(3)] == [0, 1, 2]
+    for i in range(3, 10):   # Datei wächst über die eingeblendete Größe hinaus
+        recorder.append(frame_raw(i), monotonic=float(i), timestamp=1e9 + i)
+    assert [frame_number(client) for _ in range(7)] == list(range(3, 10))
+    assert not client.finished
+    recorder.close()
+
+
+def test_reads_version_1(path):
+    # Version 1: Input-Block 20100-20155 + Holding Register, ohne Phasenlagen
+    raw = frame_raw(3)
+    values = raw[:frame_recorder.V1_INPUT_COUNT] + raw[INPUT_BLOCK_COUNT:]
+    mask = sum(1 << i for i, value in enumerate(values) if value is not None)
+    with open(path, 'wb') as f:
+        header = bytearray(frame_recorder.HEADER_SIZE)
+        frame_recorder._HEADER.pack_into(header, 0, frame_recorder.MAGIC, 1, frame_recorder.FRAME_SIZE_V1,
+                                         frame_recorder.V1_RAW_SIZE, 20100)
+        frame_recorder._COUNT.pack_into(header, frame_recorder._COUNT_OFFSET, 2)
+        f.write(header)
+        for i in range(2):
+            frame = bytearray(frame_recorder.FRAME_SIZE_V1)
+            frame_recorder._FRAME_V1.pack_into(frame, 0, float(i), 1e9 + i, mask, *(v or 0 for v in values))
+            f.write(frame)
+
+    reader = FrameReader(path)
+    assert (reader.version, len(reader)) == (1, 2)
+    data = decode_registers(reader.frame(1)[2])
+    expected = decode_registers(raw)
+    assert data['voltage'] == expected['voltage']
+    assert data['fault_number'] == expected['fault_number']
+    assert data['power']['total'] == expected['power']['total']
+    # Ohne Phasenlagen: Gesamtleistung / 3 wie im Poll-Zyklus
+    assert data['power']['L1'] == round(expected['power']['total'] / 3, 2)
+
+    columns = decode_columns(reader.upgrade(reader.frames()), ['voltage.L2', 'power.L3', 'fault_number'])
+    assert list(columns['voltage.L2']) == [expected['voltage']['L2']] * 2
+    assert list(columns['power.L3']) == [data['power']['L3']] * 2
+    assert list(columns['fault_number']) == [expected['fault_number']] * 2
+
+    client = ReplayClient(path, speed=None)
+    assert client.connect()
+    assert client.read_all_data()['voltage'] == expected['voltage']
@@ -0,0 +1,55 @@
+"""
+Tests des Log-Rings: Level-Gates, Zusammenfassen von Wiederholungen, Ringgröße
+"""
+import logging
+import threading
+
+from log_buffer import LogRing
+
+
+def record(name, level, msg, *args, created=1000.0):
+    record = logging.LogRecord(name, level, __file__, 1, msg, args, None)
+    record.created = created
+    return record
+
+
+def test_level_gates_follow_hierarchy():
+    ring = LogRing()
+    ring.set_level_gate('pymodbus', logging.ERROR)
+    ring.emit(record('pymodbus.client', logging.WARNING, "gefiltert"))
+    ring.emit(record('pymodbus.client', logging.ERROR, "Fehler"))
+    ring.emit(record('app', logging.INFO, "Info"))
+    assert [line.split(' - ', 2)[2] for line in ring.lines()] == ["Fehler", "Info"]
+
+    # Neues Gate gilt auch für schon aufgelöste Logger-Namen
+    ring.set_level_gate('pymodbus.client', logging.DEBUG)
+    ring.emit(record('pymodbus.client', logging.WARNING, "jetzt sichtbar"))
+    assert ring.lines()[-1].endswith("jetzt sichtbar")
+
+
+def test_repeats_are_counted():
+    ring = LogRing(dedup_window=60.0)
+    for i in range(3):
+        ring.emit(record('app', logging.ERROR, "Register %d nicht lesbar", 57, created=1000.0 + i))
+    ring.emit(record('app', logging.ERROR, "Register %d nicht lesbar", 57, created=1100.0))
+    lines = ring.lines()
+    assert len(lines) == 2
+    assert lines[0].endswith("Register 57 nicht lesbar (x3 in 2 s)")
+
+
+def test_capacity_and_concurrent_emit():
+    ring = LogRing(capacity=50)
+
+    def emit(name):
+        for i in range(500):
+            ring.emit(record(name, logging.INFO, "Meldung %d", i))
+            if i % 100 == 0:
+                ring.set_level_gate(name, logging.NOTSET)
+
+    threads = [threading.Thread(target=emit, args=(f'thread{n}',)) for n in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(ring.lines()) == 50
+    assert len(ring.lines(limit=10)) == 10
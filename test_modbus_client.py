@@ -0,0 +1,94 @@
+"""
+Tests der Registerumrechnung und des MRA4Client (ohne Gerät, FakeModbusDevice)
+"""
+import pytest
+
+from conftest import sample_data
+from modbus_client import (CURRENT_ANGLE_REGISTERS, RAW_SIZE, VOLTAGE_ANGLE_REGISTERS, MRA4Client,
+                           decode_registers, encode_registers, float_to_registers, input_offset,
+                           phase_powers)
+from modbus_metrics import ModbusMetrics
+
+
+def client_for(device):
+    return MRA4Client(client=device, metrics=ModbusMetrics())
+
+
+def test_encode_decode_round_trip():
+    data = sample_data()
+    data['protection_status'] = {'raw_value': 0x2004}
+    decoded = decode_registers(encode_registers(data))
+    assert decoded['voltage'] == data['voltage']
+    assert decoded['current'] == data['current']
+    assert decoded['frequency'] == data['frequency']
+    assert decoded['power'] == pytest.approx(data['power'], abs=0.05)   # float32 + Phasenlagen
+    assert decoded['fault_number'] == 7
+    assert decoded['cause_of_trip'] == 1
+    assert decoded['coupling_switch'] is True
+    assert decoded['di_status'] is True
+    assert decoded['fault_recording'] is False
+    assert decoded['protection_status']['ausl'] and decoded['protection_status']['aktiv']
+
+
+def test_decode_missing_registers():
+    decoded = decode_registers([None] * RAW_SIZE)
+    assert decoded['voltage'] == {'L1': None, 'L2': None, 'L3': None}
+    assert decoded['power'] == {'L1': None, 'L2': None, 'L3': None, 'total': None}
+    assert decoded['protection_status'] is None
+
+
+def put(raw, address, value):
+    offset = input_offset(address)
+    raw[offset:offset + 2] = float_to_registers(value)
+
+
+def test_phase_powers():
+    raw = encode_registers(sample_data())
+    put(raw, VOLTAGE_ANGLE_REGISTERS[0], 0.0)
+    put(raw, CURRENT_ANGLE_REGISTERS[0], -60.0)    # cos 60° = 0.5
+    put(raw, VOLTAGE_ANGLE_REGISTERS[1], -120.0)
+    put(raw, CURRENT_ANGLE_REGISTERS[1], 60.0)     # 180° = Lieferung
+    powers = phase_powers(raw)
+    assert powers[0] == pytest.approx(230.0 * 10.0 * 0.5)
+    assert powers[1] == pytest.approx(-231.0 * 9.5)
+
+
+def test_phase_powers_fallback_without_angles():
+    raw = encode_registers(sample_data())
+    offset = input_offset(CURRENT_ANGLE_REGISTERS[2])
+    raw[offset:offset + 2] = [None, None]
+    powers = phase_powers(raw, total=3000.0)
+    assert powers[2] == 1000.0
+    assert phase_powers(raw)[2] is None
+
+
+def test_reads_without_connect(fake_device):
+    # Kein connect() vorher - der Client existiert trotzdem (pymodbus verbindet beim Lesen selbst)
+    device = fake_device()
+    device.connected = True
+    client = client_for(device)
+    assert client.connected
+    assert client.read_voltage(2) == 231.0
+    assert client.read_all_data()['frequency'] == 50.0
+
+
+def test_lazy_client_created_on_first_use():
+    client = MRA4Client(host='127.0.0.1', port=1, metrics=ModbusMetrics())
+    assert not client.connected
+    assert client.read_voltage(1) is None   # Verbindungsfehler, kein AttributeError
+    assert client.client is not None
+
+
+def test_read_power(fake_device):
+    device = fake_device()
+    device.connected = True
+    expected = decode_registers(device.raw)['power']
+    assert client_for(device).read_power(1) == expected['L1']
+
+
+def test_read_power_falls_back_to_total(fake_device):
+    # Firmware ohne Phasenlagen: Ersatzwert total / 3 wie im Poll-Zyklus
+    device = fake_device(rejected=VOLTAGE_ANGLE_REGISTERS)
+    device.connected = True
+    total = decode_registers(device.raw)['power']['total']
+    assert client_for(device).read_power(3) == round(total / 3, 2)
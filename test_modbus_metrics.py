@@ -0,0 +1,56 @@
+"""
+Tests der Modbus-Transaktionsmetriken (ohne Gerät)
+"""
+import threading
+
+from conftest import _Response
+from modbus_client import INPUT_BLOCKS, MRA4Client
+from modbus_metrics import ModbusMetrics
+
+
+class _Exception(_Response):
+    exception_code = 2
+
+    def __init__(self):
+        super().__init__(error=True)
+
+
+def test_record_and_snapshot():
+    metrics = ModbusMetrics()
+    metrics.record(4, 20100, 10, 300_000, _Response([0] * 10))
+    metrics.record(4, 20100, 10, 700_000, _Response([0] * 10))
+    metrics.record(3, 57, 1, 100_000, _Exception())
+    metrics.failed(1, 0, 8, 2_000_000)
+    snapshot = metrics.snapshot()
+    assert (snapshot['requests'], snapshot['exceptions'], snapshot['errors']) == (4, 1, 1)
+    row = next(row for row in snapshot['series'] if row['fc'] == 4)
+    assert (row['requests'], row['ok'], row['max_us'], row['p50_us']) == (2, 2, 700.0, 500)
+    assert snapshot['exception_codes'] == [{'fc': 3, 'code': 2, 'count': 1}]
+    assert snapshot['tx_bytes'] == 4 * 12
+
+
+def test_preallocated_series_hidden_until_used():
+    metrics = ModbusMetrics()
+    MRA4Client(host='127.0.0.1', port=1, metrics=metrics)
+    start, count = INPUT_BLOCKS[0]
+    assert (4, start, count) in metrics.series
+    assert metrics.snapshot()['series'] == []
+    metrics.reset()
+    assert (4, start, count) in metrics.series   # bleibt nach reset() angelegt
+
+
+def test_concurrent_writers_keep_structure():
+    metrics = ModbusMetrics()
+
+    def write(fc):
+        for i in range(2000):
+            metrics.record(fc, i % 50, 1, 1000, _Response([0]))
+
+    threads = [threading.Thread(target=write, args=(fc,)) for fc in (1, 3, 4)]
+    for thread in threads:
+        thread.start()
+    snapshots = [metrics.snapshot() for _ in range(20)]   # Lesen während geschrieben wird
+    for thread in threads:
+        thread.join()
+    assert all(snapshot['requests'] <= 6000 for snapshot in snapshots)
+    assert len(metrics.snapshot()['series']) == 150
@@ -0,0 +1,86 @@
+"""
+Tests der Netzqualität: gleitende Statistik und df/dt gegen eine direkte Berechnung
+"""
+import math
+import random
+import statistics
+
+import pytest
+
+from power_quality import RateOfChange, RollingStats, unbalance
+
+
+def window(points, t, window_s, closed):
+    """Punkte im Fenster bis t (closed: Grenze gehört dazu wie bei RateOfChange)"""
+    return [(ti, x) for ti, x in points if (ti >= t - window_s if closed else ti > t - window_s)]
+
+
+def slope(points):
+    n = len(points)
+    mean_t = sum(t for t, _ in points) / n
+    mean_x = sum(x for _, x in points) / n
+    return (sum((t - mean_t) * (x - mean_x) for t, x in points)
+            / sum((t - mean_t) ** 2 for t, _ in points))
+
+
+def test_unbalance():
+    assert unbalance([230.0, 230.0, 230.0]) == 0.0
+    assert unbalance([220.0, 230.0, 240.0]) == pytest.approx(10 / 230 * 100)
+    assert unbalance([230.0, None, 230.0]) is None
+    assert unbalance([0.0, 0.0, 0.0], minimum=1.0) is None
+
+
+def test_rolling_stats_matches_brute_force():
+    rng = random.Random(1)
+    stats = RollingStats(30.0)
+    points = []
+    t = 1e6
+    for i in range(2000):
+        t += rng.choice((0.5, 1.0, 1.0, 3.0))
+        x = None if i % 97 == 0 else 230.0 + rng.gauss(0, 2)
+        stats.add(t, x)
+        if x is not None:
+            points.append((t, x))
+        if i % 50 != 1:
+            continue
+        values = [x for _, x in window(points, t, 30.0, closed=False)]
+        summary = stats.summary()
+        assert summary['count'] == len(values)
+        assert summary['min'] == min(values)
+        assert summary['max'] == max(values)
+        assert summary['mean'] == pytest.approx(statistics.fmean(values), rel=1e-12)
+        if len(values) > 1:
+            assert summary['std'] == pytest.approx(statistics.stdev(values), rel=1e-6)
+
+
+def test_rolling_stats_empty_window_resets():
+    stats = RollingStats(10.0)
+    stats.add(0.0, 5.0)
+    stats.add(20.0, None)
+    assert stats.summary()['count'] == 0
+    assert stats.std() is None
+
+
+def test_rate_of_change_matches_brute_force():
+    rng = random.Random(2)
+    rocof = RateOfChange(5.0)
+    points = []
+    t = 1e7   # große monotone Zeit (lange Laufzeit)
+    for i in range(200000):   # ohne neuen Bezugspunkt laufen die Summen hier um 1e-3 auseinander
+        t += 0.2
+        x = 50.0 + 0.01 * math.sin(i / 50) + rng.gauss(0, 1e-4)
+        result = rocof.add(t, x)
+        points.append((t, x))
+        points = window(points, t, 5.0, closed=True)
+        if i % 5000 == 0 and len(points) >= 3:
+            assert result == pytest.approx(slope(points), rel=1e-6, abs=1e-9)
+
+
+def test_rate_of_change_gap_and_missing_value():
+    rocof = RateOfChange(5.0, max_gap_s=2.0)
+    for t in range(5):
+        result = rocof.add(float(t), 50.0 + 0.1 * t)
+    assert result == pytest.approx(0.1)
+    assert rocof.add(20.0, 50.0) is None   # Lücke: neu beginnen
+    assert rocof.add(21.0, None) is None
+    assert rocof.add(22.0, 50.0) is None   # weniger als drei Punkte
@@ -0,0 +1,52 @@
+"""
+Tests des Render-Caches: einmal bauen, Verdrängung nach Anzahl, Größe und Alter
+"""
+import threading
+import time
+
+from render_cache import RenderCache
+
+
+def test_builds_once_per_key():
+    cache = RenderCache()
+    calls = []
+    started = threading.Event()
+
+    def build():
+        calls.append(1)
+        started.set()
+        time.sleep(0.05)
+        return {'data': [1, 2, 3]}
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(cache.get_or_build(('seq', 1), build)))
+               for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(calls) == 1
+    assert all(result is results[0] for result in results)   # dasselbe Objekt für alle Sitzungen
+
+
+def test_evicts_by_total_bytes():
+    cache = RenderCache(max_entries=100, max_bytes=100)
+    for i in range(5):
+        cache.get_or_build(i, lambda: 'x' * 38)   # 40 Bytes serialisiert
+    stats = cache.stats()
+    assert (stats['entries'], stats['bytes']) == (2, 80)
+    assert cache.get_or_build(4, lambda: 'neu') == 'x' * 38
+    assert cache.get_or_build(0, lambda: 'neu') == 'neu'
+
+
+def test_evicts_by_count_and_age(monkeypatch):
+    cache = RenderCache(max_entries=2, max_age_s=10.0)
+    for i in range(3):
+        cache.get_or_build(i, lambda: i)
+    assert cache.stats()['entries'] == 2
+    assert cache.get_or_build(0, lambda: 'neu') == 'neu'
+
+    now = time.monotonic()
+    monkeypatch.setattr(time, 'monotonic', lambda: now + 11.0)
+    assert cache.get_or_build(2, lambda: 'abgelaufen') == 'abgelaufen'
+    assert cache.stats()['entries'] == 1
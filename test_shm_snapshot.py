@@ -0,0 +1,107 @@
+"""
+Tests des Shared-Memory-Snapshots: Hin- und Rückweg, Historien-Ring und Seqlock
+"""
+import sys
+import threading
+import time
+from multiprocessing import resource_tracker
+
+import pytest
+
+import shm_snapshot
+from acquisition import Snapshot
+from alarm_engine import RuleTable
+from conftest import sample_data
+from shm_snapshot import SharedSnapshotReader, SharedSnapshotWriter
+
+T0 = 1.7e9
+
+
+@pytest.fixture
+def segment():
+    writer = SharedSnapshotWriter(capacity=4)
+    reader = SharedSnapshotReader(writer.name)
+    # Der Leser meldet das Segment beim Resource-Tracker ab - im selben Prozess gehört es aber dem Schreiber
+    resource_tracker.register(writer._shm._name, 'shared_memory')
+    yield writer, reader
+    reader.close()
+    writer.close()
+
+
+def snapshot(seq, data=None, epoch=0):
+    return Snapshot(seq, T0 + seq, float(seq), data or sample_data(), True, False, epoch)
+
+
+def test_round_trip(segment):
+    writer, reader = segment
+    data = sample_data()
+    data['protection_status'] = {'raw_value': 0x2004}
+    data['alarms'] = [{'rule': 0, 'since': T0, 'value': 50.5}]
+    writer.publish(snapshot(1, data))
+    reader.alarm_rules = RuleTable([{'id': 'f_high', 'channel': 'frequency', 'threshold': 50.2}])
+
+    latest = reader.latest()
+    assert (latest.seq, latest.timestamp, latest.connected, latest.simulator) == (1, T0 + 1, True, False)
+    assert latest.data['voltage'] == data['voltage']
+    assert latest.data['power']['total'] == data['power']['total']
+    assert latest.data['fault_number'] == data['fault_number']
+    assert latest.data['coupling_switch'] is data['coupling_switch']
+    assert latest.data['protection_status']['raw_value'] == 0x2004
+    assert [(alarm['id'], alarm['value']) for alarm in latest.data['alarms']] == [('f_high', 50.5)]
+    assert reader.latest() is latest   # unveränderte Sequenz: zwischengespeichert
+
+
+def test_history_ring_and_markers(segment):
+    writer, reader = segment
+    for seq in range(1, 7):
+        data = sample_data(power_l1=1000.0 * seq)
+        writer.publish(snapshot(seq, data, epoch=0 if seq < 5 else 1))
+    history = reader.history()
+    assert len(history['time']) == 4                                 # Kapazität
+    assert history['power']['L1'] == [3.0, 4.0, 5.0, 6.0]            # älteste zuerst, in kW
+    assert len(history['markers']) == 1                              # Quellenwechsel bei seq 5
+    assert reader.history(points=2)['power']['L1'] == [5.0, 6.0]
+
+
+def test_reader_waits_for_writer(segment):
+    writer, reader = segment
+    writer.publish(snapshot(1))
+    buf = writer._buf
+    buf[shm_snapshot._H_SEQLOCK] += 1   # Schreiben läuft (ungerade)
+    buf[shm_snapshot._H_SNAPSHOT_SEQ] = 2
+    with pytest.raises(RuntimeError):
+        reader.latest()
+    buf[shm_snapshot._H_SEQLOCK] += 1
+    assert reader.latest().seq == 2
+
+
+def test_concurrent_reads_are_consistent(segment):
+    writer, reader = segment
+    stop = threading.Event()
+    interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)   # Thread-Wechsel mitten im Schreiben provozieren
+
+    def write():
+        seq = 0
+        while not stop.is_set():
+            seq += 1
+            data = sample_data()
+            data['voltage'] = {'L1': float(seq), 'L2': float(seq), 'L3': float(seq)}
+            writer.publish(snapshot(seq, data))
+
+    thread = threading.Thread(target=write)
+    thread.start()
+    try:
+        seen = set()
+        deadline = time.monotonic() + 0.5
+        while time.monotonic() < deadline:
+            latest = reader.latest()
+            voltage = latest.data['voltage']
+            # Alle Werte aus demselben Schreibvorgang
+            assert voltage['L1'] == voltage['L2'] == voltage['L3'] == latest.seq
+            seen.add(latest.seq)
+    finally:
+        stop.set()
+        thread.join()
+        sys.setswitchinterval(interval)
+    assert len(seen) > 1
@@ -0,0 +1,96 @@
+"""
+Tests des Ereignisrekorders: Flanke, Vor- und Nachlauf, COT, Dateinamen und Aufräumen
+"""
+import os
+
+import pytest
+
+from acquisition import Snapshot
+from conftest import sample_data
+from trip_recorder import TripRecorder, event_files, list_events, load_event
+
+T0 = 1.7e9
+
+
+@pytest.fixture
+def recorder(tmp_path):
+    recorder = TripRecorder(str(tmp_path), pre_s=3, post_s=2, max_events=3)
+    recorder._write_async = recorder._write   # ohne Hintergrund-Thread schreiben
+    return recorder
+
+
+def snapshot(t, tripped=False, cot=1, fault_number=7, connected=True, timestamp=None):
+    data = sample_data()
+    data['protection_status'] = {'ausl': tripped, 'raw_value': 0x2000 if tripped else 0}
+    data['cause_of_trip'] = cot
+    data['fault_number'] = fault_number
+    return Snapshot(int(t), T0 + t if timestamp is None else timestamp, float(t), data, connected, False, 0)
+
+
+def feed(recorder, samples):
+    for sample in samples:
+        recorder.on_snapshot(sample)
+
+
+def test_edge_with_pre_and_post_window(recorder):
+    feed(recorder, [snapshot(t) for t in range(10)])
+    assert event_files(recorder.directory) == []
+    feed(recorder, [snapshot(t, tripped=True, cot=12) for t in range(10, 13)])
+    assert recorder.events_recorded == 0   # noch im Nachlauf
+    feed(recorder, [snapshot(13, tripped=True)])
+
+    [path] = event_files(recorder.directory)
+    record = load_event(path)
+    assert [sample['t'] for sample in record['samples']] == [-3.0, -2.0, -1.0, 0.0, 1.0, 2.0]
+    assert record['trip_time'] == T0 + 10
+    assert record['cause_of_trip'] == 12
+    assert recorder.events_recorded == 1
+
+
+def test_only_rising_edge_triggers(recorder):
+    # Schon beim Start ausgelöst oder Verbindung unterbrochen: keine Flanke
+    feed(recorder, [snapshot(0, tripped=True), snapshot(1), snapshot(2, tripped=True, connected=False)])
+    feed(recorder, [snapshot(t) for t in range(3, 10)])
+    recorder.flush()
+    assert event_files(recorder.directory) == []
+
+
+def test_cause_of_trip_follows_one_poll_later(recorder):
+    feed(recorder, [snapshot(0), snapshot(1, tripped=True, cot=1), snapshot(2, tripped=True, cot=23)])
+    recorder.flush()
+    [event] = list_events(recorder.directory)
+    assert event['cause_of_trip'] == 23
+
+
+def test_same_second_does_not_overwrite(recorder):
+    # Zwei Auslösungen in derselben Sekunde mit derselben Fehlernummer
+    for t in (0.0, 0.5):
+        feed(recorder, [snapshot(t, timestamp=T0), snapshot(t + 0.1, tripped=True, timestamp=T0)])
+        recorder.flush()
+    files = event_files(recorder.directory)
+    assert len(files) == 2
+    # Vorlauf der zweiten Auslösung: ab der ersten (der Ring wurde dort eingefroren)
+    assert [len(load_event(path)['samples']) for path in files] == [2, 3]
+    assert recorder.events_recorded == 2
+
+
+def test_prune_and_summary_cache(recorder):
+    for i in range(5):
+        t = 10.0 * i
+        feed(recorder, [snapshot(t), snapshot(t + 1, tripped=True, fault_number=i + 1)])
+        recorder.flush()
+        recorder.list_events()
+    names = [event['name'] for event in recorder.list_events()]
+    assert len(names) == 3   # max_events
+    assert [event['fault_number'] for event in recorder.list_events()] == [5, 4, 3]
+    assert sorted(recorder._summaries) == event_files(recorder.directory)
+
+    os.remove(os.path.join(recorder.directory, names[0]))   # von außen gelöscht
+    assert len(recorder.list_events()) == 2
+    assert len(recorder._summaries) == 2
+
+
+def test_reserved_empty_file_is_skipped(recorder, caplog):
+    open(os.path.join(recorder.directory, 'trip_20240101_000000_0.json'), 'w').close()
+    assert list_events(recorder.directory) == []
+    assert 'nicht lesbar' not in caplog.text
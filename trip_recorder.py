@@ -0,0 +1,257 @@
+"""
+Ereignisrekorder für Schutz-Auslösungen (Sequence of Events)
+
+Der Rekorder hängt als Snapshot-Listener an der Datenerfassung und hält die
+Snapshots der letzten pre_s Sekunden in einem Ring (nur Referenzen - die
+Snapshots sind nach dem Veröffentlichen unveränderlich). Bei einer
+Auslöse-Flanke (Register 1, Bit 0x2000 General-Auslösung: aus -> ein) wird
+der Ring durch einen neuen, leeren ersetzt - ein Tausch der Referenz, keine
+Kopie. Die folgenden post_s Sekunden werden dem Ereignis angehängt, danach
+schreibt ein Hintergrund-Thread die Ereignisdatei. Der Poll-Zyklus wartet
+damit nie auf Serialisierung oder Datei-I/O.
+
+Ereignisdatei (JSON, trip_YYYYmmdd_HHMMSS_<Fehlernummer>.json, bei gleichem
+Namen mit Zähler _1, _2, ... - eine Datei wird nie überschrieben):
+    Auslösezeit, COT (5004), Fehlernummer (57), Schutz-Status (1), DI (1000)
+    und Leittechnik-Befehl/BA (1005) zum Zeitpunkt der Flanke sowie alle
+    Snapshots im Fenster (Zeit relativ zur Auslösung, Datensatz, Rohregister)
+"""
+import glob
+import json
+import logging
+import os
+import threading
+from collections import deque
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+# Format der Ereignisdateien
+VERSION = 1
+
+# COT 1 = NORM (kein Fehler)
+COT_NORMAL = 1
+
+_SUMMARY_KEYS = ('trip_time', 'cause_of_trip', 'fault_number', 'di_status', 'coupling_switch')
+
+
+def _tripped(data):
+    protection = data.get('protection_status')
+    return None if protection is None else bool(protection.get('ausl'))
+
+
+def _sample(snapshot, trip_monotonic):
+    return {
+        't': round(snapshot.monotonic - trip_monotonic, 3),
+        'timestamp': snapshot.timestamp,
+        'connected': bool(snapshot.connected),
+        'data': snapshot.data,
+        'raw': None if snapshot.raw is None else list(snapshot.raw),
+    }
+
+
+class TripRecorder:
+    """Hält den Vorlauf-Ring und zeichnet Auslösungen mit Vor- und Nachlauf auf"""
+
+    def __init__(self, directory, pre_s=10.0, post_s=5.0, max_events=500):
+        """
+        Args:
+            directory: Verzeichnis der Ereignisdateien
+            pre_s: Vorlauf vor der Auslösung in Sekunden
+            post_s: Nachlauf nach der Auslösung in Sekunden
+            max_events: Höchstzahl gespeicherter Ereignisse (älteste werden gelöscht)
+        """
+        self.directory = directory
+        self.pre_s = float(pre_s)
+        self.post_s = float(post_s)
+        self.max_events = max_events
+        self._ring = deque()        # Snapshots der letzten pre_s Sekunden
+        self._open = []             # Ereignisse im Nachlauf: (Auslöse-Snapshot, Vorlauf, Nachlauf)
+        self._tripped = None        # letzter bekannter Auslösezustand
+        self._lock = threading.Lock()
+        self._summaries = {}        # Übersicht je Datei für list_events()
+        self.events_recorded = 0
+        os.makedirs(directory, exist_ok=True)
+
+    def on_snapshot(self, snapshot):
+        """Snapshot-Listener: O(1) pro Poll, bei einer Flanke nur ein Referenztausch"""
+        tripped = _tripped(snapshot.data) if snapshot.connected else None
+        edge = tripped and self._tripped is False
+        if tripped is not None:
+            self._tripped = tripped
+
+        finished = []
+        with self._lock:
+            # Nachlauf: Snapshots bis post_s nach der Auslösung, der erste danach schließt das Ereignis
+            while self._open and snapshot.monotonic - self._open[0][0].monotonic > self.post_s:
+                finished.append(self._open.pop(0))
+            for event in self._open:
+                event[2].append(snapshot)
+            horizon = snapshot.monotonic - self.pre_s
+            ring = self._ring
+            while ring and ring[0].monotonic < horizon:
+                ring.popleft()
+            if edge:
+                # Vorlauf einfrieren: der volle Ring gehört jetzt dem Ereignis, weiter geht es mit einem neuen
+                frozen, self._ring = self._ring, deque()
+                self._open.append((snapshot, frozen, []))
+                logger.warning(f"Auslösung erkannt: COT {snapshot.data.get('cause_of_trip')}, "
+                               f"Fehlernummer {snapshot.data.get('fault_number')}")
+            self._ring.append(snapshot)
+
+        for event in finished:
+            self._write_async(event)
+
+    def flush(self):
+        """Ereignisse im Nachlauf sofort schreiben (beim Beenden)"""
+        with self._lock:
+            events, self._open = self._open, []
+        for event in events:
+            self._write(event)
+
+    def _write_async(self, event):
+        threading.Thread(target=self._write, args=(event,), name='mra4-trip-writer', daemon=True).start()
+
+    def _write(self, event):
+        trip, pre, post = event
+        data = trip.data
+        samples = [_sample(s, trip.monotonic) for s in pre]
+        samples.append(_sample(trip, trip.monotonic))
+        samples += [_sample(s, trip.monotonic) for s in post]
+        # Das COT-Register kann einen Poll nach dem Auslösebit nachziehen
+        cause = data.get('cause_of_trip')
+        if cause in (None, COT_NORMAL):
+            cause = next((s.data.get('cause_of_trip') for s in post
+                          if s.data.get('cause_of_trip') not in (None, COT_NORMAL)), cause)
+        record = {
+            'version': VERSION,
+            'trip_time': trip.timestamp,
+            'cause_of_trip': cause,
+            'fault_number': data.get('fault_number'),
+            'protection_status': (data.get('protection_status') or {}).get('raw_value'),
+            'di_status': data.get('di_status'),
+            'coupling_switch': data.get('coupling_switch'),
+            'simulator': bool(trip.simulator),
+            'pre_s': self.pre_s,
+            'post_s': self.post_s,
+            'samples': samples,
+        }
+        name = f"trip_{datetime.fromtimestamp(trip.timestamp):%Y%m%d_%H%M%S}_{data.get('fault_number') or 0}"
+        try:
+            path = self._reserve(name)
+        except OSError as e:
+            logger.error(f"Ereignisdatei {name} konnte nicht angelegt werden: {e}")
+            return
+        tmp_path = path + '.tmp'
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(record, f, separators=(',', ':'), ensure_ascii=False)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, path)
+        except (OSError, TypeError, ValueError) as e:
+            logger.error(f"Ereignisdatei {path} konnte nicht geschrieben werden: {e}")
+            for leftover in (tmp_path, path):
+                try:
+                    os.remove(leftover)
+                except OSError:
+                    pass
+            return
+        with self._lock:
+            self.events_recorded += 1
+        logger.info(f"Auslösung aufgezeichnet: {path} ({len(pre)} Vorlauf, {len(post)} Nachlauf)")
+        self._prune()
+
+    def _reserve(self, name):
+        """
+        Freien Dateinamen exklusiv anlegen (zwei Auslösungen in derselben Sekunde)
+
+        Returns:
+            Pfad der angelegten, noch leeren Datei
+        """
+        for i in range(1000):
+            path = os.path.join(self.directory, f"{name}_{i}.json" if i else f"{name}.json")
+            try:
+                os.close(os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+                return path
+            except FileExistsError:
+                continue
+        raise FileExistsError(f"kein freier Name für {name}")
+
+    def _prune(self):
+        files = event_files(self.directory)
+        for path in files[:max(0, len(files) - self.max_events)]:
+            try:
+                os.remove(path)
+            except OSError as e:
+                logger.debug(f"Altes Ereignis {path} nicht gelöscht: {e}")
+                continue
+            self._summaries.pop(path, None)
+
+    def list_events(self):
+        """Übersicht der Ereignisse dieses Rekorders (siehe list_events)"""
+        return list_events(self.directory, self._summaries)
+
+
+def event_files(directory):
+    """Ereignisdateien im Verzeichnis (älteste zuerst, Zeit im Dateinamen)"""
+    if not directory or not os.path.isdir(directory):
+        return []
+    return sorted(glob.glob(os.path.join(directory, 'trip_*.json')))
+
+
+def list_events(directory, summaries=None):
+    """
+    Übersicht der Ereignisse (neueste zuerst) ohne die Messreihen
+
+    Args:
+        directory: Verzeichnis der Ereignisdateien
+        summaries: Zwischenspeicher der Übersicht je Datei (Ereignisdateien ändern sich nach dem
+            Schreiben nicht mehr); Einträge gelöschter Dateien werden entfernt
+
+    Returns:
+        Liste von {'name', 'trip_time', 'cause_of_trip', 'fault_number', 'di_status', 'coupling_switch'}
+    """
+    files = event_files(directory)
+    if summaries is None:
+        summaries = {}
+    else:
+        current = set(files)
+        for path in list(summaries):
+            if path not in current:
+                summaries.pop(path, None)
+    events = []
+    for path in reversed(files):
+        summary = summaries.get(path)
+        if summary is None:
+            try:
+                record = load_event(path)
+            except ValueError as e:
+                if not _file_size(path):
+                    continue   # Name reserviert, Datei wird gerade geschrieben
+                logger.warning(f"Ereignis {path} nicht lesbar: {e}")
+                continue
+            except OSError as e:
+                logger.warning(f"Ereignis {path} nicht lesbar: {e}")
+                continue
+            summary = summaries[path] = {key: record.get(key) for key in _SUMMARY_KEYS}
+            summary['name'] = os.path.basename(path)
+        events.append(summary)
+    return events
+
+
+def _file_size(path):
+    """Dateigröße in Bytes (0, wenn die Datei fehlt)"""
+    try:
+        return os.path.getsize(path)
+    except OSError:
+        return 0
+
+
+def load_event(path):
+    """Ereignisdatei lesen"""
+    with open(path, encoding='utf-8') as f:
+        record = json.load(f)
+    if record.get('version') != VERSION:
+        raise ValueError(f"Unbekannte Version {record.get('version')}")
+    return record
@@ -0,0 +1,10 @@
+"""
+WSGI-Einstiegspunkt für den Multi-Worker-Betrieb
+
+Wird von `python app.py --workers N` über gunicorn gestartet. Die Worker
+erhalten über MRA4_SHM_NAME/MRA4_CMD_ADDRESS/MRA4_CMD_AUTHKEY Zugriff auf den
+Snapshot und die Befehlsverbindung des Erfassungs-Prozesses.
+"""
+from app import app
+
+server = app.server